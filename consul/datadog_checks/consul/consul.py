@@ -3,10 +3,10 @@
 # Licensed under a 3-clause BSD style license (see LICENSE)
 from __future__ import division
 
+import random
 from collections import defaultdict
 from datetime import datetime, timedelta
 from itertools import islice
-from math import ceil, sqrt
 
 import requests
 from six import iteritems, iterkeys, itervalues
@@ -15,30 +15,9 @@ from six.moves.urllib.parse import urljoin
 from datadog_checks.base import AgentCheck, is_affirmative
 from datadog_checks.base.utils.containers import hash_mutable
 
-EPOCH = datetime(1970, 1, 1)
-
-
-# More information in https://www.consul.io/docs/internals/coordinates.html,
-# code is based on the snippet there.
-def distance(a, b):
-    a = a['Coord']
-    b = b['Coord']
-    total = 0
-    b_vec = b['Vec']
-    for i, a_p in enumerate(a['Vec']):
-        diff = a_p - b_vec[i]
-        total += diff * diff
-    rtt = sqrt(total) + a['Height'] + b['Height']
-
-    adjusted = rtt + a['Adjustment'] + b['Adjustment']
-    if adjusted > 0.0:
-        rtt = adjusted
+from .coordinates import NODE_LATENCY_METRICS, datacenter_latencies, node_latencies
 
-    return rtt * 1000.0
-
-
-def ceili(v):
-    return int(ceil(v))
+EPOCH = datetime(1970, 1, 1)
 
 
 class ConsulCheckInstanceState(object):
@@ -460,6 +439,11 @@ class ConsulCheck(AgentCheck):
     def _get_coord_nodes(self, instance):
         return self.consul_request(instance, 'v1/coordinate/nodes')
 
+    def _get_agent_node_name(self, instance, instance_state):
+        local_config = self._get_local_config(instance, instance_state)
+        # Member key for consul 0.7.x and up; Config key for older versions
+        return local_config.get('Config', {}).get('NodeName') or local_config.get('Member', {}).get('Name')
+
     def check_network_latency(self, instance, agent_dc, main_tags):
 
         datacenters = self._get_coord_datacenters(instance)
@@ -472,21 +456,13 @@ class ConsulCheck(AgentCheck):
                     if name == other_name:
                         # Ignore ourselves
                         continue
-                    latencies = []
-                    for node_a in datacenter['Coordinates']:
-                        for node_b in other['Coordinates']:
-                            latencies.append(distance(node_a, node_b))
-                    latencies.sort()
+                    min_latency, median, max_latency = datacenter_latencies(
+                        datacenter['Coordinates'], other['Coordinates']
+                    )
                     tags = main_tags + ['source_datacenter:{}'.format(name), 'dest_datacenter:{}'.format(other_name)]
-                    n = len(latencies)
-                    half_n = n // 2
-                    if n % 2:
-                        median = latencies[half_n]
-                    else:
-                        median = (latencies[half_n - 1] + latencies[half_n]) / 2
-                    self.gauge('consul.net.dc.latency.min', latencies[0], hostname='', tags=tags)
+                    self.gauge('consul.net.dc.latency.min', min_latency, hostname='', tags=tags)
                     self.gauge('consul.net.dc.latency.median', median, hostname='', tags=tags)
-                    self.gauge('consul.net.dc.latency.max', latencies[-1], hostname='', tags=tags)
+                    self.gauge('consul.net.dc.latency.max', max_latency, hostname='', tags=tags)
 
                 # We've found ourselves, we can move on
                 break
@@ -495,40 +471,31 @@ class ConsulCheck(AgentCheck):
         nodes = self._get_coord_nodes(instance)
         if len(nodes) == 1:
             self.log.debug("Only 1 node in cluster, skipping network latency metrics.")
-        else:
-            for node in nodes:
-                node_name = node['Node']
-                latencies = []
-                for other in nodes:
-                    other_name = other['Node']
-                    if node_name == other_name:
-                        continue
-                    latencies.append(distance(node, other))
-                latencies.sort()
-                n = len(latencies)
-                half_n = n // 2
-                if n % 2:
-                    median = latencies[half_n]
-                else:
-                    median = (latencies[half_n - 1] + latencies[half_n]) / 2
-                self.gauge('consul.net.node.latency.min', latencies[0], hostname=node_name, tags=main_tags)
-                self.gauge(
-                    'consul.net.node.latency.p25', latencies[ceili(n * 0.25) - 1], hostname=node_name, tags=main_tags
-                )
-                self.gauge('consul.net.node.latency.median', median, hostname=node_name, tags=main_tags)
-                self.gauge(
-                    'consul.net.node.latency.p75', latencies[ceili(n * 0.75) - 1], hostname=node_name, tags=main_tags
-                )
-                self.gauge(
-                    'consul.net.node.latency.p90', latencies[ceili(n * 0.90) - 1], hostname=node_name, tags=main_tags
-                )
-                self.gauge(
-                    'consul.net.node.latency.p95', latencies[ceili(n * 0.95) - 1], hostname=node_name, tags=main_tags
-                )
-                self.gauge(
-                    'consul.net.node.latency.p99', latencies[ceili(n * 0.99) - 1], hostname=node_name, tags=main_tags
-                )
-                self.gauge('consul.net.node.latency.max', latencies[-1], hostname=node_name, tags=main_tags)
+            return
+
+        sources = peers = None
+        if is_affirmative(instance.get('network_latency_local_node_only', False)):
+            # Only the latencies of the node of this agent
+            instance_state = self._instance_states[hash_mutable(instance)]
+            node_name = self._get_agent_node_name(instance, instance_state)
+            sources = [idx for idx, node in enumerate(nodes) if node['Node'] == node_name]
+            if not sources:
+                self.log.debug("Node %s has no network coordinates, skipping network latency metrics.", node_name)
+                return
+
+        sample_size = int(instance.get('network_latency_sample_size', 0))
+        if 0 < sample_size < len(nodes) - 1:
+            # The latencies of each node are estimated from a random sample of the nodes
+            peers = sorted(random.sample(range(len(nodes)), sample_size))
+
+        if sources is None:
+            sources = range(len(nodes))
+        for source, summary in zip(sources, node_latencies(nodes, sources, peers)):
+            if summary is None:
+                continue
+            node_name = nodes[source]['Node']
+            for metric, value in zip(NODE_LATENCY_METRICS, summary):
+                self.gauge('consul.net.node.latency.{}'.format(metric), value, hostname=node_name, tags=main_tags)
 
     def _get_all_nodes(self, instance):
         return self.consul_request(instance, 'v1/catalog/nodes')
@@ -0,0 +1,185 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+from __future__ import division
+
+from math import ceil, sqrt
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Percentiles of the latencies of a node to the other nodes, in the order of `NODE_LATENCY_METRICS`.
+# The median is computed separately since it is the mean of the two middle values for an even number of values.
+NODE_LATENCY_PERCENTILES = (0.25, 0.75, 0.90, 0.95, 0.99)
+NODE_LATENCY_METRICS = ('min', 'p25', 'median', 'p75', 'p90', 'p95', 'p99', 'max')
+
+# Maximum number of distances computed at once by the vectorized implementation, to bound its memory usage
+MAX_BLOCK_SIZE = 1 << 20
+
+
+# More information in https://www.consul.io/docs/internals/coordinates.html,
+# code is based on the snippet there.
+def distance(a, b):
+    a = a['Coord']
+    b = b['Coord']
+    total = 0
+    b_vec = b['Vec']
+    for i, a_p in enumerate(a['Vec']):
+        diff = a_p - b_vec[i]
+        total += diff * diff
+    rtt = sqrt(total) + a['Height'] + b['Height']
+
+    adjusted = rtt + a['Adjustment'] + b['Adjustment']
+    if adjusted > 0.0:
+        rtt = adjusted
+
+    return rtt * 1000.0
+
+
+def ceili(v):
+    return int(ceil(v))
+
+
+def median(latencies):
+    """
+    Return the median of a sorted list of latencies.
+    """
+    n = len(latencies)
+    half_n = n // 2
+    if n % 2:
+        return latencies[half_n]
+    return (latencies[half_n - 1] + latencies[half_n]) / 2
+
+
+def summarize(latencies):
+    """
+    Return the values of `NODE_LATENCY_METRICS` for a sorted list of latencies.
+    """
+    n = len(latencies)
+    p25, p75, p90, p95, p99 = [latencies[ceili(n * p) - 1] for p in NODE_LATENCY_PERCENTILES]
+    return latencies[0], p25, median(latencies), p75, p90, p95, p99, latencies[-1]
+
+
+def node_latencies(nodes, sources=None, peers=None):
+    """
+    Compute the latencies of nodes to the other nodes of the same datacenter.
+
+    `nodes` are the coordinates returned by the `/v1/coordinate/nodes` endpoint, `sources` and `peers` are
+    lists of indexes in `nodes`: the latencies of each source are computed to every peer except itself.
+    All the nodes are sources and peers by default.
+
+    Return the values of `NODE_LATENCY_METRICS` of each source, in the order of `sources`,
+    or None for a source that has no other peer than itself.
+    """
+    if sources is None:
+        sources = range(len(nodes))
+    if peers is None:
+        peers = range(len(nodes))
+
+    if np is None:
+        results = []
+        for source in sources:
+            node = nodes[source]
+            latencies = sorted(distance(node, nodes[peer]) for peer in peers if peer != source)
+            results.append(summarize(latencies) if latencies else None)
+        return results
+
+    vec, height, adjustment = _coordinate_arrays(nodes)
+    sources = np.asarray(sources, dtype=int)
+    peers = np.asarray(peers, dtype=int)
+    n_peers = len(peers)
+
+    # Position of each source among the peers, -1 if it is not one
+    peer_positions = np.full(len(nodes), -1, dtype=int)
+    peer_positions[peers] = np.arange(n_peers)
+    source_positions = peer_positions[sources]
+
+    results = [None] * len(sources)
+    # Sources that are peers have one latency less, they are summarized separately
+    for is_peer in (True, False):
+        selected = np.nonzero((source_positions >= 0) == is_peer)[0]
+        n = n_peers - 1 if is_peer else n_peers
+        if not len(selected) or not n:
+            continue
+
+        # The infinite latencies of the sources to themselves are sorted last and ignored
+        kth = _summary_ranks(n)
+        block_size = max(MAX_BLOCK_SIZE // n_peers, 1)
+        for start in range(0, len(selected), block_size):
+            block = selected[start : start + block_size]
+            latencies = _distances(vec, height, adjustment, sources[block], peers)
+            if is_peer:
+                latencies[np.arange(len(block)), source_positions[block]] = np.inf
+            latencies.partition(kth, axis=1)
+            for idx, summary in zip(block, _summarize_partitioned(latencies, n).tolist()):
+                results[idx] = tuple(summary)
+
+    return results
+
+
+def datacenter_latencies(coordinates, other_coordinates):
+    """
+    Compute the latencies between the nodes of two datacenters, as returned by the
+    `/v1/coordinate/datacenters` endpoint. Return their minimum, median and maximum.
+    """
+    if np is None:
+        latencies = sorted(distance(node_a, node_b) for node_a in coordinates for node_b in other_coordinates)
+    else:
+        nodes = list(coordinates) + list(other_coordinates)
+        vec, height, adjustment = _coordinate_arrays(nodes)
+        sources, peers = np.arange(len(coordinates)), np.arange(len(coordinates), len(nodes))
+        latencies = np.sort(_distances(vec, height, adjustment, sources, peers), axis=None).tolist()
+
+    return latencies[0], median(latencies), latencies[-1]
+
+
+def _coordinate_arrays(nodes):
+    coords = [node['Coord'] for node in nodes]
+    vec = np.array([coord['Vec'] for coord in coords], dtype=float)
+    height = np.array([coord['Height'] for coord in coords], dtype=float)
+    adjustment = np.array([coord['Adjustment'] for coord in coords], dtype=float)
+    return vec, height, adjustment
+
+
+def _distances(vec, height, adjustment, sources, peers):
+    """
+    Return the matrix of the latencies from `sources` to `peers`, computed like `distance`
+    with the same order of operations so that the results are identical.
+    """
+    total = np.zeros((len(sources), len(peers)))
+    for i in range(vec.shape[1]):
+        diff = vec[sources, i][:, None] - vec[peers, i][None, :]
+        total += diff * diff
+
+    rtt = np.sqrt(total) + height[sources][:, None] + height[peers][None, :]
+    adjusted = rtt + adjustment[sources][:, None] + adjustment[peers][None, :]
+    rtt = np.where(adjusted > 0.0, adjusted, rtt)
+    rtt *= 1000.0
+    return rtt
+
+
+def _summary_ranks(n):
+    """
+    Return the ranks of the sorted latencies needed by `summarize` for `n` latencies.
+    """
+    half_n = n // 2
+    ranks = {0, n - 1, half_n}
+    if not n % 2:
+        ranks.add(half_n - 1)
+    ranks.update(ceili(n * p) - 1 for p in NODE_LATENCY_PERCENTILES)
+    return sorted(ranks)
+
+
+def _summarize_partitioned(latencies, n):
+    """
+    Vectorized `summarize` of the rows of `latencies`, partitioned around the ranks of `_summary_ranks(n)`.
+    """
+    half_n = n // 2
+    if n % 2:
+        medians = latencies[:, half_n]
+    else:
+        medians = (latencies[:, half_n - 1] + latencies[:, half_n]) / 2
+    p25, p75, p90, p95, p99 = [latencies[:, ceili(n * p) - 1] for p in NODE_LATENCY_PERCENTILES]
+    return np.column_stack((latencies[:, 0], p25, medians, p75, p90, p95, p99, latencies[:, n - 1]))
@@ -53,6 +53,8 @@ setup(
     packages=['datadog_checks.consul'],
     # Run-time dependencies
     install_requires=[CHECKS_BASE_REQ],
+    # Optional dependencies: NumPy speeds up the computation of the network latencies
+    extras_require={'numpy': ['numpy==1.16.4']},
     # Extra files to ship with the wheel package
     include_package_data=True,
 )
@@ -24,6 +24,25 @@ MOCK_CONFIG_NETWORK_LATENCY_CHECKS = {
 }
 
 
+def generate_coord_nodes(count, seed=0):
+    """
+    Generate the network coordinates of `count` nodes
+    """
+    rand = random.Random(seed)
+    return [
+        {
+            "Node": "host-{}".format(i),
+            "Coord": {
+                "Vec": [rand.uniform(-0.01, 0.01) for _ in range(8)],
+                "Error": rand.uniform(0.1, 1.5),
+                "Adjustment": rand.uniform(-0.0005, 0.0002),
+                "Height": rand.uniform(0.00001, 0.0002),
+            },
+        }
+        for i in range(count)
+    ]
+
+
 def mock_check(check, mocks):
     for f_name, m in iteritems(mocks):
         if not hasattr(check, f_name):
@@ -103,6 +122,7 @@ def mock_get_local_config(instance, instance_state):
         "Config": {
             "AdvertiseAddr": "10.0.2.15",
             "Datacenter": "dc1",
+            "NodeName": "host-1",
             "Ports": {
                 "DNS": 8600,
                 "HTTP": 8500,
@@ -0,0 +1,26 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import mock
+import pytest
+
+from datadog_checks.consul import coordinates
+
+from . import consul_mocks
+
+NODES = consul_mocks.generate_coord_nodes(1000)
+
+
+def test_node_latencies_python(benchmark):
+    with mock.patch.object(coordinates, 'np', None):
+        benchmark(coordinates.node_latencies, NODES)
+
+
+@pytest.mark.skipif(coordinates.np is None, reason='NumPy is not installed')
+def test_node_latencies_vectorized(benchmark):
+    benchmark(coordinates.node_latencies, NODES)
+
+
+@pytest.mark.skipif(coordinates.np is None, reason='NumPy is not installed')
+def test_node_latencies_sampled(benchmark):
+    benchmark(coordinates.node_latencies, NODES, None, range(0, len(NODES), 10))
@@ -6,7 +6,7 @@ import logging
 import mock
 import pytest
 
-from datadog_checks.consul import ConsulCheck
+from datadog_checks.consul import ConsulCheck, coordinates
 from datadog_checks.utils.containers import hash_mutable
 
 from . import common, consul_mocks
@@ -320,3 +320,74 @@ def test_network_latency_checks(aggregator):
     node = [m for m in latency if '.node.latency.' in m[0]]
     assert 16 == len(node)
     assert 0.26577747932995816 == node[0][2]
+
+
+def test_network_latency_local_node_only(aggregator):
+    consul_check = ConsulCheck(common.CHECK_NAME, {}, {})
+    my_mocks = consul_mocks._get_consul_mocks()
+    my_mocks['_get_coord_nodes'] = lambda instance: consul_mocks.generate_coord_nodes(20)
+    consul_mocks.mock_check(consul_check, my_mocks)
+    instance = dict(consul_mocks.MOCK_CONFIG_NETWORK_LATENCY_CHECKS, network_latency_local_node_only=True)
+    consul_check._instance_states[hash_mutable(instance)].last_known_leader = consul_mocks.mock_get_cluster_leader_A(
+        None
+    )
+
+    consul_check.check(instance)
+
+    # Only the node of the agent, host-1, has latency metrics
+    for metric in coordinates.NODE_LATENCY_METRICS:
+        aggregator.assert_metric('consul.net.node.latency.{}'.format(metric), count=1, hostname='host-1')
+        aggregator.assert_metric('consul.net.node.latency.{}'.format(metric), count=1)
+
+
+def test_network_latency_sample_size(aggregator):
+    nodes = consul_mocks.generate_coord_nodes(50)
+    consul_check = ConsulCheck(common.CHECK_NAME, {}, {})
+    my_mocks = consul_mocks._get_consul_mocks()
+    my_mocks['_get_coord_nodes'] = lambda instance: nodes
+    consul_mocks.mock_check(consul_check, my_mocks)
+    instance = dict(consul_mocks.MOCK_CONFIG_NETWORK_LATENCY_CHECKS, network_latency_sample_size=10)
+    consul_check._instance_states[hash_mutable(instance)].last_known_leader = consul_mocks.mock_get_cluster_leader_A(
+        None
+    )
+
+    with mock.patch('datadog_checks.consul.consul.random.sample', return_value=list(range(10))):
+        consul_check.check(instance)
+
+    # Every node has latency metrics, computed against the sampled nodes
+    for metric, values in zip(
+        coordinates.NODE_LATENCY_METRICS, zip(*coordinates.node_latencies(nodes, None, range(10)))
+    ):
+        for node, value in zip(nodes, values):
+            aggregator.assert_metric(
+                'consul.net.node.latency.{}'.format(metric), value=value, count=1, hostname=node['Node']
+            )
+
+
+@pytest.mark.skipif(coordinates.np is None, reason='NumPy is not installed')
+@pytest.mark.parametrize('count', [2, 3, 10, 51])
+def test_node_latencies_vectorized(count):
+    nodes = consul_mocks.generate_coord_nodes(count)
+    vectorized = coordinates.node_latencies(nodes)
+    vectorized_subset = coordinates.node_latencies(nodes, [0, count - 1], list(range(1, count)))
+    with mock.patch.object(coordinates, 'np', None):
+        assert vectorized == coordinates.node_latencies(nodes)
+        assert vectorized_subset == coordinates.node_latencies(nodes, [0, count - 1], list(range(1, count)))
+
+    # A node that is its own single peer has no latency
+    assert coordinates.node_latencies(nodes, [0, 1], [0]) == [None, (coordinates.distance(nodes[1], nodes[0]),) * 8]
+
+
+@pytest.mark.skipif(coordinates.np is None, reason='NumPy is not installed')
+def test_datacenter_latencies_vectorized():
+    datacenter = consul_mocks.mock_get_coord_datacenters(None)
+    nodes = consul_mocks.generate_coord_nodes(9)
+    vectorized = [
+        coordinates.datacenter_latencies(datacenter[0]['Coordinates'], datacenter[1]['Coordinates']),
+        coordinates.datacenter_latencies(nodes[:4], nodes[4:]),
+    ]
+    with mock.patch.object(coordinates, 'np', None):
+        assert vectorized == [
+            coordinates.datacenter_latencies(datacenter[0]['Coordinates'], datacenter[1]['Coordinates']),
+            coordinates.datacenter_latencies(nodes[:4], nodes[4:]),
+        ]
@@ -19,7 +19,9 @@ from ..constants import ServiceCheck
 from ..utils.agent.debug import enter_pdb
 from ..utils.common import ensure_bytes, ensure_unicode
 from ..utils.http import RequestsWrapper
+from ..utils.instance import InstanceView
 from ..utils.limiter import Limiter
+from ..utils.profiling import NULL_PHASE, CheckProfiler
 from ..utils.proxy import config_proxy_skip
 
 try:
@@ -52,6 +54,19 @@ if datadog_agent.get_config('disable_unsafe_yaml'):
 # Metric types for which it's only useful to submit once per set of tags
 ONE_PER_CONTEXT_METRIC_TYPES = [aggregator.GAUGE, aggregator.RATE, aggregator.MONOTONIC_COUNT]
 
+# Metric types accepted by `submit_metrics`, by name of the corresponding submission method
+BATCH_METRIC_TYPES = {
+    'gauge': aggregator.GAUGE,
+    'count': aggregator.COUNT,
+    'monotonic_count': aggregator.MONOTONIC_COUNT,
+    'rate': aggregator.RATE,
+    'histogram': aggregator.HISTOGRAM,
+    'historate': aggregator.HISTORATE,
+}
+
+# Whether the aggregator can receive a whole batch of metric samples in one call
+AGGREGATOR_HAS_BATCH_SUBMISSION = hasattr(aggregator, 'submit_metrics')
+
 
 class __AgentCheckPy3(object):
     """
@@ -75,6 +90,13 @@ class __AgentCheckPy3(object):
     """
     DEFAULT_METRIC_LIMIT = 0
 
+    """
+    On every run, `check` is given an `InstanceView` of the instance: a mapping that deep copies values
+    on first access only, so that changes made by the check do not outlive the run. Checks relying on the
+    instance being an actual dictionary can set DEEP_COPY_INSTANCE to receive a full deep copy instead.
+    """
+    DEEP_COPY_INSTANCE = False
+
     def __init__(self, *args, **kwargs):
         """
         args: `name`, `init_config`, `agentConfig` (deprecated), `instances`
@@ -169,6 +191,15 @@ class __AgentCheckPy3(object):
         if metric_limit > 0:
             self.metric_limiter = Limiter(self.name, 'metrics', metric_limit, self.warning)
 
+        # Setup run profiling, see `profile_phase`
+        self.profiler = None
+        if self.init_config and is_affirmative(self.init_config.get('profile_check', False)):
+            self.profiler = CheckProfiler(
+                self.name,
+                dump_every=int(self.init_config.get('profile_dump_every', 0)),
+                dump_dir=self.init_config.get('profile_dump_dir'),
+            )
+
     @staticmethod
     def load_config(yaml_str):
         """
@@ -179,7 +210,7 @@ class __AgentCheckPy3(object):
     @property
     def http(self):
         if self._http is None:
-            self._http = RequestsWrapper(self.instance or {}, self.init_config, self.HTTP_CONFIG_REMAPPER)
+            self._http = RequestsWrapper(self.instance or {}, self.init_config or {}, self.HTTP_CONFIG_REMAPPER)
 
         return self._http
 
@@ -234,8 +265,106 @@ class __AgentCheckPy3(object):
             self.warning(err_msg)
             return
 
+        if self.profiler is not None:
+            self.profiler.count_sample(mtype, name, tags, hostname)
+
         aggregator.submit_metric(self, self.check_id, mtype, ensure_unicode(name), value, tags, hostname)
 
+    def submit_metrics(self, metric_type, names, values, tags=None, hostname=None, row_tags=None, row_hostnames=None):
+        """
+        Submit a batch of samples of the same metric type, validating what is common to all of them only once.
+
+        :param metric_type: one of `gauge`, `count`, `monotonic_count`, `rate`, `histogram` or `historate`
+        :param names: metric name of all the samples, or sequence with the metric name of each sample
+        :param values: sequence with the value of each sample, `None` values are ignored
+        :param tags: tags of all the samples
+        :param hostname: hostname of all the samples
+        :param row_tags: optional sequence with the additional tags of each sample
+        :param row_hostnames: optional sequence with the hostname of each sample, `None` to use `hostname`
+
+        The samples are forwarded to the aggregator in one call when it has a `submit_metrics` entry point.
+        Otherwise, e.g. with Agents predating it, they are forwarded with one `submit_metric` call each.
+        """
+        try:
+            mtype = BATCH_METRIC_TYPES[metric_type]
+        except KeyError:
+            raise ValueError(
+                'Unknown metric type `{}`, expected one of: {}'.format(
+                    metric_type, ', '.join(sorted(BATCH_METRIC_TYPES))
+                )
+            )
+
+        shared_name = isinstance(names, (text_type, bytes))
+        if shared_name:
+            name = ensure_unicode(names)
+        shared_tags = self._normalize_tags_type(tags, metric_name=names if shared_name else None)
+        hostname = '' if hostname is None else ensure_unicode(hostname)
+
+        rows = [i for i, value in enumerate(values) if value is not None]
+        limit_contexts = False
+        if self.metric_limiter:
+            if mtype in ONE_PER_CONTEXT_METRIC_TYPES:
+                # Fast path for gauges, rates, monotonic counters, assume one set of tags per sample
+                rows = rows[: self.metric_limiter.reserve(len(rows))]
+            else:
+                limit_contexts = True
+
+        batch_names = []
+        batch_values = []
+        batch_tags = []
+        batch_hostnames = []
+        for i in rows:
+            if not shared_name:
+                name = ensure_unicode(names[i])
+
+            if row_tags is None:
+                sample_tags = shared_tags
+            else:
+                sample_tags = shared_tags + self._normalize_tags_type(row_tags[i], metric_name=name)
+
+            sample_hostname = hostname
+            if row_hostnames is not None and row_hostnames[i] is not None:
+                sample_hostname = ensure_unicode(row_hostnames[i])
+
+            if limit_contexts:
+                context = self._context_uid(mtype, name, sample_tags, sample_hostname)
+                if self.metric_limiter.is_reached(context):
+                    continue
+
+            try:
+                value = float(values[i])
+            except ValueError:
+                err_msg = 'Metric: {} has non float value: {}. Only float values can be submitted as metrics.'.format(
+                    name, values[i]
+                )
+                if using_stub_aggregator:
+                    raise ValueError(err_msg)
+                self.warning(err_msg)
+                continue
+
+            batch_names.append(name)
+            batch_values.append(value)
+            batch_tags.append(sample_tags)
+            batch_hostnames.append(sample_hostname)
+
+        if not batch_values:
+            return
+
+        if self.profiler is not None:
+            for name, sample_tags, sample_hostname in zip(batch_names, batch_tags, batch_hostnames):
+                self.profiler.count_sample(mtype, name, sample_tags, sample_hostname)
+
+        if AGGREGATOR_HAS_BATCH_SUBMISSION:
+            aggregator.submit_metrics(
+                self, self.check_id, mtype, batch_names, batch_values, batch_tags, batch_hostnames
+            )
+        else:
+            # Aggregators without batch entry point: one call per sample, the validation is still done once
+            for name, value, sample_tags, sample_hostname in zip(
+                batch_names, batch_values, batch_tags, batch_hostnames
+            ):
+                aggregator.submit_metric(self, self.check_id, mtype, name, value, sample_tags, sample_hostname)
+
     def gauge(self, name, value, tags=None, hostname=None, device_name=None):
         self._submit_metric(aggregator.GAUGE, name, value, tags=tags, hostname=hostname, device_name=device_name)
 
@@ -420,9 +549,33 @@ class __AgentCheckPy3(object):
         self.warnings = []
         return warnings
 
+    def profile_phase(self, name):
+        """
+        Returns a context manager timing its block as the phase `name` of the run, when profiling
+        is enabled with `profile_check` in the init_config. It does nothing otherwise.
+        """
+        if self.profiler is None:
+            return NULL_PHASE
+        return self.profiler.phase(name)
+
+    def profile_iter(self, name, iterable):
+        """
+        Returns `iterable`, timing the production of its items as the phase `name` of the run when profiling
+        is enabled. Meant for generators, whose work is interleaved with the processing of their items.
+        """
+        if self.profiler is None:
+            return iterable
+        return self.profiler.iterate(name, iterable)
+
     def run(self):
+        if self.profiler is not None:
+            self.profiler.start_run()
+
         try:
-            instance = copy.deepcopy(self.instances[0])
+            if self.DEEP_COPY_INSTANCE:
+                instance = copy.deepcopy(self.instances[0])
+            else:
+                instance = InstanceView(self.instances[0])
 
             if 'set_breakpoint' in self.init_config:
                 enter_pdb(self.check, line=self.init_config['set_breakpoint'], args=(instance,))
@@ -433,11 +586,34 @@ class __AgentCheckPy3(object):
         except Exception as e:
             result = json.dumps([{'message': str(e), 'traceback': traceback.format_exc()}])
         finally:
+            if self.profiler is not None:
+                self._submit_profiling_metrics()
             if self.metric_limiter:
                 self.metric_limiter.reset()
 
         return result
 
+    def _submit_profiling_metrics(self):
+        # Submitted directly to the aggregator, they are neither limited nor counted by the profiler
+        for name, value, tags in self.profiler.stop_run():
+            aggregator.submit_metric(
+                self,
+                self.check_id,
+                aggregator.GAUGE,
+                ensure_unicode(name),
+                float(value),
+                [ensure_unicode(tag) for tag in tags],
+                '',
+            )
+
+        try:
+            path = self.profiler.dump_stats(self.check_id)
+        except Exception as e:
+            self.log.warning('Unable to write the profiling stats of the check: {}'.format(e))
+        else:
+            if path is not None:
+                self.log.debug('Profiling stats of the check written to {}'.format(path))
+
     def _get_requests_proxy(self):
         # TODO: Remove with Agent 5
         no_proxy_settings = {'http': None, 'https': None, 'no': []}
@@ -473,6 +649,13 @@ class __AgentCheckPy2(object):
     """
     DEFAULT_METRIC_LIMIT = 0
 
+    """
+    On every run, `check` is given an `InstanceView` of the instance: a mapping that deep copies values
+    on first access only, so that changes made by the check do not outlive the run. Checks relying on the
+    instance being an actual dictionary can set DEEP_COPY_INSTANCE to receive a full deep copy instead.
+    """
+    DEEP_COPY_INSTANCE = False
+
     # Used by `self.http` RequestsWrapper
     HTTP_CONFIG_REMAPPER = None
 
@@ -563,6 +746,15 @@ class __AgentCheckPy2(object):
         if metric_limit > 0:
             self.metric_limiter = Limiter(self.name, "metrics", metric_limit, self.warning)
 
+        # Setup run profiling, see `profile_phase`
+        self.profiler = None
+        if self.init_config and is_affirmative(self.init_config.get('profile_check', False)):
+            self.profiler = CheckProfiler(
+                self.name,
+                dump_every=int(self.init_config.get('profile_dump_every', 0)),
+                dump_dir=self.init_config.get('profile_dump_dir'),
+            )
+
     @staticmethod
     def load_config(yaml_str):
         """
@@ -573,7 +765,7 @@ class __AgentCheckPy2(object):
     @property
     def http(self):
         if self._http is None:
-            self._http = RequestsWrapper(self.instance or {}, self.init_config, self.HTTP_CONFIG_REMAPPER)
+            self._http = RequestsWrapper(self.instance or {}, self.init_config or {}, self.HTTP_CONFIG_REMAPPER)
 
         return self._http
 
@@ -628,8 +820,106 @@ class __AgentCheckPy2(object):
             self.warning(err_msg)
             return
 
+        if self.profiler is not None:
+            self.profiler.count_sample(mtype, name, tags, hostname)
+
         aggregator.submit_metric(self, self.check_id, mtype, ensure_bytes(name), value, tags, hostname)
 
+    def submit_metrics(self, metric_type, names, values, tags=None, hostname=None, row_tags=None, row_hostnames=None):
+        """
+        Submit a batch of samples of the same metric type, validating what is common to all of them only once.
+
+        :param metric_type: one of `gauge`, `count`, `monotonic_count`, `rate`, `histogram` or `historate`
+        :param names: metric name of all the samples, or sequence with the metric name of each sample
+        :param values: sequence with the value of each sample, `None` values are ignored
+        :param tags: tags of all the samples
+        :param hostname: hostname of all the samples
+        :param row_tags: optional sequence with the additional tags of each sample
+        :param row_hostnames: optional sequence with the hostname of each sample, `None` to use `hostname`
+
+        The samples are forwarded to the aggregator in one call when it has a `submit_metrics` entry point.
+        Otherwise, e.g. with Agents predating it, they are forwarded with one `submit_metric` call each.
+        """
+        try:
+            mtype = BATCH_METRIC_TYPES[metric_type]
+        except KeyError:
+            raise ValueError(
+                'Unknown metric type `{}`, expected one of: {}'.format(
+                    metric_type, ', '.join(sorted(BATCH_METRIC_TYPES))
+                )
+            )
+
+        shared_name = isinstance(names, (text_type, bytes))
+        if shared_name:
+            name = ensure_bytes(names)
+        shared_tags = self._normalize_tags_type(tags, metric_name=names if shared_name else None)
+        hostname = b'' if hostname is None else ensure_bytes(hostname)
+
+        rows = [i for i, value in enumerate(values) if value is not None]
+        limit_contexts = False
+        if self.metric_limiter:
+            if mtype in ONE_PER_CONTEXT_METRIC_TYPES:
+                # Fast path for gauges, rates, monotonic counters, assume one set of tags per sample
+                rows = rows[: self.metric_limiter.reserve(len(rows))]
+            else:
+                limit_contexts = True
+
+        batch_names = []
+        batch_values = []
+        batch_tags = []
+        batch_hostnames = []
+        for i in rows:
+            if not shared_name:
+                name = ensure_bytes(names[i])
+
+            if row_tags is None:
+                sample_tags = shared_tags
+            else:
+                sample_tags = shared_tags + self._normalize_tags_type(row_tags[i], metric_name=name)
+
+            sample_hostname = hostname
+            if row_hostnames is not None and row_hostnames[i] is not None:
+                sample_hostname = ensure_bytes(row_hostnames[i])
+
+            if limit_contexts:
+                context = self._context_uid(mtype, name, sample_tags, sample_hostname)
+                if self.metric_limiter.is_reached(context):
+                    continue
+
+            try:
+                value = float(values[i])
+            except ValueError:
+                err_msg = 'Metric: {} has non float value: {}. Only float values can be submitted as metrics.'.format(
+                    repr(name), repr(values[i])
+                )
+                if using_stub_aggregator:
+                    raise ValueError(err_msg)
+                self.warning(err_msg)
+                continue
+
+            batch_names.append(name)
+            batch_values.append(value)
+            batch_tags.append(sample_tags)
+            batch_hostnames.append(sample_hostname)
+
+        if not batch_values:
+            return
+
+        if self.profiler is not None:
+            for name, sample_tags, sample_hostname in zip(batch_names, batch_tags, batch_hostnames):
+                self.profiler.count_sample(mtype, name, sample_tags, sample_hostname)
+
+        if AGGREGATOR_HAS_BATCH_SUBMISSION:
+            aggregator.submit_metrics(
+                self, self.check_id, mtype, batch_names, batch_values, batch_tags, batch_hostnames
+            )
+        else:
+            # Aggregators without batch entry point: one call per sample, the validation is still done once
+            for name, value, sample_tags, sample_hostname in zip(
+                batch_names, batch_values, batch_tags, batch_hostnames
+            ):
+                aggregator.submit_metric(self, self.check_id, mtype, name, value, sample_tags, sample_hostname)
+
     def gauge(self, name, value, tags=None, hostname=None, device_name=None):
         self._submit_metric(aggregator.GAUGE, name, value, tags=tags, hostname=hostname, device_name=device_name)
 
@@ -836,9 +1126,33 @@ class __AgentCheckPy2(object):
         self.warnings = []
         return warnings
 
+    def profile_phase(self, name):
+        """
+        Returns a context manager timing its block as the phase `name` of the run, when profiling
+        is enabled with `profile_check` in the init_config. It does nothing otherwise.
+        """
+        if self.profiler is None:
+            return NULL_PHASE
+        return self.profiler.phase(name)
+
+    def profile_iter(self, name, iterable):
+        """
+        Returns `iterable`, timing the production of its items as the phase `name` of the run when profiling
+        is enabled. Meant for generators, whose work is interleaved with the processing of their items.
+        """
+        if self.profiler is None:
+            return iterable
+        return self.profiler.iterate(name, iterable)
+
     def run(self):
+        if self.profiler is not None:
+            self.profiler.start_run()
+
         try:
-            instance = copy.deepcopy(self.instances[0])
+            if self.DEEP_COPY_INSTANCE:
+                instance = copy.deepcopy(self.instances[0])
+            else:
+                instance = InstanceView(self.instances[0])
 
             if 'set_breakpoint' in self.init_config:
                 enter_pdb(self.check, line=self.init_config['set_breakpoint'], args=(instance,))
@@ -849,11 +1163,34 @@ class __AgentCheckPy2(object):
         except Exception as e:
             result = json.dumps([{"message": str(e), "traceback": traceback.format_exc()}])
         finally:
+            if self.profiler is not None:
+                self._submit_profiling_metrics()
             if self.metric_limiter:
                 self.metric_limiter.reset()
 
         return result
 
+    def _submit_profiling_metrics(self):
+        # Submitted directly to the aggregator, they are neither limited nor counted by the profiler
+        for name, value, tags in self.profiler.stop_run():
+            aggregator.submit_metric(
+                self,
+                self.check_id,
+                aggregator.GAUGE,
+                ensure_bytes(name),
+                float(value),
+                [ensure_bytes(tag) for tag in tags],
+                b'',
+            )
+
+        try:
+            path = self.profiler.dump_stats(self.check_id)
+        except Exception as e:
+            self.log.warning('Unable to write the profiling stats of the check: {}'.format(e))
+        else:
+            if path is not None:
+                self.log.debug('Profiling stats of the check written to {}'.format(path))
+
     def _get_requests_proxy(self):
         # TODO: Remove with Agent 5
         no_proxy_settings = {"http": None, "https": None, "no": []}
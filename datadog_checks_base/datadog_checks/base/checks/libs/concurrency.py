@@ -0,0 +1,33 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+from .thread_pool import Pool
+
+
+def run_concurrently(func, items, max_concurrency, name='Pool'):
+    """
+    Call `func` with every item of `items`, at most `max_concurrency` at the same time, in a pool of threads
+    named after `name` that is terminated before returning. The items are processed in the calling thread
+    if `max_concurrency` is 1 or less, or if there is at most one item.
+
+    Return the tuples (item, result, exception) in the order of the items: the exception raised by `func`
+    for an item is returned instead of being raised, and its result is then `None`.
+    """
+
+    def call(item):
+        try:
+            return item, func(item), None
+        except Exception as e:
+            return item, None, e
+
+    items = list(items)
+    if max_concurrency <= 1 or len(items) <= 1:
+        return [call(item) for item in items]
+
+    # The workers of the pool are not daemon threads, they must be stopped whatever happens
+    pool = Pool(min(max_concurrency, len(items)), name=name)
+    try:
+        return pool.map(call, items)
+    finally:
+        pool.terminate()
+        pool.join()
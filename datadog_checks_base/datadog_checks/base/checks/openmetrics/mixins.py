@@ -2,21 +2,54 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 
+import time
+from collections import OrderedDict, namedtuple
 from fnmatch import fnmatchcase
 from math import isinf, isnan
 
 import requests
+from prometheus_client.core import Metric
 from prometheus_client.parser import text_fd_to_metric_families
+from requests.adapters import HTTPAdapter
 from six import PY3, iteritems, itervalues, string_types
+from six.moves.urllib.parse import urlparse
 from urllib3 import disable_warnings
 from urllib3.exceptions import InsecureRequestWarning
 
 from ...config import is_affirmative
 from ...errors import CheckException
+from ...utils.prometheus import parse_metric_family as parse_protobuf_metric_family
 from .. import AgentCheck
 
 if PY3:
+    from sys import intern
+
     long = int
+else:
+    # Tags may be unicode on Python 2, which `intern` does not accept
+    def intern(tag):
+        return tag
+
+
+# How a metric family is handled, resolved once per family name and cached in the scraper config
+METRIC_HANDLER_IGNORE = 0
+METRIC_HANDLER_MAPPER = 1
+METRIC_HANDLER_TRANSFORMER = 2
+METRIC_HANDLER_WILDCARD = 3
+METRIC_HANDLER_NONE = 4
+
+# `handler` is one of the METRIC_HANDLER_* constants, `metric_name` the name to submit under
+ScrapePlanEntry = namedtuple('ScrapePlanEntry', 'handler metric_name')
+
+# Accept header of the Prometheus server, preferring the delimited protobuf format and falling back to text
+PROTOBUF_ACCEPT_HEADER = (
+    'application/vnd.google.protobuf; proto=io.prometheus.client.MetricFamily; encoding=delimited;q=0.7,'
+    'text/plain;version=0.0.4;q=0.3,*/*;q=0.1'
+)
+PROTOBUF_CONTENT_TYPE = 'application/vnd.google.protobuf'
+
+# Indexed by the values of the metrics_pb2.MetricType enum
+PROTOBUF_METRIC_TYPES = ['counter', 'gauge', 'summary', 'untyped', 'histogram']
 
 
 class OpenMetricsScraperMixin(object):
@@ -36,6 +69,10 @@ class OpenMetricsScraperMixin(object):
         # Initialize AgentCheck's base class
         super(OpenMetricsScraperMixin, self).__init__(*args, **kwargs)
 
+        # Persistent sessions, shared by the scrapers hitting the same host, see `_get_scraper_session`.
+        # Maps (scheme, host:port, pool size) to [requests.Session, last use timestamp]
+        self._scraper_sessions = {}
+
     def create_scraper_configuration(self, instance=None):
 
         # We can choose to create a default mixin configuration for an empty instance
@@ -106,27 +143,40 @@ class OpenMetricsScraperMixin(object):
         config['label_joins'].update(instance.get('label_joins', {}))
 
         # `_label_mapping` holds the additionals label info to add for a specific
-        # label value, example:
+        # label value, as found during the last scrape, example:
         # self._label_mapping = {
         #     'pod': {
-        #         'dd-agent-9s1l1': [("node","yolo"),("host_ip","yey")]
+        #         'dd-agent-9s1l1': {"node": "yolo", "host_ip": "yey"}
         #     }
         # }
         config['_label_mapping'] = {}
 
-        # `_active_label_mapping` holds a dictionary of label values found during the run
-        # to cleanup the label_mapping of unused values, example:
-        # self._active_label_mapping = {
-        #     'pod': {
-        #         'dd-agent-9s1l1': True
-        #     }
-        # }
-        config['_active_label_mapping'] = {}
+        # `_next_label_mapping` has the same structure and holds the label values found during the
+        # current scrape, their entries are moved from `_label_mapping` when found. It replaces
+        # `_label_mapping` at the end of the scrape, so that the values absent from a whole scrape
+        # are dropped without going over the mapping.
+        config['_next_label_mapping'] = {}
+
+        # Number of label values dropped from the mapping at the end of the last scrape
+        config['_label_mapping_dropped'] = 0
 
         # `_watched_labels` holds the list of label to watch for enrichment
         config['_watched_labels'] = set()
 
-        config['_dry_run'] = True
+        # Whether the label mapping is still to be built by a first scrape. During that scrape, the metric
+        # families with watched labels are held back until the whole payload has been read, so that they
+        # are submitted with the labels joined from the same payload.
+        config['_label_joins_buffering'] = True
+
+        # Maximum number of samples held back while the label mapping is built, the families beyond that
+        # are not submitted during that scrape
+        config['label_joins_buffer_size'] = int(
+            instance.get('label_joins_buffer_size', default_instance.get('label_joins_buffer_size', 100000))
+        )
+
+        # Number of samples held back and skipped during the last scrape, see `_buffer_joined_families`
+        config['_label_joins_buffered'] = 0
+        config['_label_joins_buffer_dropped'] = 0
 
         # Some metrics are ignored because they are duplicates or introduce a
         # very high cardinality. Metrics included in this list will be silently
@@ -209,12 +259,68 @@ class OpenMetricsScraperMixin(object):
         config['username'] = instance.get('username', default_instance.get('username', None))
         config['password'] = instance.get('password', default_instance.get('password', None))
 
+        # Whether to keep the connections to the endpoint open between runs. The underlying requests.Session
+        # is shared with the other scrapers of the check targeting the same host.
+        config['persist_connections'] = is_affirmative(
+            instance.get('persist_connections', default_instance.get('persist_connections', False))
+        )
+
+        # Maximum number of connections kept open to the host when `persist_connections` is set
+        config['connection_pool_size'] = int(
+            instance.get('connection_pool_size', default_instance.get('connection_pool_size', 10))
+        )
+
+        # Number of seconds after which persistent connections that were not used are closed, 0 to never close them
+        config['connection_idle_timeout'] = float(
+            instance.get('connection_idle_timeout', default_instance.get('connection_idle_timeout', 300))
+        )
+
+        # Submit metrics about the scraper itself, like the reuse of persistent connections
+        config['debug_metrics'] = is_affirmative(
+            instance.get('debug_metrics', default_instance.get('debug_metrics', False))
+        )
+
         # Custom tags that will be sent with each metric
         config['custom_tags'] = instance.get('tags', [])
 
         # Additional tags to be sent with each metric
         config['_metric_tags'] = []
 
+        # `_scrape_plan` caches how each metric family is handled, keyed by metric family name.
+        # It is filled lazily on first encounter of a family and cleared whenever the set of
+        # transformers passed to `process_metric` changes. If a check alters the mapping-related
+        # settings of a configuration that was already used, it must call `reset_scrape_plan`.
+        config['_scrape_plan'] = {}
+        config['_scrape_plan_transformers'] = None
+        config['_scrape_plan_transformer_names'] = None
+
+        # `_label_tag_names` caches the tag name to use for each label name, `None` for excluded labels
+        config['_label_tag_names'] = {}
+
+        # Maximum number of label sets whose tags are cached, 0 to disable the cache
+        config['tags_cache_size'] = int(instance.get('tags_cache_size', default_instance.get('tags_cache_size', 10000)))
+
+        # `_tags_cache` maps the frozen label set of a sample to the tuple of tags to submit it with,
+        # least recently used first. It is built on top of `custom_tags` and `_metric_tags`, whose values
+        # at the time are kept in `_tags_cache_base_tags` to detect changes and start over.
+        config['_tags_cache'] = OrderedDict()
+        config['_tags_cache_base_tags'] = ([], [])
+        config['_tags_cache_hits'] = 0
+        config['_tags_cache_misses'] = 0
+
+        # Whether to drop, while reading the text payload, the metric families that will not be submitted:
+        # families absent from `metrics_mapper`, `type_overrides`, `label_joins` and the metric transformers.
+        # Their samples are then never parsed.
+        config['skip_unused_families'] = is_affirmative(
+            instance.get('skip_unused_families', default_instance.get('skip_unused_families', False))
+        )
+
+        # Whether to ask for the protobuf exposition format, cheaper to transfer and to parse than the text format.
+        # Endpoints not supporting it answer with the text format, which is still handled.
+        config['use_protobuf_format'] = is_affirmative(
+            instance.get('use_protobuf_format', default_instance.get('use_protobuf_format', False))
+        )
+
         # List of strings to filter the input text payload on. If any line contains
         # one of these strings, it will be filtered out before being parsed.
         # INTERNAL FEATURE, might be removed in future versions
@@ -222,24 +328,89 @@ class OpenMetricsScraperMixin(object):
 
         return config
 
-    def parse_metric_family(self, response, scraper_config):
+    def parse_metric_family(self, response, scraper_config, metric_transformers=None):
         """
         Parse the MetricFamily from a valid requests.Response object to provide a MetricFamily object (see [0])
         The text format uses iter_lines() generator.
+        The protobuf format, used if requested with `use_protobuf_format` and returned by the endpoint,
+        is decoded from response.content and converted to the same core.Metric objects.
         :param response: requests.Response
+        :param metric_transformers: transformers that will process the metrics, used by `skip_unused_families`
         :return: core.Metric
         """
-        input_gen = response.iter_lines(chunk_size=self.REQUESTS_CHUNK_SIZE, decode_unicode=True)
-        if scraper_config['_text_filter_blacklist']:
-            input_gen = self._text_filter_input(input_gen, scraper_config)
+        if scraper_config['use_protobuf_format'] and PROTOBUF_CONTENT_TYPE in response.headers.get('Content-Type', ''):
+            metric_families = self._parse_protobuf_input(response.content, scraper_config, metric_transformers)
+        else:
+            metric_families = self._parse_text_input(response, scraper_config, metric_transformers)
 
-        for metric in text_fd_to_metric_families(input_gen):
+        for metric in metric_families:
             metric.type = scraper_config['type_overrides'].get(metric.name, metric.type)
             if metric.type not in self.METRIC_TYPES:
                 continue
             metric.name = self._remove_metric_prefix(metric.name, scraper_config)
             yield metric
 
+    def _parse_text_input(self, response, scraper_config, metric_transformers=None):
+        input_gen = response.iter_lines(chunk_size=self.REQUESTS_CHUNK_SIZE, decode_unicode=True)
+        if scraper_config['_text_filter_blacklist']:
+            input_gen = self._text_filter_input(input_gen, scraper_config)
+        if scraper_config['skip_unused_families']:
+            input_gen = self._text_filter_unused_families(input_gen, scraper_config, metric_transformers)
+
+        return text_fd_to_metric_families(input_gen)
+
+    def _parse_protobuf_input(self, content, scraper_config, metric_transformers=None):
+        """
+        Converts the delimited protobuf MetricFamily messages of the payload to core.Metric objects, with
+        the same samples the text parser would produce for the equivalent text payload
+        """
+        skip_unused_families = scraper_config['skip_unused_families']
+        for message in parse_protobuf_metric_family(content):
+            if skip_unused_families and not self._is_family_used(message.name, scraper_config, metric_transformers):
+                continue
+            yield self._protobuf_to_metric(message)
+
+    def _protobuf_to_metric(self, message):
+        name = message.name
+        metric_type = PROTOBUF_METRIC_TYPES[message.type]
+        metric = Metric(name, message.help, metric_type)
+        samples = metric.samples
+        for m in message.metric:
+            labels = {label.name: label.value for label in m.label}
+            if metric_type == 'counter':
+                samples.append((name, labels, m.counter.value))
+            elif metric_type == 'gauge':
+                samples.append((name, labels, m.gauge.value))
+            elif metric_type == 'untyped':
+                samples.append((name, labels, m.untyped.value))
+            elif metric_type == 'summary':
+                for quantile in m.summary.quantile:
+                    quantile_labels = dict(labels, quantile=self._format_protobuf_float(quantile.quantile))
+                    samples.append((name, quantile_labels, quantile.value))
+                samples.append((name + '_sum', labels, m.summary.sample_sum))
+                samples.append((name + '_count', labels, float(m.summary.sample_count)))
+            elif metric_type == 'histogram':
+                infinite_bucket = False
+                for bucket in m.histogram.bucket:
+                    infinite_bucket = isinf(bucket.upper_bound)
+                    bucket_labels = dict(labels, le=self._format_protobuf_float(bucket.upper_bound))
+                    samples.append((name + '_bucket', bucket_labels, float(bucket.cumulative_count)))
+                # The text format always exposes the +Inf bucket, protobuf payloads may omit it
+                if not infinite_bucket:
+                    samples.append((name + '_bucket', dict(labels, le='+Inf'), float(m.histogram.sample_count)))
+                samples.append((name + '_sum', labels, m.histogram.sample_sum))
+                samples.append((name + '_count', labels, float(m.histogram.sample_count)))
+        return metric
+
+    @staticmethod
+    def _format_protobuf_float(value):
+        """
+        Formats quantiles and bucket bounds the way they appear as label values in the text format
+        """
+        if isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+
     def _text_filter_input(self, input_gen, scraper_config):
         """
         Filters out the text input line by line to avoid parsing and processing
@@ -256,38 +427,155 @@ class OpenMetricsScraperMixin(object):
                 # No blacklist matches, passing the line through
                 yield line
 
+    def _text_filter_unused_families(self, input_gen, scraper_config, metric_transformers=None):
+        """
+        Filters out the text input of whole metric families that would not be submitted. Families are
+        identified by their `# HELP`/`# TYPE` headers, so the samples of skipped families are only compared
+        to the family name and never parsed.
+        :param input_gen: line generator
+        :param metric_transformers: transformers that will process the metrics
+        :output: generator of filtered lines
+        """
+        # Name of the family whose lines are currently skipped, if any
+        skipped_family = None
+        for line in input_gen:
+            if line.startswith('#'):
+                parts = line.split(None, 3)
+                if len(parts) > 2 and parts[1] in ('HELP', 'TYPE'):
+                    if parts[2] == skipped_family:
+                        continue
+                    if self._is_family_used(parts[2], scraper_config, metric_transformers):
+                        skipped_family = None
+                    else:
+                        skipped_family = parts[2]
+                        continue
+            elif skipped_family is not None and line:
+                if self._is_family_sample(line, skipped_family):
+                    continue
+                # Samples without headers are parsed as their own untyped family
+                skipped_family = None
+                sample_name = line.split('{', 1)[0].split(None, 1)[0]
+                if not self._is_family_used(sample_name, scraper_config, metric_transformers):
+                    continue
+            yield line
+
+    @staticmethod
+    def _is_family_sample(line, family):
+        """
+        Whether a sample line belongs to the given metric family, following the text format naming rules
+        """
+        if not line.startswith(family):
+            return False
+        end = len(family)
+        if line[end : end + 1] in ('{', ' ', '\t'):
+            return True
+        for suffix in ('_bucket', '_count', '_sum'):
+            if line.startswith(suffix, end) and line[end + len(suffix) : end + len(suffix) + 1] in ('{', ' ', '\t'):
+                return True
+        return False
+
+    def _is_family_used(self, family, scraper_config, metric_transformers=None):
+        """
+        Whether a metric family, named as in the payload, would be used by `process_metric`
+        """
+        if family in scraper_config['type_overrides']:
+            return True
+        metric_name = self._remove_metric_prefix(family, scraper_config)
+        if metric_name in scraper_config['label_joins']:
+            return True
+        handler = self._get_scrape_plan_entry(metric_name, scraper_config, metric_transformers).handler
+        return handler != METRIC_HANDLER_IGNORE and handler != METRIC_HANDLER_NONE
+
     def _remove_metric_prefix(self, metric, scraper_config):
         prometheus_metrics_prefix = scraper_config['prometheus_metrics_prefix']
         return metric[len(prometheus_metrics_prefix) :] if metric.startswith(prometheus_metrics_prefix) else metric
 
-    def scrape_metrics(self, scraper_config):
+    def scrape_metrics(self, scraper_config, metric_transformers=None):
         """
         Poll the data from prometheus and return the metrics as a generator.
         """
-        response = self.poll(scraper_config)
+        with self.profile_phase('http_fetch'):
+            response = self.poll(scraper_config)
         try:
-            # no dry run if no label joins
-            if not scraper_config['label_joins']:
-                scraper_config['_dry_run'] = False
-            elif not scraper_config['_watched_labels']:
+            if scraper_config['label_joins'] and not scraper_config['_watched_labels']:
                 # build the _watched_labels set
                 for val in itervalues(scraper_config['label_joins']):
                     scraper_config['_watched_labels'].add(val['label_to_match'])
 
-            for metric in self.parse_metric_family(response, scraper_config):
+            # The payload is read from the response while being parsed
+            metrics = self.parse_metric_family(response, scraper_config, metric_transformers)
+            metrics = self.profile_iter('parse', metrics)
+            if scraper_config['label_joins'] and scraper_config['_label_joins_buffering']:
+                metrics = self._buffer_joined_families(metrics, scraper_config, metric_transformers)
+            for metric in metrics:
                 yield metric
 
-            # Set dry run off
-            scraper_config['_dry_run'] = False
-            # Garbage collect unused mapping and reset active labels
-            for metric, mapping in list(iteritems(scraper_config['_label_mapping'])):
-                for key in list(mapping):
-                    if key not in scraper_config['_active_label_mapping'][metric]:
-                        del scraper_config['_label_mapping'][metric][key]
-            scraper_config['_active_label_mapping'] = {}
+            scraper_config['_label_joins_buffering'] = False
+            # Start the mapping of the next scrape, dropping the label values that were not found
+            scraper_config['_label_mapping_dropped'] = sum(
+                len(values) for values in itervalues(scraper_config['_label_mapping'])
+            )
+            scraper_config['_label_mapping'] = scraper_config['_next_label_mapping']
+            scraper_config['_next_label_mapping'] = {}
         finally:
             response.close()
 
+    def _buffer_joined_families(self, metrics, scraper_config, metric_transformers=None):
+        """
+        Yields the metric families, holding back until the end of the payload the submitted ones that have
+        watched labels, so that the labels of all the join targets of the payload are known when they are
+        processed. At most `label_joins_buffer_size` samples are held back, the families beyond that are
+        skipped for this scrape.
+        :param metrics: metric families generator
+        :param metric_transformers: transformers that will process the metrics
+        :output: generator of metric families
+        """
+        label_joins = scraper_config['label_joins']
+        watched_labels = scraper_config['_watched_labels']
+        buffer_size = scraper_config['label_joins_buffer_size']
+
+        buffered = []
+        buffered_samples = 0
+        dropped_samples = 0
+        for metric in metrics:
+            handler = self._get_scrape_plan_entry(metric.name, scraper_config, metric_transformers).handler
+            if (
+                metric.name in label_joins
+                or handler == METRIC_HANDLER_IGNORE
+                or handler == METRIC_HANDLER_NONE
+                or not self._has_watched_labels(metric, watched_labels)
+            ):
+                yield metric
+                continue
+
+            sample_count = len(metric.samples)
+            if buffered_samples + sample_count > buffer_size:
+                dropped_samples += sample_count
+                continue
+            buffered.append(metric)
+            buffered_samples += sample_count
+
+        if dropped_samples:
+            self.log.warning(
+                "Skipped {} samples with joined labels from {} while building the label mapping, "
+                "increase `label_joins_buffer_size` to submit them".format(
+                    dropped_samples, scraper_config['prometheus_url']
+                )
+            )
+        scraper_config['_label_joins_buffered'] = buffered_samples
+        scraper_config['_label_joins_buffer_dropped'] = dropped_samples
+
+        for metric in buffered:
+            yield metric
+
+    def _has_watched_labels(self, metric, watched_labels):
+        for sample in metric.samples:
+            labels = sample[self.SAMPLE_LABELS]
+            for label_name in watched_labels:
+                if label_name in labels:
+                    return True
+        return False
+
     def process(self, scraper_config, metric_transformers=None):
         """
         Polls the data from prometheus and pushes them as gauges
@@ -296,13 +584,57 @@ class OpenMetricsScraperMixin(object):
         Note that if the instance has a 'tags' attribute, it will be pushed
         automatically as additional custom tags and added to the metrics
         """
-        for metric in self.scrape_metrics(scraper_config):
-            self.process_metric(metric, scraper_config, metric_transformers=metric_transformers)
+        for metric in self.scrape_metrics(scraper_config, metric_transformers):
+            with self.profile_phase('submission'):
+                self.process_metric(metric, scraper_config, metric_transformers=metric_transformers)
+
+        if scraper_config['debug_metrics']:
+            self._submit_tags_cache_metrics(scraper_config)
+            if scraper_config['label_joins']:
+                self._submit_label_joins_metrics(scraper_config)
+
+    def _submit_tags_cache_metrics(self, scraper_config):
+        namespace = scraper_config['namespace']
+        tags = ['endpoint:{}'.format(scraper_config['prometheus_url'])]
+        tags.extend(scraper_config['custom_tags'])
+        self.count('{}.prometheus.tags_cache.hits'.format(namespace), scraper_config['_tags_cache_hits'], tags=tags)
+        self.count('{}.prometheus.tags_cache.misses'.format(namespace), scraper_config['_tags_cache_misses'], tags=tags)
+        self.gauge('{}.prometheus.tags_cache.size'.format(namespace), len(scraper_config['_tags_cache']), tags=tags)
+        scraper_config['_tags_cache_hits'] = 0
+        scraper_config['_tags_cache_misses'] = 0
+
+    def _submit_label_joins_metrics(self, scraper_config):
+        namespace = scraper_config['namespace']
+        tags = ['endpoint:{}'.format(scraper_config['prometheus_url'])]
+        tags.extend(scraper_config['custom_tags'])
+        for label_name, values in iteritems(scraper_config['_label_mapping']):
+            self.gauge(
+                '{}.prometheus.label_joins.index_size'.format(namespace),
+                len(values),
+                tags=tags + ['label:{}'.format(label_name)],
+            )
+        self.count(
+            '{}.prometheus.label_joins.dropped'.format(namespace), scraper_config['_label_mapping_dropped'], tags=tags
+        )
+        self.gauge(
+            '{}.prometheus.label_joins.buffered'.format(namespace), scraper_config['_label_joins_buffered'], tags=tags
+        )
+        self.count(
+            '{}.prometheus.label_joins.buffer_dropped'.format(namespace),
+            scraper_config['_label_joins_buffer_dropped'],
+            tags=tags,
+        )
+        scraper_config['_label_joins_buffered'] = 0
+        scraper_config['_label_joins_buffer_dropped'] = 0
 
     def _store_labels(self, metric, scraper_config):
         # If targeted metric, store labels
         if metric.name in scraper_config['label_joins']:
-            matching_label = scraper_config['label_joins'][metric.name]['label_to_match']
+            label_join = scraper_config['label_joins'][metric.name]
+            matching_label = label_join['label_to_match']
+            labels_to_get = label_join['labels_to_get']
+            next_mapping = scraper_config['_next_label_mapping'].setdefault(matching_label, {})
+            mapping = scraper_config['_label_mapping'].get(matching_label, {})
             for sample in metric.samples:
                 # metadata-only metrics that are used for label joins are always equal to 1
                 # this is required for metrics where all combinations of a state are sent
@@ -310,40 +642,101 @@ class OpenMetricsScraperMixin(object):
                 # example: kube_pod_status_phase in kube-state-metrics
                 if sample[self.SAMPLE_VALUE] != 1:
                     continue
-                label_dict = dict()
-                matching_value = None
-                for label_name, label_value in iteritems(sample[self.SAMPLE_LABELS]):
-                    if label_name == matching_label:
-                        matching_value = label_value
-                    elif label_name in scraper_config['label_joins'][metric.name]['labels_to_get']:
-                        label_dict[label_name] = label_value
-                try:
-                    if scraper_config['_label_mapping'][matching_label].get(matching_value):
-                        scraper_config['_label_mapping'][matching_label][matching_value].update(label_dict)
-                    else:
-                        scraper_config['_label_mapping'][matching_label][matching_value] = label_dict
-                except KeyError:
-                    if matching_value is not None:
-                        scraper_config['_label_mapping'][matching_label] = {matching_value: label_dict}
+                labels = sample[self.SAMPLE_LABELS]
+                matching_value = labels.get(matching_label)
+                if matching_value is None:
+                    continue
+                label_dict = {label_name: labels[label_name] for label_name in labels_to_get if label_name in labels}
+
+                joined_labels = next_mapping.get(matching_value)
+                if joined_labels is None:
+                    joined_labels = mapping.pop(matching_value, None)
+                    if joined_labels is None:
+                        next_mapping[matching_value] = label_dict
+                        continue
+                    next_mapping[matching_value] = joined_labels
+                joined_labels.update(label_dict)
 
     def _join_labels(self, metric, scraper_config):
         # Filter metric to see if we can enrich with joined labels
-        if scraper_config['label_joins']:
-            for sample in metric.samples:
-                watched_labels = scraper_config['_watched_labels'].intersection(set(sample[self.SAMPLE_LABELS].keys()))
-                for label_name in watched_labels:
-                    # Set this label value as active
-                    if label_name not in scraper_config['_active_label_mapping']:
-                        scraper_config['_active_label_mapping'][label_name] = {}
-                    scraper_config['_active_label_mapping'][label_name][sample[self.SAMPLE_LABELS][label_name]] = True
-                    # If mapping found add corresponding labels
-                    try:
-                        for name, val in iteritems(
-                            scraper_config['_label_mapping'][label_name][sample[self.SAMPLE_LABELS][label_name]]
-                        ):
-                            sample[self.SAMPLE_LABELS][name] = val
-                    except KeyError:
-                        pass
+        if not scraper_config['label_joins']:
+            return
+
+        # The mappings of the watched labels are resolved once for the whole metric family
+        watched_mappings = []
+        for label_name in scraper_config['_watched_labels']:
+            watched_mappings.append(
+                (
+                    label_name,
+                    scraper_config['_next_label_mapping'].setdefault(label_name, {}),
+                    scraper_config['_label_mapping'].get(label_name, {}),
+                )
+            )
+
+        for sample in metric.samples:
+            labels = sample[self.SAMPLE_LABELS]
+            for label_name, next_mapping, mapping in watched_mappings:
+                label_value = labels.get(label_name)
+                if label_value is None:
+                    continue
+                # If mapping found add corresponding labels, keeping it for the next scrape
+                joined_labels = next_mapping.get(label_value)
+                if joined_labels is None:
+                    joined_labels = mapping.pop(label_value, None)
+                    if joined_labels is None:
+                        continue
+                    next_mapping[label_value] = joined_labels
+                labels.update(joined_labels)
+
+    def reset_scrape_plan(self, scraper_config):
+        """
+        Forget the cached handling of metric families and labels, to be called after changing
+        `metrics_mapper`, `ignore_metrics`, `labels_mapper` or `exclude_labels` of a configuration in use.
+        """
+        scraper_config['_scrape_plan'] = {}
+        scraper_config['_scrape_plan_transformers'] = None
+        scraper_config['_scrape_plan_transformer_names'] = None
+        scraper_config['_label_tag_names'] = {}
+        scraper_config['_tags_cache'].clear()
+
+    def _get_scrape_plan_entry(self, metric_name, scraper_config, metric_transformers):
+        # Checks may build a new transformers dict on every run, only drop the plan if its content changed
+        if metric_transformers is not scraper_config['_scrape_plan_transformers']:
+            transformer_names = None if metric_transformers is None else frozenset(metric_transformers)
+            if transformer_names != scraper_config['_scrape_plan_transformer_names']:
+                scraper_config['_scrape_plan'] = {}
+                scraper_config['_scrape_plan_transformer_names'] = transformer_names
+            scraper_config['_scrape_plan_transformers'] = metric_transformers
+
+        try:
+            return scraper_config['_scrape_plan'][metric_name]
+        except KeyError:
+            entry = self._build_scrape_plan_entry(metric_name, scraper_config, metric_transformers)
+            scraper_config['_scrape_plan'][metric_name] = entry
+            return entry
+
+    def _build_scrape_plan_entry(self, metric_name, scraper_config, metric_transformers):
+        if metric_name in scraper_config['ignore_metrics']:
+            return ScrapePlanEntry(METRIC_HANDLER_IGNORE, None)
+
+        if metric_name in scraper_config['metrics_mapper']:
+            return ScrapePlanEntry(METRIC_HANDLER_MAPPER, scraper_config['metrics_mapper'][metric_name])
+
+        if metric_transformers is not None:
+            if metric_name in metric_transformers:
+                return ScrapePlanEntry(METRIC_HANDLER_TRANSFORMER, metric_name)
+            return ScrapePlanEntry(METRIC_HANDLER_NONE, None)
+
+        # build the wildcard list if first pass
+        if scraper_config['_metrics_wildcards'] is None:
+            scraper_config['_metrics_wildcards'] = [x for x in scraper_config['metrics_mapper'] if '*' in x]
+
+        # try matching wildcard (generic check)
+        for wildcard in scraper_config['_metrics_wildcards']:
+            if fnmatchcase(metric_name, wildcard):
+                return ScrapePlanEntry(METRIC_HANDLER_WILDCARD, metric_name)
+
+        return ScrapePlanEntry(METRIC_HANDLER_NONE, None)
 
     def process_metric(self, metric, scraper_config, metric_transformers=None):
         """
@@ -352,45 +745,33 @@ class OpenMetricsScraperMixin(object):
             - call check method with the same name as the metric
             - log some info if none of the above worked
 
+        The outcome of this flow only depends on the metric name and is cached in scraper_config['_scrape_plan'].
+
         `metric_transformers` is a dict of <metric name>:<function to run when the metric name is encountered>
         """
         # If targeted metric, store labels
         self._store_labels(metric, scraper_config)
 
-        if metric.name in scraper_config['ignore_metrics']:
+        plan_entry = self._get_scrape_plan_entry(metric.name, scraper_config, metric_transformers)
+        if plan_entry.handler == METRIC_HANDLER_IGNORE:
             return  # Ignore the metric
 
         # Filter metric to see if we can enrich with joined labels
         self._join_labels(metric, scraper_config)
 
-        if scraper_config['_dry_run']:
-            return
-
-        try:
-            self.submit_openmetric(scraper_config['metrics_mapper'][metric.name], metric, scraper_config)
-        except KeyError:
-            if metric_transformers is not None:
-                if metric.name in metric_transformers:
-                    try:
-                        # Get the transformer function for this specific metric
-                        transformer = metric_transformers[metric.name]
-                        transformer(metric, scraper_config)
-                    except Exception as err:
-                        self.log.warning("Error handling metric: {} - error: {}".format(metric.name, err))
-                else:
-                    self.log.debug(
-                        "Unable to handle metric: {0} - error: "
-                        "No handler function named '{0}' defined".format(metric.name)
-                    )
-            else:
-                # build the wildcard list if first pass
-                if scraper_config['_metrics_wildcards'] is None:
-                    scraper_config['_metrics_wildcards'] = [x for x in scraper_config['metrics_mapper'] if '*' in x]
-
-                # try matching wildcard (generic check)
-                for wildcard in scraper_config['_metrics_wildcards']:
-                    if fnmatchcase(metric.name, wildcard):
-                        self.submit_openmetric(metric.name, metric, scraper_config)
+        if plan_entry.handler == METRIC_HANDLER_MAPPER or plan_entry.handler == METRIC_HANDLER_WILDCARD:
+            self.submit_openmetric(plan_entry.metric_name, metric, scraper_config)
+        elif plan_entry.handler == METRIC_HANDLER_TRANSFORMER:
+            try:
+                # Get the transformer function for this specific metric
+                transformer = metric_transformers[metric.name]
+                transformer(metric, scraper_config)
+            except Exception as err:
+                self.log.warning("Error handling metric: {} - error: {}".format(metric.name, err))
+        elif metric_transformers is not None:
+            self.log.debug(
+                "Unable to handle metric: {0} - error: No handler function named '{0}' defined".format(metric.name)
+            )
 
     def poll(self, scraper_config, headers=None):
         """
@@ -439,6 +820,8 @@ class OpenMetricsScraperMixin(object):
             headers = {}
         if 'accept-encoding' not in headers:
             headers['accept-encoding'] = 'gzip'
+        if scraper_config['use_protobuf_format'] and 'accept' not in headers:
+            headers['accept'] = PROTOBUF_ACCEPT_HEADER
         headers.update(scraper_config['extra_headers'])
 
         # Determine the SSL verification settings
@@ -464,7 +847,22 @@ class OpenMetricsScraperMixin(object):
         password = scraper_config['password']
         auth = (username, password) if username is not None and password is not None else None
 
-        return requests.get(
+        if not scraper_config['persist_connections']:
+            return requests.get(
+                endpoint,
+                headers=headers,
+                stream=True,
+                timeout=scraper_config['prometheus_timeout'],
+                cert=cert,
+                verify=verify,
+                auth=auth,
+            )
+
+        session = self._get_scraper_session(endpoint, scraper_config)
+        if scraper_config['debug_metrics']:
+            connections_before, requests_before = self._get_session_stats(session)
+
+        response = session.get(
             endpoint,
             headers=headers,
             stream=True,
@@ -474,6 +872,65 @@ class OpenMetricsScraperMixin(object):
             auth=auth,
         )
 
+        if scraper_config['debug_metrics']:
+            connections_after, requests_after = self._get_session_stats(session)
+            opened = connections_after - connections_before
+            reused = max(requests_after - requests_before - opened, 0)
+            tags = ['endpoint:{}'.format(endpoint)]
+            tags.extend(scraper_config['custom_tags'])
+            self.count('{}.prometheus.connections.opened'.format(scraper_config['namespace']), opened, tags=tags)
+            self.count('{}.prometheus.connections.reused'.format(scraper_config['namespace']), reused, tags=tags)
+
+        return response
+
+    def _get_scraper_session(self, endpoint, scraper_config):
+        """
+        Returns the persistent requests.Session to use for the endpoint, shared between all the scrapers
+        of the check hitting the same host. Sessions unused for more than `connection_idle_timeout` seconds
+        are closed and replaced, as their connections have most likely been dropped by the server.
+        """
+        parsed_endpoint = urlparse(endpoint)
+        key = (parsed_endpoint.scheme, parsed_endpoint.netloc, scraper_config['connection_pool_size'])
+        now = time.time()
+
+        entry = self._scraper_sessions.get(key)
+        if entry is not None:
+            session, last_used = entry
+            idle_timeout = scraper_config['connection_idle_timeout']
+            if idle_timeout and now - last_used > idle_timeout:
+                self.log.debug(
+                    "Closing connections to {} idle for {:.0f}s".format(parsed_endpoint.netloc, now - last_used)
+                )
+                session.close()
+                entry = None
+
+        if entry is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=scraper_config['connection_pool_size'])
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            entry = [session, now]
+            self._scraper_sessions[key] = entry
+        else:
+            entry[1] = now
+
+        return entry[0]
+
+    @staticmethod
+    def _get_session_stats(session):
+        """
+        Returns the number of connections opened and requests made by the connection pools of a session
+        """
+        connections = 0
+        requests_made = 0
+        for adapter in set(itervalues(session.adapters)):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                connections += pool.num_connections
+                requests_made += pool.num_requests
+        return connections, requests_made
+
     def get_hostname_for_sample(self, sample, scraper_config):
         """
         Expose the label_to_hostname mapping logic to custom handler methods
@@ -536,6 +993,9 @@ class OpenMetricsScraperMixin(object):
         """
         Extracts metrics from a prometheus summary metric and sends them as gauges
         """
+        sum_metric_name = '{}.{}.sum'.format(scraper_config['namespace'], metric_name)
+        count_metric_name = '{}.{}.count'.format(scraper_config['namespace'], metric_name)
+        quantile_metric_name = '{}.{}.quantile'.format(scraper_config['namespace'], metric_name)
         for sample in metric.samples:
             val = sample[self.SAMPLE_VALUE]
             if not self._is_value_valid(val):
@@ -544,34 +1004,21 @@ class OpenMetricsScraperMixin(object):
             custom_hostname = self._get_hostname(hostname, sample, scraper_config)
             if sample[self.SAMPLE_NAME].endswith("_sum"):
                 tags = self._metric_tags(metric_name, val, sample, scraper_config, hostname=custom_hostname)
-                self.gauge(
-                    "{}.{}.sum".format(scraper_config['namespace'], metric_name),
-                    val,
-                    tags=tags,
-                    hostname=custom_hostname,
-                )
+                self.gauge(sum_metric_name, val, tags=tags, hostname=custom_hostname)
             elif sample[self.SAMPLE_NAME].endswith("_count"):
                 tags = self._metric_tags(metric_name, val, sample, scraper_config, hostname=custom_hostname)
-                self.gauge(
-                    "{}.{}.count".format(scraper_config['namespace'], metric_name),
-                    val,
-                    tags=tags,
-                    hostname=custom_hostname,
-                )
+                self.gauge(count_metric_name, val, tags=tags, hostname=custom_hostname)
             else:
                 sample[self.SAMPLE_LABELS]["quantile"] = float(sample[self.SAMPLE_LABELS]["quantile"])
                 tags = self._metric_tags(metric_name, val, sample, scraper_config, hostname=custom_hostname)
-                self.gauge(
-                    "{}.{}.quantile".format(scraper_config['namespace'], metric_name),
-                    val,
-                    tags=tags,
-                    hostname=custom_hostname,
-                )
+                self.gauge(quantile_metric_name, val, tags=tags, hostname=custom_hostname)
 
     def _submit_gauges_from_histogram(self, metric_name, metric, scraper_config, hostname=None):
         """
         Extracts metrics from a prometheus histogram and sends them as gauges
         """
+        sum_metric_name = '{}.{}.sum'.format(scraper_config['namespace'], metric_name)
+        count_metric_name = '{}.{}.count'.format(scraper_config['namespace'], metric_name)
         for sample in metric.samples:
             val = sample[self.SAMPLE_VALUE]
             if not self._is_value_valid(val):
@@ -580,20 +1027,10 @@ class OpenMetricsScraperMixin(object):
             custom_hostname = self._get_hostname(hostname, sample, scraper_config)
             if sample[self.SAMPLE_NAME].endswith("_sum"):
                 tags = self._metric_tags(metric_name, val, sample, scraper_config, hostname)
-                self.gauge(
-                    "{}.{}.sum".format(scraper_config['namespace'], metric_name),
-                    val,
-                    tags=tags,
-                    hostname=custom_hostname,
-                )
+                self.gauge(sum_metric_name, val, tags=tags, hostname=custom_hostname)
             elif sample[self.SAMPLE_NAME].endswith("_count"):
                 tags = self._metric_tags(metric_name, val, sample, scraper_config, hostname)
-                self.gauge(
-                    "{}.{}.count".format(scraper_config['namespace'], metric_name),
-                    val,
-                    tags=tags,
-                    hostname=custom_hostname,
-                )
+                self.gauge(count_metric_name, val, tags=tags, hostname=custom_hostname)
             elif (
                 scraper_config['send_histograms_buckets']
                 and sample[self.SAMPLE_NAME].endswith("_bucket")
@@ -601,24 +1038,75 @@ class OpenMetricsScraperMixin(object):
             ):
                 sample[self.SAMPLE_LABELS]["le"] = float(sample[self.SAMPLE_LABELS]["le"])
                 tags = self._metric_tags(metric_name, val, sample, scraper_config, hostname)
-                self.gauge(
-                    "{}.{}.count".format(scraper_config['namespace'], metric_name),
-                    val,
-                    tags=tags,
-                    hostname=custom_hostname,
-                )
+                self.gauge(count_metric_name, val, tags=tags, hostname=custom_hostname)
 
     def _metric_tags(self, metric_name, val, sample, scraper_config, hostname=None):
         custom_tags = scraper_config['custom_tags']
-        _tags = list(custom_tags)
-        _tags.extend(scraper_config['_metric_tags'])
-        for label_name, label_value in iteritems(sample[self.SAMPLE_LABELS]):
-            if label_name not in scraper_config['exclude_labels']:
-                tag_name = scraper_config['labels_mapper'].get(label_name, label_name)
-                _tags.append('{}:{}'.format(tag_name, label_value))
+        labels = sample[self.SAMPLE_LABELS]
+        if self.profiler is not None:
+            with self.profiler.phase('tag_building'):
+                _tags = self._get_label_tags(labels, scraper_config)
+        else:
+            _tags = self._get_label_tags(labels, scraper_config)
         return self._finalize_tags_to_submit(
             _tags, metric_name, val, sample, custom_tags=custom_tags, hostname=hostname
         )
 
+    def _get_label_tags(self, labels, scraper_config):
+        if scraper_config['tags_cache_size'] > 0:
+            return list(self._get_cached_label_tags(labels, scraper_config))
+        return self._build_label_tags(labels, scraper_config)
+
+    def _get_cached_label_tags(self, labels, scraper_config):
+        """
+        Return the tuple of tags for a label set from the `_tags_cache` LRU, building it on a miss
+        """
+        cache = scraper_config['_tags_cache']
+        base_tags = scraper_config['_tags_cache_base_tags']
+        if base_tags[0] != scraper_config['custom_tags'] or base_tags[1] != scraper_config['_metric_tags']:
+            cache.clear()
+            scraper_config['_tags_cache_base_tags'] = (
+                list(scraper_config['custom_tags']),
+                list(scraper_config['_metric_tags']),
+            )
+
+        key = frozenset(iteritems(labels))
+        try:
+            # Re-inserted below to mark it as the most recently used
+            tags = cache.pop(key)
+            scraper_config['_tags_cache_hits'] += 1
+        except KeyError:
+            tags = tuple(self._build_label_tags(labels, scraper_config))
+            scraper_config['_tags_cache_misses'] += 1
+            if len(cache) >= scraper_config['tags_cache_size']:
+                cache.popitem(last=False)
+        cache[key] = tags
+        return tags
+
+    def _build_label_tags(self, labels, scraper_config):
+        _tags = list(scraper_config['custom_tags'])
+        _tags.extend(scraper_config['_metric_tags'])
+        label_tag_names = scraper_config['_label_tag_names']
+        for label_name, label_value in iteritems(labels):
+            try:
+                tag_name = label_tag_names[label_name]
+            except KeyError:
+                tag_name = self._get_label_tag_name(label_name, scraper_config)
+            if tag_name is not None:
+                # The same label values show up in many label sets, share a single string
+                _tags.append(intern('{}:{}'.format(tag_name, label_value)))
+        return _tags
+
+    def _get_label_tag_name(self, label_name, scraper_config):
+        """
+        Resolve the tag name for a label according to `exclude_labels` and `labels_mapper` and cache it
+        """
+        if label_name in scraper_config['exclude_labels']:
+            tag_name = None
+        else:
+            tag_name = scraper_config['labels_mapper'].get(label_name, label_name)
+        scraper_config['_label_tag_names'][label_name] = tag_name
+        return tag_name
+
     def _is_value_valid(self, val):
         return not (isnan(val) or isinf(val))
@@ -47,6 +47,10 @@ class AggregatorStub(object):
     def submit_metric(self, check, check_id, mtype, name, value, tags, hostname):
         self._metrics[name].append(MetricStub(name, mtype, value, tags, hostname))
 
+    def submit_metrics(self, check, check_id, mtype, names, values, tags, hostnames):
+        for name, value, sample_tags, hostname in zip(names, values, tags, hostnames):
+            self._metrics[name].append(MetricStub(name, mtype, value, sample_tags, hostname))
+
     def submit_service_check(self, check, check_id, name, status, tags, hostname, message):
         self._service_checks[name].append(ServiceCheckStub(check_id, name, status, tags, hostname, message))
 
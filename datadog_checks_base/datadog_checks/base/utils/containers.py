@@ -1,18 +1,23 @@
 # (C) Datadog, Inc. 2010-2019
 # All rights reserved
 # Licensed under Simplified BSD License (see LICENSE)
-from six import iteritems
+from six import PY3, iteritems
+
+if PY3:
+    from collections.abc import Mapping
+else:
+    from collections import Mapping
 
 
 def freeze(o):
     """
     Freezes any mutable object including dictionaries and lists for hashing.
-    Accepts nested dictionaries.
+    Accepts nested dictionaries and other mappings, e.g. the `InstanceView` given to `check`.
     """
     if isinstance(o, (tuple, list)):
         return tuple(sorted(freeze(e) for e in o))
 
-    if isinstance(o, dict):
+    if isinstance(o, Mapping):
         return tuple(sorted((k, freeze(v)) for k, v in iteritems(o)))
 
     if isinstance(o, (set, frozenset)):
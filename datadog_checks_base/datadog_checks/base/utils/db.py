@@ -0,0 +1,223 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+from contextlib import closing
+from time import time as timestamp
+
+from ..errors import ConfigurationError
+
+# Number of rows fetched at once from the cursors of custom queries
+DEFAULT_CHUNK_SIZE = 1000
+
+# Column types submitting their value with the corresponding method of the check
+SUBMISSION_METHODS = ('gauge', 'count', 'monotonic_count', 'rate', 'histogram', 'historate')
+
+
+class Query(object):
+    """
+    A custom query compiled into the plan of its columns: the metrics to submit and the tags to add,
+    with the index of their value in the rows returned by the query.
+    """
+
+    __slots__ = ('metric_prefix', 'query', 'column_count', 'metric_columns', 'tag_columns', 'tags')
+
+    def __init__(self, metric_prefix, query, column_count, metric_columns, tag_columns, tags):
+        self.metric_prefix = metric_prefix
+        self.query = query
+        self.column_count = column_count
+        # (index, column name, metric name, submission method name)
+        self.metric_columns = metric_columns
+        # (index, tag prefix)
+        self.tag_columns = tag_columns
+        self.tags = tags
+
+    @classmethod
+    def compile(cls, custom_query):
+        """
+        Compile the configuration of a custom query: a mapping with the `metric_prefix`, `query`,
+        `columns` and optional `tags` options. Raise a `ConfigurationError` if it is invalid.
+        """
+        metric_prefix = custom_query.get('metric_prefix')
+        if not metric_prefix:
+            raise ConfigurationError('custom query field `metric_prefix` is required')
+        metric_prefix = metric_prefix.rstrip('.')
+
+        query = custom_query.get('query')
+        if not query:
+            raise ConfigurationError(
+                'custom query field `query` is required for metric_prefix `{}`'.format(metric_prefix)
+            )
+
+        columns = custom_query.get('columns')
+        if not columns:
+            raise ConfigurationError(
+                'custom query field `columns` is required for metric_prefix `{}`'.format(metric_prefix)
+            )
+
+        metric_columns = []
+        tag_columns = []
+        for index, column in enumerate(columns):
+            # Columns can be ignored via configuration.
+            if not column:
+                continue
+
+            name = column.get('name')
+            if not name:
+                raise ConfigurationError('column field `name` is required for metric_prefix `{}`'.format(metric_prefix))
+
+            column_type = column.get('type')
+            if not column_type:
+                raise ConfigurationError(
+                    'column field `type` is required for column `{}` of metric_prefix `{}`'.format(name, metric_prefix)
+                )
+
+            if column_type == 'tag':
+                tag_columns.append((index, '{}:'.format(name)))
+            elif column_type in SUBMISSION_METHODS:
+                metric_columns.append((index, name, '{}.{}'.format(metric_prefix, name), column_type))
+            else:
+                raise ConfigurationError(
+                    'invalid submission method `{}` for column `{}` of metric_prefix `{}`'.format(
+                        column_type, name, metric_prefix
+                    )
+                )
+
+        tags = list(custom_query.get('tags') or [])
+
+        return cls(metric_prefix, query, len(columns), metric_columns, tag_columns, tags)
+
+
+class QueryManager(object):
+    """
+    Runs the custom queries of a check and submits the metrics of every row they return.
+
+    The queries are compiled once when the manager is created, invalid ones are logged and skipped.
+    They are run by an `executor`, a callable taking a query and returning an iterable of its rows,
+    like the ones returned by `cursor_executor` for DB-API connections.
+
+    If `stats_namespace` is set, the execution time in seconds and the number of rows of every query
+    are submitted as the `<stats_namespace>.custom_queries.execution_time` and `.rows` gauges,
+    tagged by `metric_prefix`.
+    """
+
+    def __init__(self, check, custom_queries, stats_namespace=None):
+        self.check = check
+        self.stats_namespace = stats_namespace
+        self.queries = []
+
+        for custom_query in custom_queries or []:
+            try:
+                self.queries.append(Query.compile(custom_query))
+            except ConfigurationError as e:
+                check.log.error(str(e))
+
+    def execute(self, executor, tags=None):
+        """
+        Run all the queries with `executor`, `tags` are added to all the metrics.
+        """
+        for query in self.queries:
+            self.execute_query(executor, query, tags)
+
+    def execute_query(self, executor, query, tags=None):
+        log = self.check.log
+        metric_prefix = query.metric_prefix
+        base_tags = list(tags or []) + query.tags
+        submit = {method: getattr(self.check, method) for _, _, _, method in query.metric_columns}
+
+        log.debug('Running query for metric_prefix `{}`: {}'.format(metric_prefix, query.query))
+        start_time = timestamp()
+        row_count = 0
+        rows = None
+        try:
+            rows = executor(query.query)
+            for row in rows:
+                row_count += 1
+                if not row:
+                    log.debug('query result for metric_prefix {}: returned an empty result'.format(metric_prefix))
+                    continue
+
+                if len(row) != query.column_count:
+                    log.error(
+                        'query result for metric_prefix {}: expected {} columns, got {}'.format(
+                            metric_prefix, query.column_count, len(row)
+                        )
+                    )
+                    continue
+
+                values = []
+                for index, name, metric, method in query.metric_columns:
+                    value = row[index]
+                    try:
+                        values.append((method, metric, float(value)))
+                    except (ValueError, TypeError):
+                        log.error(
+                            'non-numeric value `{}` for metric column `{}` of metric_prefix `{}`'.format(
+                                value, name, metric_prefix
+                            )
+                        )
+                        break
+
+                # Only submit metrics if there were absolutely no errors - all or nothing.
+                else:
+                    if query.tag_columns:
+                        row_tags = base_tags + [
+                            '{}{}'.format(prefix, row[index]) for index, prefix in query.tag_columns
+                        ]
+                    else:
+                        row_tags = base_tags
+
+                    for method, metric, value in values:
+                        submit[method](metric, value, tags=row_tags)
+        except Exception as e:
+            log.error('Error executing query for metric_prefix {}: {}'.format(metric_prefix, e))
+            return
+        finally:
+            # Release the cursor of the query even if its rows were not all consumed
+            close = getattr(rows, 'close', None)
+            if close is not None:
+                close()
+
+        execution_time = timestamp() - start_time
+        log.debug(
+            'Query for metric_prefix `{}` returned {} rows in {:.3f}s'.format(metric_prefix, row_count, execution_time)
+        )
+        if self.stats_namespace:
+            stats_tags = base_tags + ['metric_prefix:{}'.format(metric_prefix)]
+            self.check.gauge(
+                '{}.custom_queries.execution_time'.format(self.stats_namespace), execution_time, tags=stats_tags
+            )
+            self.check.gauge('{}.custom_queries.rows'.format(self.stats_namespace), row_count, tags=stats_tags)
+
+
+def iter_cursor(cursor, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the rows of an executed DB-API cursor, fetching at most `chunk_size` of them at once.
+    """
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+
+        for row in rows:
+            yield row
+
+
+def cursor_executor(connection, chunk_size=DEFAULT_CHUNK_SIZE, on_error=None):
+    """
+    Return an executor for `QueryManager` running every query on a new cursor of a DB-API `connection`.
+    `on_error` is called with the exception raised by a query before it is logged, e.g. to roll back.
+    """
+
+    def execute(query):
+        with closing(connection.cursor()) as cursor:
+            try:
+                cursor.execute(query)
+            except Exception as e:
+                if on_error is not None:
+                    on_error(e)
+                raise
+
+            for row in iter_cursor(cursor, chunk_size):
+                yield row
+
+    return execute
@@ -0,0 +1,95 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+from copy import deepcopy
+
+from six import PY3, binary_type, integer_types, text_type
+
+if PY3:
+    from collections.abc import MutableMapping
+else:
+    from collections import MutableMapping
+
+# Values that can be handed out without copying them first
+IMMUTABLE_TYPES = (text_type, binary_type, bool, float, type(None)) + integer_types
+
+
+class InstanceView(MutableMapping):
+    """
+    InstanceView gives a check run its own version of an instance without copying it upfront.
+
+    Values are deep copied the first time they are accessed, unless they are immutable,
+    and the copy is then returned by later accesses. Assignments and deletions are only
+    applied to the view. The instance itself is thus never modified through the view,
+    like with a deep copy, while the values that are never read are never copied.
+    """
+
+    __slots__ = ('_instance', '_values', '_deleted')
+
+    def __init__(self, instance):
+        self._instance = instance
+        # Copies of the accessed values and assigned values
+        self._values = {}
+        # Keys of the instance deleted from the view
+        self._deleted = set()
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+
+        if key in self._deleted:
+            raise KeyError(key)
+
+        value = self._instance[key]
+        if isinstance(value, IMMUTABLE_TYPES):
+            return value
+
+        value = self._values[key] = deepcopy(value)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self._values or (key in self._instance and key not in self._deleted)
+
+    def __setitem__(self, key, value):
+        self._values[key] = value
+        self._deleted.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+
+        self._values.pop(key, None)
+        if key in self._instance:
+            self._deleted.add(key)
+
+    def __iter__(self):
+        for key in self._instance:
+            if key not in self._deleted:
+                yield key
+
+        for key in self._values:
+            if key not in self._instance:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __deepcopy__(self, memo):
+        return deepcopy(dict(self), memo)
+
+    def copy(self):
+        """
+        Returns a shallow copy of the view as a dictionary, like `dict.copy`
+        """
+        return dict(self)
@@ -67,6 +67,32 @@ class Limiter(object):
             return True
         return False
 
+    def reserve(self, count):
+        """
+        reserve counts `count` new objects at once towards the limit, it is equivalent to
+        calling is_reached without uid for each of them, and stopping at the first refusal.
+
+        :param count: number of new objects
+        :returns: integer, how many of these objects are accepted
+        """
+        if self.reached_limit:
+            return 0
+
+        accepted = min(count, max(self.limit - self.count, 0))
+        self.count += accepted
+
+        if accepted < count:
+            # The object hitting the limit is counted too, like with is_reached
+            self.count += 1
+            if self.warning:
+                self.warning(
+                    "Check {} exceeded limit of {} {}, ignoring next ones".format(
+                        self.check_name, self.limit, self.name
+                    )
+                )
+            self.reached_limit = True
+        return accepted
+
     def get_status(self):
         """
         Returns the internal state of the limiter for unit tests
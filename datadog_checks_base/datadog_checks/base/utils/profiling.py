@@ -0,0 +1,157 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import cProfile
+import os
+import re
+import tempfile
+import time
+from collections import defaultdict
+
+from six import iteritems
+
+# Characters not allowed in the name of pstats files, check ids contain colons for instance
+FILENAME_UNSAFE_CHARS = re.compile(r'[^a-zA-Z0-9_.-]+')
+
+
+class _NullPhase(object):
+    """
+    Context manager doing nothing, used in place of a phase when profiling is disabled
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.phase_times[self.name] += time.time() - self.start
+        return False
+
+
+class CheckProfiler(object):
+    """
+    CheckProfiler collects, for each run of a check, its wall time, the time spent in named phases
+    and the number of metric samples and contexts submitted. It is used by the AgentCheck class
+    when `profile_check` is set in the init_config.
+
+    Every `dump_every` runs, the run is also profiled with cProfile and the stats are written
+    to `<dump_dir>/<check id>.pstats`, overwriting the previous ones.
+    """
+
+    def __init__(self, check_name, dump_every=0, dump_dir=None):
+        """
+        :param check_name: name of the profiled check
+        :param dump_every: number of runs between two cProfile dumps, 0 to never dump
+        :param dump_dir: directory to write the dumps to, defaults to the temporary directory
+        """
+        self.check_name = check_name
+        self.dump_every = dump_every
+        self.dump_dir = dump_dir or tempfile.gettempdir()
+
+        self.runs = 0
+        self.run_start = None
+        self.phase_times = defaultdict(float)
+        self.submitted = 0
+        self.contexts = set()
+        self.cprofile = None
+
+    def phase(self, name):
+        """
+        Returns a context manager adding the wall time of its block to the time of the phase `name`.
+        Phases can be nested, the time of a nested phase also counts in the enclosing one.
+        """
+        return _Phase(self, name)
+
+    def iterate(self, name, iterable):
+        """
+        Yields the items of `iterable`, adding the time spent producing them to the phase `name`.
+        This is meant for generators, whose work is interleaved with the processing of their items.
+        """
+        phase_times = self.phase_times
+        iterator = iter(iterable)
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                phase_times[name] += time.time() - start
+                return
+            phase_times[name] += time.time() - start
+            yield item
+
+    def count_sample(self, mtype, name, tags, hostname):
+        self.submitted += 1
+        self.contexts.add((mtype, name, frozenset(tags), hostname))
+
+    def start_run(self):
+        self.runs += 1
+        self.phase_times.clear()
+        self.submitted = 0
+        self.contexts.clear()
+
+        if self.dump_every and self.runs % self.dump_every == 0:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+        self.run_start = time.time()
+
+    def stop_run(self):
+        """
+        Ends the current run.
+
+        :returns: list of (metric name, value, tags) to submit as gauges
+        """
+        run_time = time.time() - self.run_start
+
+        if self.cprofile is not None:
+            self.cprofile.disable()
+
+        tags = ['check_name:{}'.format(self.check_name)]
+        metrics = [
+            ('datadog.agent.check.run.time', run_time, tags),
+            ('datadog.agent.check.metrics.submitted', self.submitted, tags),
+            ('datadog.agent.check.metrics.contexts', len(self.contexts), tags),
+        ]
+        for phase, phase_time in sorted(iteritems(self.phase_times)):
+            metrics.append(('datadog.agent.check.phase.time', phase_time, tags + ['phase:{}'.format(phase)]))
+
+        self.contexts.clear()
+        return metrics
+
+    def dump_stats(self, check_id=None):
+        """
+        Writes the cProfile stats of the last run, if it was profiled.
+
+        :param check_id: id of the check instance, used to name the dump
+        :returns: the path of the dump, `None` if the last run was not profiled
+        """
+        if self.cprofile is None:
+            return
+
+        cprofile = self.cprofile
+        self.cprofile = None
+
+        filename = '{}.pstats'.format(FILENAME_UNSAFE_CHARS.sub('_', check_id or self.check_name))
+        path = os.path.join(self.dump_dir, filename)
+        cprofile.dump_stats(path)
+        return path
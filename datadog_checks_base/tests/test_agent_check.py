@@ -7,7 +7,8 @@ import mock
 import pytest
 from six import PY3
 
-from datadog_checks.base import AgentCheck
+from datadog_checks.base import AgentCheck, ensure_bytes
+from datadog_checks.base.utils.containers import hash_mutable
 
 
 def test_instance():
@@ -31,6 +32,41 @@ def test_load_config():
     assert AgentCheck.load_config("raw_foo: bar") == {'raw_foo': 'bar'}
 
 
+class MutatingCheck(AgentCheck):
+    def check(self, instance):
+        self.instance_type = type(instance)
+        instance['tags'].append('run:{}'.format(len(instance['tags'])))
+        instance['error'] = 'message'
+        self.gauge('metric', 1, tags=instance['tags'])
+
+
+@pytest.mark.parametrize('deep_copy_instance', [False, True])
+def test_run_does_not_modify_instance(aggregator, deep_copy_instance):
+    check = MutatingCheck('test', {}, [{'tags': ['foo:bar']}])
+    check.DEEP_COPY_INSTANCE = deep_copy_instance
+    check.run()
+    check.run()
+
+    assert (check.instance_type is dict) is deep_copy_instance
+    assert check.instances == [{'tags': ['foo:bar']}]
+    aggregator.assert_metric('metric', tags=['foo:bar', 'run:1'], count=2)
+
+
+class HashingCheck(AgentCheck):
+    def check(self, instance):
+        self.instance_hash = hash_mutable(instance)
+
+
+@pytest.mark.parametrize('deep_copy_instance', [False, True])
+def test_run_hash_instance(deep_copy_instance):
+    instance = {'tags': ['foo:bar'], 'nested': {'list': [1, 2]}}
+    check = HashingCheck('test', {}, [instance])
+    check.DEEP_COPY_INSTANCE = deep_copy_instance
+    check.run()
+
+    assert check.instance_hash == hash_mutable(instance)
+
+
 def test_log_critical_error():
     check = AgentCheck()
 
@@ -107,6 +143,87 @@ class TestMetrics:
             check.gauge(metric_name, '85k')
         aggregator.assert_metric(metric_name, count=0)
 
+    def test_submit_metrics(self, aggregator):
+        check = AgentCheck()
+        check.submit_metrics(
+            'gauge',
+            ['metric.a', 'metric.b', 'metric.c'],
+            [1, None, '3.5'],
+            tags=['shared:tag'],
+            hostname='host',
+            row_tags=[['row:0'], ['row:1'], [b'row:2']],
+            row_hostnames=[None, None, 'other_host'],
+        )
+
+        aggregator.assert_metric('metric.a', 1, tags=['shared:tag', 'row:0'], hostname='host', count=1)
+        aggregator.assert_metric('metric.b', count=0)
+        aggregator.assert_metric('metric.c', 3.5, tags=['shared:tag', 'row:2'], hostname='other_host', count=1)
+        aggregator.assert_all_metrics_covered()
+
+    def test_submit_metrics_shared_name(self, aggregator):
+        check = AgentCheck()
+        check.submit_metrics('monotonic_count', 'metric', [1, 2], tags=['shared:tag'])
+
+        aggregator.assert_metric('metric', 1, tags=['shared:tag'], metric_type=aggregator.MONOTONIC_COUNT, count=1)
+        aggregator.assert_metric('metric', 2, tags=['shared:tag'], metric_type=aggregator.MONOTONIC_COUNT, count=1)
+
+    def test_submit_metrics_non_float_value(self, aggregator):
+        check = AgentCheck()
+        with pytest.raises(ValueError):
+            check.submit_metrics('gauge', 'metric', [1, '85k'])
+
+    def test_submit_metrics_unknown_type(self, aggregator):
+        check = AgentCheck()
+        with pytest.raises(ValueError):
+            check.submit_metrics('set', 'metric', [1])
+
+    def test_submit_metrics_without_batch_aggregator(self, aggregator):
+        check = AgentCheck()
+        with mock.patch('datadog_checks.base.checks.base.AGGREGATOR_HAS_BATCH_SUBMISSION', False):
+            with mock.patch.object(aggregator, 'submit_metrics') as submit_metrics:
+                check.submit_metrics('rate', 'metric', [1, 2])
+
+        submit_metrics.assert_not_called()
+        aggregator.assert_metric('metric', metric_type=aggregator.RATE, count=2)
+
+    @pytest.mark.parametrize('batch_submission', [True, False])
+    def test_submit_metrics_forwarded(self, aggregator, batch_submission):
+        check = AgentCheck()
+        expected = [
+            ('metric.a', 1.0, ['shared:tag', 'row:0'], 'host'),
+            ('metric.b', 2.0, ['shared:tag', 'row:1'], 'other_host'),
+        ]
+        if not PY3:
+            expected = [
+                (ensure_bytes(n), v, [ensure_bytes(t) for t in tags], ensure_bytes(h)) for n, v, tags, h in expected
+            ]
+
+        with mock.patch('datadog_checks.base.checks.base.AGGREGATOR_HAS_BATCH_SUBMISSION', batch_submission):
+            with mock.patch.object(aggregator, 'submit_metrics') as submit_metrics, mock.patch.object(
+                aggregator, 'submit_metric'
+            ) as submit_metric:
+                check.submit_metrics(
+                    'gauge',
+                    [u'metric.a', b'metric.b'],
+                    [1, '2'],
+                    tags=[u'shared:tag'],
+                    hostname=b'host',
+                    row_tags=[[b'row:0'], [u'row:1']],
+                    row_hostnames=[None, b'other_host'],
+                )
+
+        if batch_submission:
+            submit_metric.assert_not_called()
+            submit_metrics.assert_called_once_with(
+                check, check.check_id, aggregator.GAUGE, *[list(column) for column in zip(*expected)]
+            )
+        else:
+            submit_metrics.assert_not_called()
+            assert submit_metric.call_args_list == [
+                mock.call(check, check.check_id, aggregator.GAUGE, name, value, tags, hostname)
+                for name, value, tags, hostname in expected
+            ]
+
 
 class TestEvents:
     def test_valid_event(self, aggregator):
@@ -289,6 +406,28 @@ class TestLimits:
         assert len(check.get_warnings()) == 1
         assert len(aggregator.metrics("metric")) == 29
 
+    def test_metric_limit_submit_metrics_gauges(self, aggregator):
+        check = LimitedCheck()
+
+        check.submit_metrics('gauge', 'metric', [0] * 8)
+        assert len(check.get_warnings()) == 0
+        check.submit_metrics('gauge', 'metric', [0] * 8)
+        assert len(check.get_warnings()) == 1
+        assert len(aggregator.metrics("metric")) == 10
+
+    def test_metric_limit_submit_metrics_count(self, aggregator):
+        check = LimitedCheck()
+
+        # Multiple samples for a single set of (metric_name, tags) should not trigger
+        check.submit_metrics('count', 'metric', [0] * 20, hostname='host-single')
+        assert len(check.get_warnings()) == 0
+        assert len(aggregator.metrics("metric")) == 20
+
+        # Only 9 new sets of tags should pass through
+        check.submit_metrics('count', 'metric', [0] * 20, row_hostnames=['host-{}'.format(i) for i in range(20)])
+        assert len(check.get_warnings()) == 1
+        assert len(aggregator.metrics("metric")) == 29
+
     def test_metric_limit_instance_config(self, aggregator):
         instances = [{"max_returned_metrics": 42}]
         check = AgentCheck("test", {}, instances)
@@ -312,3 +451,58 @@ class TestLimits:
             check.gauge("metric", 0)
         assert len(check.get_warnings()) == 1  # get_warnings resets the array
         assert len(aggregator.metrics("metric")) == 10
+
+
+class ProfiledCheck(AgentCheck):
+    def check(self, instance):
+        with self.profile_phase('fetch'):
+            values = list(self.profile_iter('parse', iter([1, 2, 3])))
+        with self.profile_phase('submission'):
+            self.gauge('metric', values[0], tags=['foo:bar'])
+            self.gauge('metric', values[1], tags=['foo:bar'])
+            self.submit_metrics('gauge', 'other_metric', values, tags=['foo:bar'])
+
+
+class TestProfiling:
+    def test_disabled(self, aggregator):
+        check = ProfiledCheck('test', {}, [{}])
+        assert check.profiler is None
+        check.run()
+
+        aggregator.assert_metric('metric', count=2)
+        aggregator.assert_metric('other_metric', count=3)
+        assert not [name for name in aggregator.metric_names if name.startswith('datadog.agent.check.')]
+
+    def test_run_metrics(self, aggregator):
+        check = ProfiledCheck('test', {'profile_check': True}, [{}])
+        check.run()
+
+        tags = ['check_name:test']
+        aggregator.assert_metric('datadog.agent.check.run.time', tags=tags, count=1)
+        aggregator.assert_metric('datadog.agent.check.metrics.submitted', 5, tags=tags, count=1)
+        aggregator.assert_metric('datadog.agent.check.metrics.contexts', 2, tags=tags, count=1)
+        for phase in ('fetch', 'parse', 'submission'):
+            aggregator.assert_metric('datadog.agent.check.phase.time', tags=tags + ['phase:' + phase], count=1)
+
+        # Counters start over on every run
+        aggregator.reset()
+        check.run()
+        aggregator.assert_metric('datadog.agent.check.metrics.submitted', 5, tags=tags, count=1)
+
+    def test_run_metrics_on_error(self, aggregator):
+        check = AgentCheck('test', {'profile_check': True}, [{}])
+        assert check.run() != ''
+
+        aggregator.assert_metric('datadog.agent.check.run.time', count=1)
+        aggregator.assert_metric('datadog.agent.check.metrics.submitted', 0, count=1)
+
+    def test_dump_stats(self, aggregator, tmpdir):
+        init_config = {'profile_check': True, 'profile_dump_every': 2, 'profile_dump_dir': str(tmpdir)}
+        check = ProfiledCheck('test', init_config, [{}])
+        check.check_id = 'test:123'
+
+        check.run()
+        assert tmpdir.listdir() == []
+
+        check.run()
+        assert [path.basename for path in tmpdir.listdir()] == ['test_123.pstats']
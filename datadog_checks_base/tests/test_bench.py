@@ -0,0 +1,62 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import pytest
+
+from datadog_checks.checks.openmetrics import OpenMetricsBaseCheck
+
+PAYLOAD = '# TYPE metric_0 gauge\nmetric_0{label_0="value"} 1\n'
+
+
+class MockResponse:
+    headers = {'Content-Type': 'text/plain'}
+
+    @staticmethod
+    def iter_lines(**_):
+        return iter(PAYLOAD.split('\n'))
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(scope='module')
+def large_instance():
+    """
+    An openmetrics instance with large metrics, labels mapping and label joins configurations
+    """
+    return {
+        'prometheus_url': 'http://localhost:10249/metrics',
+        'namespace': 'bench',
+        'metrics': [{'metric_{}'.format(i): 'metric.{}'.format(i)} for i in range(2000)],
+        'labels_mapper': {'label_{}'.format(i): 'tag_{}'.format(i) for i in range(200)},
+        'label_joins': {
+            'info_{}'.format(i): {'label_to_match': 'label_{}'.format(i), 'labels_to_get': ['extra']}
+            for i in range(100)
+        },
+        'exclude_labels': ['excluded_{}'.format(i) for i in range(100)],
+        'tags': ['tag_{}:value'.format(i) for i in range(20)],
+    }
+
+
+def run_check(benchmark, instance, deep_copy_instance):
+    class BenchCheck(OpenMetricsBaseCheck):
+        DEEP_COPY_INSTANCE = deep_copy_instance
+
+        def poll(self, scraper_config, headers=None):
+            return MockResponse()
+
+    check = BenchCheck('bench', {}, {}, [instance])
+    assert check.run() == ''
+
+    benchmark(check.run)
+
+
+def test_run_deep_copy_instance(benchmark, large_instance):
+    run_check(benchmark, large_instance, True)
+
+
+def test_run_instance_view(benchmark, large_instance):
+    run_check(benchmark, large_instance, False)
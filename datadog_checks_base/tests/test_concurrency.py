@@ -0,0 +1,64 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import threading
+
+import mock
+import pytest
+
+from datadog_checks.base.checks.libs.concurrency import run_concurrently
+
+
+@pytest.mark.parametrize('max_concurrency', [1, 4])
+def test_run_concurrently(max_concurrency):
+    error = Exception('not authorized')
+
+    def func(item):
+        if item == 'forbidden':
+            raise error
+        return item.upper()
+
+    results = run_concurrently(func, ['foo', 'forbidden', 'bar', 'baz'], max_concurrency)
+
+    assert results == [('foo', 'FOO', None), ('forbidden', None, error), ('bar', 'BAR', None), ('baz', 'BAZ', None)]
+
+
+def test_run_concurrently_threads():
+    barrier = threading.Event()
+    running = []
+    lock = threading.Lock()
+
+    def func(item):
+        with lock:
+            running.append(item)
+            if len(running) == 2:
+                barrier.set()
+        # Only returns once two items are processed at the same time
+        assert barrier.wait(5)
+        return threading.current_thread().name
+
+    results = run_concurrently(func, [1, 2], 2, name='test')
+
+    assert [e for _, _, e in results] == [None, None]
+    assert all(thread_name.startswith('Worker-test-') for _, thread_name, _ in results)
+    # The workers are stopped
+    assert not any(thread.name.startswith('Worker-test-') for thread in threading.enumerate())
+
+
+@pytest.mark.parametrize('max_concurrency, items', [(1, [1, 2]), (4, [1]), (4, [])])
+def test_run_concurrently_inline(max_concurrency, items):
+    with mock.patch('datadog_checks.base.checks.libs.concurrency.Pool') as pool:
+        results = run_concurrently(lambda item: item * 2, items, max_concurrency)
+
+    pool.assert_not_called()
+    assert results == [(item, item * 2, None) for item in items]
+
+
+def test_run_concurrently_pool_size():
+    with mock.patch('datadog_checks.base.checks.libs.concurrency.Pool') as pool:
+        pool.return_value.map.return_value = []
+        run_concurrently(lambda item: item, [1, 2, 3], 10, name='test')
+
+    pool.assert_called_once_with(3, name='test')
+    pool.return_value.terminate.assert_called_once_with()
+    pool.return_value.join.assert_called_once_with()
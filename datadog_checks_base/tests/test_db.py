@@ -0,0 +1,206 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import mock
+import pytest
+
+from datadog_checks.base import AgentCheck, ConfigurationError
+from datadog_checks.base.utils.db import Query, QueryManager, cursor_executor, iter_cursor
+
+
+class FakeCursor(object):
+    def __init__(self, rows, error=None):
+        self.rows = list(rows)
+        self.error = error
+        self.executed = []
+        self.fetch_sizes = []
+        self.closed = False
+
+    def execute(self, query):
+        self.executed.append(query)
+        if self.error is not None:
+            raise self.error
+
+    def fetchmany(self, size):
+        self.fetch_sizes.append(size)
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection(object):
+    def __init__(self, *cursors):
+        self.cursors = list(cursors)
+
+    def cursor(self):
+        return self.cursors.pop(0)
+
+
+class TestQuery:
+    def test_compile(self):
+        custom_query = {
+            'metric_prefix': 'foo.',
+            'query': 'SELECT a, b, c, d',
+            'columns': [
+                {'name': 'a', 'type': 'tag'},
+                None,
+                {'name': 'c', 'type': 'gauge'},
+                {'name': 'd', 'type': 'rate'},
+            ],
+            'tags': ['query:tag'],
+        }
+        query = Query.compile(custom_query)
+
+        assert query.metric_prefix == 'foo'
+        assert query.query == 'SELECT a, b, c, d'
+        assert query.column_count == 4
+        assert query.metric_columns == [(2, 'c', 'foo.c', 'gauge'), (3, 'd', 'foo.d', 'rate')]
+        assert query.tag_columns == [(0, 'a:')]
+        assert query.tags == ['query:tag']
+        assert query.tags is not custom_query['tags']
+
+    @pytest.mark.parametrize(
+        'custom_query, message',
+        [
+            ({}, 'custom query field `metric_prefix` is required'),
+            ({'metric_prefix': 'foo'}, 'custom query field `query` is required for metric_prefix `foo`'),
+            (
+                {'metric_prefix': 'foo', 'query': 'q'},
+                'custom query field `columns` is required for metric_prefix `foo`',
+            ),
+            (
+                {'metric_prefix': 'foo', 'query': 'q', 'columns': [{'type': 'gauge'}]},
+                'column field `name` is required for metric_prefix `foo`',
+            ),
+            (
+                {'metric_prefix': 'foo', 'query': 'q', 'columns': [{'name': 'bar'}]},
+                'column field `type` is required for column `bar` of metric_prefix `foo`',
+            ),
+            (
+                {'metric_prefix': 'foo', 'query': 'q', 'columns': [{'name': 'bar', 'type': 'check'}]},
+                'invalid submission method `check` for column `bar` of metric_prefix `foo`',
+            ),
+        ],
+    )
+    def test_compile_invalid(self, custom_query, message):
+        with pytest.raises(ConfigurationError) as excinfo:
+            Query.compile(custom_query)
+
+        assert str(excinfo.value) == message
+
+
+class TestQueryManager:
+    def test_execute(self, aggregator):
+        check = AgentCheck('test', {}, [{}])
+        custom_queries = [
+            {
+                'metric_prefix': 'foo',
+                'query': 'SELECT name, value, total',
+                'columns': [{'name': 'name', 'type': 'tag'}, {'name': 'value', 'type': 'gauge'}, {}],
+                'tags': ['query:foo'],
+            },
+            {
+                'metric_prefix': 'bar',
+                'query': 'SELECT total',
+                'columns': [{'name': 'total', 'type': 'monotonic_count'}],
+            },
+        ]
+        foo_cursor = FakeCursor([('a', 1, 10), ('b', '2.5', 20), ('c', 3, 30)])
+        bar_cursor = FakeCursor([(5,)])
+        connection = FakeConnection(foo_cursor, bar_cursor)
+
+        QueryManager(check, custom_queries).execute(cursor_executor(connection, chunk_size=2), tags=['test:db'])
+
+        aggregator.assert_metric('foo.value', 1, count=1, tags=['test:db', 'query:foo', 'name:a'])
+        aggregator.assert_metric('foo.value', 2.5, count=1, tags=['test:db', 'query:foo', 'name:b'])
+        aggregator.assert_metric('foo.value', 3, count=1, tags=['test:db', 'query:foo', 'name:c'])
+        aggregator.assert_metric('bar.total', 5, count=1, tags=['test:db'], metric_type=aggregator.MONOTONIC_COUNT)
+        aggregator.assert_all_metrics_covered()
+
+        assert foo_cursor.executed == ['SELECT name, value, total']
+        assert foo_cursor.fetch_sizes == [2, 2, 2]
+        assert foo_cursor.closed
+        assert bar_cursor.closed
+        # The configuration is left untouched
+        assert custom_queries[0]['tags'] == ['query:foo']
+
+    def test_execute_stats(self, aggregator):
+        check = AgentCheck('test', {}, [{}])
+        custom_queries = [{'metric_prefix': 'foo', 'query': 'q', 'columns': [{'name': 'value', 'type': 'gauge'}]}]
+        executor = mock.MagicMock(return_value=[(1,), (2,)])
+
+        QueryManager(check, custom_queries, stats_namespace='test').execute(executor, tags=['test:db'])
+
+        executor.assert_called_once_with('q')
+        tags = ['test:db', 'metric_prefix:foo']
+        aggregator.assert_metric('test.custom_queries.execution_time', count=1, tags=tags)
+        aggregator.assert_metric('test.custom_queries.rows', 2, count=1, tags=tags)
+        aggregator.assert_metric('foo.value', count=2, tags=['test:db'])
+
+    def test_invalid_queries_skipped(self, aggregator):
+        check = AgentCheck('test', {}, [{}])
+        check.log = mock.MagicMock()
+        custom_queries = [
+            {'metric_prefix': 'foo', 'query': 'q'},
+            {'metric_prefix': 'bar', 'query': 'q', 'columns': [{'name': 'value', 'type': 'gauge'}]},
+        ]
+
+        query_manager = QueryManager(check, custom_queries)
+
+        check.log.error.assert_called_once_with('custom query field `columns` is required for metric_prefix `foo`')
+        assert [query.metric_prefix for query in query_manager.queries] == ['bar']
+
+    def test_invalid_rows(self, aggregator):
+        check = AgentCheck('test', {}, [{}])
+        check.log = mock.MagicMock()
+        custom_queries = [
+            {
+                'metric_prefix': 'foo',
+                'query': 'q',
+                'columns': [{'name': 'name', 'type': 'tag'}, {'name': 'value', 'type': 'gauge'}],
+            }
+        ]
+        executor = mock.MagicMock(return_value=[('a', 1, 2), (), ('b', 'NaN?'), ('c', None), ('d', 4)])
+
+        QueryManager(check, custom_queries).execute(executor)
+
+        check.log.error.assert_has_calls(
+            [
+                mock.call('query result for metric_prefix foo: expected 2 columns, got 3'),
+                mock.call('non-numeric value `NaN?` for metric column `value` of metric_prefix `foo`'),
+                mock.call('non-numeric value `None` for metric column `value` of metric_prefix `foo`'),
+            ]
+        )
+        check.log.debug.assert_any_call('query result for metric_prefix foo: returned an empty result')
+        aggregator.assert_metric('foo.value', 4, count=1, tags=['name:d'])
+        aggregator.assert_all_metrics_covered()
+
+    def test_query_error(self, aggregator):
+        check = AgentCheck('test', {}, [{}])
+        check.log = mock.MagicMock()
+        on_error = mock.MagicMock()
+        error = Exception('syntax error')
+        failing_cursor = FakeCursor([], error=error)
+        cursor = FakeCursor([(1,)])
+        connection = FakeConnection(failing_cursor, cursor)
+        custom_queries = [
+            {'metric_prefix': 'foo', 'query': 'q', 'columns': [{'name': 'value', 'type': 'gauge'}]},
+            {'metric_prefix': 'bar', 'query': 'q', 'columns': [{'name': 'value', 'type': 'gauge'}]},
+        ]
+
+        QueryManager(check, custom_queries).execute(cursor_executor(connection, on_error=on_error))
+
+        on_error.assert_called_once_with(error)
+        check.log.error.assert_called_once_with('Error executing query for metric_prefix foo: syntax error')
+        assert failing_cursor.closed
+        aggregator.assert_metric('bar.value', 1, count=1)
+        aggregator.assert_all_metrics_covered()
+
+
+def test_iter_cursor():
+    cursor = FakeCursor(range(5))
+
+    assert list(iter_cursor(cursor, 2)) == [0, 1, 2, 3, 4]
+    assert cursor.fetch_sizes == [2, 2, 2, 2]
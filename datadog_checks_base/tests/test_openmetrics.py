@@ -4,16 +4,23 @@
 import logging
 import math
 import os
+import threading
+import time
 
 import mock
 import pytest
 import requests
+from google.protobuf.internal.encoder import _VarintBytes  # pylint: disable=E0611,E0401
 from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily, SummaryMetricFamily
 from six import iteritems
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
 
+from datadog_checks.base.utils.prometheus import metrics_pb2
 from datadog_checks.checks.openmetrics import OpenMetricsBaseCheck
 
 text_content_type = 'text/plain; version=0.0.4'
+protobuf_content_type = 'application/vnd.google.protobuf; proto=io.prometheus.client.MetricFamily; encoding=delimited'
 
 
 class MockResponse:
@@ -117,7 +124,6 @@ def test_process(text_data, mocked_prometheus_check, mocked_prometheus_scraper_c
 def test_process_metric_gauge(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config, ref_gauge):
     """ Gauge ref submission """
     check = mocked_prometheus_check
-    mocked_prometheus_scraper_config['_dry_run'] = False
     check.process_metric(ref_gauge, mocked_prometheus_scraper_config)
 
     aggregator.assert_metric('prometheus.process.vm.bytes', 54927360.0, tags=[], count=1)
@@ -129,7 +135,6 @@ def test_process_metric_filtered(aggregator, mocked_prometheus_check, mocked_pro
         'process_start_time_seconds', 'Start time of the process since unix epoch in seconds.'
     )
     filtered_gauge.add_metric([], 123456789.0)
-    mocked_prometheus_scraper_config['_dry_run'] = False
 
     check = mocked_prometheus_check
     check.process_metric(filtered_gauge, mocked_prometheus_scraper_config, metric_transformers={})
@@ -995,10 +1000,7 @@ def test_label_joins(aggregator, mocked_prometheus_check, mocked_prometheus_scra
         'kube_deployment_status_replicas': 'deploy.replicas.available',
     }
 
-    # dry run to build mapping
-    check.process(mocked_prometheus_scraper_config)
-
-    # run with submit
+    # the mapping is built and used within the same scrape
     check.process(mocked_prometheus_scraper_config)
 
     # check a bunch of metrics
@@ -1273,9 +1275,7 @@ def test_label_joins_gc(aggregator, mocked_prometheus_check, mocked_prometheus_s
         'kube_pod_info': {'label_to_match': 'pod', 'labels_to_get': ['node', 'pod_ip']}
     }
     mocked_prometheus_scraper_config['metrics_mapper'] = {'kube_pod_status_ready': 'pod.ready'}
-    # dry run to build mapping
-    check.process(mocked_prometheus_scraper_config)
-    # run with submit
+    # the mapping is built and used within the same scrape
     check.process(mocked_prometheus_scraper_config)
 
     # check a bunch of metrics
@@ -1316,6 +1316,67 @@ def test_label_joins_gc(aggregator, mocked_prometheus_check, mocked_prometheus_s
         assert 15 == len(mocked_prometheus_scraper_config['_label_mapping']['pod'])
 
 
+def test_label_joins_debug_metrics(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config, mock_get):
+    check = mocked_prometheus_check
+    config = mocked_prometheus_scraper_config
+    config['namespace'] = 'ksm'
+    config['debug_metrics'] = True
+    config['label_joins'] = {'kube_pod_info': {'label_to_match': 'pod', 'labels_to_get': ['node', 'pod_ip']}}
+    config['metrics_mapper'] = {'kube_pod_status_ready': 'pod.ready'}
+    check.process(config)
+
+    tags = ['endpoint:{}'.format(config['prometheus_url'])]
+    aggregator.assert_metric('ksm.prometheus.label_joins.index_size', value=15, tags=tags + ['label:pod'], count=1)
+    aggregator.assert_metric('ksm.prometheus.label_joins.dropped', value=0, tags=tags, count=1)
+    aggregator.assert_metric('ksm.prometheus.label_joins.buffered', value=45, tags=tags, count=1)
+    aggregator.assert_metric('ksm.prometheus.label_joins.buffer_dropped', value=0, tags=tags, count=1)
+    aggregator.reset()
+
+    text_data = mock_get.replace('dd-agent-62bgh', 'dd-agent-1337')
+    mock_response = mock.MagicMock(
+        status_code=200, iter_lines=lambda **kwargs: text_data.split("\n"), headers={'Content-Type': text_content_type}
+    )
+    with mock.patch('requests.get', return_value=mock_response, __name__="get"):
+        check.process(config)
+
+    aggregator.assert_metric('ksm.prometheus.label_joins.index_size', value=15, tags=tags + ['label:pod'], count=1)
+    aggregator.assert_metric('ksm.prometheus.label_joins.dropped', value=1, tags=tags, count=1)
+    assert not config['_next_label_mapping']
+
+
+def test_label_joins_buffer_size(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config, mock_get):
+    """ Tests families beyond the buffer are skipped while the label mapping is built """
+    check = mocked_prometheus_check
+    config = mocked_prometheus_scraper_config
+    config['namespace'] = 'ksm'
+    config['debug_metrics'] = True
+    config['label_joins_buffer_size'] = 1
+    config['label_joins'] = {'kube_pod_info': {'label_to_match': 'pod', 'labels_to_get': ['node']}}
+    config['metrics_mapper'] = {'kube_pod_status_ready': 'pod.ready'}
+    tags = ['endpoint:{}'.format(config['prometheus_url'])]
+
+    check.process(config)
+    assert not aggregator.metrics('ksm.pod.ready')
+    aggregator.assert_metric('ksm.prometheus.label_joins.buffered', value=0, tags=tags, count=1)
+    aggregator.assert_metric('ksm.prometheus.label_joins.buffer_dropped', value=45, tags=tags, count=1)
+    aggregator.reset()
+
+    # The mapping of the previous scrape is used from then on
+    check.process(config)
+    aggregator.assert_metric(
+        'ksm.pod.ready',
+        1.0,
+        tags=[
+            'pod:fluentd-gcp-v2.0.9-6dj58',
+            'namespace:kube-system',
+            'condition:true',
+            'node:gke-foobar-test-kube-default-pool-9b4ff111-0kch',
+        ],
+        count=1,
+    )
+    aggregator.assert_metric('ksm.prometheus.label_joins.buffer_dropped', value=0, tags=tags, count=1)
+
+
 def test_label_joins_missconfigured(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config, mock_get):
     """ Tests label join missconfigured label is ignored """
     check = mocked_prometheus_check
@@ -1325,9 +1386,7 @@ def test_label_joins_missconfigured(aggregator, mocked_prometheus_check, mocked_
     }
     mocked_prometheus_scraper_config['metrics_mapper'] = {'kube_pod_status_ready': 'pod.ready'}
 
-    # dry run to build mapping
-    check.process(mocked_prometheus_scraper_config)
-    # run with submit
+    # the mapping is built and used within the same scrape
     check.process(mocked_prometheus_scraper_config)
 
     # check a bunch of metrics
@@ -1363,9 +1422,7 @@ def test_label_join_not_existing(aggregator, mocked_prometheus_check, mocked_pro
         'kube_pod_info': {'label_to_match': 'not_existing', 'labels_to_get': ['node', 'pod_ip']}
     }
     mocked_prometheus_scraper_config['metrics_mapper'] = {'kube_pod_status_ready': 'pod.ready'}
-    # dry run to build mapping
-    check.process(mocked_prometheus_scraper_config)
-    # run with submit
+    # the mapping is built and used within the same scrape
     check.process(mocked_prometheus_scraper_config)
     # check a bunch of metrics
     aggregator.assert_metric(
@@ -1386,9 +1443,7 @@ def test_label_join_metric_not_existing(
         'not_existing': {'label_to_match': 'pod', 'labels_to_get': ['node', 'pod_ip']}
     }
     mocked_prometheus_scraper_config['metrics_mapper'] = {'kube_pod_status_ready': 'pod.ready'}
-    # dry run to build mapping
-    check.process(mocked_prometheus_scraper_config)
-    # run with submit
+    # the mapping is built and used within the same scrape
     check.process(mocked_prometheus_scraper_config)
     # check a bunch of metrics
     aggregator.assert_metric(
@@ -1408,9 +1463,7 @@ def test_label_join_with_hostname(aggregator, mocked_prometheus_check, mocked_pr
     }
     mocked_prometheus_scraper_config['label_to_hostname'] = 'node'
     mocked_prometheus_scraper_config['metrics_mapper'] = {'kube_pod_status_ready': 'pod.ready'}
-    # dry run to build mapping
-    check.process(mocked_prometheus_scraper_config)
-    # run with submit
+    # the mapping is built and used within the same scrape
     check.process(mocked_prometheus_scraper_config)
     # check a bunch of metrics
     aggregator.assert_metric(
@@ -1451,9 +1504,7 @@ def test_label_join_state_change(aggregator, mocked_prometheus_check, mocked_pro
         'kube_pod_status_phase': {'label_to_match': 'pod', 'labels_to_get': ['phase']},
     }
     mocked_prometheus_scraper_config['metrics_mapper'] = {'kube_pod_status_ready': 'pod.ready'}
-    # dry run to build mapping
-    check.process(mocked_prometheus_scraper_config)
-    # run with submit
+    # the mapping is built and used within the same scrape
     check.process(mocked_prometheus_scraper_config)
 
     # check that 15 pods are in phase:Running
@@ -1524,3 +1575,360 @@ def test_text_filter_input(mocked_prometheus_check, mocked_prometheus_scraper_co
 
     filtered = [x for x in check._text_filter_input(lines_in, mocked_prometheus_scraper_config)]
     assert filtered == expected_out
+
+
+def test_scrape_plan_is_cached(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config, ref_gauge):
+    check = mocked_prometheus_check
+    check.process_metric(ref_gauge, mocked_prometheus_scraper_config)
+
+    plan = mocked_prometheus_scraper_config['_scrape_plan']
+    assert list(plan) == ['process_virtual_memory_bytes']
+    assert plan['process_virtual_memory_bytes'].metric_name == 'process.vm.bytes'
+
+    # The cached plan is used until explicitly reset
+    mocked_prometheus_scraper_config['metrics_mapper'] = {'process_virtual_memory_bytes': 'process.vm.other'}
+    check.process_metric(ref_gauge, mocked_prometheus_scraper_config)
+    aggregator.assert_metric('prometheus.process.vm.bytes', count=2)
+
+    check.reset_scrape_plan(mocked_prometheus_scraper_config)
+    check.process_metric(ref_gauge, mocked_prometheus_scraper_config)
+    aggregator.assert_metric('prometheus.process.vm.other', count=1)
+
+
+def test_scrape_plan_ignored_metric(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config, ref_gauge):
+    check = mocked_prometheus_check
+    mocked_prometheus_scraper_config['ignore_metrics'] = ['process_virtual_memory_bytes']
+    check.process_metric(ref_gauge, mocked_prometheus_scraper_config)
+    check.process_metric(ref_gauge, mocked_prometheus_scraper_config)
+
+    aggregator.assert_all_metrics_covered()
+    assert len(aggregator.metric_names) == 0
+
+
+def test_scrape_plan_wildcard_submits_once(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config):
+    check = mocked_prometheus_check
+    mocked_prometheus_scraper_config['metrics_mapper'] = {'process_*': 'process_*', '*_bytes': '*_bytes'}
+    gauge = GaugeMetricFamily('process_virtual_memory_bytes', 'Virtual memory size in bytes.')
+    gauge.add_metric([], 54927360.0)
+    check.process_metric(gauge, mocked_prometheus_scraper_config)
+
+    aggregator.assert_metric('prometheus.process_virtual_memory_bytes', 54927360.0, count=1)
+
+
+def test_scrape_plan_follows_transformers(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config):
+    check = mocked_prometheus_check
+    gauge = GaugeMetricFamily('process_start_time_seconds', 'Start time of the process since unix epoch in seconds.')
+    gauge.add_metric([], 123456789.0)
+    transformer = mock.MagicMock()
+
+    check.process_metric(gauge, mocked_prometheus_scraper_config, metric_transformers={})
+    transformer.assert_not_called()
+
+    # A new dict with the same keys keeps the plan
+    check.process_metric(gauge, mocked_prometheus_scraper_config, metric_transformers={})
+    assert 'process_start_time_seconds' in mocked_prometheus_scraper_config['_scrape_plan']
+
+    # A new set of transformers invalidates it
+    check.process_metric(
+        gauge, mocked_prometheus_scraper_config, metric_transformers={'process_start_time_seconds': transformer}
+    )
+    transformer.assert_called_once_with(gauge, mocked_prometheus_scraper_config)
+
+
+def test_label_tag_names_cache(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config):
+    check = mocked_prometheus_check
+    mocked_prometheus_scraper_config['labels_mapper'] = {'my_1st_label': 'transformed_1st'}
+    mocked_prometheus_scraper_config['exclude_labels'] = ['my_2nd_label']
+    ref_gauge = GaugeMetricFamily(
+        'process_virtual_memory_bytes', 'Virtual memory size in bytes.', labels=['my_1st_label', 'my_2nd_label']
+    )
+    ref_gauge.add_metric(['value1', 'value2'], 54927360.0)
+    ref_gauge.add_metric(['value3', 'value4'], 54927361.0)
+    check.process_metric(ref_gauge, mocked_prometheus_scraper_config)
+
+    assert mocked_prometheus_scraper_config['_label_tag_names'] == {
+        'my_1st_label': 'transformed_1st',
+        'my_2nd_label': None,
+    }
+    aggregator.assert_metric('prometheus.process.vm.bytes', 54927360.0, tags=['transformed_1st:value1'], count=1)
+    aggregator.assert_metric('prometheus.process.vm.bytes', 54927361.0, tags=['transformed_1st:value3'], count=1)
+
+
+def test_tags_cache(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config):
+    check = mocked_prometheus_check
+    config = mocked_prometheus_scraper_config
+    config['tags_cache_size'] = 2
+    config['custom_tags'] = ['env:dev']
+    ref_gauge = GaugeMetricFamily('process_virtual_memory_bytes', 'Virtual memory size in bytes.', labels=['pod'])
+    for pod in ('pod1', 'pod2', 'pod1', 'pod3', 'pod2'):
+        ref_gauge.add_metric([pod], 1.0)
+    check.process_metric(ref_gauge, config)
+
+    # pod2 was evicted when pod3 was added, pod1 being used more recently
+    assert config['_tags_cache_hits'] == 1
+    assert config['_tags_cache_misses'] == 4
+    assert list(config['_tags_cache'].values()) == [('env:dev', 'pod:pod3'), ('env:dev', 'pod:pod2')]
+    aggregator.assert_metric('prometheus.process.vm.bytes', tags=['env:dev', 'pod:pod1'], count=2)
+    aggregator.assert_metric('prometheus.process.vm.bytes', tags=['env:dev', 'pod:pod2'], count=2)
+
+    # Changing the tags of the configuration invalidates the cache
+    aggregator.reset()
+    config['_metric_tags'] = ['foo:bar']
+    check.process_metric(ref_gauge, config)
+    aggregator.assert_metric('prometheus.process.vm.bytes', tags=['env:dev', 'foo:bar', 'pod:pod1'], count=2)
+    assert ('env:dev', 'pod:pod2') not in config['_tags_cache'].values()
+
+
+def test_tags_cache_disabled(aggregator, mocked_prometheus_check, mocked_prometheus_scraper_config, ref_gauge):
+    check = mocked_prometheus_check
+    config = mocked_prometheus_scraper_config
+    config['tags_cache_size'] = 0
+    check.process_metric(ref_gauge, config)
+    check.process_metric(ref_gauge, config)
+
+    assert not config['_tags_cache']
+    aggregator.assert_metric('prometheus.process.vm.bytes', tags=[], count=2)
+
+
+def test_tags_cache_debug_metrics(aggregator, mocked_prometheus_check, text_data):
+    check = mocked_prometheus_check
+    config = check.create_scraper_configuration(
+        {
+            'prometheus_url': 'http://fake.endpoint:10055/metrics',
+            'namespace': 'prometheus',
+            'metrics': ['process_virtual_memory_bytes'],
+            'debug_metrics': True,
+        }
+    )
+    check.poll = mock.MagicMock(return_value=MockResponse(text_data, text_content_type))
+    check.process(config)
+    check.process(config)
+
+    tags = ['endpoint:http://fake.endpoint:10055/metrics']
+    # Counters are reset after each submission
+    aggregator.assert_metric('prometheus.prometheus.tags_cache.misses', value=1, tags=tags, count=2)
+    aggregator.assert_metric('prometheus.prometheus.tags_cache.hits', value=1, tags=tags, count=2)
+    aggregator.assert_metric('prometheus.prometheus.tags_cache.size', value=1, tags=tags, count=2)
+
+
+def test_skip_unused_families(mocked_prometheus_check, mocked_prometheus_scraper_config, mock_get):
+    check = mocked_prometheus_check
+    config = mocked_prometheus_scraper_config
+    config['metrics_mapper'] = {'kube_pod_status_ready': 'pod.ready'}
+    config['label_joins'] = {'kube_pod_info': {'label_to_match': 'pod', 'labels_to_get': ['node']}}
+    config['type_overrides'] = {'kube_pod_labels': 'gauge'}
+    transformers = {'kube_pod_status_phase': mock.MagicMock()}
+    used = {'kube_pod_status_ready', 'kube_pod_info', 'kube_pod_labels', 'kube_pod_status_phase'}
+
+    response = check.poll(config)
+    expected = [m for m in check.parse_metric_family(response, config) if m.name in used]
+    assert len(expected) == len(used)
+
+    config['skip_unused_families'] = True
+    response = check.poll(config)
+    assert list(check.parse_metric_family(response, config, transformers)) == expected
+
+
+def test_text_filter_unused_families(mocked_prometheus_check, mocked_prometheus_scraper_config):
+    check = mocked_prometheus_check
+    config = mocked_prometheus_scraper_config
+    config['metrics_mapper'] = {'used_histogram': 'used_histogram', 'used_untyped': 'used_untyped'}
+
+    lines_in = [
+        '# HELP unused_histogram Unused.',
+        '# TYPE unused_histogram histogram',
+        'unused_histogram_bucket{le="1"} 1',
+        'unused_histogram_sum 1',
+        'unused_histogram_count 1',
+        'unused_untyped 1',
+        'used_untyped{foo="bar"} 1',
+        '# HELP used_histogram Used.',
+        '# TYPE used_histogram histogram',
+        'used_histogram_bucket{le="1"} 1',
+        'used_histogram_sum 1',
+        'used_histogram_count 1',
+        '# TYPE unused_gauge gauge',
+        'unused_gauge 1',
+        'unused_gauge_other 1',
+    ]
+    expected_out = [
+        'used_untyped{foo="bar"} 1',
+        '# HELP used_histogram Used.',
+        '# TYPE used_histogram histogram',
+        'used_histogram_bucket{le="1"} 1',
+        'used_histogram_sum 1',
+        'used_histogram_count 1',
+    ]
+
+    assert list(check._text_filter_unused_families(lines_in, config)) == expected_out
+
+
+@pytest.fixture
+def bin_data():
+    f_name = os.path.join(os.path.dirname(__file__), 'fixtures', 'prometheus', 'protobuf.bin')
+    with open(f_name, 'rb') as f:
+        return f.read()
+
+
+def test_send_request_protobuf_accept_header(mocked_prometheus_check, mocked_prometheus_scraper_config):
+    check = mocked_prometheus_check
+    with mock.patch('requests.get') as mock_get:
+        check.send_request('http://fake.endpoint', mocked_prometheus_scraper_config)
+        assert 'accept' not in mock_get.call_args[1]['headers']
+
+        mocked_prometheus_scraper_config['use_protobuf_format'] = True
+        check.send_request('http://fake.endpoint', mocked_prometheus_scraper_config)
+        assert mock_get.call_args[1]['headers']['accept'].startswith('application/vnd.google.protobuf;')
+
+
+def test_parse_metric_family_protobuf(bin_data, mocked_prometheus_check, mocked_prometheus_scraper_config):
+    check = mocked_prometheus_check
+    mocked_prometheus_scraper_config['use_protobuf_format'] = True
+    response = MockResponse(bin_data, protobuf_content_type)
+
+    metrics = {metric.name: metric for metric in check.parse_metric_family(response, mocked_prometheus_scraper_config)}
+
+    assert len(metrics) == 61
+    assert metrics['go_goroutines'].type == 'gauge'
+    assert metrics['go_goroutines'].samples == [('go_goroutines', {}, 23.0)]
+    assert metrics['kube_pod_container_status_restarts'].type == 'counter'
+    assert metrics['kube_pod_container_status_restarts'].samples[0] == (
+        'kube_pod_container_status_restarts',
+        {'container': 'dd-agent', 'namespace': 'default', 'pod': 'dd-agent'},
+        0.0,
+    )
+    gc_duration = metrics['go_gc_duration_seconds']
+    assert gc_duration.type == 'summary'
+    assert gc_duration.samples[2] == ('go_gc_duration_seconds', {'quantile': '0.5'}, 4.6962e-05)
+    assert gc_duration.samples[-2:] == [
+        ('go_gc_duration_seconds_sum', {}, 0.0005755570000000001),
+        ('go_gc_duration_seconds_count', {}, 11.0),
+    ]
+
+
+def test_parse_metric_family_protobuf_histogram(mocked_prometheus_check, mocked_prometheus_scraper_config):
+    check = mocked_prometheus_check
+    mocked_prometheus_scraper_config['use_protobuf_format'] = True
+
+    histogram = metrics_pb2.MetricFamily()
+    histogram.name = 'request_latency_seconds'
+    histogram.help = 'Request latency.'
+    histogram.type = metrics_pb2.HISTOGRAM
+    metric = histogram.metric.add()
+    label = metric.label.add()
+    label.name = 'handler'
+    label.value = 'api'
+    metric.histogram.sample_count = 4
+    metric.histogram.sample_sum = 1.5
+    for upper_bound, cumulative_count in [(0.1, 1), (1.0, 3)]:
+        bucket = metric.histogram.bucket.add()
+        bucket.upper_bound = upper_bound
+        bucket.cumulative_count = cumulative_count
+    payload = histogram.SerializeToString()
+    response = MockResponse(_VarintBytes(len(payload)) + payload, protobuf_content_type)
+
+    metrics = list(check.parse_metric_family(response, mocked_prometheus_scraper_config))
+
+    assert len(metrics) == 1
+    assert metrics[0].type == 'histogram'
+    assert metrics[0].samples == [
+        ('request_latency_seconds_bucket', {'handler': 'api', 'le': '0.1'}, 1.0),
+        ('request_latency_seconds_bucket', {'handler': 'api', 'le': '1.0'}, 3.0),
+        ('request_latency_seconds_bucket', {'handler': 'api', 'le': '+Inf'}, 4.0),
+        ('request_latency_seconds_sum', {'handler': 'api'}, 1.5),
+        ('request_latency_seconds_count', {'handler': 'api'}, 4.0),
+    ]
+
+
+def test_process_protobuf(aggregator, bin_data, mocked_prometheus_check, mocked_prometheus_scraper_config):
+    check = mocked_prometheus_check
+    mocked_prometheus_scraper_config['use_protobuf_format'] = True
+    mocked_prometheus_scraper_config['metrics_mapper'] = {
+        'go_gc_duration_seconds': 'go.gc.duration',
+        'kube_pod_container_status_restarts': 'container.restarts',
+    }
+    check.poll = mock.MagicMock(return_value=MockResponse(bin_data, protobuf_content_type))
+    check.process(mocked_prometheus_scraper_config)
+
+    aggregator.assert_metric('prometheus.go.gc.duration.quantile', 4.6962e-05, tags=['quantile:0.5'], count=1)
+    aggregator.assert_metric('prometheus.go.gc.duration.count', 11.0, tags=[], count=1)
+    aggregator.assert_metric(
+        'prometheus.container.restarts',
+        0.0,
+        tags=['container:dd-agent', 'namespace:default', 'pod:dd-agent'],
+        count=1,
+    )
+
+
+@pytest.fixture
+def keep_alive_endpoint(text_data):
+    payload = text_data.encode('utf-8')
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', text_content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:{}'.format(server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_persist_connections(aggregator, mocked_prometheus_check, keep_alive_endpoint):
+    check = mocked_prometheus_check
+    instance = {
+        'prometheus_url': keep_alive_endpoint + '/metrics',
+        'namespace': 'prometheus',
+        'metrics': ['process_virtual_memory_bytes'],
+        'persist_connections': True,
+        'debug_metrics': True,
+    }
+    metrics_config = check.create_scraper_configuration(instance)
+    other_config = check.create_scraper_configuration(dict(instance, prometheus_url=keep_alive_endpoint + '/other'))
+
+    check.process(metrics_config)
+    check.process(metrics_config)
+    check.process(other_config)
+
+    # The scrapers share a single session for the host
+    assert len(check._scraper_sessions) == 1
+    tags = ['endpoint:{}/metrics'.format(keep_alive_endpoint)]
+    aggregator.assert_metric('prometheus.prometheus.connections.opened', value=1, tags=tags)
+    aggregator.assert_metric('prometheus.prometheus.connections.reused', value=1, tags=tags)
+    aggregator.assert_metric('prometheus.process_virtual_memory_bytes', count=3)
+
+
+def test_persist_connections_idle_timeout(mocked_prometheus_check, keep_alive_endpoint):
+    check = mocked_prometheus_check
+    config = check.create_scraper_configuration(
+        {
+            'prometheus_url': keep_alive_endpoint,
+            'namespace': 'prometheus',
+            'metrics': ['process_virtual_memory_bytes'],
+            'persist_connections': True,
+            'connection_idle_timeout': 60,
+        }
+    )
+
+    session = check._get_scraper_session(keep_alive_endpoint, config)
+    assert check._get_scraper_session(keep_alive_endpoint, config) is session
+
+    with mock.patch('time.time', return_value=time.time() + 61):
+        assert check._get_scraper_session(keep_alive_endpoint, config) is not session
@@ -1,10 +1,14 @@
 # (C) Datadog, Inc. 2018-2019
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
+from copy import deepcopy
 from decimal import ROUND_HALF_DOWN
 
+import pytest
+
 from datadog_checks.base.utils.common import pattern_filter, round_value
 from datadog_checks.base.utils.containers import iter_unique
+from datadog_checks.base.utils.instance import InstanceView
 from datadog_checks.base.utils.limiter import Limiter
 
 
@@ -98,6 +102,18 @@ class TestLimiter:
             assert limiter.is_reached() is False
         assert limiter.get_status() == (6, 10, False)
 
+    def test_reserve(self):
+        warnings = []
+        limiter = Limiter("my_check", "names", 10, warning_func=warnings.append)
+
+        assert limiter.reserve(6) == 6
+        assert limiter.get_status() == (6, 10, False)
+        assert limiter.reserve(6) == 4
+        assert limiter.get_status() == (11, 10, True)
+        assert len(warnings) == 1
+        assert limiter.reserve(1) == 0
+        assert len(warnings) == 1
+
     def test_reset(self):
         limiter = Limiter("my_check", "names", 10)
 
@@ -142,3 +158,60 @@ class TestContainers:
         ]
 
         assert len(list(iter_unique(custom_queries))) == 1
+
+
+class TestInstanceView:
+    def test_read(self):
+        instance = {'url': 'http://localhost', 'tags': ['foo:bar'], 'port': 80}
+        view = InstanceView(instance)
+
+        assert view['url'] == 'http://localhost'
+        assert view.get('port') == 80
+        assert view.get('missing', 'default') == 'default'
+        assert 'tags' in view
+        assert 'missing' not in view
+        assert len(view) == 3
+        assert view == instance
+        with pytest.raises(KeyError):
+            view['missing']
+
+    def test_values_copied_on_access(self):
+        instance = {'tags': ['foo:bar'], 'metrics': [{'foo': 'bar'}]}
+        view = InstanceView(instance)
+
+        tags = view['tags']
+        tags.append('baz:qux')
+        view.get('metrics')[0]['foo'] = 'baz'
+
+        # The same copy is returned for the rest of the run
+        assert view['tags'] is tags
+        assert view['tags'] == ['foo:bar', 'baz:qux']
+        assert view['metrics'] == [{'foo': 'baz'}]
+        assert instance == {'tags': ['foo:bar'], 'metrics': [{'foo': 'bar'}]}
+
+    def test_write(self):
+        instance = {'url': 'http://localhost', 'port': 80}
+        view = InstanceView(instance)
+
+        view['error'] = 'message'
+        view['port'] = 8080
+        del view['url']
+        view.setdefault('timeout', 5)
+
+        assert dict(view) == {'port': 8080, 'error': 'message', 'timeout': 5}
+        assert 'url' not in view
+        assert instance == {'url': 'http://localhost', 'port': 80}
+        with pytest.raises(KeyError):
+            del view['url']
+
+        view['url'] = 'http://remote'
+        assert view['url'] == 'http://remote'
+
+    def test_copy(self):
+        instance = {'tags': ['foo:bar']}
+        view = InstanceView(instance)
+
+        copied = deepcopy(view)
+        assert type(copied) is dict
+        assert copied == instance
+        assert type(view.copy()) is dict
@@ -7,27 +7,80 @@ from collections import defaultdict
 import requests
 
 from datadog_checks.checks import AgentCheck
+from datadog_checks.config import is_affirmative
 
 from .errors import UnknownMetric, UnknownTags
 from .parser import parse_histogram, parse_metric
 
+# Outcomes of the handling of a stat name, see `Envoy.parse_stat`
+STAT_FILTERED = 0
+STAT_UNKNOWN_METRIC = 1
+STAT_UNKNOWN_TAGS = 2
+STAT_PARSED = 3
+
+DEFAULT_MAX_CACHED_METRICS = 50000
+
+# Size of the chunks the stats are read in, the response is never held in memory at once
+STATS_CHUNK_SIZE = 65536
+
+# Backreferences and conditionals, referring to the groups of a pattern by number or name
+GROUP_REFERENCE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+
+class MetricFilter(object):
+    """
+    Searches metric names for any of a list of regular expressions.
+
+    The patterns are combined into a single regular expression so that each name is searched only once,
+    unless one of them refers to its own groups: the groups of all the patterns are numbered together
+    in the combination. Such patterns are searched one by one instead, as are the ones that cannot be
+    combined. `pattern` is the combined regular expression, or None if there is none.
+    """
+
+    def __init__(self, patterns):
+        regexes = [re.compile(pattern) for pattern in patterns]
+
+        self.pattern = None
+        if len(patterns) == 1 or not any(GROUP_REFERENCE.search(pattern) for pattern in patterns):
+            try:
+                combined = re.compile('|'.join('(?:{})'.format(pattern) for pattern in patterns))
+            except re.error:
+                pass
+            else:
+                self.pattern = combined.pattern
+                self.search = combined.search
+                return
+
+        self.search = lambda metric: any(regex.search(metric) for regex in regexes)
+
 
 class Envoy(AgentCheck):
     SERVICE_CHECK_NAME = 'envoy.can_connect'
 
+    HTTP_CONFIG_REMAPPER = {
+        'verify_ssl': {'name': 'tls_verify'},
+        'timeout': {'name': 'timeout', 'default': 20},
+        'persist_connections': {'name': 'persist_connections', 'default': True},
+    }
+
     def __init__(self, name, init_config, agentConfig, instances=None):
         super(Envoy, self).__init__(name, init_config, agentConfig, instances)
+        # Occurrences of unknown metrics and tags during the last run
         self.unknown_metrics = defaultdict(int)
         self.unknown_tags = defaultdict(int)
+
+        # `MetricFilter` of the whitelist and blacklist patterns, None if there are none
         self.whitelist = None
         self.blacklist = None
+        self.filters_compiled = False
 
-        # The memory implications here are unclear to me. We may want a bloom filter
-        # or a data structure that expires elements based on inactivity.
-        self.whitelisted_metrics = set()
-        self.blacklisted_metrics = set()
-
+        # The handling of each stat name is cached in two generations: entries used during the current run
+        # are moved from `previous_stats_cache` to `stats_cache`, entries not used for a whole run are dropped.
+        self.stats_cache = {}
+        self.previous_stats_cache = {}
         self.caching_metrics = None
+        self.max_cached_metrics = None
+        self.server_side_filter = False
 
     def check(self, instance):
         custom_tags = instance.get('tags', [])
@@ -40,72 +93,86 @@ class Envoy(AgentCheck):
             self.log.error(msg)
             return
 
-        username = instance.get('username', None)
-        password = instance.get('password', None)
-        auth = (username, password) if username and password else None
-        verify_ssl = instance.get('verify_ssl', True)
-        proxies = self.get_instance_proxy(instance, stats_url)
-        timeout = int(instance.get('timeout', 20))
-
-        if self.whitelist is None:
-            whitelist = set(re.sub(r'^envoy\\?\.', '', s, 1) for s in instance.get('metric_whitelist', []))
-            self.whitelist = [re.compile(pattern) for pattern in whitelist]
-
-        if self.blacklist is None:
-            blacklist = set(re.sub(r'^envoy\\?\.', '', s, 1) for s in instance.get('metric_blacklist', []))
-            self.blacklist = [re.compile(pattern) for pattern in blacklist]
+        if not self.filters_compiled:
+            self.whitelist = self.compile_filter(instance.get('metric_whitelist', []))
+            self.blacklist = self.compile_filter(instance.get('metric_blacklist', []))
+            self.server_side_filter = is_affirmative(instance.get('server_side_filter', False))
+            self.filters_compiled = True
 
         if self.caching_metrics is None:
             self.caching_metrics = instance.get('cache_metrics', True)
+            self.max_cached_metrics = int(instance.get('max_cached_metrics', DEFAULT_MAX_CACHED_METRICS))
+
+        # Let Envoy drop the stats not matching the whitelist, the blacklist is still applied by the check
+        params = None
+        if self.server_side_filter and self.whitelist is not None:
+            if self.whitelist.pattern is not None:
+                params = {'filter': self.whitelist.pattern}
+            else:
+                self.log.debug('The metric_whitelist patterns cannot be combined, they are not sent to Envoy')
+
+        # The session does not apply its timeout, it must be passed with each request
+        timeout = self.http.options['timeout']
 
         try:
-            response = requests.get(stats_url, auth=auth, verify=verify_ssl, proxies=proxies, timeout=timeout)
+            response = self.http.get(stats_url, params=params, stream=True, timeout=timeout)
         except requests.exceptions.Timeout:
             msg = 'Envoy endpoint `{}` timed out after {} seconds'.format(stats_url, timeout)
             self.service_check(self.SERVICE_CHECK_NAME, AgentCheck.CRITICAL, message=msg, tags=custom_tags)
             self.log.exception(msg)
             return
-        except (requests.exceptions.RequestException, requests.exceptions.ConnectionError):
+        except requests.exceptions.RequestException:
             msg = 'Error accessing Envoy endpoint `{}`'.format(stats_url)
             self.service_check(self.SERVICE_CHECK_NAME, AgentCheck.CRITICAL, message=msg, tags=custom_tags)
             self.log.exception(msg)
             return
 
-        if response.status_code != 200:
-            msg = 'Envoy endpoint `{}` responded with HTTP status code {}'.format(stats_url, response.status_code)
+        try:
+            if response.status_code != 200:
+                msg = 'Envoy endpoint `{}` responded with HTTP status code {}'.format(stats_url, response.status_code)
+                self.service_check(self.SERVICE_CHECK_NAME, AgentCheck.CRITICAL, message=msg, tags=custom_tags)
+                self.log.warning(msg)
+                return
+
+            # Stat names are ASCII, Envoy does not send a charset
+            response.encoding = 'utf-8'
+            self.process_stats(response.iter_lines(chunk_size=STATS_CHUNK_SIZE, decode_unicode=True), custom_tags)
+        except requests.exceptions.RequestException:
+            msg = 'Error reading the stats of Envoy endpoint `{}`'.format(stats_url)
             self.service_check(self.SERVICE_CHECK_NAME, AgentCheck.CRITICAL, message=msg, tags=custom_tags)
-            self.log.warning(msg)
+            self.log.exception(msg)
             return
+        finally:
+            # Return the connection to the pool even if the stats were not all read
+            response.close()
+
+        self.service_check(self.SERVICE_CHECK_NAME, AgentCheck.OK, tags=custom_tags)
 
+    def process_stats(self, lines, custom_tags):
+        """
+        Submits the stats read from `lines`, an iterable over the lines of the `/stats` endpoint.
+        """
         # Avoid repeated global lookups.
         get_method = getattr
+        parse_stat = self.parse_stat
+        self.unknown_metrics.clear()
+        self.unknown_tags.clear()
 
-        for line in response.content.decode().splitlines():
+        for line in lines:
             try:
                 envoy_metric, value = line.split(': ')
             except ValueError:
                 continue
 
-            if not self.whitelisted_metric(envoy_metric):
+            status, metric, tags, method = parse_stat(envoy_metric, custom_tags)
+            if status != STAT_PARSED:
+                if status == STAT_UNKNOWN_METRIC:
+                    self.unknown_metrics[envoy_metric] += 1
+                elif status == STAT_UNKNOWN_TAGS:
+                    for tag in tags:
+                        self.unknown_tags[tag] += 1
                 continue
 
-            try:
-                metric, tags, method = parse_metric(envoy_metric)
-            except UnknownMetric:
-                if envoy_metric not in self.unknown_metrics:
-                    self.log.debug('Unknown metric `{}`'.format(envoy_metric))
-                self.unknown_metrics[envoy_metric] += 1
-                continue
-            except UnknownTags as e:
-                unknown_tags = str(e).split('|||')
-                for tag in unknown_tags:
-                    if tag not in self.unknown_tags:
-                        self.log.debug('Unknown tag `{}` in metric `{}`'.format(tag, envoy_metric))
-                    self.unknown_tags[tag] += 1
-                continue
-
-            tags.extend(custom_tags)
-
             try:
                 value = int(value)
                 get_method(self, method)(metric, value, tags=tags)
@@ -115,30 +182,60 @@ class Envoy(AgentCheck):
                 for metric, value in parse_histogram(metric, value):
                     self.gauge(metric, value, tags=tags)
 
-        self.service_check(self.SERVICE_CHECK_NAME, AgentCheck.OK, tags=custom_tags)
+        # Drop the cached stats that were not seen during this run
+        self.previous_stats_cache = self.stats_cache
+        self.stats_cache = {}
+
+    @staticmethod
+    def compile_filter(patterns):
+        patterns = sorted(set(re.sub(r'^envoy\\?\.', '', pattern, 1) for pattern in patterns))
+        if not patterns:
+            return None
+        return MetricFilter(patterns)
 
     def whitelisted_metric(self, metric):
-        if self.caching_metrics:
-            if metric in self.whitelisted_metrics:
-                return True
-            elif metric in self.blacklisted_metrics:
-                return False
-
-        if self.whitelist:
-            whitelisted = any(pattern.search(metric) for pattern in self.whitelist)
-            if self.blacklist:
-                whitelisted = whitelisted and not any(pattern.search(metric) for pattern in self.blacklist)
-
-            if self.caching_metrics and whitelisted:
-                self.whitelisted_metrics.add(metric)
-
-            return whitelisted
-        elif self.blacklist:
-            blacklisted = any(pattern.search(metric) for pattern in self.blacklist)
-
-            if self.caching_metrics and blacklisted:
-                self.blacklisted_metrics.add(metric)
-
-            return not blacklisted
-        else:
-            return True
+        if self.whitelist is not None and not self.whitelist.search(metric):
+            return False
+        return self.blacklist is None or not self.blacklist.search(metric)
+
+    def parse_stat(self, envoy_metric, custom_tags):
+        """
+        Returns the handling of a stat name as a tuple `(status, metric, tags, method)`, with `status` one of:
+            - STAT_PARSED: `metric` is to be submitted with `tags` using `method`
+            - STAT_FILTERED: the stat is filtered out by the whitelist or blacklist
+            - STAT_UNKNOWN_METRIC: the metric is not known
+            - STAT_UNKNOWN_TAGS: the metric has tags that are not known, listed in `tags`
+
+        The result is cached when `cache_metrics` is enabled, its tags must not be modified.
+        """
+        try:
+            return self.stats_cache[envoy_metric]
+        except KeyError:
+            pass
+
+        result = self.previous_stats_cache.pop(envoy_metric, None)
+        if result is None:
+            result = self._parse_stat(envoy_metric, custom_tags)
+
+        if self.caching_metrics and len(self.stats_cache) < self.max_cached_metrics:
+            self.stats_cache[envoy_metric] = result
+
+        return result
+
+    def _parse_stat(self, envoy_metric, custom_tags):
+        if not self.whitelisted_metric(envoy_metric):
+            return STAT_FILTERED, None, None, None
+
+        try:
+            metric, tags, method = parse_metric(envoy_metric)
+        except UnknownMetric:
+            self.log.debug('Unknown metric `{}`'.format(envoy_metric))
+            return STAT_UNKNOWN_METRIC, None, None, None
+        except UnknownTags as e:
+            unknown_tags = str(e).split('|||')
+            for tag in unknown_tags:
+                self.log.debug('Unknown tag `{}` in metric `{}`'.format(tag, envoy_metric))
+            return STAT_UNKNOWN_TAGS, None, unknown_tags, None
+
+        tags.extend(custom_tags)
+        return STAT_PARSED, metric, tags, method
@@ -29,6 +29,16 @@ class MockResponse:
     def __init__(self, content, status_code):
         self.content = content
         self.status_code = status_code
+        self.encoding = None
+
+    def iter_lines(self, chunk_size=512, decode_unicode=False):
+        content = self.content
+        if decode_unicode and self.encoding:
+            content = content.decode(self.encoding)
+        return iter(content.splitlines())
+
+    def close(self):
+        pass
 
 
 @lru_cache(maxsize=None)
@@ -19,8 +19,27 @@ def test_fixture(benchmark):
     instance = INSTANCES['main']
     c = Envoy('envoy', None, {}, [instance])
 
-    with mock.patch('requests.get', return_value=response('multiple_services')):
+    with mock.patch('requests.Session.get', return_value=response('multiple_services')):
         # Run once to get logging of unknown metrics out of the way.
         c.check(instance)
 
         benchmark(c.check, instance)
+
+
+def test_fixture_whitelist_blacklist(benchmark):
+    instance = INSTANCES['whitelist_blacklist']
+    c = Envoy('envoy', None, {}, [instance])
+
+    with mock.patch('requests.Session.get', return_value=response('multiple_services')):
+        # Run once to get logging of unknown metrics out of the way.
+        c.check(instance)
+
+        benchmark(c.check, instance)
+
+
+def test_fixture_no_cache(benchmark):
+    instance = dict(INSTANCES['main'], cache_metrics=False)
+    c = Envoy('envoy', None, {}, [instance])
+
+    with mock.patch('requests.Session.get', return_value=response('multiple_services')):
+        benchmark(c.check, instance)
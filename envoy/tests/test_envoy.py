@@ -2,6 +2,7 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 import mock
+import requests
 
 from datadog_checks.envoy import Envoy
 from datadog_checks.envoy.metrics import METRIC_PREFIX, METRICS
@@ -27,7 +28,7 @@ class TestEnvoy:
         instance = INSTANCES['main']
         c = Envoy(self.CHECK_NAME, None, {}, [instance])
 
-        with mock.patch('requests.get', return_value=response('multiple_services')):
+        with mock.patch('requests.Session.get', return_value=response('multiple_services')):
             c.check(instance)
 
         metrics_collected = 0
@@ -42,7 +43,7 @@ class TestEnvoy:
         instance = INSTANCES['whitelist']
         c = Envoy(self.CHECK_NAME, None, {}, [instance])
 
-        with mock.patch('requests.get', return_value=response('multiple_services')):
+        with mock.patch('requests.Session.get', return_value=response('multiple_services')):
             c.check(instance)
 
         for metric in aggregator.metric_names:
@@ -52,7 +53,7 @@ class TestEnvoy:
         instance = INSTANCES['blacklist']
         c = Envoy(self.CHECK_NAME, None, {}, [instance])
 
-        with mock.patch('requests.get', return_value=response('multiple_services')):
+        with mock.patch('requests.Session.get', return_value=response('multiple_services')):
             c.check(instance)
 
         for metric in aggregator.metric_names:
@@ -62,7 +63,7 @@ class TestEnvoy:
         instance = INSTANCES['whitelist_blacklist']
         c = Envoy(self.CHECK_NAME, None, {}, [instance])
 
-        with mock.patch('requests.get', return_value=response('multiple_services')):
+        with mock.patch('requests.Session.get', return_value=response('multiple_services')):
             c.check(instance)
 
         for metric in aggregator.metric_names:
@@ -72,7 +73,7 @@ class TestEnvoy:
         instance = INSTANCES['main']
         c = Envoy(self.CHECK_NAME, None, {}, [instance])
 
-        with mock.patch('requests.get', return_value=response('multiple_services')):
+        with mock.patch('requests.Session.get', return_value=response('multiple_services')):
             c.check(instance)
 
         assert aggregator.service_checks(Envoy.SERVICE_CHECK_NAME)[0].status == Envoy.OK
@@ -81,7 +82,139 @@ class TestEnvoy:
         instance = INSTANCES['main']
         c = Envoy(self.CHECK_NAME, None, {}, [instance])
 
-        with mock.patch('requests.get', return_value=response('unknown_metrics')):
+        with mock.patch('requests.Session.get', return_value=response('unknown_metrics')):
             c.check(instance)
 
         assert sum(c.unknown_metrics.values()) == 5
+
+    def test_unknown_counts_reset_every_run(self):
+        instance = INSTANCES['main']
+        c = Envoy(self.CHECK_NAME, None, {}, [instance])
+
+        with mock.patch('requests.Session.get', return_value=response('unknown_metrics')):
+            c.check(instance)
+            c.check(instance)
+
+        assert sum(c.unknown_metrics.values()) == 5
+
+    def test_stats_cache(self, aggregator):
+        instance = INSTANCES['main']
+        c = Envoy(self.CHECK_NAME, None, {}, [instance])
+
+        with mock.patch('requests.Session.get', return_value=response('multiple_services')):
+            c.check(instance)
+        cached_stats = len(c.previous_stats_cache)
+        assert cached_stats > 3900
+
+        with mock.patch('requests.Session.get', return_value=response('multiple_services')):
+            c.check(instance)
+        assert len(c.previous_stats_cache) == cached_stats
+
+        # Stats absent from a run are dropped
+        with mock.patch('requests.Session.get', return_value=response('unknown_metrics')):
+            c.check(instance)
+        assert len(c.previous_stats_cache) == 4
+
+    def test_stats_cache_size(self, aggregator):
+        instance = dict(INSTANCES['main'], max_cached_metrics=100)
+        c = Envoy(self.CHECK_NAME, None, {}, [instance])
+
+        with mock.patch('requests.Session.get', return_value=response('multiple_services')):
+            c.check(instance)
+            c.check(instance)
+
+        assert len(c.previous_stats_cache) == 100
+        num_metrics = len(response('multiple_services').content.decode().splitlines())
+        num_metrics -= sum(c.unknown_metrics.values()) + sum(c.unknown_tags.values())
+        assert len(aggregator.metric_names) > 0
+        assert sum(len(aggregator.metrics(name)) for name in aggregator.metric_names) == 2 * num_metrics
+
+    def test_stats_cache_disabled(self, aggregator):
+        instance = dict(INSTANCES['main'], cache_metrics=False)
+        c = Envoy(self.CHECK_NAME, None, {}, [instance])
+
+        with mock.patch('requests.Session.get', return_value=response('multiple_services')):
+            c.check(instance)
+
+        assert not c.previous_stats_cache
+
+    def test_whitelisted_metric(self):
+        instance = INSTANCES['whitelist_blacklist']
+        c = Envoy(self.CHECK_NAME, None, {}, [instance])
+
+        with mock.patch('requests.Session.get', return_value=response('unknown_metrics')):
+            c.check(instance)
+
+        assert c.whitelisted_metric('cluster.in.0000.lb_subsets_active')
+        assert not c.whitelisted_metric('cluster.out.0000.lb_subsets_active')
+        assert not c.whitelisted_metric('http.admin.downstream_cx_total')
+
+    def test_whitelisted_metric_group_reference(self, aggregator):
+        # Combined, the backreference of the second pattern would refer to the group of the first one
+        instance = dict(
+            INSTANCES['main'], metric_whitelist=[r'^(http)\.', r'^cluster\.(\w+)\.\1\.'], server_side_filter=True
+        )
+        c = Envoy(self.CHECK_NAME, None, {}, [instance])
+
+        with mock.patch('requests.Session.get', return_value=response('multiple_services')) as get:
+            c.check(instance)
+
+        assert c.whitelisted_metric('http.admin.downstream_cx_total')
+        assert c.whitelisted_metric('cluster.foo.foo.upstream_cx_total')
+        assert not c.whitelisted_metric('cluster.foo.bar.upstream_cx_total')
+        # The patterns cannot be sent to Envoy as one
+        assert get.call_args[1]['params'] is None
+
+    def test_stats_streamed_over_session(self, aggregator):
+        instance = INSTANCES['main']
+        c = Envoy(self.CHECK_NAME, None, {}, [instance])
+
+        with mock.patch('requests.Session.get', return_value=response('multiple_services')) as get:
+            c.check(instance)
+            c.check(instance)
+
+        assert get.call_count == 2
+        get.assert_called_with(instance['stats_url'], params=None, stream=True, timeout=20)
+
+    def test_persist_connections_disabled(self, aggregator):
+        instance = dict(INSTANCES['main'], persist_connections=False)
+        c = Envoy(self.CHECK_NAME, None, {}, [instance])
+
+        with mock.patch('requests.get', return_value=response('multiple_services')) as get:
+            c.check(instance)
+
+        assert get.call_count == 1
+        assert get.call_args[1]['stream'] is True
+        assert aggregator.service_checks(Envoy.SERVICE_CHECK_NAME)[0].status == Envoy.OK
+
+    def test_server_side_filter(self, aggregator):
+        instance = dict(INSTANCES['whitelist'], server_side_filter=True)
+        c = Envoy(self.CHECK_NAME, None, {}, [instance])
+
+        with mock.patch('requests.Session.get', return_value=response('multiple_services')) as get:
+            c.check(instance)
+
+        assert get.call_args[1]['params'] == {'filter': r'(?:cluster\..*)'}
+        for metric in aggregator.metric_names:
+            assert metric.startswith('envoy.cluster.')
+
+    def test_server_side_filter_without_whitelist(self, aggregator):
+        instance = dict(INSTANCES['blacklist'], server_side_filter=True)
+        c = Envoy(self.CHECK_NAME, None, {}, [instance])
+
+        with mock.patch('requests.Session.get', return_value=response('multiple_services')) as get:
+            c.check(instance)
+
+        assert get.call_args[1]['params'] is None
+
+    def test_error_while_reading(self, aggregator):
+        instance = INSTANCES['main']
+        c = Envoy(self.CHECK_NAME, None, {}, [instance])
+
+        mock_response = mock.MagicMock(status_code=200)
+        mock_response.iter_lines.side_effect = requests.exceptions.ChunkedEncodingError()
+        with mock.patch('requests.Session.get', return_value=mock_response):
+            c.check(instance)
+
+        assert aggregator.service_checks(Envoy.SERVICE_CHECK_NAME)[0].status == Envoy.CRITICAL
+        mock_response.close.assert_called_once()
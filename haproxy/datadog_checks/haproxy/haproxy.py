@@ -5,6 +5,7 @@
 from __future__ import division
 
 import copy
+import csv
 import re
 import socket
 import time
@@ -22,6 +23,9 @@ STATS_URL = "/;csv;norefresh"
 EVENT_TYPE = SOURCE_TYPE_NAME = 'haproxy'
 BUFSIZE = 8192
 
+# Fields of the stats used as tags or to select the rows, the other fields are only read if they are reported
+STRING_FIELDS = frozenset(('pxname', 'svname', 'status', 'addr'))
+
 
 class Services(object):
     BACKEND = 'BACKEND'
@@ -64,6 +68,17 @@ class HAProxy(AgentCheck):
         # https://gist.github.com/hrldcpr/2012250
         self.host_status = defaultdict(lambda: defaultdict(lambda: None))
 
+        # Handling of the fields of the stats, by header
+        self._field_plans = {}
+
+        # Name of the metric of each reported field, by type of row
+        self._metric_names = {
+            back_or_front: {
+                key: "haproxy.%s.%s" % (back_or_front.lower(), suffix) for key, (_, suffix) in iteritems(self.METRICS)
+            }
+            for back_or_front in Services.ALL
+        }
+
     METRICS = {
         "qcur": ("gauge", "queue.current"),
         "scur": ("gauge", "session.current"),
@@ -175,20 +190,7 @@ class HAProxy(AgentCheck):
         )
         response.raise_for_status()
 
-        # it only needs additional decoding in py3, so skip it if it's py2
-        if PY2:
-            return response.content.splitlines()
-        else:
-            content = response.content
-
-            # If the content is a string, it can't be decoded again
-            # But if it's bytes, it can be decoded.
-            # So, check if it has the decode method
-            decode_fn = getattr(content, "decode", None)
-            if callable(decode_fn):
-                content = content.decode('utf-8')
-
-            return content.splitlines()
+        return self._split_lines(response.content)
 
     def _fetch_socket_data(self, parsed_url):
         ''' Hit a given stats socket and return the stats lines '''
@@ -206,15 +208,31 @@ class HAProxy(AgentCheck):
             sock.connect(parsed_url.path)
         sock.send(b"show stat\r\n")
 
-        response = ""
+        response = bytearray()
         output = sock.recv(BUFSIZE)
         while output:
-            response += output.decode("ASCII")
+            response.extend(output)
             output = sock.recv(BUFSIZE)
 
         sock.close()
 
-        return response.splitlines()
+        return self._split_lines(bytes(response))
+
+    @staticmethod
+    def _split_lines(content):
+        ''' Split the stats in lines, decoded on py3 '''
+        # it only needs additional decoding in py3, so skip it if it's py2
+        if PY2:
+            return content.splitlines()
+
+        # If the content is a string, it can't be decoded again
+        # But if it's bytes, it can be decoded.
+        # So, check if it has the decode method
+        decode_fn = getattr(content, "decode", None)
+        if callable(decode_fn):
+            content = content.decode('utf-8')
+
+        return content.splitlines()
 
     def _process_data(
         self,
@@ -237,38 +255,36 @@ class HAProxy(AgentCheck):
         ''' Main data-processing loop. For each piece of useful data, we'll
         either save a metric, save an event or both. '''
 
-        # Split the first line into an index of fields
-        # The line looks like (broken up onto multiple lines)
+        # The lines are parsed as CSV, values can be quoted and span several lines.
+        # The first line is an index of fields, it looks like (broken up onto multiple lines)
         # "# pxname,svname,qcur,qmax,scur,smax,slim,
         # stot,bin,bout,dreq,dresp,ereq,econ,eresp,wretr,
         # wredis,status,weight,act,bck,chkfail,chkdown,lastchg,
         # downtime,qlimit,pid,iid,sid,throttle,lbtot,tracked,
         # type,rate,rate_lim,rate_max,"
-        fields = []
-        for f in data[0].split(','):
-            if f:
-                f = f.replace('# ', '')
-                fields.append(f.strip())
+        rows = csv.reader(data)
+        plan = self._get_field_plan(next(rows, []))
+
+        # Only keep the rows with values
+        rows = [row for row in rows if len(row) > 1 or (row and row[0].strip())]
 
         self.hosts_statuses = defaultdict(int)
 
         back_or_front = None
 
-        # Sanitize CSV, handle line breaks
-        data = self._sanitize_lines(data)
         custom_tags = [] if custom_tags is None else custom_tags
         active_tag = [] if active_tag is None else active_tag
 
         # First initialize here so that it is defined whether or not we enter the for loop
         line_tags = list(custom_tags)
 
-        # Skip the first line, go backwards to set back_or_front
-        for line in data[:0:-1]:
-            if not line.strip():
-                continue
+        # Tags extracted by `tags_regex`, by service
+        regex_tags_by_service = {}
 
+        # Go backwards to set back_or_front
+        for row in reversed(rows):
             # Store each line's values in a dictionary
-            data_dict = self._line_to_dict(fields, line)
+            data_dict = self._row_to_dict(plan, row)
 
             if self._is_aggregate(data_dict):
                 back_or_front = data_dict['svname']
@@ -283,7 +299,10 @@ class HAProxy(AgentCheck):
             # which would carry over previous iteration tags
             line_tags = list(custom_tags)
 
-            regex_tags = self._tag_from_regex(tags_regex, data_dict['pxname'])
+            service_name = data_dict['pxname']
+            regex_tags = regex_tags_by_service.get(service_name)
+            if regex_tags is None:
+                regex_tags = regex_tags_by_service[service_name] = self._tag_from_regex(tags_regex, service_name)
             if regex_tags:
                 line_tags.extend(regex_tags)
 
@@ -336,68 +355,48 @@ class HAProxy(AgentCheck):
                 active_tag=active_tag,
             )
 
-        return data
-
-    def _sanitize_lines(self, data):
-        sanitized = []
-
-        def char_count(line, char):
-            count = 0
-
-            for c in line:
-                if c is char:
-                    count += 1
-
-            return count
-
-        clean = ''
-        double_quotes = 0
-        for line in data:
-            double_quotes += char_count(line, '"')
-            clean += line
-
-            if double_quotes % 2 == 0:
-                sanitized.append(clean.replace('\n', '').replace('\r', ''))
-                double_quotes = 0
-                clean = ''
-
-        return sanitized
-
-    def _line_to_dict(self, fields, line):
+    def _get_field_plan(self, header):
+        """
+        Return the handling of the fields of the rows following this header, compiled once per header:
+        the index of the fields kept as strings and of the reported fields converted to floats.
+        The other fields are never read.
+        """
+        key = tuple(header)
+        plan = self._field_plans.get(key)
+        if plan is None:
+            string_fields = []
+            metric_fields = []
+            for index, field in enumerate(header):
+                field = field.replace('# ', '').strip()
+                if field in STRING_FIELDS:
+                    string_fields.append((field, index))
+                elif field in self.METRICS:
+                    metric_fields.append((field, index))
+
+            plan = self._field_plans[key] = (string_fields, metric_fields)
+
+        return plan
+
+    def _row_to_dict(self, plan, row):
+        string_fields, metric_fields = plan
+        row_length = len(row)
         data_dict = {}
-        values = line.split(',')
-        if len(values) > len(fields):
-            values = self._gather_quoted_values(values)
-        for i, val in enumerate(values):
-            if val:
+        for field, index in string_fields:
+            if index < row_length and row[index]:
+                data_dict[field] = row[index]
+
+        for field, index in metric_fields:
+            if index < row_length and row[index]:
                 try:
-                    # Try converting to a long, if failure, just leave it
-                    val = float(val)
-                except Exception:
+                    data_dict[field] = float(row[index])
+                except ValueError:
                     pass
-                data_dict[fields[i]] = val
 
         if 'status' in data_dict:
             data_dict['status'] = self._normalize_status(data_dict['status'])
 
         return data_dict
 
-    def _gather_quoted_values(self, values):
-        gathered_values = []
-        previous = ''
-        for val in values:
-            if val.startswith('"') and not val.endswith('"'):
-                previous = val
-            elif previous:
-                if val.endswith('"'):
-                    gathered_values.append(previous + val)
-                    previous = ''
-                else:
-                    previous += val
-            else:
-                gathered_values.append(val)
-        return gathered_values
-
     def _update_data_dict(self, data_dict, back_or_front):
         """
         Adds spct if relevant, adds service
@@ -624,17 +623,27 @@ class HAProxy(AgentCheck):
             if data.get('addr'):
                 tags.append('server_address:{}'.format(data.get('addr')))
 
-        for key, value in data.items():
-            if HAProxy.METRICS.get(key):
-                suffix = HAProxy.METRICS[key][1]
+        # The metrics of the row are submitted in one batch per type, the tags are only validated once
+        metrics = {'gauge': ([], []), 'rate': ([], [])}
+        metric_names = self._metric_names.get(back_or_front)
+        for key, (method, suffix) in iteritems(HAProxy.METRICS):
+            # Reported fields are already converted to floats
+            value = data.get(key)
+            if value is None:
+                continue
+
+            if metric_names is not None:
+                name = metric_names[key]
+            else:
                 name = "haproxy.%s.%s" % (back_or_front.lower(), suffix)
-                try:
-                    if HAProxy.METRICS[key][0] == 'rate':
-                        self.rate(name, float(value), tags=tags)
-                    else:
-                        self.gauge(name, float(value), tags=tags)
-                except ValueError:
-                    pass
+
+            names, values = metrics[method]
+            names.append(name)
+            values.append(value)
+
+        for method, (names, values) in iteritems(metrics):
+            if values:
+                self.submit_metrics(method, names, values, tags=tags)
 
     def _process_event(self, data, url, services_incl_filter=None, services_excl_filter=None, custom_tags=None):
         '''
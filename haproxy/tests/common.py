@@ -1,4 +1,5 @@
 import os
+import random
 
 import pytest
 
@@ -125,3 +126,51 @@ BACKEND_CHECK_RATES_POST_1_4 = [
 BACKEND_CHECK_GAUGES_POST_1_7 = ['haproxy.backend.uptime']
 
 SERVICE_CHECK_NAME = 'haproxy.backend_up'
+
+
+def generate_stats(backends, servers_per_backend, seed=0):
+    """
+    Generate the CSV stats of `backends` proxies with `servers_per_backend` servers each, like HAProxy 1.8 reports.
+    """
+    rand = random.Random(seed)
+    header = (
+        '# pxname,svname,qcur,qmax,scur,smax,slim,stot,bin,bout,dreq,dresp,ereq,econ,eresp,wretr,wredis,status,'
+        'weight,act,bck,chkfail,chkdown,lastchg,downtime,qlimit,pid,iid,sid,throttle,lbtot,tracked,type,rate,'
+        'rate_lim,rate_max,check_status,check_code,check_duration,hrsp_1xx,hrsp_2xx,hrsp_3xx,hrsp_4xx,hrsp_5xx,'
+        'hrsp_other,hanafail,req_rate,req_rate_max,req_tot,cli_abrt,srv_abrt,addr,'
+    )
+    lines = [header]
+    for backend in range(backends):
+        name = 'be_{}'.format(backend)
+        lines.append(
+            '{},FRONTEND,,,1,2,2000,1,11,11,0,0,0,,,,,OPEN,,,,,,,,,1,1,0,,,,0,1,0,2,,,,0,1,0,0,0,0,,1,1,1,,,,'.format(
+                name
+            )
+        )
+        for server in range(servers_per_backend):
+            values = [rand.randint(0, 100000) for _ in range(6)]
+            status = rand.choice(('UP', 'UP', 'UP 1/2', 'DOWN', 'MAINT', 'no check'))
+            lines.append(
+                '{},srv-{},0,0,{},5,,{},{},{},,0,,0,0,0,0,{},1,1,0,0,1,{},30,,1,3,{},,70,,2,0,,1,'
+                'L7OK,200,"1, the first",0,{},0,0,0,0,,,,,0,0,10.0.{}.{}:80,'.format(
+                    name,
+                    server,
+                    values[0] % 5,
+                    values[1],
+                    values[2],
+                    values[3],
+                    status,
+                    values[4],
+                    server + 1,
+                    values[5],
+                    backend,
+                    server % 256,
+                )
+            )
+        lines.append(
+            '{},BACKEND,0,0,1,2,200,421,1,0,0,0,,0,0,0,0,UP,6,6,0,,0,1,0,,1,3,0,,421,,1,0,,1,,,,,,,,,,,,,,0,0,,'.format(
+                name
+            )
+        )
+
+    return '\n'.join(lines).encode('utf-8')
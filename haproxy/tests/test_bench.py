@@ -0,0 +1,55 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import csv
+
+import mock
+import pytest
+
+from datadog_checks.haproxy import HAProxy
+
+from . import common
+
+# 10,000 server rows
+STATS = common.generate_stats(100, 100)
+
+
+@pytest.fixture
+def haproxy_mock_bench():
+    with mock.patch('requests.get', return_value=mock.Mock(content=STATS)):
+        yield
+
+
+@pytest.mark.usefixtures('haproxy_mock_bench')
+def test_run(benchmark):
+    instance = {'url': 'http://localhost/admin?stats', 'collect_aggregates_only': False}
+    check = HAProxy(common.CHECK_NAME, {}, {})
+
+    benchmark(check.check, instance)
+
+
+@pytest.mark.usefixtures('haproxy_mock_bench')
+def test_run_status_metrics(benchmark):
+    instance = {
+        'url': 'http://localhost/admin?stats',
+        'collect_aggregates_only': False,
+        'collect_status_metrics': True,
+        'collect_status_metrics_by_host': True,
+        'enable_service_check': True,
+    }
+    check = HAProxy(common.CHECK_NAME, {}, {})
+
+    benchmark(check.check, instance)
+
+
+def test_parse(benchmark):
+    check = HAProxy(common.CHECK_NAME, {}, {})
+    lines = check._split_lines(STATS)
+
+    def parse():
+        rows = csv.reader(lines)
+        plan = check._get_field_plan(next(rows))
+        for row in rows:
+            check._row_to_dict(plan, row)
+
+    benchmark(parse)
@@ -6,19 +6,23 @@ from __future__ import unicode_literals
 import re
 import socket
 import ssl
+import threading
 import time
 import warnings
 from datetime import datetime
 
 import _strptime  # noqa
 import requests
+from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 from requests_ntlm import HttpNtlmAuth
 from six import string_types
+from six.moves.http_cookiejar import DefaultCookiePolicy
 from six.moves.urllib.parse import urlparse
 
-from datadog_checks.base import ensure_unicode
+from datadog_checks.base import ConfigurationError, ensure_unicode, is_affirmative
 from datadog_checks.base.checks import NetworkCheck, Status
+from datadog_checks.base.checks.libs.concurrency import run_concurrently
 
 from .adapters import WeakCiphersAdapter, WeakCiphersHTTPSConnection
 from .config import DEFAULT_EXPECTED_CODE, from_instance
@@ -32,6 +36,8 @@ CONTENT_LENGTH = 200
 
 DATA_METHODS = ['POST', 'PUT', 'DELETE', 'PATCH']
 
+DEFAULT_MAX_CONCURRENT_REQUESTS = 10
+
 
 class HTTPCheck(NetworkCheck):
     SOURCE_TYPE_NAME = 'system'
@@ -45,7 +51,115 @@ class HTTPCheck(NetworkCheck):
         if not self.ca_certs:
             self.ca_certs = get_ca_certs_path()
 
+        # Sessions kept across runs, by origin
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+
+    def stop(self):
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, {}
+        for sess in sessions.values():
+            sess.close()
+
+    def check(self, instance):
+        if 'targets' not in instance:
+            return super(HTTPCheck, self).check(instance)
+
+        targets = instance['targets']
+        if not isinstance(targets, list) or not targets:
+            raise ConfigurationError('`targets` must be a non-empty list of mappings with a `url`')
+
+        target_instances = [self._get_target_instance(instance, target) for target in targets]
+        persist_connections = is_affirmative(instance.get('persist_connections', True))
+        max_concurrent_requests = int(instance.get('max_concurrent_requests', DEFAULT_MAX_CONCURRENT_REQUESTS))
+
+        results = run_concurrently(
+            lambda target_instance: self._probe(target_instance, persist_connections, max_concurrent_requests),
+            target_instances,
+            max_concurrent_requests,
+            name='http_check',
+        )
+
+        # Results are submitted from this thread only, in the order of the targets
+        for target_instance, result, e in results:
+            if e is not None:
+                self.log.error(u"Failed to probe target '%s': %s", target_instance['url'], e)
+                continue
+
+            metrics, service_checks = result
+            for name, value, tags in metrics:
+                self.gauge(name, value, tags=tags)
+            for sc_name, status, msg in service_checks:
+                self.report_as_service_check(sc_name, status, target_instance, msg)
+
+    @staticmethod
+    def _get_target_instance(instance, target):
+        """
+        Return the configuration of a target: the options of the instance overridden by the ones of the target,
+        the tags of the target are added to the ones of the instance.
+        """
+        if not isinstance(target, dict) or not target.get('url'):
+            raise ConfigurationError('Every target must be a mapping with a `url`')
+
+        target_instance = {
+            key: value
+            for key, value in instance.items()
+            if key not in ('targets', 'persist_connections', 'max_concurrent_requests')
+        }
+        target_instance.update(target)
+        target_instance['tags'] = list(instance.get('tags', [])) + list(target.get('tags', []))
+        target_instance.setdefault('name', instance.get('name', target['url']))
+        return target_instance
+
+    def _get_session(self, parsed_uri, weakcipher, persist_connections, pool_maxsize=DEFAULT_MAX_CONCURRENT_REQUESTS):
+        """
+        Return the session used to request a URL. Sessions are shared by all the URLs of the same origin
+        and kept across runs if `persist_connections`, so that their connections are reused.
+        """
+        base_addr = '{uri.scheme}://{uri.netloc}/'.format(uri=parsed_uri)
+        key = (base_addr, weakcipher)
+        if persist_connections:
+            with self._sessions_lock:
+                sess = self._sessions.get(key)
+                if sess is None:
+                    sess = self._sessions[key] = self._create_session(base_addr, weakcipher, pool_maxsize)
+            return sess
+
+        return self._create_session(base_addr, weakcipher, pool_maxsize)
+
+    def _create_session(self, base_addr, weakcipher, pool_maxsize):
+        sess = requests.Session()
+        sess.trust_env = False
+        # Cookies are never kept from one request to the next, only during the redirects of a request
+        sess.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize)
+        sess.mount('http://', adapter)
+        sess.mount('https://', adapter)
+        if weakcipher:
+            sess.mount(base_addr, WeakCiphersAdapter(pool_maxsize=pool_maxsize))
+            self.log.debug(
+                "Weak Ciphers will be used for {}. Supported Cipherlist: {}".format(
+                    base_addr, WeakCiphersHTTPSConnection.SUPPORTED_CIPHERS
+                )
+            )
+
+        return sess
+
     def _check(self, instance):
+        metrics, service_checks = self._probe(instance, is_affirmative(instance.get('persist_connections', False)))
+        for name, value, tags in metrics:
+            self.gauge(name, value, tags=tags)
+
+        return service_checks
+
+    def _probe(self, instance, persist_connections=False, pool_maxsize=DEFAULT_MAX_CONCURRENT_REQUESTS):
+        """
+        Request the URL of an instance, return the metrics to submit as (name, value, tags)
+        and the service checks to report as (name, status, message).
+
+        Safe to call from several threads at the same time: nothing is submitted.
+        """
         (
             addr,
             ntlm_domain,
@@ -94,7 +208,10 @@ class HTTPCheck(NetworkCheck):
         instance_name = self.normalize(instance['name'])
         tags_list.append("instance:{}".format(instance_name))
         service_checks = []
+        metrics = []
         r = None
+        peer_cert = None
+        sess = None
         try:
             parsed_uri = urlparse(addr)
             self.log.debug("Connecting to {}".format(addr))
@@ -127,16 +244,7 @@ class HTTPCheck(NetworkCheck):
                 elif ntlm_domain is not None:
                     auth = HttpNtlmAuth(ntlm_domain, password)
 
-            sess = requests.Session()
-            sess.trust_env = False
-            if weakcipher:
-                base_addr = '{uri.scheme}://{uri.netloc}/'.format(uri=parsed_uri)
-                sess.mount(base_addr, WeakCiphersAdapter())
-                self.log.debug(
-                    "Weak Ciphers will be used for {}. Supported Cipherlist: {}".format(
-                        base_addr, WeakCiphersHTTPSConnection.SUPPORTED_CIPHERS
-                    )
-                )
+            sess = self._get_session(parsed_uri, weakcipher, persist_connections, pool_maxsize)
 
             with warnings.catch_warnings():
                 # Suppress warnings from urllib3 only if disable_ssl_validation is explicitly set to True
@@ -152,13 +260,22 @@ class HTTPCheck(NetworkCheck):
                     headers=headers,
                     proxies=instance_proxy,
                     allow_redirects=allow_redirects,
-                    stream=stream,
+                    # The content is read below, once the certificate of the connection is known
+                    stream=True,
                     verify=False if disable_ssl_validation else instance_ca_certs,
                     json=data if method.upper() in DATA_METHODS and isinstance(data, dict) else None,
                     data=data if method.upper() in DATA_METHODS and isinstance(data, string_types) else None,
                     cert=(client_cert, client_key) if client_cert and client_key else None,
                 )
 
+                # The certificate validated by the request can only be used for the expiration if the
+                # expiration check would validate the same one: same CA certificates and host name
+                if ssl_expire and not disable_ssl_validation and 'ssl_server_name' not in instance:
+                    peer_cert = self._get_peer_cert(r)
+
+                if not stream:
+                    r.content
+
         except (socket.timeout, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
             length = int((time.time() - start) * 1000)
             self.log.info("{} is DOWN, error: {}. Connection failed after {} ms".format(addr, str(e), length))
@@ -187,7 +304,7 @@ class HTTPCheck(NetworkCheck):
             if response_time and not service_checks:
                 # Stop the timer as early as possible
                 running_time = time.time() - start
-                self.gauge('network.http.response_time', running_time, tags=tags_list)
+                metrics.append(('network.http.response_time', running_time, tags_list))
 
             content = r.text
 
@@ -244,29 +361,54 @@ class HTTPCheck(NetworkCheck):
         finally:
             if r is not None:
                 r.close()
+            if sess is not None and not persist_connections:
+                sess.close()
 
         # Report status metrics as well
         if service_checks:
             can_status = 1 if service_checks[0][1] == "UP" else 0
-            self.gauge('network.http.can_connect', can_status, tags=tags_list)
+            metrics.append(('network.http.can_connect', can_status, tags_list))
 
             # cant_connect is useful for top lists
             cant_status = 0 if service_checks[0][1] == "UP" else 1
-            self.gauge('network.http.cant_connect', cant_status, tags=tags_list)
+            metrics.append(('network.http.cant_connect', cant_status, tags_list))
 
         if ssl_expire and parsed_uri.scheme == "https":
-            status, days_left, seconds_left, msg = self.check_cert_expiration(
-                instance, timeout, instance_ca_certs, check_hostname, client_cert, client_key
-            )
+            if peer_cert:
+                self.log.debug("Using the certificate of the connection to {} for its expiration".format(addr))
+                status, days_left, seconds_left, msg = self._get_cert_expiration_status(instance, peer_cert)
+            else:
+                status, days_left, seconds_left, msg = self.check_cert_expiration(
+                    instance, timeout, instance_ca_certs, check_hostname, client_cert, client_key
+                )
             tags_list = list(tags)
             tags_list.append('url:{}'.format(addr))
             tags_list.append("instance:{}".format(instance_name))
-            self.gauge('http.ssl.days_left', days_left, tags=tags_list)
-            self.gauge('http.ssl.seconds_left', seconds_left, tags=tags_list)
+            metrics.append(('http.ssl.days_left', days_left, tags_list))
+            metrics.append(('http.ssl.seconds_left', seconds_left, tags_list))
 
             service_checks.append((self.SC_SSL_CERT, status, msg))
 
-        return service_checks
+        return metrics, service_checks
+
+    @staticmethod
+    def _get_peer_cert(response):
+        """
+        Return the certificate validated during the TLS handshake of the connection of a response,
+        if it still holds it: before its content is read, when it was not redirected and when
+        the server keeps the connection alive.
+        """
+        if response.history:
+            return None
+
+        connection = getattr(response.raw, '_connection', None)
+        if not getattr(connection, 'is_verified', False):
+            return None
+
+        try:
+            return connection.sock.getpeercert() or None
+        except Exception:
+            return None
 
     def report_as_service_check(self, sc_name, status, instance, msg=None):
         instance_name = self.normalize(instance['name'])
@@ -297,17 +439,6 @@ class HTTPCheck(NetworkCheck):
     def check_cert_expiration(
         self, instance, timeout, instance_ca_certs, check_hostname, client_cert=None, client_key=None
     ):
-        # thresholds expressed in seconds take precedence over those expressed in days
-        seconds_warning = (
-            int(instance.get('seconds_warning', 0))
-            or int(instance.get('days_warning', 0)) * 24 * 3600
-            or DEFAULT_EXPIRE_WARNING
-        )
-        seconds_critical = (
-            int(instance.get('seconds_critical', 0))
-            or int(instance.get('days_critical', 0)) * 24 * 3600
-            or DEFAULT_EXPIRE_CRITICAL
-        )
         url = instance.get('url')
 
         o = urlparse(url)
@@ -342,6 +473,21 @@ class HTTPCheck(NetworkCheck):
                 self.log.debug("Site is down, unable to connect to get cert expiration: {}".format(e))
                 return Status.DOWN, 0, 0, msg
 
+        return self._get_cert_expiration_status(instance, cert)
+
+    def _get_cert_expiration_status(self, instance, cert):
+        # thresholds expressed in seconds take precedence over those expressed in days
+        seconds_warning = (
+            int(instance.get('seconds_warning', 0))
+            or int(instance.get('days_warning', 0)) * 24 * 3600
+            or DEFAULT_EXPIRE_WARNING
+        )
+        seconds_critical = (
+            int(instance.get('seconds_critical', 0))
+            or int(instance.get('days_critical', 0)) * 24 * 3600
+            or DEFAULT_EXPIRE_CRITICAL
+        )
+
         exp_date = datetime.strptime(cert['notAfter'], "%b %d %H:%M:%S %Y %Z")
         time_left = exp_date - datetime.utcnow()
         days_left = time_left.days
@@ -23,6 +23,17 @@ def http_check():
         yield HTTPCheck('http_check', {}, {})
 
 
+@pytest.fixture
+def new_http_check():
+    """
+    A check of its own for the tests depending on its state, e.g. the sessions it keeps
+    """
+    with patch('datadog_checks.http_check.http_check.get_ca_certs_path', new=mock_get_ca_certs_path):
+        check = HTTPCheck('http_check', {}, {})
+        yield check
+        check.stop()
+
+
 def mock_get_ca_certs_path():
     """
     Mimic get_ca_certs_path() by using the certificates located in the `tests/` folder
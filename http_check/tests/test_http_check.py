@@ -4,10 +4,14 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 import os
+import threading
 
 import mock
 import pytest
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
 
+from datadog_checks.base import ConfigurationError
 from datadog_checks.http_check import HTTPCheck
 
 from .common import (
@@ -286,3 +290,147 @@ def test_data_methods(aggregator, http_check):
         # Assert coverage for this check on this instance
         aggregator.assert_all_metrics_covered()
         aggregator.reset()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    # Keep-alive
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        code = int(self.path.strip('/'))
+        body = b'status'
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def status_server():
+    """
+    A local server responding with the status code of the path of the request, e.g. `/404`,
+    recording the client address of every connection.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StatusHandler)
+    server.connections = set()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:{}'.format(server.server_address[1]), server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.unit
+def test_check_targets(aggregator, status_server, new_http_check):
+    base_url, server = status_server
+    check = new_http_check
+    instance = {
+        'name': 'local',
+        'tags': ['env:test'],
+        'max_concurrent_requests': 1,
+        'targets': [
+            {'url': '{}/200'.format(base_url), 'tags': ['target:ok']},
+            {'url': '{}/404'.format(base_url), 'name': 'missing'},
+        ],
+    }
+
+    # The connections are kept across runs
+    check.check(instance)
+    check.check(instance)
+    assert len(server.connections) == 1
+    assert len(check._sessions) == 1
+    # The instance is left untouched
+    assert instance['tags'] == ['env:test']
+
+    ok_tags = ['env:test', 'target:ok', 'url:{}/200'.format(base_url), 'instance:local']
+    aggregator.assert_service_check(HTTPCheck.SC_STATUS, status=HTTPCheck.OK, tags=ok_tags, count=2)
+    aggregator.assert_metric('network.http.can_connect', value=1, tags=ok_tags, count=2)
+    aggregator.assert_metric('network.http.cant_connect', value=0, tags=ok_tags, count=2)
+    aggregator.assert_metric('network.http.response_time', tags=ok_tags, count=2)
+
+    missing_tags = ['env:test', 'url:{}/404'.format(base_url), 'instance:missing']
+    aggregator.assert_service_check(HTTPCheck.SC_STATUS, status=HTTPCheck.CRITICAL, tags=missing_tags, count=2)
+    aggregator.assert_metric('network.http.can_connect', value=0, tags=missing_tags, count=2)
+    aggregator.assert_metric('network.http.cant_connect', value=1, tags=missing_tags, count=2)
+    aggregator.assert_all_metrics_covered()
+
+    check.stop()
+    assert check._sessions == {}
+
+
+@pytest.mark.unit
+def test_check_targets_concurrent(aggregator, status_server, new_http_check):
+    base_url, server = status_server
+    check = new_http_check
+    targets = [{'url': '{}/200'.format(base_url), 'name': 'target_{}'.format(i)} for i in range(20)]
+    instance = {'targets': targets, 'max_concurrent_requests': 5, 'persist_connections': False}
+
+    check.check(instance)
+
+    assert check._sessions == {}
+    for target in targets:
+        tags = ['url:{}'.format(target['url']), 'instance:{}'.format(target['name'])]
+        aggregator.assert_service_check(HTTPCheck.SC_STATUS, status=HTTPCheck.OK, tags=tags, count=1)
+        aggregator.assert_metric('network.http.response_time', tags=tags, count=1)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize('targets', [[], [{'name': 'no_url'}], ['http://localhost']])
+def test_check_targets_invalid(new_http_check, targets):
+    check = new_http_check
+
+    with pytest.raises(ConfigurationError):
+        check.check({'targets': targets})
+
+
+@pytest.mark.unit
+def test_get_peer_cert():
+    cert = {'notAfter': 'Jan  1 00:00:00 2100 GMT'}
+    response = mock.MagicMock(history=[])
+    response.raw._connection.is_verified = True
+    response.raw._connection.sock.getpeercert.return_value = cert
+    assert HTTPCheck._get_peer_cert(response) == cert
+
+    # The certificate of the connection is not the one of the URL after redirects
+    response.history = [mock.MagicMock()]
+    assert HTTPCheck._get_peer_cert(response) is None
+
+    response.history = []
+    response.raw._connection.is_verified = False
+    assert HTTPCheck._get_peer_cert(response) is None
+
+    # The connection was released
+    response.raw._connection = None
+    assert HTTPCheck._get_peer_cert(response) is None
+
+
+@pytest.mark.unit
+def test_check_ssl_expire_peer_cert(aggregator, new_http_check):
+    check = new_http_check
+    instance = {'url': 'https://example.com', 'name': 'example', 'disable_ssl_validation': False}
+    cert = {'notAfter': 'Jan  1 00:00:00 2100 GMT'}
+
+    response = mock.MagicMock(status_code=200, history=[], text='')
+    with mock.patch('requests.Session.request', return_value=response), mock.patch.object(
+        HTTPCheck, '_get_peer_cert', return_value=cert
+    ), mock.patch.object(HTTPCheck, 'check_cert_expiration') as check_cert_expiration:
+        check.check(instance)
+
+    # No other TLS handshake
+    check_cert_expiration.assert_not_called()
+    tags = ['url:https://example.com', 'instance:example']
+    aggregator.assert_service_check(HTTPCheck.SC_STATUS, status=HTTPCheck.OK, tags=tags, count=1)
+    aggregator.assert_service_check(HTTPCheck.SC_SSL_CERT, status=HTTPCheck.OK, tags=tags, count=1)
+    aggregator.assert_metric('http.ssl.days_left', tags=tags, count=1)
+    aggregator.assert_metric('http.ssl.seconds_left', tags=tags, count=1)
@@ -3,13 +3,13 @@
 # Licensed under a 3-clause BSD style license (see LICENSE)
 from __future__ import division
 
-from itertools import chain
 from time import time as timestamp
 
 import ibm_db
 
 from datadog_checks.base import AgentCheck, is_affirmative
 from datadog_checks.base.utils.containers import iter_unique
+from datadog_checks.base.utils.db import QueryManager
 
 from . import queries
 from .utils import scrub_connection_string, status_to_service_check
@@ -52,6 +52,12 @@ class IbmDb2Check(AgentCheck):
         # Deduplicate
         self._custom_queries = list(iter_unique(custom_queries))
 
+        # Compile custom queries once
+        stats_namespace = None
+        if is_affirmative(self.instance.get('collect_custom_query_stats', False)):
+            stats_namespace = self.METRIC_PREFIX
+        self._query_manager = QueryManager(self, self._custom_queries, stats_namespace=stats_namespace)
+
     def check(self, instance):
         if self._conn is None:
             connection = self.get_connection()
@@ -389,93 +395,10 @@ class IbmDb2Check(AgentCheck):
             self.monotonic_count(self.m('log.writes'), tlog['log_writes'], tags=self._tags)
 
     def query_custom(self):
-        for custom_query in self._custom_queries:
-            metric_prefix = custom_query.get('metric_prefix')
-            if not metric_prefix:  # no cov
-                self.log.error('Custom query field `metric_prefix` is required')
-                continue
-            metric_prefix = metric_prefix.rstrip('.')
-
-            query = custom_query.get('query')
-            if not query:  # no cov
-                self.log.error('Custom query field `query` is required for metric_prefix `{}`'.format(metric_prefix))
-                continue
-
-            columns = custom_query.get('columns')
-            if not columns:  # no cov
-                self.log.error('Custom query field `columns` is required for metric_prefix `{}`'.format(metric_prefix))
-                continue
-
-            rows = self.iter_rows(query, ibm_db.fetch_tuple)
-            self.log.debug('Running query for metric_prefix `{}`: `{}`'.format(metric_prefix, query))
-
-            # Trigger query execution
-            try:
-                first_row = next(rows)
-            except Exception as e:  # no cov
-                self.log.error('Error executing query for metric_prefix `{}`: `{}`'.format(metric_prefix, e))
-                continue
-
-            for row in chain((first_row,), rows):
-                if not row:  # no cov
-                    self.log.debug(
-                        'Query result for metric_prefix `{}`: returned an empty result'.format(metric_prefix)
-                    )
-                    continue
-
-                if len(columns) != len(row):  # no cov
-                    self.log.error(
-                        'Query result for metric_prefix `{}`: expected {} columns, got {}'.format(
-                            metric_prefix, len(columns), len(row)
-                        )
-                    )
-                    continue
-
-                metric_info = []
-                query_tags = list(self._tags)
-                query_tags.extend(custom_query.get('tags', []))
-
-                for column, value in zip(columns, row):
-                    # Columns can be ignored via configuration.
-                    if not column:  # no cov
-                        continue
-
-                    name = column.get('name')
-                    if not name:  # no cov
-                        self.log.error('Column field `name` is required for metric_prefix `{}`'.format(metric_prefix))
-                        break
-
-                    column_type = column.get('type')
-                    if not column_type:  # no cov
-                        self.log.error(
-                            'Column field `type` is required for column `{}` '
-                            'of metric_prefix `{}`'.format(name, metric_prefix)
-                        )
-                        break
-
-                    if column_type == 'tag':
-                        query_tags.append('{}:{}'.format(name, value))
-                    else:
-                        if not hasattr(self, column_type):
-                            self.log.error(
-                                'Invalid submission method `{}` for metric column `{}` of '
-                                'metric_prefix `{}`'.format(column_type, name, metric_prefix)
-                            )
-                            break
-                        try:
-                            metric_info.append(('{}.{}'.format(metric_prefix, name), float(value), column_type))
-                        except (ValueError, TypeError):  # no cov
-                            self.log.error(
-                                'Non-numeric value `{}` for metric column `{}` of '
-                                'metric_prefix `{}`'.format(value, name, metric_prefix)
-                            )
-                            break
-
-                # Only submit metrics if there were absolutely no errors - all or nothing.
-                else:
-                    for info in metric_info:
-                        metric, value, method = info
-                        getattr(self, method)(metric, value, tags=query_tags)
+        self._query_manager.execute(self.execute_custom_query, tags=self._tags)
+
+    def execute_custom_query(self, query):
+        return self.iter_rows(query, ibm_db.fetch_tuple)
 
     def track_table_space_state_changes(self, name, state, tags):
         previous_state = self._table_space_states.get(name)
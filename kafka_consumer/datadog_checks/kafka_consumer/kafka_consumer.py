@@ -54,6 +54,7 @@ class KafkaCheck(AgentCheck):
         self._zk_last_ts = {}
 
         self.kafka_clients = {}
+        self._zk_clients = {}
 
     def check(self, instance):
         # For calculating lag, we have to fetch offsets from both kafka and
@@ -71,6 +72,9 @@ class KafkaCheck(AgentCheck):
         get_kafka_consumer_offsets = is_affirmative(instance.get('kafka_consumer_offsets', zk_hosts_ports is None))
 
         custom_tags = instance.get('tags', [])
+        collect_phase_timings = is_affirmative(instance.get('collect_phase_timings', False))
+        # (phase, duration in seconds)
+        timings = []
 
         # If monitor_unlisted_consumer_groups is True, fetch all groups stored in ZK
         consumer_groups = None
@@ -82,9 +86,11 @@ class KafkaCheck(AgentCheck):
 
         zk_consumer_offsets = None
         if zk_hosts_ports and self._should_zk(zk_hosts_ports, zk_interval, get_kafka_consumer_offsets):
+            start = time()
             zk_consumer_offsets, consumer_groups = self._get_zk_consumer_offsets(
                 zk_hosts_ports, consumer_groups, zk_prefix
             )
+            timings.append(('zk_consumer_offsets', time() - start))
 
         topics = defaultdict(set)
         kafka_consumer_offsets = None
@@ -106,7 +112,9 @@ class KafkaCheck(AgentCheck):
             #
             # Kafka 0.8.2 added support for storing consumer offsets in Kafka.
             if cli.config.get('api_version') >= (0, 8, 2):
+                start = time()
                 kafka_consumer_offsets, topics = self._get_kafka_consumer_offsets(instance, consumer_groups)
+                timings.append(('kafka_consumer_offsets', time() - start))
 
         if not topics:
             # val = {'consumer_group': {'topic': [0, 1]}}
@@ -126,11 +134,14 @@ class KafkaCheck(AgentCheck):
             return
 
         # Fetch the broker highwater offsets
+        start = time()
         try:
             highwater_offsets, topic_partitions_without_a_leader = self._get_broker_offsets(instance, topics)
         except Exception:
             self.log.exception('There was a problem collecting the high watermark offsets')
             return
+        timings.append(('broker_offsets', time() - start))
+        start = time()
 
         # Report the broker highwater offset
         for (topic, partition), highwater_offset in iteritems(highwater_offsets):
@@ -152,14 +163,23 @@ class KafkaCheck(AgentCheck):
                 topic_partitions_without_a_leader,
                 tags=custom_tags + ['source:kafka'],
             )
+        timings.append(('report', time() - start))
+
+        for phase, duration in timings:
+            self.log.debug('Phase %s took %.3fs', phase, duration)
+            if collect_phase_timings:
+                self.gauge('kafka.consumer_check.duration', duration, tags=['phase:%s' % phase] + custom_tags)
 
     def stop(self):
         """
         cleanup kafka connections (to all brokers) to avoid leaving
-        stale connections in older kafkas.
+        stale connections in older kafkas, and zookeeper sessions.
         """
         for cli in itervalues(self.kafka_clients):
             cli.close()
+        for zk_conn in itervalues(self._zk_clients):
+            self._close_zk_client(zk_conn)
+        self._zk_clients = {}
 
     def _get_kafka_client(self, instance):
         kafka_conn_str = instance.get('kafka_connect_str')
@@ -226,6 +246,21 @@ class KafkaCheck(AgentCheck):
 
         return response
 
+    def _make_concurrent_reqs(self, client, requests):
+        """
+        Send all the `(node_id, request)` pairs before waiting for any response, so that the brokers
+        process them at the same time. Return their futures, in the same order, once all of them are done.
+        """
+        for node_id in set(node_id for node_id, _ in requests):
+            self._ensure_ready_node(client, node_id)
+
+        futures = [client.send(node_id, request) for node_id, request in requests]
+        # Polling processes the responses of all the connections, not only the one of the future
+        for future in futures:
+            client.poll(future=future)
+
+        return futures
+
     def _get_group_coordinator(self, client, group):
         request = GroupCoordinatorRequest[0](group)
 
@@ -248,6 +283,34 @@ class KafkaCheck(AgentCheck):
 
         return coord_id
 
+    def _get_group_coordinators(self, client, consumer_groups):
+        """
+        Look up the coordinators of all the consumer groups at once, falling back to
+        `_get_group_coordinator` for the groups whose coordinator is still unknown.
+        """
+        groups = list(consumer_groups)
+        futures = {}
+        try:
+            node_id = client.least_loaded_node()
+            requests = [(node_id, GroupCoordinatorRequest[0](group)) for group in groups]
+            futures = dict(zip(groups, self._make_concurrent_reqs(client, requests)))
+        except Exception as e:
+            self.log.debug('Unable to look up the group coordinators at once: %s', e)
+
+        coordinators = {}
+        for group in groups:
+            coord_id = None
+            future = futures.get(group)
+            # 0 means that there is no error
+            if future is not None and future.succeeded() and future.value.error_code == 0:
+                client.cluster.add_group_coordinator(group, future.value)
+                coord_id = client.cluster.coordinator_for_group(group)
+            if coord_id is None or coord_id < 0:
+                coord_id = self._get_group_coordinator(client, group)
+            coordinators[group] = coord_id
+
+        return coordinators
+
     def _process_highwater_offsets(self, response):
         highwater_offsets = {}
         topic_partitions_without_a_leader = []
@@ -328,6 +391,7 @@ class KafkaCheck(AgentCheck):
                     leader_tp[partition_leader][topic].add(partition)
 
         max_offsets = 1
+        requests = []
         for node_id, tps in iteritems(leader_tp):
             # Construct the OffsetRequest
             request = OffsetRequest[0](
@@ -337,22 +401,38 @@ class KafkaCheck(AgentCheck):
                     for topic, partitions in iteritems(tps)
                 ],
             )
+            requests.append((node_id, request))
 
-            response = self._make_blocking_req(cli, request, node_id=node_id)
-            offsets, unled = self._process_highwater_offsets(response)
+        for (node_id, _), future in zip(requests, self._make_concurrent_reqs(cli, requests)):
+            if future.failed():
+                self.log.error('Unable to fetch highwater offsets from broker id: %s: %s', node_id, future.exception)
+                # The consumer offsets of these partitions are skipped without reporting them as unknown
+                topic_partitions_without_a_leader.extend(
+                    (topic, partition)
+                    for topic, partitions in iteritems(leader_tp[node_id])
+                    for partition in partitions
+                )
+                continue
+            offsets, unled = self._process_highwater_offsets(future.value)
             highwater_offsets.update(offsets)
             topic_partitions_without_a_leader.extend(unled)
 
         return highwater_offsets, list(set(topic_partitions_without_a_leader))
 
     def _report_consumer_metrics(self, highwater_offsets, consumer_offsets, unled_topic_partitions=None, tags=None):
-        if unled_topic_partitions is None:
-            unled_topic_partitions = []
+        unled_topic_partitions = set(unled_topic_partitions or [])
         if tags is None:
             tags = []
-        for (consumer_group, topic, partition), consumer_offset in iteritems(consumer_offsets):
-            # Report the consumer group offsets and consumer lag
-            if (topic, partition) not in highwater_offsets:
+
+        # Join the consumer offsets with the highwater offsets of their partitions,
+        # then compute the lag of all of them at once
+        keys = []
+        consumer_values = []
+        highwater_values = []
+        for key, consumer_offset in iteritems(consumer_offsets):
+            consumer_group, topic, partition = key
+            highwater_offset = highwater_offsets.get((topic, partition))
+            if highwater_offset is None:
                 self.log.warn(
                     "[%s] topic: %s partition: %s was not available in the consumer - skipping consumer submission",
                     consumer_group,
@@ -370,6 +450,16 @@ class KafkaCheck(AgentCheck):
                     )
                 continue
 
+            keys.append(key)
+            consumer_values.append(consumer_offset)
+            highwater_values.append(highwater_offset)
+
+        consumer_lags = [highwater - consumer for highwater, consumer in zip(highwater_values, consumer_values)]
+
+        # Report the consumer group offsets and consumer lag
+        for (consumer_group, topic, partition), consumer_offset, consumer_lag in zip(
+            keys, consumer_values, consumer_lags
+        ):
             consumer_group_tags = [
                 'topic:%s' % topic,
                 'partition:%s' % partition,
@@ -377,7 +467,6 @@ class KafkaCheck(AgentCheck):
             ] + tags
             self.gauge('kafka.consumer_offset', consumer_offset, tags=consumer_group_tags)
 
-            consumer_lag = highwater_offsets[(topic, partition)] - consumer_offset
             if consumer_lag < 0:
                 # this will result in data loss, so emit an event for max visibility
                 title = "Negative consumer lag for group: {group}.".format(group=consumer_group)
@@ -393,16 +482,52 @@ class KafkaCheck(AgentCheck):
 
             self.gauge('kafka.consumer_lag', consumer_lag, tags=consumer_group_tags)
 
-    def _get_zk_path_children(self, zk_conn, zk_path, name_for_error):
-        """Fetch child nodes for a given Zookeeper path."""
-        children = []
+    def _get_zk_client(self, zk_hosts_ports):
+        """
+        Return the started ZooKeeper client of these hosts, kept across check runs.
+        Kazoo reconnects it by itself when its connection is lost.
+        """
+        key = hash_mutable(zk_hosts_ports)
+        zk_conn = self._zk_clients.get(key)
+        if zk_conn is None:
+            zk_conn = KazooClient(zk_hosts_ports, timeout=self._zk_timeout)
+            try:
+                zk_conn.start(timeout=self._zk_timeout)
+            except Exception:
+                self._close_zk_client(zk_conn)
+                raise
+            self._zk_clients[key] = zk_conn
+
+        return zk_conn
+
+    def _close_zk_client(self, zk_conn):
         try:
-            children = zk_conn.get_children(zk_path)
-        except NoNodeError:
-            self.log.info('No zookeeper node at %s', zk_path)
+            zk_conn.stop()
+            zk_conn.close()
         except Exception:
-            self.log.exception('Could not read %s from %s', name_for_error, zk_path)
-        return children
+            self.log.exception('Error cleaning up Zookeeper connection')
+
+    def _get_zk_results(self, zk_conn, zk_paths, name_for_error, children=False):
+        """
+        Read the data, or the child nodes if `children`, of all the Zookeeper paths at once: all the
+        requests are pipelined on the connection before waiting for their results.
+
+        Return the results of the paths that could be read, by path.
+        """
+        if children:
+            async_results = [(zk_path, zk_conn.get_children_async(zk_path)) for zk_path in zk_paths]
+        else:
+            async_results = [(zk_path, zk_conn.get_async(zk_path)) for zk_path in zk_paths]
+
+        results = {}
+        for zk_path, async_result in async_results:
+            try:
+                results[zk_path] = async_result.get(timeout=self._zk_timeout)
+            except NoNodeError:
+                self.log.info('No zookeeper node at %s', zk_path)
+            except Exception:
+                self.log.exception('Could not read %s from %s', name_for_error, zk_path)
+        return results
 
     def _get_zk_consumer_offsets(self, zk_hosts_ports, consumer_groups=None, zk_prefix=''):
         """
@@ -411,6 +536,9 @@ class KafkaCheck(AgentCheck):
         Also fetch consumer_groups, topics, and partitions if not
         already specified in consumer_groups.
 
+        Each level of the tree is read with one pipelined batch of requests,
+        instead of one request at a time.
+
         :param dict consumer_groups: The consumer groups, topics, and partitions
             that you want to fetch offsets for. If consumer_groups is None, will
             fetch offsets for all consumer_groups. For examples of what this
@@ -423,112 +551,146 @@ class KafkaCheck(AgentCheck):
         zk_path_consumer = zk_prefix + '/consumers/'
         zk_path_topic_tmpl = zk_path_consumer + '{group}/offsets/'
         zk_path_partition_tmpl = zk_path_topic_tmpl + '{topic}/'
+        zk_path_offset_tmpl = zk_path_partition_tmpl + '{partition}/'
 
-        zk_conn = KazooClient(zk_hosts_ports, timeout=self._zk_timeout)
-        zk_conn.start()
+        zk_conn = self._get_zk_client(zk_hosts_ports)
         try:
             if consumer_groups is None:
                 # If consumer groups aren't specified, fetch them from ZK
-                consumer_groups = {
-                    consumer_group: None
-                    for consumer_group in self._get_zk_path_children(zk_conn, zk_path_consumer, 'consumer groups')
-                }
-
+                children = self._get_zk_results(zk_conn, [zk_path_consumer], 'consumer groups', children=True)
+                consumer_groups = {consumer_group: None for consumer_group in children.get(zk_path_consumer, [])}
+
+            # Never modify the consumer groups of the instance
+            consumer_groups = {
+                consumer_group: None if topics is None else dict(topics)
+                for consumer_group, topics in iteritems(consumer_groups)
+            }
+
+            # If topics are't specified, fetch them from ZK
+            zk_paths = {
+                zk_path_topic_tmpl.format(group=consumer_group): consumer_group
+                for consumer_group, topics in iteritems(consumer_groups)
+                if topics is None
+            }
+            children = self._get_zk_results(zk_conn, zk_paths, 'topics', children=True)
+            for zk_path, consumer_group in iteritems(zk_paths):
+                consumer_groups[consumer_group] = {topic: None for topic in children.get(zk_path, [])}
+
+            # If partitions aren't specified, fetch them from ZK
+            zk_paths = {}
             for consumer_group, topics in iteritems(consumer_groups):
-                if topics is None:
-                    # If topics are't specified, fetch them from ZK
-                    zk_path_topics = zk_path_topic_tmpl.format(group=consumer_group)
-                    topics = {topic: None for topic in self._get_zk_path_children(zk_conn, zk_path_topics, 'topics')}
-                    consumer_groups[consumer_group] = topics
-
                 for topic, partitions in iteritems(topics):
-                    if partitions is not None:
-                        partitions = set(partitions)  # defend against bad user input
-                    else:
-                        # If partitions aren't specified, fetch them from ZK
-                        zk_path_partitions = zk_path_partition_tmpl.format(group=consumer_group, topic=topic)
-                        # Zookeeper returns the partition IDs as strings because
-                        # they are extracted from the node path
-                        partitions = [
-                            int(x) for x in self._get_zk_path_children(zk_conn, zk_path_partitions, 'partitions')
-                        ]
-                        consumer_groups[consumer_group][topic] = partitions
-
-                    # Fetch consumer offsets for each partition from ZK
-                    for partition in partitions:
-                        zk_path = (zk_path_partition_tmpl + '{partition}/').format(
-                            group=consumer_group, topic=topic, partition=partition
+                    if partitions is None:
+                        zk_paths[zk_path_partition_tmpl.format(group=consumer_group, topic=topic)] = (
+                            consumer_group,
+                            topic,
                         )
-                        try:
-                            consumer_offset = int(zk_conn.get(zk_path)[0])
-                            key = (consumer_group, topic, partition)
-                            zk_consumer_offsets[key] = consumer_offset
-                        except NoNodeError:
-                            self.log.info('No zookeeper node at %s', zk_path)
-                        except Exception:
-                            self.log.exception('Could not read consumer offset from %s', zk_path)
-        finally:
-            try:
-                zk_conn.stop()
-                zk_conn.close()
-            except Exception:
-                self.log.exception('Error cleaning up Zookeeper connection')
+                    else:
+                        topics[topic] = set(partitions)  # defend against bad user input
+            children = self._get_zk_results(zk_conn, zk_paths, 'partitions', children=True)
+            for zk_path, (consumer_group, topic) in iteritems(zk_paths):
+                # Zookeeper returns the partition IDs as strings because
+                # they are extracted from the node path
+                consumer_groups[consumer_group][topic] = [int(x) for x in children.get(zk_path, [])]
+
+            # Fetch consumer offsets for each partition from ZK
+            zk_paths = {
+                zk_path_offset_tmpl.format(group=consumer_group, topic=topic, partition=partition): (
+                    consumer_group,
+                    topic,
+                    partition,
+                )
+                for consumer_group, topics in iteritems(consumer_groups)
+                for topic, partitions in iteritems(topics)
+                for partition in partitions
+            }
+            results = self._get_zk_results(zk_conn, zk_paths, 'consumer offset')
+            for zk_path, key in iteritems(zk_paths):
+                if zk_path not in results:
+                    continue
+                try:
+                    zk_consumer_offsets[key] = int(results[zk_path][0])
+                except Exception:
+                    self.log.exception('Could not read consumer offset from %s', zk_path)
+        except Exception:
+            # Start from a new connection at the next run
+            self._zk_clients.pop(hash_mutable(zk_hosts_ports), None)
+            self._close_zk_client(zk_conn)
+            raise
+
         return zk_consumer_offsets, consumer_groups
 
     def _get_kafka_consumer_offsets(self, instance, consumer_groups):
         """
         retrieve consumer offsets via the new consumer api. Offsets in this version are stored directly
         in kafka (__consumer_offsets topic) rather than in zookeeper
+
+        The OffsetFetchRequests of all the consumer groups are sent at once.
         """
         consumer_offsets = {}
         topics = defaultdict(set)
 
         cli = self._get_kafka_client(instance)
+        coordinators = self._get_group_coordinators(cli, consumer_groups)
 
+        requests = []
+        request_groups = []
         for consumer_group, topic_partitions in iteritems(consumer_groups):
             try:
-                coordinator_id = self._get_group_coordinator(cli, consumer_group)
-                if coordinator_id:
-                    offsets = self._get_consumer_offsets(cli, consumer_group, topic_partitions, coordinator_id)
-                else:
-                    offsets = self._get_consumer_offsets(cli, consumer_group, topic_partitions)
+                coordinator_id = coordinators[consumer_group]
+                if coordinator_id is None or coordinator_id < 0:
                     self.log.info("unable to find group coordinator for %s", consumer_group)
 
-                for (topic, partition), offset in iteritems(offsets):
-                    topics[topic].update([partition])
-                    key = (consumer_group, topic, partition)
-                    consumer_offsets[key] = offset
+                for request in self._get_consumer_offsets_requests(
+                    cli, consumer_group, topic_partitions, coordinator_id
+                ):
+                    requests.append(request)
+                    request_groups.append(consumer_group)
             except Exception:
                 self.log.exception('Could not read consumer offsets from kafka.')
 
+        try:
+            futures = self._make_concurrent_reqs(cli, requests)
+        except Exception:
+            self.log.exception('Could not read consumer offsets from kafka.')
+            return consumer_offsets, topics
+
+        for consumer_group, future in zip(request_groups, futures):
+            if future.failed():
+                self.log.error(
+                    'Could not read consumer offsets of group %s from kafka: %s', consumer_group, future.exception
+                )
+                continue
+
+            for (topic, partition_offsets) in future.value.topics:
+                for partition, offset, _, error_code in partition_offsets:
+                    if error_code != 0:
+                        continue
+                    topics[topic].add(partition)
+                    consumer_offsets[(consumer_group, topic, partition)] = offset
+
         return consumer_offsets, topics
 
-    def _get_consumer_offsets(self, client, consumer_group, topic_partitions, coord_id=None):
+    def _get_consumer_offsets_requests(self, client, consumer_group, topic_partitions, coord_id=None):
+        """
+        Return the `(node_id, request)` pairs fetching the offsets of a consumer group: from its coordinator
+        if it is known, otherwise from all the brokers.
+        """
         tps = defaultdict(set)
         for topic, partitions in iteritems(topic_partitions):
             if len(partitions) == 0:
                 partitions = client.cluster.available_partitions_for_topic(topic)
             tps[topic] = tps[text_type(topic)].union(set(partitions))
 
-        consumer_offsets = {}
         if coord_id is not None and coord_id >= 0:
             broker_ids = [coord_id]
         else:
             broker_ids = [b.nodeId for b in client.cluster.brokers()]
 
-        for broker_id in broker_ids:
-            # Kafka protocol uses OffsetFetchRequests to retrieve consumer offsets:
-            # https://kafka.apache.org/protocol#The_Messages_OffsetFetch
-            # https://cwiki.apache.org/confluence/display/KAFKA/A+Guide+To+The+Kafka+Protocol#AGuideToTheKafkaProtocol-OffsetFetchRequest
-            request = OffsetFetchRequest[1](consumer_group, list(iteritems(tps)))
-            response = self._make_blocking_req(client, request, node_id=broker_id)
-            for (topic, partition_offsets) in response.topics:
-                for partition, offset, _, error_code in partition_offsets:
-                    if error_code != 0:
-                        continue
-                    consumer_offsets[(topic, partition)] = offset
-
-        return consumer_offsets
+        # Kafka protocol uses OffsetFetchRequests to retrieve consumer offsets:
+        # https://kafka.apache.org/protocol#The_Messages_OffsetFetch
+        # https://cwiki.apache.org/confluence/display/KAFKA/A+Guide+To+The+Kafka+Protocol#AGuideToTheKafkaProtocol-OffsetFetchRequest
+        return [(broker_id, OffsetFetchRequest[1](consumer_group, list(iteritems(tps)))) for broker_id in broker_ids]
 
     def _should_zk(self, zk_hosts_ports, interval, kafka_collect=False):
         if not kafka_collect or not interval:
@@ -0,0 +1,170 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import copy
+
+import mock
+import pytest
+from kafka.future import Future
+from kazoo.exceptions import NoNodeError
+
+from datadog_checks.kafka_consumer import KafkaCheck
+
+pytestmark = pytest.mark.unit
+
+
+class FakeAsyncResult(object):
+    def __init__(self, value=None, error=None):
+        self.value = value
+        self.error = error
+
+    def get(self, block=True, timeout=None):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class FakeZkClient(object):
+    """
+    A Zookeeper tree of consumer offsets, the data of the nodes holding an offset is the offset.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.started = 0
+        self.requests = []
+
+    def start(self, timeout=None):
+        self.started += 1
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+    def get_children_async(self, path):
+        self.requests.append(path)
+        children = sorted(
+            set(p[len(path) :].split('/')[0] for p in self.nodes if p.startswith(path) and len(p) > len(path))
+        )
+        return FakeAsyncResult(children) if children else FakeAsyncResult(error=NoNodeError())
+
+    def get_async(self, path):
+        self.requests.append(path)
+        if path.rstrip('/') in self.nodes:
+            return FakeAsyncResult((self.nodes[path.rstrip('/')], None))
+        return FakeAsyncResult(error=NoNodeError())
+
+
+def test_make_concurrent_reqs():
+    check = KafkaCheck('kafka_consumer', {}, {})
+    client = mock.MagicMock()
+    client.ready.return_value = True
+    calls = []
+    futures = {}
+
+    def send(node_id, request):
+        calls.append(('send', node_id))
+        futures[node_id] = Future()
+        return futures[node_id]
+
+    def poll(future=None):
+        calls.append(('poll', future))
+        # Responses of all the connections are processed by the first poll
+        for node_id, f in sorted(futures.items()):
+            if f.is_done:
+                continue
+            if node_id:
+                f.success(node_id * 10)
+            else:
+                f.failure(Exception('broker down'))
+
+    client.send.side_effect = send
+    client.poll.side_effect = poll
+
+    results = check._make_concurrent_reqs(client, [(1, 'a'), (2, 'b'), (0, 'c')])
+
+    assert [call for call, _ in calls] == ['send', 'send', 'send', 'poll', 'poll', 'poll']
+    assert [f.value for f in results[:2]] == [10, 20]
+    assert results[2].failed()
+
+
+def test_zk_consumer_offsets_pipelined():
+    check = KafkaCheck('kafka_consumer', {}, {})
+    zk_client = FakeZkClient(
+        {
+            '/consumers/group_a/offsets/marvel/0': b'10',
+            '/consumers/group_a/offsets/marvel/1': b'11',
+            '/consumers/group_a/offsets/dc/0': b'20',
+            '/consumers/group_b/offsets/marvel/0': b'30',
+        }
+    )
+    consumer_groups = {'group_a': None, 'group_b': {'marvel': [0, 3]}}
+    original_consumer_groups = copy.deepcopy(consumer_groups)
+
+    with mock.patch('datadog_checks.kafka_consumer.kafka_consumer.KazooClient', return_value=zk_client) as kazoo:
+        offsets, groups = check._get_zk_consumer_offsets('localhost:2181', consumer_groups)
+        assert check._get_zk_consumer_offsets('localhost:2181', consumer_groups)[0] == offsets
+
+    # The client is kept across runs
+    assert kazoo.call_count == 1
+    assert zk_client.started == 1
+    assert offsets == {
+        ('group_a', 'marvel', 0): 10,
+        ('group_a', 'marvel', 1): 11,
+        ('group_a', 'dc', 0): 20,
+        ('group_b', 'marvel', 0): 30,
+    }
+    assert groups == {'group_a': {'marvel': [0, 1], 'dc': [0]}, 'group_b': {'marvel': {0, 3}}}
+    assert consumer_groups == original_consumer_groups
+
+    with mock.patch.object(check, '_close_zk_client') as close:
+        check.stop()
+        close.assert_called_once_with(zk_client)
+    assert check._zk_clients == {}
+
+
+def test_broker_offsets_concurrent():
+    check = KafkaCheck('kafka_consumer', {}, {})
+    client = mock.MagicMock()
+    client.cluster.leader_for_partition.side_effect = lambda tp: tp.partition % 2
+    check.kafka_clients[tuple('localhost:9092')] = client
+
+    def make_concurrent_reqs(cli, requests):
+        futures = []
+        for node_id, request in requests:
+            if node_id == 1:
+                futures.append(Future().failure(Exception('broker down')))
+                continue
+            response = mock.Mock()
+            response.topics = [
+                (topic, [(partition, 0, [100 + partition]) for partition, _, _ in partitions])
+                for topic, partitions in request.topics
+            ]
+            futures.append(Future().success(response))
+        return futures
+
+    with mock.patch.object(check, '_make_concurrent_reqs', side_effect=make_concurrent_reqs) as reqs:
+        highwater_offsets, unled = check._get_broker_offsets(
+            {'kafka_connect_str': 'localhost:9092'}, {'marvel': {0, 1, 2}}
+        )
+
+    assert reqs.call_count == 1
+    assert highwater_offsets == {('marvel', 0): 100, ('marvel', 2): 102}
+    assert unled == [('marvel', 1)]
+
+
+def test_report_consumer_metrics(aggregator):
+    check = KafkaCheck('kafka_consumer', {}, {})
+    highwater_offsets = {('marvel', 0): 100, ('marvel', 1): 50}
+    consumer_offsets = {('group', 'marvel', 0): 90, ('group', 'marvel', 1): 60, ('group', 'dc', 0): 5}
+
+    check._report_consumer_metrics(highwater_offsets, consumer_offsets, tags=['source:kafka'])
+
+    for partition, offset, lag in ((0, 90, 10), (1, 60, -10)):
+        tags = ['topic:marvel', 'partition:{}'.format(partition), 'consumer_group:group', 'source:kafka']
+        aggregator.assert_metric('kafka.consumer_offset', offset, count=1, tags=tags)
+        aggregator.assert_metric('kafka.consumer_lag', lag, count=1, tags=tags)
+    aggregator.assert_all_metrics_covered()
+    assert len(aggregator.events) == 1
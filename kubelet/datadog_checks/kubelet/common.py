@@ -78,44 +78,132 @@ class PodListUtils(object):
     """
     Queries the podlist and the agent6's filtering logic to determine whether to
     send metrics for a given container.
-    Results and podlist are cached between calls to avoid the repeated python-go switching
-    cost (filter called once per prometheus metric), hence the PodListUtils object MUST
-    be re-created at every check run.
+    Results are cached to avoid the repeated python-go switching cost (filter called
+    once per prometheus metric). The PodListUtils object is kept between check runs
+    and updated with each new podlist: only the pods that were added, removed or
+    changed since the previous podlist are re-indexed, and the filtering results of
+    the containers still running are kept.
 
     Containers that are part of a static pod are not filtered, as we cannot curently
     reliably determine their image name to pass to the filtering logic.
     """
 
-    def __init__(self, podlist):
+    def __init__(self, podlist=None):
         self.containers = {}
         self.static_pod_uids = set()
         self.cache = {}
+        self.pods = {}
         self.pod_uid_by_name_tuple = {}
         self.container_id_by_name_tuple = {}
+        # Indexing state of each pod, by pod key, see `_pod_key` and `_index_pod`
+        self.pod_entries = {}
 
-        if podlist is None:
-            return
+        self.update(podlist)
 
-        pods = podlist.get('items') or []
+    @staticmethod
+    def _pod_key(metadata):
+        uid = metadata.get("uid")
+        if uid:
+            return uid
+        return metadata.get("namespace"), metadata.get("name")
 
+    @staticmethod
+    def _pod_signature(pod, metadata):
+        """
+        Everything the indexes depend on: the pod is re-indexed when its signature changes
+        """
+        status = pod.get('status', {})
+        container_statuses = status.get('containerStatuses')
+        cids = tuple(ctr.get('containerID') for ctr in container_statuses or [])
+        return metadata.get('resourceVersion'), status.get('phase'), container_statuses is None, cids
+
+    def update(self, podlist):
+        """
+        Updates the indexes and the filtering cache with a new podlist.
+
+        :param podlist: podlist dict object, None to clear the indexes
+        :return: number of pods added, changed or removed since the previous podlist
+        """
+        pods = (podlist or {}).get('items') or []
+
+        self.pods = {}
+        changed = 0
+        seen = set()
         for pod in pods:
             metadata = pod.get("metadata", {})
+            key = self._pod_key(metadata)
+            seen.add(key)
+
             uid = metadata.get("uid")
-            namespace = metadata.get("namespace")
-            pod_name = metadata.get("name")
-            self.pod_uid_by_name_tuple[(namespace, pod_name)] = uid
-
-            # FIXME we are forced to do that because the Kubelet PodList isn't updated
-            # for static pods, see https://github.com/kubernetes/kubernetes/pull/59948
-            if is_static_pending_pod(pod):
-                self.static_pod_uids.add(uid)
-
-            for ctr in pod.get('status', {}).get('containerStatuses', []):
-                cid = ctr.get('containerID')
-                if not cid:
+            if uid:
+                self.pods[uid] = pod
+
+            signature = self._pod_signature(pod, metadata)
+            entry = self.pod_entries.get(key)
+            if entry is not None:
+                if entry[0] == signature:
                     continue
-                self.containers[cid] = ctr
-                self.container_id_by_name_tuple[(namespace, pod_name, ctr.get('name'))] = cid
+                self._unindex_pod(entry)
+
+            self.pod_entries[key] = self._index_pod(pod, metadata, signature)
+            changed += 1
+
+        for key in [key for key in self.pod_entries if key not in seen]:
+            self._unindex_pod(self.pod_entries.pop(key))
+            changed += 1
+
+        # Results for containers that are not part of a pod, like system slices, are only kept for one podlist
+        containers = self.containers
+        cache = self.cache
+        for cid in [cid for cid in cache if cid not in containers]:
+            del cache[cid]
+
+        return changed
+
+    def _index_pod(self, pod, metadata, signature):
+        uid = metadata.get("uid")
+        namespace = metadata.get("namespace")
+        pod_name = metadata.get("name")
+        self.pod_uid_by_name_tuple[(namespace, pod_name)] = uid
+
+        # FIXME we are forced to do that because the Kubelet PodList isn't updated
+        # for static pods, see https://github.com/kubernetes/kubernetes/pull/59948
+        if is_static_pending_pod(pod):
+            self.static_pod_uids.add(uid)
+
+        cids = []
+        for ctr in pod.get('status', {}).get('containerStatuses', []):
+            cid = ctr.get('containerID')
+            if not cid:
+                continue
+            name_tuple = (namespace, pod_name, ctr.get('name'))
+            self.containers[cid] = ctr
+            self.container_id_by_name_tuple[name_tuple] = cid
+            cids.append((cid, name_tuple))
+
+        return signature, uid, (namespace, pod_name), cids
+
+    def _unindex_pod(self, entry):
+        _, uid, pod_name_tuple, cids = entry
+
+        if pod_name_tuple in self.pod_uid_by_name_tuple and self.pod_uid_by_name_tuple[pod_name_tuple] == uid:
+            del self.pod_uid_by_name_tuple[pod_name_tuple]
+        self.static_pod_uids.discard(uid)
+
+        for cid, name_tuple in cids:
+            self.containers.pop(cid, None)
+            self.cache.pop(cid, None)
+            if self.container_id_by_name_tuple.get(name_tuple) == cid:
+                del self.container_id_by_name_tuple[name_tuple]
+
+    def get_pod_by_uid(self, uid):
+        """
+        Get the pod of the last podlist with the given uid
+
+        :param uid: pod uid
+        :return: pod dict object if found, None if not found
+        """
+        return self.pods.get(uid)
 
     def get_uid_by_name_tuple(self, name_tuple):
         """
@@ -136,6 +136,9 @@ class KubeletCheck(CadvisorPrometheusScraperMixin, OpenMetricsBaseCheck, Cadviso
 
         self.kubelet_scraper_config = self.get_scraper_config(kubelet_instance)
 
+        # Indexes of the podlist, updated incrementally at every run
+        self.pod_list_utils = PodListUtils()
+
     def _create_kubelet_prometheus_instance(self, instance):
         """
         Create a copy of the instance and set default values.
@@ -165,6 +168,8 @@ class KubeletCheck(CadvisorPrometheusScraperMixin, OpenMetricsBaseCheck, Cadviso
                         'kubelet_volume_stats_inodes_used': 'kubelet.volume.stats.inodes_used',
                     }
                 ],
+                # Keep the connection to the kubelet open between runs, it is shared with the cadvisor scraper
+                'persist_connections': instance.get('persist_connections', True),
                 # Defaults that were set when the Kubelet scraper was based on PrometheusScraper
                 'send_monotonic_counter': instance.get('send_monotonic_counter', False),
                 'health_service_check': instance.get('health_service_check', False),
@@ -214,7 +219,9 @@ class KubeletCheck(CadvisorPrometheusScraperMixin, OpenMetricsBaseCheck, Cadviso
             self.log.debug('cAdvisor not found, running in prometheus mode: %s' % str(e))
 
         self.pod_list = self.retrieve_pod_list()
-        self.pod_list_utils = PodListUtils(self.pod_list)
+        changed_pods = self.pod_list_utils.update(self.pod_list)
+        self.log.debug('%d pods changed since the previous podlist', changed_pods)
+        self.reset_container_contexts()
 
         self._report_node_metrics(self.instance_tags)
         self._report_pods_running(self.pod_list, self.instance_tags)
@@ -232,9 +239,8 @@ class KubeletCheck(CadvisorPrometheusScraperMixin, OpenMetricsBaseCheck, Cadviso
             self.log.debug('processing kubelet metrics')
             self.process(self.kubelet_scraper_config)
 
-        # Free up memory
+        # Free up memory, the pods still referenced by pod_list_utils are replaced at the next run
         self.pod_list = None
-        self.pod_list_utils = None
 
     def perform_kubelet_query(self, url, verbose=True, timeout=10, stream=False):
         """
@@ -10,7 +10,7 @@ from six import iteritems
 from datadog_checks.base.utils.tagging import tagger
 from datadog_checks.checks.openmetrics import OpenMetricsBaseCheck
 
-from .common import get_pod_by_uid, is_static_pending_pod
+from .common import is_static_pending_pod
 
 METRIC_TYPES = ['counter', 'gauge', 'summary']
 
@@ -32,6 +32,11 @@ class CadvisorPrometheusScraperMixin(object):
         self.fs_usage_bytes = {}
         self.mem_usage_bytes = {}
 
+        # Resolved once per check run and shared by all the metric families, see `reset_container_contexts`
+        self.container_entity_ids = {}
+        self.container_tags = {}
+        self.pod_tags_by_uid = {}
+
         self.CADVISOR_METRIC_TRANSFORMERS = {
             'container_cpu_usage_seconds_total': self.container_cpu_usage_seconds_total,
             'container_cpu_load_average_10s': self.container_cpu_load_average_10s,
@@ -88,6 +93,11 @@ class CadvisorPrometheusScraperMixin(object):
                     'container_spec_memory_swap_limit_bytes',
                     'container_scrape_error',
                 ],
+                # Only the families handled by CADVISOR_METRIC_TRANSFORMERS are submitted, skip the others
+                # while reading the payload
+                'skip_unused_families': instance.get('skip_unused_families', True),
+                # Keep the connection to the kubelet open between runs, it is shared with the kubelet scraper
+                'persist_connections': instance.get('persist_connections', True),
                 # Defaults that were set when CadvisorPrometheusScraper was based on PrometheusScraper
                 'send_monotonic_counter': instance.get('send_monotonic_counter', False),
                 'health_service_check': instance.get('health_service_check', False),
@@ -166,17 +176,28 @@ class CadvisorPrometheusScraperMixin(object):
         """
         Checks the labels indicate a container metric,
         then extract the container id from them.
+        The result is cached until `reset_container_contexts` is called.
 
         :param labels
         :return str or None
         """
         if CadvisorPrometheusScraperMixin._is_container_metric(labels):
+            key = (labels['namespace'], labels['pod_name'], labels['container_name'])
+            try:
+                return self.container_entity_ids[key]
+            except KeyError:
+                pass
+
             pod = self._get_pod_by_metric_label(labels)
             if is_static_pending_pod(pod):
                 # If the pod is static, ContainerStatus is unavailable.
                 # Return the pod UID so that we can collect metrics from it later on.
-                return self._get_pod_uid(labels)
-            return self._get_container_id(labels)
+                entity_id = self._get_pod_uid(labels)
+            else:
+                entity_id = self._get_container_id(labels)
+
+            self.container_entity_ids[key] = entity_id
+            return entity_id
 
     def _get_pod_uid(self, labels):
         """
@@ -205,10 +226,10 @@ class CadvisorPrometheusScraperMixin(object):
         :param pod_uid: str
         :return: bool
         """
-        for pod in self.pod_list['items']:
-            if pod.get('metadata', {}).get('uid', '') == pod_uid:
-                return pod.get('spec', {}).get('hostNetwork', False)
-        return False
+        pod = self.pod_list_utils.get_pod_by_uid(pod_uid)
+        if pod is None:
+            return False
+        return pod.get('spec', {}).get('hostNetwork', False)
 
     def _get_pod_by_metric_label(self, labels):
         """
@@ -216,7 +237,7 @@ class CadvisorPrometheusScraperMixin(object):
         :return:
         """
         pod_uid = self._get_pod_uid(labels)
-        return get_pod_by_uid(pod_uid, self.pod_list)
+        return self.pod_list_utils.get_pod_by_uid(pod_uid)
 
     @staticmethod
     def _get_kube_container_name(labels):
@@ -234,34 +255,94 @@ class CadvisorPrometheusScraperMixin(object):
             return ["kube_container_name:%s" % container_name]
         return []
 
+    def reset_container_contexts(self):
+        """
+        Forgets the container ids and tags resolved from the metric labels,
+        must be called before each scrape once the podlist is updated.
+        """
+        self.container_entity_ids.clear()
+        self.container_tags.clear()
+        self.pod_tags_by_uid.clear()
+
+    def _get_container_tags(self, c_id, labels, scraper_config):
+        """
+        Returns the tags of a container as a tuple `(tags, static_pod_tags)`, or None if it is excluded.
+        For containers of static pods, `static_pod_tags` also has the tags of the pod and the container name,
+        otherwise it is `tags`. The result is cached until `reset_container_contexts` is called,
+        the tags must not be modified.
+
+        :param c_id: container id, or pod uid for static pods
+        :param labels: labels of a sample of the container
+        :return: tuple or None
+        """
+        key = (c_id, labels.get('container_name'))
+        try:
+            return self.container_tags[key]
+        except KeyError:
+            pass
+
+        context = None
+        pod_uid = self._get_pod_uid(labels)
+        if not self.pod_list_utils.is_excluded(c_id, pod_uid):
+            tags = tagger.tag(c_id, tagger.HIGH) + scraper_config['custom_tags']
+            static_pod_tags = tags
+
+            # FIXME we are forced to do that because the Kubelet PodList isn't updated
+            # for static pods, see https://github.com/kubernetes/kubernetes/pull/59948
+            pod = self._get_pod_by_metric_label(labels)
+            if pod is not None and is_static_pending_pod(pod):
+                static_pod_tags = tags + tagger.tag('kubernetes_pod://%s' % pod["metadata"]["uid"], tagger.HIGH)
+                static_pod_tags += self._get_kube_container_name(labels)
+                static_pod_tags = list(set(static_pod_tags))
+
+            context = (tags, static_pod_tags)
+
+        self.container_tags[key] = context
+        return context
+
+    def _get_pod_tags(self, pod_uid, scraper_config):
+        """
+        Returns the tags of a pod, cached until `reset_container_contexts` is called.
+        The tags must not be modified.
+        """
+        try:
+            return self.pod_tags_by_uid[pod_uid]
+        except KeyError:
+            pass
+
+        tags = tagger.tag('kubernetes_pod://%s' % pod_uid, tagger.HIGH) + scraper_config['custom_tags']
+        self.pod_tags_by_uid[pod_uid] = tags
+        return tags
+
     @staticmethod
     def _sum_values_by_context(metric, uid_from_labels):
         """
         Iterates over all metrics in a metric and sums the values
-        matching the same uid. Modifies the metric family in place.
+        matching the same uid.
         :param metric: prometheus metric family
         :param uid_from_labels: function mapping a metric.label to a unique context id
         :return: dict with uid as keys, metric object references as values
         """
-        seen = {}
+        first_samples = {}
+        values = {}
         for sample in metric.samples:
             uid = uid_from_labels(sample[OpenMetricsBaseCheck.SAMPLE_LABELS])
             if not uid:
-                # TODO
-                # metric.Clear()  # Ignore this metric message
                 continue
-            # Sum the counter value accross all contexts
-            if uid not in seen:
-                seen[uid] = sample
+            # Sum the counter value accross all contexts, the sample tuples are only built once
+            if uid in values:
+                values[uid] += sample[OpenMetricsBaseCheck.SAMPLE_VALUE]
             else:
-                # We have to create a new tuple
-                seen[uid] = (
-                    seen[uid][OpenMetricsBaseCheck.SAMPLE_NAME],
-                    seen[uid][OpenMetricsBaseCheck.SAMPLE_LABELS],
-                    seen[uid][OpenMetricsBaseCheck.SAMPLE_VALUE] + sample[OpenMetricsBaseCheck.SAMPLE_VALUE],
-                )
-                # TODO
-                # metric.Clear()  # Ignore this metric message
+                values[uid] = sample[OpenMetricsBaseCheck.SAMPLE_VALUE]
+                first_samples[uid] = sample
+
+        seen = {}
+        for uid, sample in iteritems(first_samples):
+            seen[uid] = (
+                sample[OpenMetricsBaseCheck.SAMPLE_NAME],
+                sample[OpenMetricsBaseCheck.SAMPLE_LABELS],
+                values[uid],
+            )
         return seen
 
     def _process_container_metric(self, type, metric_name, metric, scraper_config):
@@ -273,29 +354,14 @@ class CadvisorPrometheusScraperMixin(object):
             self.log.error("Metric type %s unsupported for metric %s" % (metric.type, metric.name))
             return
 
+        submit = self.rate if "rate" == type else self.gauge
         samples = self._sum_values_by_context(metric, self._get_entity_id_if_container_metric)
         for c_id, sample in iteritems(samples):
-            pod_uid = self._get_pod_uid(sample[self.SAMPLE_LABELS])
-            if self.pod_list_utils.is_excluded(c_id, pod_uid):
+            context = self._get_container_tags(c_id, sample[self.SAMPLE_LABELS], scraper_config)
+            if context is None:
                 continue
 
-            tags = tagger.tag(c_id, tagger.HIGH)
-            tags += scraper_config['custom_tags']
-
-            # FIXME we are forced to do that because the Kubelet PodList isn't updated
-            # for static pods, see https://github.com/kubernetes/kubernetes/pull/59948
-            pod = self._get_pod_by_metric_label(sample[self.SAMPLE_LABELS])
-            if pod is not None and is_static_pending_pod(pod):
-                tags += tagger.tag('kubernetes_pod://%s' % pod["metadata"]["uid"], tagger.HIGH)
-                tags += self._get_kube_container_name(sample[self.SAMPLE_LABELS])
-                tags = list(set(tags))
-
-            val = sample[self.SAMPLE_VALUE]
-
-            if "rate" == type:
-                self.rate(metric_name, val, tags)
-            elif "gauge" == type:
-                self.gauge(metric_name, val, tags)
+            submit(metric_name, sample[self.SAMPLE_VALUE], context[1])
 
     def _process_pod_rate(self, metric_name, metric, scraper_config):
         """
@@ -310,8 +376,7 @@ class CadvisorPrometheusScraperMixin(object):
         for pod_uid, sample in iteritems(samples):
             if '.network.' in metric_name and self._is_pod_host_networked(pod_uid):
                 continue
-            tags = tagger.tag('kubernetes_pod://%s' % pod_uid, tagger.HIGH)
-            tags += scraper_config['custom_tags']
+            tags = self._get_pod_tags(pod_uid, scraper_config)
             val = sample[self.SAMPLE_VALUE]
             self.rate(metric_name, val, tags)
 
@@ -329,21 +394,11 @@ class CadvisorPrometheusScraperMixin(object):
             c_name = self._get_container_label(sample[self.SAMPLE_LABELS], 'name')
             if not c_name:
                 continue
-            pod_uid = self._get_pod_uid(sample[self.SAMPLE_LABELS])
-            if self.pod_list_utils.is_excluded(c_id, pod_uid):
+            context = self._get_container_tags(c_id, sample[self.SAMPLE_LABELS], scraper_config)
+            if context is None:
                 continue
 
-            tags = tagger.tag(c_id, tagger.HIGH)
-            tags += scraper_config['custom_tags']
-
-            # FIXME we are forced to do that because the Kubelet PodList isn't updated
-            # for static pods, see https://github.com/kubernetes/kubernetes/pull/59948
-            pod = self._get_pod_by_metric_label(sample[self.SAMPLE_LABELS])
-            if pod is not None and is_static_pending_pod(pod):
-                tags += tagger.tag('kubernetes_pod://%s' % pod["metadata"]["uid"], tagger.HIGH)
-                tags += self._get_kube_container_name(sample[self.SAMPLE_LABELS])
-                tags = list(set(tags))
-
+            tags = context[1]
             val = sample[self.SAMPLE_VALUE]
             cache[c_name] = (val, tags)
             seen_keys[c_name] = True
@@ -363,15 +418,12 @@ class CadvisorPrometheusScraperMixin(object):
         samples = self._sum_values_by_context(metric, self._get_entity_id_if_container_metric)
         for c_id, sample in iteritems(samples):
             limit = sample[self.SAMPLE_VALUE]
-            pod_uid = self._get_pod_uid(sample[self.SAMPLE_LABELS])
-            if self.pod_list_utils.is_excluded(c_id, pod_uid):
+            context = self._get_container_tags(c_id, sample[self.SAMPLE_LABELS], scraper_config)
+            if context is None:
                 continue
 
-            tags = tagger.tag(c_id, tagger.HIGH)
-            tags += scraper_config['custom_tags']
-
             if m_name:
-                self.gauge(m_name, limit, tags)
+                self.gauge(m_name, limit, context[0])
 
             if pct_m_name and limit > 0:
                 c_name = self._get_container_label(sample[self.SAMPLE_LABELS], 'name')
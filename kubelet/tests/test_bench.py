@@ -0,0 +1,89 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import gzip
+from io import BytesIO
+
+import mock
+import pytest
+from google.protobuf.internal.encoder import _VarintBytes  # pylint: disable=E0611,E0401
+from prometheus_client.parser import text_string_to_metric_families
+
+from datadog_checks.base.utils.prometheus import metrics_pb2
+from datadog_checks.kubelet import KubeletCheck
+
+from .test_kubelet import mock_from_file
+
+
+PROTOBUF_CONTENT_TYPE = 'application/vnd.google.protobuf; proto=io.prometheus.client.MetricFamily; encoding=delimited'
+
+
+@pytest.fixture(scope='module')
+def cadvisor_lines():
+    return mock_from_file('cadvisor_metrics.txt').split('\n')
+
+
+@pytest.fixture(scope='module')
+def cadvisor_protobuf():
+    """
+    The cadvisor fixture encoded in the delimited protobuf format, as the kubelet serves it when asked to
+    """
+    payload = b''
+    for family in text_string_to_metric_families(mock_from_file('cadvisor_metrics.txt')):
+        message = metrics_pb2.MetricFamily(name=family.name, help=family.documentation)
+        message.type = metrics_pb2.MetricType.Value(family.type.upper())
+        for _, labels, value in family.samples:
+            metric = message.metric.add()
+            for name, label_value in sorted(labels.items()):
+                metric.label.add(name=name, value=label_value)
+            getattr(metric, family.type).value = value
+        serialized = message.SerializeToString()
+        payload += _VarintBytes(len(serialized)) + serialized
+    return payload
+
+
+def gzipped_size(payload):
+    buf = BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(payload)
+    return len(buf.getvalue())
+
+
+def parse_cadvisor(check, lines):
+    response = mock.Mock(**{'iter_lines.return_value': lines})
+    config = check.cadvisor_scraper_config
+    return list(check.parse_metric_family(response, config, check.CADVISOR_METRIC_TRANSFORMERS))
+
+
+def test_parse_cadvisor_all_families(benchmark, cadvisor_lines):
+    check = KubeletCheck('kubelet', None, {}, [{'skip_unused_families': False}])
+
+    benchmark(parse_cadvisor, check, cadvisor_lines)
+
+
+def test_parse_cadvisor_skip_unused_families(benchmark, cadvisor_lines):
+    check = KubeletCheck('kubelet', None, {}, [{}])
+
+    benchmark(parse_cadvisor, check, cadvisor_lines)
+
+
+def test_parse_cadvisor_text(benchmark, cadvisor_lines):
+    check = KubeletCheck('kubelet', None, {}, [{'skip_unused_families': False}])
+    payload = '\n'.join(cadvisor_lines).encode('utf-8')
+    benchmark.extra_info['payload_bytes'] = len(payload)
+    benchmark.extra_info['gzipped_payload_bytes'] = gzipped_size(payload)
+
+    benchmark(parse_cadvisor, check, cadvisor_lines)
+
+
+def test_parse_cadvisor_protobuf(benchmark, cadvisor_protobuf):
+    check = KubeletCheck('kubelet', None, {}, [{'skip_unused_families': False, 'use_protobuf_format': True}])
+    response = mock.Mock(content=cadvisor_protobuf, headers={'Content-Type': PROTOBUF_CONTENT_TYPE})
+    benchmark.extra_info['payload_bytes'] = len(cadvisor_protobuf)
+    benchmark.extra_info['gzipped_payload_bytes'] = gzipped_size(cadvisor_protobuf)
+
+    def parse():
+        config = check.cadvisor_scraper_config
+        return list(check.parse_metric_family(response, config, check.CADVISOR_METRIC_TRANSFORMERS))
+
+    benchmark(parse)
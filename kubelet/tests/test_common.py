@@ -89,6 +89,54 @@ def test_filter_staticpods(monkeypatch):
     )
 
 
+def test_pod_list_utils_update(monkeypatch):
+    is_excluded = mock.Mock(return_value=False)
+    monkeypatch.setattr('datadog_checks.kubelet.common.is_excluded', is_excluded)
+
+    fluentd_uid = "2edfd4d9-10ce-11e8-bd5a-42010af00137"
+    fluentd_cid = "docker://5741ed2471c0e458b6b95db40ba05d1a5ee168256638a0264f08703e48d76561"
+    agent_cid = "docker://a335589109ce5506aa69ba7481fc3e6c943abd23c5277016c92dac15d0f40479"
+
+    pod_list_utils = PodListUtils(json.loads(mock_from_file('pods.json')))
+    assert pod_list_utils.is_excluded(fluentd_cid) is False
+    assert pod_list_utils.is_excluded(agent_cid) is False
+    assert pod_list_utils.is_excluded("invalid") is True
+    assert is_excluded.call_count == 2
+
+    # Same podlist: nothing is re-indexed and the filtering results are kept
+    assert pod_list_utils.update(json.loads(mock_from_file('pods.json'))) == 0
+    assert pod_list_utils.is_excluded(fluentd_cid) is False
+    assert pod_list_utils.is_excluded(agent_cid) is False
+    assert is_excluded.call_count == 2
+    assert "invalid" not in pod_list_utils.cache
+
+    # A restarted container changes the pod, a removed pod is dropped from the indexes
+    pods = json.loads(mock_from_file('pods.json'))
+    pods['items'] = [pod for pod in pods['items'] if pod['metadata']['name'] != 'datadog-agent-jbm2k']
+    fluentd = next(pod for pod in pods['items'] if pod['metadata']['uid'] == fluentd_uid)
+    fluentd['status']['containerStatuses'][0]['containerID'] = 'docker://restarted'
+    assert pod_list_utils.update(pods) == 2
+
+    assert len(pod_list_utils.containers) == 7
+    assert agent_cid not in pod_list_utils.containers
+    assert fluentd_cid not in pod_list_utils.containers
+    assert pod_list_utils.get_uid_by_name_tuple(('default', 'datadog-agent-jbm2k')) is None
+    assert pod_list_utils.get_cid_by_name_tuple(('kube-system', 'fluentd-gcp-v2.0.10-9q9t4', 'fluentd-gcp')) == (
+        'docker://restarted'
+    )
+    assert pod_list_utils.get_pod_by_uid(fluentd_uid) is fluentd
+    assert pod_list_utils.is_excluded(agent_cid) is True
+    assert pod_list_utils.is_excluded('docker://restarted') is False
+    assert is_excluded.call_count == 3
+
+    # No podlist clears the indexes
+    assert pod_list_utils.update(None) == 7
+    assert not pod_list_utils.containers
+    assert not pod_list_utils.pods
+    assert not pod_list_utils.pod_uid_by_name_tuple
+    assert not pod_list_utils.static_pod_uids
+
+
 def test_pod_by_uid():
     podlist = json.loads(mock_from_file('pods.json'))
 
@@ -184,3 +184,38 @@ def test_get_kube_container_name():
 
     tags = CadvisorPrometheusScraperMixin._get_kube_container_name([])
     assert tags == []
+
+
+def test_container_tags_resolved_once_per_run(cadvisor_scraper, aggregator):
+    config = cadvisor_scraper.cadvisor_scraper_config
+    labels = {
+        "container_name": "datadog-agent",
+        "namespace": "default",
+        "pod_name": "datadog-agent-pbqt2",
+        "name": "datadog-agent",
+        "image": "datadog/agent",
+        "id": "/kubepods/burstable/podb66c40af-997d-11e8-96a3-42010a840157/51cba2ca",
+    }
+    cpu_labels = dict(labels, cpu="cpu00")
+    family = mock.Mock(type='gauge', samples=[('container_memory_rss', labels, 10.0)])
+    family_per_cpu = mock.Mock(
+        type='counter',
+        samples=[
+            ('container_cpu_user_seconds_total', cpu_labels, 1.0),
+            ('container_cpu_user_seconds_total', labels, 2.0),
+        ],
+    )
+
+    with mock.patch('datadog_checks.kubelet.prometheus.tagger.tag', return_value=['container:agent']) as tag:
+        cadvisor_scraper.reset_container_contexts()
+        cadvisor_scraper.container_memory_rss(family, config)
+        cadvisor_scraper.container_cpu_user_seconds_total(family_per_cpu, config)
+        assert tag.call_count == 1
+
+        cadvisor_scraper.reset_container_contexts()
+        cadvisor_scraper.container_memory_working_set_bytes(family, config)
+        assert tag.call_count == 2
+
+    aggregator.assert_metric('kubernetes.memory.rss', 10.0, tags=['container:agent'])
+    aggregator.assert_metric('kubernetes.cpu.user.total', 3.0, tags=['container:agent'])
+    aggregator.assert_metric('kubernetes.memory.working_set', 10.0, tags=['container:agent'])
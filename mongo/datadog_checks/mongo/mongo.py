@@ -12,12 +12,14 @@ from six import PY3, iteritems, itervalues
 from six.moves.urllib.parse import unquote_plus, urlsplit
 
 from datadog_checks.base import AgentCheck, is_affirmative
+from datadog_checks.base.checks.libs.concurrency import run_concurrently
 from datadog_checks.base.utils.common import round_value
 
 if PY3:
     long = int
 
 DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_CONCURRENT_COMMANDS = 4
 GAUGE = AgentCheck.gauge
 RATE = AgentCheck.rate
 
@@ -427,6 +429,9 @@ class MongoDb(AgentCheck):
         # List of metrics to collect per instance
         self.metrics_to_collect_by_instance = {}
 
+        # Authenticated clients kept across check runs, per server, timeout, ssl parameters and replica set
+        self._clients = {}
+
         self.collection_metrics_names = []
         for key in self.COLLECTION_METRICS:
             self.collection_metrics_names.append(key.split('.')[1])
@@ -607,6 +612,52 @@ class MongoDb(AgentCheck):
 
         return authenticated
 
+    def _get_client(self, server, timeout, ssl_params, authenticate=None, replicaset=None):
+        """
+        Return the client for the server, creating and authenticating it if it is not cached yet.
+
+        Clients are kept across check runs: pymongo monitors the servers in the background and manages
+        a pool of connections per server, so the discovery, the connection handshakes and the
+        authentication are only done once instead of at every run.
+        """
+        key = (server, timeout, tuple(sorted(iteritems(ssl_params))), replicaset)
+        cli = self._clients.get(key)
+        if cli is not None:
+            return cli
+
+        options = {}
+        if replicaset:
+            options['replicaset'] = replicaset
+            options['read_preference'] = pymongo.ReadPreference.NEAREST
+        else:
+            options['read_preference'] = pymongo.ReadPreference.PRIMARY_PREFERRED
+        options.update(ssl_params)
+
+        cli = pymongo.mongo_client.MongoClient(
+            server, socketTimeoutMS=timeout, connectTimeoutMS=timeout, serverSelectionTimeoutMS=timeout, **options
+        )
+        if authenticate is not None:
+            try:
+                authenticate(cli)
+            except Exception:
+                cli.close()
+                raise
+
+        self._clients[key] = cli
+        return cli
+
+    def _close_client(self, cli):
+        """
+        Close a client and remove it from the cache, so that a new one is created at the next run.
+        """
+        for key, cached_cli in list(iteritems(self._clients)):
+            if cached_cli is cli:
+                del self._clients[key]
+        try:
+            cli.close()
+        except Exception as e:
+            self.log.debug(u"Failed to close the MongoDB client: %s", e)
+
     @classmethod
     def _parse_uri(cls, server, sanitize_username=False):
         """
@@ -715,44 +766,41 @@ class MongoDb(AgentCheck):
             service_check_tags = service_check_tags + ["host:%s" % host, "port:%s" % port]
 
         timeout = float(instance.get('timeout', DEFAULT_TIMEOUT)) * 1000
-        try:
-            cli = pymongo.mongo_client.MongoClient(
-                server,
-                socketTimeoutMS=timeout,
-                connectTimeoutMS=timeout,
-                serverSelectionTimeoutMS=timeout,
-                read_preference=pymongo.ReadPreference.PRIMARY_PREFERRED,
-                **ssl_params
-            )
-            # some commands can only go against the admin DB
-            admindb = cli['admin']
-            db = cli[db_name]
-        except Exception:
-            self.service_check(self.SERVICE_CHECK_NAME, AgentCheck.CRITICAL, tags=service_check_tags)
-            raise
+        max_concurrent_commands = int(instance.get('max_concurrent_commands', DEFAULT_MAX_CONCURRENT_COMMANDS))
 
         # Authenticate
-        do_auth = True
         use_x509 = ssl_params and not password
 
         if not username:
             self.log.debug(u"A username is required to authenticate to `%s`", server)
-            do_auth = False
-
-        if do_auth:
+            authenticate = None
+        else:
             if auth_source:
                 msg = "authSource was specified in the the server URL: using '%s' as the authentication database"
                 self.log.info(msg, auth_source)
+            auth_db_name = auth_source or db_name
+
+            def authenticate(client):
                 self._authenticate(
-                    cli[auth_source], username, password, use_x509, clean_server_name, service_check_tags
+                    client[auth_db_name], username, password, use_x509, clean_server_name, service_check_tags
                 )
-            else:
-                self._authenticate(db, username, password, use_x509, clean_server_name, service_check_tags)
+
+        try:
+            cli = self._get_client(server, timeout, ssl_params, authenticate)
+        except pymongo.errors.PyMongoError:
+            self.service_check(self.SERVICE_CHECK_NAME, AgentCheck.CRITICAL, tags=service_check_tags)
+            raise
+
+        # some commands can only go against the admin DB
+        admindb = cli['admin']
+        db = cli[db_name]
 
         try:
             status = db.command('serverStatus', tcmalloc=collect_tcmalloc_metrics)
         except Exception:
             self.service_check(self.SERVICE_CHECK_NAME, AgentCheck.CRITICAL, tags=service_check_tags)
+            # Start from a new client at the next run
+            self._close_client(cli)
             raise
         else:
             self.service_check(self.SERVICE_CHECK_NAME, AgentCheck.OK, tags=service_check_tags)
@@ -763,13 +811,11 @@ class MongoDb(AgentCheck):
         ops = db.current_op()
         status['fsyncLocked'] = 1 if ops.get('fsyncLock') else 0
 
-        status['stats'] = db.command('dbstats')
-        dbstats = {db_name: {'stats': status['stats']}}
-
         # Handle replica data, if any
         # See
         # http://www.mongodb.org/display/DOCS/Replica+Set+Commands#ReplicaSetCommands-replSetGetStatus  # noqa
         if is_affirmative(instance.get('replica_check', True)):
+            cli_rs = None
             try:
                 data = {}
 
@@ -780,25 +826,7 @@ class MongoDb(AgentCheck):
 
                     # need a new connection to deal with replica sets
                     setname = replSet.get('set')
-                    cli_rs = pymongo.mongo_client.MongoClient(
-                        server,
-                        socketTimeoutMS=timeout,
-                        connectTimeoutMS=timeout,
-                        serverSelectionTimeoutMS=timeout,
-                        replicaset=setname,
-                        read_preference=pymongo.ReadPreference.NEAREST,
-                        **ssl_params
-                    )
-
-                    if do_auth:
-                        if auth_source:
-                            self._authenticate(
-                                cli_rs[auth_source], username, password, use_x509, server, service_check_tags
-                            )
-                        else:
-                            self._authenticate(
-                                cli_rs[db_name], username, password, use_x509, server, service_check_tags
-                            )
+                    cli_rs = self._get_client(server, timeout, ssl_params, authenticate, replicaset=setname)
 
                     # Replication set information
                     replset_name = replSet['set']
@@ -844,6 +872,8 @@ class MongoDb(AgentCheck):
                 ):
                     pass
                 else:
+                    if cli_rs is not None:
+                        self._close_client(cli_rs)
                     raise e
 
         # If these keys exist, remove them for now as they cannot be serialized
@@ -859,9 +889,16 @@ class MongoDb(AgentCheck):
         dbnames = cli.database_names()
         self.gauge('mongodb.dbs', len(dbnames), tags=tags)
 
-        for db_n in dbnames:
-            db_aux = cli[db_n]
-            dbstats[db_n] = {'stats': db_aux.command('dbstats')}
+        # The configured database may not be listed, e.g. without the privilege to list databases
+        dbstats = {}
+        stats_dbnames = dbnames if db_name in dbnames else [db_name] + dbnames
+        for db_n, stats, e in run_concurrently(
+            lambda db_n: cli[db_n].command('dbstats'), stats_dbnames, max_concurrent_commands, name='mongo'
+        ):
+            if e is not None:
+                self.log.warning(u"Failed to record `dbstats` metrics of database %s: %s", db_n, e)
+                continue
+            dbstats[db_n] = {'stats': stats}
 
         # Go through the metrics and save the values
         for metric_name in metrics_to_collect:
@@ -1014,10 +1051,13 @@ class MongoDb(AgentCheck):
             db = cli[db_name]
             # grab the collections from the configutation
             coll_names = instance.get('collections', [])
-            # loop through the collections
-            for coll_name in coll_names:
-                # grab the stats from the collection
-                stats = db.command("collstats", coll_name)
+            # loop through the stats of the collections, fetched concurrently
+            for coll_name, stats, e in run_concurrently(
+                lambda coll_name: db.command("collstats", coll_name), coll_names, max_concurrent_commands, name='mongo'
+            ):
+                if e is not None:
+                    self.log.warning(u"Failed to record `collection` metrics of collection %s: %s", coll_name, e)
+                    continue
                 # loop through the metrics
                 for m in self.collection_metrics_names:
                     coll_tags = tags + ["db:%s" % db_name, "collection:%s" % coll_name]
@@ -4,6 +4,7 @@
 import logging
 
 import mock
+import pymongo
 import pytest
 from six import iteritems
 
@@ -147,3 +148,37 @@ def test_server_uri_sanitization(check):
     for server, expected_clean_name in server_names:
         _, _, _, _, clean_name, _ = _parse_uri(server, sanitize_username=True)
         assert expected_clean_name == clean_name
+
+
+@pytest.mark.unit
+def test_client_cache(check):
+    """
+    Clients are created and authenticated once per server, timeout, ssl parameters and replica set.
+    """
+    authenticate = mock.Mock()
+    server = 'mongodb://localhost:27017/admin'
+
+    with mock.patch('pymongo.mongo_client.MongoClient', side_effect=lambda *args, **kwargs: mock.Mock()) as client:
+        cli = check._get_client(server, 1000, {}, authenticate)
+        assert check._get_client(server, 1000, {}, authenticate) is cli
+        assert client.call_count == 1
+        authenticate.assert_called_once_with(cli)
+        assert client.call_args[1]['read_preference'] == pymongo.ReadPreference.PRIMARY_PREFERRED
+
+        cli_ssl = check._get_client(server, 1000, {'ssl': True}, authenticate)
+        cli_rs = check._get_client(server, 1000, {}, authenticate, replicaset='foo')
+        assert len({cli, cli_ssl, cli_rs}) == 3
+        assert client.call_args[1]['replicaset'] == 'foo'
+        assert client.call_args[1]['read_preference'] == pymongo.ReadPreference.NEAREST
+
+        # Closed clients are created again
+        check._close_client(cli)
+        cli.close.assert_called_once_with()
+        assert check._get_client(server, 1000, {}, authenticate) is not cli
+        assert check._get_client(server, 1000, {'ssl': True}, authenticate) is cli_ssl
+
+        # Clients failing to authenticate are not kept
+        authenticate.side_effect = Exception('Mongo: cannot connect')
+        with pytest.raises(Exception):
+            check._get_client(server, 2000, {}, authenticate)
+        assert len(check._clients) == 3
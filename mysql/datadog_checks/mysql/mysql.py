@@ -13,6 +13,7 @@ import pymysql
 from six import PY3, iteritems, itervalues, text_type
 
 from datadog_checks.base import AgentCheck, is_affirmative
+from datadog_checks.base.utils.db import QueryManager, cursor_executor
 
 try:
     import psutil
@@ -284,6 +285,7 @@ class MySql(AgentCheck):
         AgentCheck.__init__(self, name, init_config, agentConfig, instances)
         self.mysql_version = {}
         self.qcache_stats = {}
+        self.query_managers = {}
 
     @classmethod
     def get_library_versions(cls):
@@ -310,6 +312,8 @@ class MySql(AgentCheck):
         if not (host and user) and not defaults_file:
             raise Exception("Mysql host and user are needed.")
 
+        query_manager = self._get_query_manager(instance, max_custom_queries)
+
         with self._connect(host, port, mysql_sock, user, password, defaults_file, ssl, connect_timeout, tags) as db:
             try:
                 # Metadata collection
@@ -317,6 +321,7 @@ class MySql(AgentCheck):
 
                 # Metric collection
                 self._collect_metrics(db, tags, options, queries, max_custom_queries)
+                query_manager.execute(cursor_executor(db), tags=tags)
                 self._collect_system_metrics(host, db, tags)
 
                 # keeping track of these:
@@ -367,6 +372,19 @@ class MySql(AgentCheck):
         host_key = self._get_host_key()
         self.qcache_stats[host_key] = (self._qcache_hits, self._qcache_inserts, self._qcache_not_cached)
 
+    def _get_query_manager(self, instance, max_custom_queries):
+        host_key = self._get_host_key()
+        if host_key not in self.query_managers:
+            custom_queries = instance.get('custom_queries', [])
+            if len(custom_queries) > max_custom_queries:
+                self.warning("Maximum number (%s) of custom queries reached.  Skipping the rest." % max_custom_queries)
+            stats_namespace = 'mysql' if is_affirmative(instance.get('collect_custom_query_stats', False)) else None
+            self.query_managers[host_key] = QueryManager(
+                self, custom_queries[:max_custom_queries], stats_namespace=stats_namespace
+            )
+
+        return self.query_managers[host_key]
+
     def _get_host_key(self):
         if self.defaults_file:
             return self.defaults_file
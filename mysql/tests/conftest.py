@@ -66,6 +66,14 @@ def instance_complex():
                 'field': 'age',
             },
         ],
+        'custom_queries': [
+            {
+                'query': "SELECT name, age from testdb.users",
+                'metric_prefix': 'users',
+                'columns': [{'name': 'name', 'type': 'tag'}, {'name': 'age', 'type': 'gauge'}],
+                'tags': ['query:users'],
+            }
+        ],
     }
 
 
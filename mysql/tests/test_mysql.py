@@ -92,6 +92,8 @@ def test_complex_config(aggregator, instance_complex):
     # test custom query metrics
     aggregator.assert_metric('alice.age', value=25)
     aggregator.assert_metric('bob.age', value=20)
+    aggregator.assert_metric('users.age', value=25, tags=tags.METRIC_TAGS + ['query:users', 'name:Alice'], count=1)
+    aggregator.assert_metric('users.age', value=20, tags=tags.METRIC_TAGS + ['query:users', 'name:Bob'], count=1)
 
     # test optional metrics
     optional_metrics = (
@@ -201,6 +203,22 @@ def _test_optional_metrics(aggregator, optional_metrics, at_least):
     assert before - after > at_least
 
 
+@pytest.mark.unit
+def test__get_query_manager(instance_complex):
+    mysql_check = MySql(common.CHECK_NAME, {}, {})
+    mysql_check.warning = mock.MagicMock()
+    mysql_check._get_config(instance_complex)
+    custom_query = instance_complex['custom_queries'][0]
+    instance_complex['custom_queries'] = [dict(custom_query, metric_prefix='users{}'.format(i)) for i in range(3)]
+
+    query_manager = mysql_check._get_query_manager(instance_complex, 2)
+
+    assert [query.metric_prefix for query in query_manager.queries] == ['users0', 'users1']
+    mysql_check.warning.assert_called_once_with("Maximum number (2) of custom queries reached.  Skipping the rest.")
+    # Queries are only compiled once per server
+    assert mysql_check._get_query_manager(instance_complex, 2) is query_manager
+
+
 @pytest.mark.unit
 def test__get_server_pid():
     """
@@ -8,6 +8,7 @@ import cx_Oracle
 import jaydebeapi as jdb
 import jpype
 
+from datadog_checks.base.utils.db import QueryManager, cursor_executor
 from datadog_checks.checks import AgentCheck
 from datadog_checks.config import is_affirmative
 
@@ -62,6 +63,11 @@ class Oracle(AgentCheck):
         ]
     )
 
+    def __init__(self, name, init_config, agentConfig, instances=None):
+        AgentCheck.__init__(self, name, init_config, agentConfig, instances)
+        # Compiled custom queries per server and service
+        self._query_managers = {}
+
     def check(self, instance):
         self.use_oracle_client = True
         server, user, password, service, jdbc_driver, tags, custom_queries = self._get_config(instance)
@@ -69,6 +75,10 @@ class Oracle(AgentCheck):
         if not server or not user:
             raise OracleConfigError("Oracle host and user are needed")
 
+        query_manager = self._get_query_manager(
+            server, service, custom_queries, is_affirmative(instance.get('collect_custom_query_stats', False))
+        )
+
         try:
             # Check if the instantclient is available
             cx_Oracle.clientversion()
@@ -82,7 +92,7 @@ class Oracle(AgentCheck):
             self._get_sys_metrics(con, tags)
             self._get_process_metrics(con, tags)
             self._get_tablespace_metrics(con, tags)
-            self._get_custom_metrics(con, custom_queries, tags)
+            self._get_custom_metrics(con, query_manager, tags)
 
     def _get_config(self, instance):
         self.server = instance.get('server', None)
@@ -93,7 +103,7 @@ class Oracle(AgentCheck):
         tags = instance.get('tags', [])
         custom_queries = instance.get('custom_queries', [])
         if is_affirmative(instance.get('use_global_custom_queries', True)):
-            custom_queries.extend(self.init_config.get('global_custom_queries', []))
+            custom_queries = custom_queries + self.init_config.get('global_custom_queries', [])
 
         return self.server, user, password, service, jdbc_driver, tags, custom_queries
 
@@ -142,83 +152,16 @@ class Oracle(AgentCheck):
             raise
         return con
 
-    def _get_custom_metrics(self, con, custom_queries, global_tags):
-        global_tags = global_tags or []
-
-        for custom_query in custom_queries:
-            metric_prefix = custom_query.get('metric_prefix')
-            if not metric_prefix:
-                self.log.error('custom query field `metric_prefix` is required')
-                continue
-            metric_prefix = metric_prefix.rstrip('.')
-
-            query = custom_query.get('query')
-            if not query:
-                self.log.error('custom query field `query` is required for metric_prefix `{}`'.format(metric_prefix))
-                continue
-
-            columns = custom_query.get('columns')
-            if not columns:
-                self.log.error('custom query field `columns` is required for metric_prefix `{}`'.format(metric_prefix))
-                continue
-
-            with closing(con.cursor()) as cursor:
-                cursor.execute(query)
-                row = cursor.fetchone()
-                if row:
-                    if len(columns) != len(row):
-                        self.log.error(
-                            'query result for metric_prefix {}: expected {} columns, got {}'.format(
-                                metric_prefix, len(columns), len(row)
-                            )
-                        )
-                        continue
-
-                    metric_info = []
-                    query_tags = custom_query.get('tags', [])
-                    query_tags.extend(global_tags)
-
-                    for column, value in zip(columns, row):
-                        # Columns can be ignored via configuration.
-                        if column:
-                            name = column.get('name')
-                            if not name:
-                                self.log.error(
-                                    'column field `name` is required for metric_prefix `{}`'.format(metric_prefix)
-                                )
-                                break
-
-                            column_type = column.get('type')
-                            if not column_type:
-                                self.log.error(
-                                    'column field `type` is required for column `{}` '
-                                    'of metric_prefix `{}`'.format(name, metric_prefix)
-                                )
-                                break
-
-                            if column_type == 'tag':
-                                query_tags.append('{}:{}'.format(name, value))
-                            else:
-                                if not hasattr(self, column_type):
-                                    self.log.error(
-                                        'invalid submission method `{}` for column `{}` of '
-                                        'metric_prefix `{}`'.format(column_type, name, metric_prefix)
-                                    )
-                                    break
-                                try:
-                                    metric_info.append(('{}.{}'.format(metric_prefix, name), float(value), column_type))
-                                except (ValueError, TypeError):
-                                    self.log.error(
-                                        'non-numeric value `{}` for metric column `{}` of '
-                                        'metric_prefix `{}`'.format(value, name, metric_prefix)
-                                    )
-                                    break
-
-                    # Only submit metrics if there were absolutely no errors - all or nothing.
-                    else:
-                        for info in metric_info:
-                            metric, value, method = info
-                            getattr(self, method)(metric, value, tags=query_tags)
+    def _get_query_manager(self, server, service, custom_queries, collect_stats):
+        key = (server, service)
+        if key not in self._query_managers:
+            self._query_managers[key] = QueryManager(
+                self, custom_queries, stats_namespace='oracle' if collect_stats else None
+            )
+        return self._query_managers[key]
+
+    def _get_custom_metrics(self, con, query_manager, global_tags):
+        query_manager.execute(cursor_executor(con), tags=global_tags)
 
     def _get_sys_metrics(self, con, tags):
         if tags is None:
@@ -3,6 +3,7 @@
 # Licensed under a 3-clause BSD style license (see LICENSE)
 import mock
 
+from datadog_checks.base.utils.db import QueryManager
 from datadog_checks.oracle import queries
 
 
@@ -93,7 +94,6 @@ def test__get_custom_metrics_misconfigured(check):
     gauge = mock.MagicMock()
     con = mock.MagicMock()
     cursor = mock.MagicMock()
-    cursor.fetchone.return_value = ["foo", "bar"]
     con.cursor.return_value = cursor
     check.log = log
     check.gauge = gauge
@@ -102,28 +102,29 @@ def test__get_custom_metrics_misconfigured(check):
     custom_queries = [query]
 
     # No metric_prefix
-    check._get_custom_metrics(None, custom_queries, None)
+    QueryManager(check, custom_queries)
     log.error.assert_called_once_with('custom query field `metric_prefix` is required')
     log.reset_mock()
 
     query["metric_prefix"] = "foo"
 
     # No query for metric_prefix
-    check._get_custom_metrics(None, custom_queries, None)
+    QueryManager(check, custom_queries)
     log.error.assert_called_once_with('custom query field `query` is required for metric_prefix `foo`')
     log.reset_mock()
 
     query["query"] = "bar"
 
     # No columns for metric_prefix
-    check._get_custom_metrics(None, custom_queries, None)
+    QueryManager(check, custom_queries)
     log.error.assert_called_once_with('custom query field `columns` is required for metric_prefix `foo`')
     log.reset_mock()
 
     query["columns"] = [{}]
 
     # Wrong number of columns
-    check._get_custom_metrics(con, custom_queries, None)
+    cursor.fetchmany.side_effect = [[["foo", "bar"]], []]
+    check._get_custom_metrics(con, QueryManager(check, custom_queries), None)
     log.error.assert_called_once_with('query result for metric_prefix foo: expected 1 columns, got 2')
     log.reset_mock()
 
@@ -133,7 +134,7 @@ def test__get_custom_metrics_misconfigured(check):
     query["columns"] = columns
 
     # No name in column
-    check._get_custom_metrics(con, custom_queries, None)
+    QueryManager(check, custom_queries)
     log.error.assert_called_once_with('column field `name` is required for metric_prefix `foo`')
     log.reset_mock()
 
@@ -141,21 +142,22 @@ def test__get_custom_metrics_misconfigured(check):
     col2["name"] = "foo"
 
     # No type in column
-    check._get_custom_metrics(con, custom_queries, None)
+    QueryManager(check, custom_queries)
     log.error.assert_called_once_with('column field `type` is required for column `foo` of metric_prefix `foo`')
     log.reset_mock()
 
     col2["type"] = "invalid"
 
     # Invalid type column
-    check._get_custom_metrics(con, custom_queries, None)
+    QueryManager(check, custom_queries)
     log.error.assert_called_once_with('invalid submission method `invalid` for column `foo` of metric_prefix `foo`')
     log.reset_mock()
 
     col2["type"] = "gauge"
 
     # Non numeric value
-    check._get_custom_metrics(con, custom_queries, None)
+    cursor.fetchmany.side_effect = [[["foo", "bar"]], []]
+    check._get_custom_metrics(con, QueryManager(check, custom_queries), None)
     log.error.assert_called_once_with('non-numeric value `bar` for metric column `foo` of metric_prefix `foo`')
 
     # No metric sent if errors
@@ -165,7 +167,7 @@ def test__get_custom_metrics_misconfigured(check):
 def test__get_custom_metrics(aggregator, check):
     con = mock.MagicMock()
     cursor = mock.MagicMock()
-    cursor.fetchone.side_effect = [["tag_value1", "1"], [1, 2, "tag_value2"]]
+    cursor.fetchmany.side_effect = [[["tag_value1", "1"]], [], [[1, 2, "tag_value2"], [3, 4, "tag_value3"]], []]
     con.cursor.return_value = cursor
 
     custom_queries = [
@@ -187,7 +189,7 @@ def test__get_custom_metrics(aggregator, check):
         },
     ]
 
-    check._get_custom_metrics(con, custom_queries, ["custom_tag"])
+    check._get_custom_metrics(con, QueryManager(check, custom_queries), ["custom_tag"])
     aggregator.assert_metric(
         "oracle.test1.metric", value=1, count=1, tags=["tag_name:tag_value1", "query_tags1", "custom_tag"]
     )
@@ -205,3 +207,12 @@ def test__get_custom_metrics(aggregator, check):
         metric_type=aggregator.RATE,
         tags=["tag_name:tag_value2", "query_tags2", "custom_tag"],
     )
+    aggregator.assert_metric(
+        "oracle.test2.gauge",
+        value=4,
+        count=1,
+        metric_type=aggregator.GAUGE,
+        tags=["tag_name:tag_value3", "query_tags2", "custom_tag"],
+    )
+    # The configured tags are left untouched
+    assert custom_queries[0]["tags"] == ["query_tags1"]
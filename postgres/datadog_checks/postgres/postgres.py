@@ -4,13 +4,13 @@
 import re
 import socket
 import threading
-from contextlib import closing
 
 import pg8000
 from six import iteritems
 from six.moves import zip_longest
 
 from datadog_checks.base import AgentCheck, ConfigurationError, is_affirmative
+from datadog_checks.base.utils.db import QueryManager, cursor_executor
 
 try:
     import psycopg2
@@ -365,6 +365,7 @@ GROUP BY datid, datname
         self.replication_metrics = {}
         self.activity_metrics = {}
         self.custom_metrics = {}
+        self.query_managers = {}
 
         # Deprecate custom_metrics in favor of custom_queries
         if instances is not None and any('custom_metrics' in instance for instance in instances):
@@ -875,99 +876,25 @@ GROUP BY datid, datname
             elif not user:
                 raise ConfigurationError('Please specify a user to connect to Postgres as.')
 
-    def _get_custom_queries(self, db, tags, custom_queries, programming_error):
-        """
-        Given a list of custom_queries, execute each query and parse the result for metrics
-        """
-        for custom_query in custom_queries:
-            metric_prefix = custom_query.get('metric_prefix')
-            if not metric_prefix:
-                self.log.error("custom query field `metric_prefix` is required")
-                continue
-            metric_prefix = metric_prefix.rstrip('.')
-
-            query = custom_query.get('query')
-            if not query:
-                self.log.error("custom query field `query` is required for metric_prefix `{}`".format(metric_prefix))
-                continue
-
-            columns = custom_query.get('columns')
-            if not columns:
-                self.log.error("custom query field `columns` is required for metric_prefix `{}`".format(metric_prefix))
-                continue
+    def _get_query_manager(self, custom_queries, key, collect_stats):
+        # Pre-processed cached custom_queries
+        if key in self.query_managers:
+            return self.query_managers[key]
 
-            cursor = db.cursor()
-            with closing(cursor) as cursor:
-                try:
-                    self.log.debug("Running query: {}".format(query))
-                    cursor.execute(query)
-                except programming_error as e:
-                    self.log.error("Error executing query for metric_prefix {}: {}".format(metric_prefix, str(e)))
-                    db.rollback()
-                    continue
+        query_manager = QueryManager(self, custom_queries, stats_namespace='postgresql' if collect_stats else None)
+        self.query_managers[key] = query_manager
+        return query_manager
 
-                for row in cursor:
-                    if not row:
-                        self.log.debug(
-                            "query result for metric_prefix {}: returned an empty result".format(metric_prefix)
-                        )
-                        continue
+    def _get_custom_queries(self, db, tags, query_manager, programming_error):
+        """
+        Execute each of the custom queries of the query manager and parse the result for metrics
+        """
 
-                    if len(columns) != len(row):
-                        self.log.error(
-                            "query result for metric_prefix {}: expected {} columns, got {}".format(
-                                metric_prefix, len(columns), len(row)
-                            )
-                        )
-                        continue
+        def on_error(e):
+            if isinstance(e, programming_error):
+                db.rollback()
 
-                    metric_info = []
-                    query_tags = custom_query.get('tags', [])
-                    query_tags.extend(tags)
-
-                    for column, value in zip(columns, row):
-                        # Columns can be ignored via configuration.
-                        if not column:
-                            continue
-
-                        name = column.get('name')
-                        if not name:
-                            self.log.error(
-                                "column field `name` is required for metric_prefix `{}`".format(metric_prefix)
-                            )
-                            break
-
-                        column_type = column.get('type')
-                        if not column_type:
-                            self.log.error(
-                                "column field `type` is required for column `{}` "
-                                "of metric_prefix `{}`".format(name, metric_prefix)
-                            )
-                            break
-
-                        if column_type == 'tag':
-                            query_tags.append('{}:{}'.format(name, value))
-                        else:
-                            if not hasattr(self, column_type):
-                                self.log.error(
-                                    "invalid submission method `{}` for column `{}` of "
-                                    "metric_prefix `{}`".format(column_type, name, metric_prefix)
-                                )
-                                break
-                            try:
-                                metric_info.append(('{}.{}'.format(metric_prefix, name), float(value), column_type))
-                            except (ValueError, TypeError):
-                                self.log.error(
-                                    "non-numeric value `{}` for metric column `{}` of "
-                                    "metric_prefix `{}`".format(value, name, metric_prefix)
-                                )
-                                break
-
-                    # Only submit metrics if there were absolutely no errors - all or nothing.
-                    else:
-                        for info in metric_info:
-                            metric, value, method = info
-                            getattr(self, method)(metric, value, tags=query_tags)
+        query_manager.execute(cursor_executor(db, on_error=on_error), tags=tags)
 
     def _get_custom_metrics(self, custom_metrics, key):
         # Pre-processed cached custom_metrics
@@ -1029,7 +956,9 @@ GROUP BY datid, datname
         key = (host, port, dbname)
 
         custom_metrics = self._get_custom_metrics(instance.get('custom_metrics', []), key)
-        custom_queries = instance.get('custom_queries', [])
+        query_manager = self._get_query_manager(
+            instance.get('custom_queries', []), key, is_affirmative(instance.get('collect_custom_query_stats', False))
+        )
 
         # Clean up tags in case there was a None entry in the instance
         # e.g. if the yaml contains tags: but no actual tags
@@ -1074,7 +1003,7 @@ GROUP BY datid, datname
                 interface_error,
                 programming_error,
             )
-            self._get_custom_queries(db, tags, custom_queries, programming_error)
+            self._get_custom_queries(db, tags, query_manager, programming_error)
         except ShouldRestartException:
             self.log.info("Resetting the connection")
             db = self.get_connection(key, host, port, user, password, dbname, ssl, connect_fct, tags, use_cached=False)
@@ -1092,7 +1021,7 @@ GROUP BY datid, datname
                 interface_error,
                 programming_error,
             )
-            self._get_custom_queries(db, tags, custom_queries, programming_error)
+            self._get_custom_queries(db, tags, query_manager, programming_error)
 
         service_check_tags = self._get_service_check_tags(host, port, tags)
         message = u'Established connection to postgres://%s:%s/%s' % (host, port, dbname)
@@ -4,6 +4,8 @@
 import pytest
 from mock import MagicMock
 
+from datadog_checks.base.utils.db import QueryManager
+
 # Mark the entire module as tests of type `unit`
 pytestmark = pytest.mark.unit
 
@@ -164,13 +166,13 @@ def test_malformed_get_custom_queries(check):
     malformed_custom_query = {}
 
     # Make sure 'metric_prefix' is defined
-    check._get_custom_queries(db, [], [malformed_custom_query], programming_error)
+    QueryManager(check, [malformed_custom_query])
     check.log.error.assert_called_once_with("custom query field `metric_prefix` is required")
     check.log.reset_mock()
 
     # Make sure 'query' is defined
     malformed_custom_query['metric_prefix'] = 'postgresql'
-    check._get_custom_queries(db, [], [malformed_custom_query], programming_error)
+    QueryManager(check, [malformed_custom_query])
     check.log.error.assert_called_once_with(
         "custom query field `query` is required for metric_prefix `{}`".format(malformed_custom_query['metric_prefix'])
     )
@@ -178,7 +180,7 @@ def test_malformed_get_custom_queries(check):
 
     # Make sure 'columns' is defined
     malformed_custom_query['query'] = 'SELECT num FROM sometable'
-    check._get_custom_queries(db, [], [malformed_custom_query], programming_error)
+    QueryManager(check, [malformed_custom_query])
     check.log.error.assert_called_once_with(
         "custom query field `columns` is required for metric_prefix `{}`".format(
             malformed_custom_query['metric_prefix']
@@ -190,19 +192,18 @@ def test_malformed_get_custom_queries(check):
     malformed_custom_query_column = {}
     malformed_custom_query['columns'] = [malformed_custom_query_column]
     db.cursor().execute.side_effect = programming_error
-    check._get_custom_queries(db, [], [malformed_custom_query], programming_error)
+    check._get_custom_queries(db, [], QueryManager(check, [malformed_custom_query]), programming_error)
     check.log.error.assert_called_once_with(
         "Error executing query for metric_prefix {}: ".format(malformed_custom_query['metric_prefix'])
     )
+    db.rollback.assert_called_once_with()
     check.log.reset_mock()
 
     # Make sure the number of columns defined is the same as the number of columns return by the query
-    malformed_custom_query_column = {}
-    malformed_custom_query['columns'] = [malformed_custom_query_column]
     query_return = ['num', 1337]
     db.cursor().execute.side_effect = None
-    db.cursor().__iter__.return_value = iter([query_return])
-    check._get_custom_queries(db, [], [malformed_custom_query], programming_error)
+    db.cursor().fetchmany.side_effect = [[query_return], []]
+    check._get_custom_queries(db, [], QueryManager(check, [malformed_custom_query]), programming_error)
     check.log.error.assert_called_once_with(
         "query result for metric_prefix {}: expected {} columns, got {}".format(
             malformed_custom_query['metric_prefix'], len(malformed_custom_query['columns']), len(query_return)
@@ -211,17 +212,16 @@ def test_malformed_get_custom_queries(check):
     check.log.reset_mock()
 
     # Make sure the query does not return an empty result
-    db.cursor().__iter__.return_value = iter([[]])
-    check._get_custom_queries(db, [], [malformed_custom_query], programming_error)
-    check.log.debug.assert_called_with(
+    db.cursor().fetchmany.side_effect = [[[]], []]
+    check._get_custom_queries(db, [], QueryManager(check, [malformed_custom_query]), programming_error)
+    check.log.debug.assert_any_call(
         "query result for metric_prefix {}: returned an empty result".format(malformed_custom_query['metric_prefix'])
     )
     check.log.reset_mock()
 
     # Make sure 'name' is defined in each column
     malformed_custom_query_column['some_key'] = 'some value'
-    db.cursor().__iter__.return_value = iter([[1337]])
-    check._get_custom_queries(db, [], [malformed_custom_query], programming_error)
+    QueryManager(check, [malformed_custom_query])
     check.log.error.assert_called_once_with(
         "column field `name` is required for metric_prefix `{}`".format(malformed_custom_query['metric_prefix'])
     )
@@ -229,8 +229,7 @@ def test_malformed_get_custom_queries(check):
 
     # Make sure 'type' is defined in each column
     malformed_custom_query_column['name'] = 'num'
-    db.cursor().__iter__.return_value = iter([[1337]])
-    check._get_custom_queries(db, [], [malformed_custom_query], programming_error)
+    QueryManager(check, [malformed_custom_query])
     check.log.error.assert_called_once_with(
         "column field `type` is required for column `{}` "
         "of metric_prefix `{}`".format(malformed_custom_query_column['name'], malformed_custom_query['metric_prefix'])
@@ -239,8 +238,7 @@ def test_malformed_get_custom_queries(check):
 
     # Make sure 'type' is a valid metric type
     malformed_custom_query_column['type'] = 'invalid_type'
-    db.cursor().__iter__.return_value = iter([[1337]])
-    check._get_custom_queries(db, [], [malformed_custom_query], programming_error)
+    QueryManager(check, [malformed_custom_query])
     check.log.error.assert_called_once_with(
         "invalid submission method `{}` for column `{}` of "
         "metric_prefix `{}`".format(
@@ -255,8 +253,8 @@ def test_malformed_get_custom_queries(check):
     malformed_custom_query_column['type'] = 'gauge'
     query_return = MagicMock()
     query_return.__float__.side_effect = ValueError('Mocked exception')
-    db.cursor().__iter__.return_value = iter([[query_return]])
-    check._get_custom_queries(db, [], [malformed_custom_query], programming_error)
+    db.cursor().fetchmany.side_effect = [[[query_return]], []]
+    check._get_custom_queries(db, [], QueryManager(check, [malformed_custom_query]), programming_error)
     check.log.error.assert_called_once_with(
         "non-numeric value `{}` for metric column `{}` of "
         "metric_prefix `{}`".format(
@@ -0,0 +1,124 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under a 3-clause BSD style license (see LICENSE)
+import threading
+import time
+
+import psutil
+
+# Shorter than the default collection interval of 15 seconds, so that the processes are listed
+# once per collection and the instances running in the same collection share the list
+DEFAULT_SHARED_PROCESS_LIST_CACHE_DURATION = 10
+
+
+class ProcessInfo(object):
+    """
+    A process of the process list, with the attributes used to select processes.
+    Each attribute is read from procfs the first time it is needed, then kept.
+    """
+
+    __slots__ = ('process', 'pid', 'first_seen', '_name', '_cmdline', '_cmdline_lower', '_username')
+
+    def __init__(self, process, first_seen=None):
+        self.process = process
+        self.pid = process.pid
+        self.first_seen = first_seen
+        self._name = None
+        self._cmdline = None
+        self._cmdline_lower = None
+        self._username = None
+
+    def name(self):
+        if self._name is None:
+            self._name = self.process.name()
+        return self._name
+
+    def cmdline(self, lower=False):
+        """
+        Return the command line of the process joined with spaces, lowercased if `lower`.
+        """
+        if self._cmdline is None:
+            self._cmdline = ' '.join(self.process.cmdline())
+        if not lower:
+            return self._cmdline
+        if self._cmdline_lower is None:
+            self._cmdline_lower = self._cmdline.lower()
+        return self._cmdline_lower
+
+    def username(self):
+        if self._username is None:
+            self._username = self.process.username()
+        return self._username
+
+    def is_long_lived(self, duration):
+        """
+        Whether the process was already running for more than `duration` seconds when it was first seen.
+        The attributes of such processes are not expected to change anymore, unlike the ones of processes
+        just started that may still rename themselves or drop their privileges.
+        """
+        try:
+            return self.first_seen - self.process.create_time() > duration
+        except psutil.Error:
+            return False
+
+
+class ProcessListCache(object):
+    """
+    A snapshot of the processes running on the host, shared by all the instances of the check
+    so that procfs is only listed once every `cache_duration` seconds whatever the number of instances.
+
+    The attributes of the processes that were already running for a while when they appeared in the
+    snapshot are kept from one snapshot to the next, they are only read once for long-lived processes.
+    Failures to read an attribute (access denied...) are not kept, they are raised every time.
+    """
+
+    def __init__(self, cache_duration=DEFAULT_SHARED_PROCESS_LIST_CACHE_DURATION):
+        self.cache_duration = cache_duration
+        self.last_ts = 0
+        self.procfs_path = None
+        # pid -> ProcessInfo
+        self.processes = {}
+        self._lock = threading.Lock()
+
+    def should_refresh(self):
+        return time.time() - self.last_ts > self.cache_duration or self.procfs_path != psutil.PROCFS_PATH
+
+    def reset(self):
+        """
+        Force the next call to `get_processes` to list the processes again, after one of them disappeared.
+        """
+        self.last_ts = 0
+
+    def get_processes(self):
+        """
+        Return the processes of the snapshot, listing them again if the snapshot expired.
+        """
+        with self._lock:
+            if self.should_refresh():
+                self.refresh()
+            return list(self.processes.values())
+
+    def get_process(self, pid):
+        """
+        Return the process of the snapshot with this pid, or a new one if it is not in the snapshot.
+        """
+        process = self.processes.get(pid)
+        if process is None:
+            process = ProcessInfo(psutil.Process(pid), time.time())
+        return process
+
+    def refresh(self):
+        now = time.time()
+        previous = self.processes if self.procfs_path == psutil.PROCFS_PATH else {}
+
+        processes = {}
+        # `process_iter` yields the same `Process` objects as long as the processes are running
+        for process in psutil.process_iter():
+            info = previous.get(process.pid)
+            if info is None or info.process is not process or not info.is_long_lived(self.cache_duration):
+                info = ProcessInfo(process, now)
+            processes[process.pid] = info
+
+        self.processes = processes
+        self.procfs_path = psutil.PROCFS_PATH
+        self.last_ts = now
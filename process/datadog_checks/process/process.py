@@ -6,6 +6,7 @@ from __future__ import division
 import os
 import re
 import subprocess
+import threading
 import time
 from collections import defaultdict
 
@@ -16,6 +17,8 @@ from datadog_checks.checks import AgentCheck
 from datadog_checks.config import _is_affirmative
 from datadog_checks.utils.platform import Platform
 
+from .cache import DEFAULT_SHARED_PROCESS_LIST_CACHE_DURATION, ProcessListCache
+
 DEFAULT_AD_CACHE_DURATION = 120
 DEFAULT_PID_CACHE_DURATION = 120
 
@@ -54,9 +57,22 @@ ATTR_TO_METRIC_RATE = {
 
 
 class ProcessCheck(AgentCheck):
+    # The lists of the processes running on the host, shared by all the instances of the check
+    # with the same `shared_process_list_cache_duration`
+    process_list_caches = {}
+    process_list_caches_lock = threading.Lock()
+
     def __init__(self, name, init_config, agentConfig, instances=None):
         AgentCheck.__init__(self, name, init_config, agentConfig, instances)
 
+        cache_duration = int(
+            init_config.get('shared_process_list_cache_duration', DEFAULT_SHARED_PROCESS_LIST_CACHE_DURATION)
+        )
+        with self.process_list_caches_lock:
+            self.process_list_cache = self.process_list_caches.get(cache_duration)
+            if self.process_list_cache is None:
+                self.process_list_cache = self.process_list_caches[cache_duration] = ProcessListCache(cache_duration)
+
         # ad stands for access denied
         # We cache the PIDs getting this error and don't iterate on them more often than `access_denied_cache_duration``
         # This cache is for all PIDs so it's global, but it should be refreshed by instance
@@ -111,13 +127,18 @@ class ProcessCheck(AgentCheck):
 
         matching_pids = set()
 
-        for proc in psutil.process_iter():
+        if exact_match:
+            patterns = [string.lower() if os.name == 'nt' else string for string in search_string]
+        else:
+            patterns = [re.compile(string.lower() if os.name == 'nt' else string) for string in search_string]
+
+        for proc in self.process_list_cache.get_processes():
             # Skip access denied processes
             if not refresh_ad_cache and proc.pid in self.ad_cache:
                 continue
 
             found = False
-            for string in search_string:
+            for string, pattern in zip(search_string, patterns):
                 try:
                     # FIXME 8.x: All has been deprecated
                     # from the doc, should be removed
@@ -125,21 +146,15 @@ class ProcessCheck(AgentCheck):
                         found = True
                     if exact_match:
                         if os.name == 'nt':
-                            if proc.name().lower() == string.lower():
+                            if proc.name().lower() == pattern:
                                 found = True
                         else:
-                            if proc.name() == string:
+                            if proc.name() == pattern:
                                 found = True
 
                     else:
-                        cmdline = proc.cmdline()
-                        if os.name == 'nt':
-                            lstring = string.lower()
-                            if re.search(lstring, ' '.join(cmdline).lower()):
-                                found = True
-                        else:
-                            if re.search(string, ' '.join(cmdline)):
-                                found = True
+                        if pattern.search(proc.cmdline(lower=os.name == 'nt')):
+                            found = True
                 except psutil.NoSuchProcess:
                     self.log.warning('Process disappeared while scanning')
                 except psutil.AccessDenied as e:
@@ -240,6 +255,7 @@ class ProcessCheck(AgentCheck):
                     self.warning('Process {} disappeared while scanning'.format(pid))
                     # reset the PID cache now, something changed
                     self.last_pid_cache_ts[name] = 0
+                    self.process_list_cache.reset()
                     continue
 
             p = self.process_cache[name][pid]
@@ -479,7 +495,7 @@ class ProcessCheck(AgentCheck):
         filtered_pids = set()
         for pid in pids:
             try:
-                proc = psutil.Process(pid)
+                proc = self.process_list_cache.get_process(pid)
                 if proc.username() == user:
                     self.log.debug("Collecting pid {} belonging to {}".format(pid, user))
                     filtered_pids.add(pid)
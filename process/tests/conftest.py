@@ -2,8 +2,10 @@
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
 import pytest
+from mock import patch
 
 from datadog_checks.process import ProcessCheck
+from datadog_checks.process.cache import DEFAULT_SHARED_PROCESS_LIST_CACHE_DURATION, ProcessListCache
 
 from . import common
 
@@ -16,3 +18,11 @@ def dd_environment():
 @pytest.fixture
 def check():
     return ProcessCheck(common.CHECK_NAME, {}, {})
+
+
+@pytest.fixture(autouse=True)
+def process_list_cache():
+    # Do not share the processes listed by a test with the next ones
+    cache = ProcessListCache()
+    with patch.dict(ProcessCheck.process_list_caches, {DEFAULT_SHARED_PROCESS_LIST_CACHE_DURATION: cache}, clear=True):
+        yield cache
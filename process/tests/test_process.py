@@ -9,6 +9,7 @@ from mock import patch
 from six import iteritems
 
 from datadog_checks.process import ProcessCheck
+from datadog_checks.process.cache import ProcessInfo
 
 from . import common
 
@@ -104,6 +105,76 @@ def test_ad_cache(aggregator):
     process.check(config['instances'][0])
 
 
+def test_shared_process_list_cache(aggregator):
+    instances = [
+        {'name': 'py', 'search_string': ['python'], 'exact_match': False},
+        {'name': 'pytest', 'search_string': ['pytest'], 'exact_match': False},
+        {'name': 'nothing', 'search_string': ['nothing_should_match_this'], 'exact_match': False},
+    ]
+    # One check object per instance, like the Agent does
+    checks = [ProcessCheck(common.CHECK_NAME, {'shared_process_list_cache_duration': 60}, {}) for _ in instances]
+    process_list_cache = checks[0].process_list_cache
+    assert all(check.process_list_cache is process_list_cache for check in checks)
+
+    # Checks configured with another duration do not change it
+    other_check = ProcessCheck(common.CHECK_NAME, {'shared_process_list_cache_duration': 5}, {})
+    assert other_check.process_list_cache is not process_list_cache
+    assert other_check.process_list_cache.cache_duration == 5
+
+    with patch('psutil.process_iter', wraps=psutil.process_iter) as process_iter:
+        for check, instance in zip(checks, instances):
+            check.check(instance)
+        assert process_iter.call_count == 1
+
+        # The pid caches of the instances are refreshed from the same snapshot
+        for check in checks:
+            check.last_pid_cache_ts = {}
+        for check, instance in zip(checks, instances):
+            check.check(instance)
+        assert process_iter.call_count == 1
+
+        process_list_cache.reset()
+        checks[0].last_pid_cache_ts = {}
+        checks[0].check(instances[0])
+        assert process_iter.call_count == 2
+
+    assert process_list_cache.cache_duration == 60
+    assert os.getpid() in checks[0].find_pids('py', ['python'], False)
+    assert os.getpid() in checks[1].find_pids('pytest', ['pytest'], False)
+    aggregator.assert_service_check(
+        'process.up', status=ProcessCheck.OK, tags=generate_expected_tags(instances[0]) + ['process:py']
+    )
+    aggregator.assert_service_check(
+        'process.up', status=ProcessCheck.CRITICAL, tags=generate_expected_tags(instances[2]) + ['process:nothing']
+    )
+
+
+def test_process_list_cache_attributes(process_list_cache):
+    process_list_cache.cache_duration = 0
+    processes = {p.pid: p for p in process_list_cache.get_processes()}
+    me = processes[os.getpid()]
+    name = psutil.Process(os.getpid()).name()
+    assert me.name() == name
+    assert 'pytest' in me.cmdline()
+
+    # The attributes of long-lived processes are only read once
+    with patch.object(psutil.Process, 'name', side_effect=psutil.AccessDenied()):
+        process_list_cache.reset()
+        processes = {p.pid: p for p in process_list_cache.get_processes()}
+        assert processes[os.getpid()] is me
+        assert me.name() == name
+
+    # But not the ones of the processes that were just started, nor the failures
+    process = psutil.Process(os.getpid())
+    started = ProcessInfo(process, first_seen=process.create_time() + 1)
+    assert started.is_long_lived(0)
+    assert not started.is_long_lived(10)
+    with patch.object(psutil.Process, 'name', side_effect=psutil.AccessDenied()):
+        with pytest.raises(psutil.AccessDenied):
+            started.name()
+    assert started.name() == process.name()
+
+
 def mock_find_pid(name, search_string, exact_match=True, ignore_ad=True, refresh_ad_cache=True):
     if search_string is not None:
         idx = search_string[0].split('_')[1]
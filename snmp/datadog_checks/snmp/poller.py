@@ -0,0 +1,241 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+from collections import deque
+
+from pyasn1.type.univ import Null
+from pysnmp.entity.rfc3413 import cmdgen
+from pysnmp.hlapi.lcd import CommandGeneratorLcdConfigurator
+from pysnmp.hlapi.varbinds import CommandGeneratorVarBinds
+from pysnmp.proto import errind
+
+DEFAULT_MAX_CONCURRENT_REQUESTS = 10
+DEFAULT_BULK_MAX_REPETITIONS = 10
+
+vb_processor = CommandGeneratorVarBinds()
+lcd = CommandGeneratorLcdConfigurator()
+
+
+class SnmpPoller(object):
+    """
+    Sends SNMP requests to any number of devices over a single SNMP engine, using the asynchronous
+    API of pysnmp instead of waiting for each answer in turn like the synchronous `hlapi` commands.
+
+    Requests are queued by `get`, `walk` and `bulk_walk`, and sent by `run` which returns once all of them,
+    including the ones sent from the callbacks, got an answer or timed out. The timeout and number
+    of retries of the requests are the ones of their transport target, so they can differ per device.
+    At most `max_concurrent_requests` requests are in flight at the same time.
+
+    Callbacks are called with `(error, error_indication, error_status, var_binds)`: `error` is the
+    exception raised while building the request or decoding the answer, if any, the others are
+    the ones of the `hlapi` commands.
+    """
+
+    def __init__(self, snmp_engine, max_concurrent_requests=DEFAULT_MAX_CONCURRENT_REQUESTS):
+        self.snmp_engine = snmp_engine
+        self.max_concurrent_requests = max(int(max_concurrent_requests), 1)
+        self._queue = deque()
+        self._in_flight = 0
+
+    def get(self, target, var_binds, callback, lookup_mib=True):
+        """
+        Send a GET request for `var_binds` to `target`, a tuple (auth data, transport target, context data).
+        """
+        self._queue.append((cmdgen.GetCommandGenerator(), (), False, target, var_binds, lookup_mib, callback))
+        self._send_queued()
+
+    def get_next(self, target, var_binds, callback, lookup_mib=True):
+        """
+        Send a GETNEXT request for `var_binds` to `target`, the callback gets a table of var binds.
+        """
+        self._queue.append((cmdgen.NextCommandGenerator(), (), True, target, var_binds, lookup_mib, callback))
+        self._send_queued()
+
+    def get_bulk(self, target, max_repetitions, var_binds, callback, lookup_mib=True):
+        """
+        Send a GETBULK request for `var_binds` to `target`, asking for up to `max_repetitions` successors
+        of each of them. The callback gets a table of var binds, one row per repetition.
+        """
+        generator = cmdgen.BulkCommandGenerator()
+        self._queue.append((generator, (0, max_repetitions), True, target, var_binds, lookup_mib, callback))
+        self._send_queued()
+
+    def walk(self, target, var_binds, callback, lookup_mib=True, ignore_nonincreasing_oid=False):
+        """
+        Walk the OIDs following `var_binds` with GETNEXT requests until all of them left the subtree
+        of their initial OID, like `hlapi.nextCmd` with `lexicographicMode=False`.
+        The callback gets all the rows once the walk is over.
+        """
+        try:
+            initial_names = [var_bind[0] for var_bind in vb_processor.makeVarBinds(self.snmp_engine, var_binds)]
+        except Exception as e:
+            callback(e, None, None, [])
+            return
+
+        rows = []
+
+        def on_response(error, error_indication, error_status, var_bind_table):
+            if ignore_nonincreasing_oid and isinstance(error_indication, errind.OidNotIncreasing):
+                error_indication = None
+
+            if error or error_indication:
+                callback(error, error_indication, error_status, rows)
+                return
+
+            if error_status:
+                # SNMPv1 noSuchName error means the end of the MIB was reached
+                if error_status == 2:
+                    error_status = None
+                callback(None, None, error_status, rows)
+                return
+
+            row = var_bind_table[0] if var_bind_table else []
+            for idx, (name, value) in enumerate(row):
+                if not isinstance(value, Null) and initial_names[idx].isPrefixOf(name):
+                    break
+            else:
+                callback(None, None, None, rows)
+                return
+
+            rows.append(row)
+            self.get_next(target, [(name, Null('')) for name, _ in row], on_response, lookup_mib=lookup_mib)
+
+        self.get_next(target, var_binds, on_response, lookup_mib=lookup_mib)
+
+    def bulk_walk(
+        self,
+        target,
+        var_binds,
+        callback,
+        lookup_mib=True,
+        max_repetitions=DEFAULT_BULK_MAX_REPETITIONS,
+        ignore_nonincreasing_oid=False,
+    ):
+        """
+        Walk the OIDs following `var_binds` like `walk`, with GETBULK requests fetching up to
+        `max_repetitions` rows at once. Only SNMP v2c and v3 devices support them.
+
+        Each column stops being requested as soon as it left the subtree of its initial OID, so the
+        rows only hold the var binds of the columns still being walked. A column also stops at the first
+        OID not greater than the previous one, or with `ignore_nonincreasing_oid` at the first OID it
+        already returned, so that a device answering with non increasing OIDs is never looped on.
+        """
+        try:
+            initial_names = [var_bind[0] for var_bind in vb_processor.makeVarBinds(self.snmp_engine, var_binds)]
+        except Exception as e:
+            callback(e, None, None, [])
+            return
+
+        rows = []
+        # The OIDs returned for each column, to detect loops when non increasing OIDs are accepted
+        seen_names = [set() for _ in initial_names]
+
+        def request(columns, names):
+            self.get_bulk(
+                target,
+                max_repetitions,
+                [(name, Null('')) for name in names],
+                lambda *response: on_response(columns, names, *response),
+                lookup_mib=lookup_mib,
+            )
+
+        def on_response(columns, names, error, error_indication, error_status, var_bind_table):
+            if ignore_nonincreasing_oid and isinstance(error_indication, errind.OidNotIncreasing):
+                error_indication = None
+
+            if error or error_indication:
+                callback(error, error_indication, error_status, rows)
+                return
+
+            if error_status:
+                if error_status == 2:
+                    error_status = None
+                callback(None, None, error_status, rows)
+                return
+
+            last_names = list(names)
+            active = [True] * len(columns)
+            progressed = False
+            for table_row in var_bind_table:
+                if len(table_row) != len(columns):
+                    # Truncated response, the following rows are requested again
+                    break
+                row = []
+                for idx, (name, value) in enumerate(table_row):
+                    if not active[idx]:
+                        continue
+                    column = columns[idx]
+                    oid = name.asTuple()
+                    if ignore_nonincreasing_oid:
+                        looping = oid in seen_names[column]
+                    else:
+                        looping = oid <= last_names[idx].asTuple()
+                    if isinstance(value, Null) or not initial_names[column].isPrefixOf(name) or looping:
+                        active[idx] = False
+                        continue
+                    row.append((name, value))
+                    last_names[idx] = name
+                    seen_names[column].add(oid)
+                if row:
+                    rows.append(row)
+                    progressed = True
+
+            next_columns = [column for idx, column in enumerate(columns) if active[idx]]
+            next_names = [name for idx, name in enumerate(last_names) if active[idx]]
+            if not next_columns or not progressed:
+                callback(None, None, None, rows)
+                return
+
+            request(next_columns, next_names)
+
+        request(list(range(len(initial_names))), initial_names)
+
+    def run(self):
+        """
+        Send the queued requests and wait for all the answers.
+        """
+        if self._in_flight:
+            self.snmp_engine.transportDispatcher.runDispatcher()
+
+    def _send_queued(self):
+        while self._queue and self._in_flight < self.max_concurrent_requests:
+            generator, args, is_table, target, var_binds, lookup_mib, callback = self._queue.popleft()
+            auth_data, transport_target, context_data = target
+            try:
+                addr_name, _ = lcd.configure(self.snmp_engine, auth_data, transport_target)
+                send_args = (
+                    (self.snmp_engine, addr_name, context_data.contextEngineId, context_data.contextName)
+                    + args
+                    + (
+                        vb_processor.makeVarBinds(self.snmp_engine, var_binds),
+                        self._on_response,
+                        (is_table, lookup_mib, callback),
+                    )
+                )
+                generator.sendVarBinds(*send_args)
+            except Exception as e:
+                callback(e, None, None, [])
+            else:
+                self._in_flight += 1
+
+    def _on_response(
+        self, snmp_engine, send_request_handle, error_indication, error_status, error_index, var_binds, cb_ctx
+    ):
+        is_table, lookup_mib, callback = cb_ctx
+        self._in_flight -= 1
+
+        error = None
+        try:
+            if is_table:
+                var_binds = [vb_processor.unmakeVarBinds(snmp_engine, row, lookup_mib) for row in var_binds or []]
+            else:
+                var_binds = vb_processor.unmakeVarBinds(snmp_engine, var_binds or [], lookup_mib)
+        except Exception as e:
+            # Values not matching the constraints of their MIB, with `lookup_mib`
+            error = e
+            var_binds = []
+
+        callback(error, error_indication, error_status, var_binds)
+        self._send_queued()
+        # Never let a GETNEXT or GETBULK request be continued by pysnmp, walks are driven by the poller
+        return False
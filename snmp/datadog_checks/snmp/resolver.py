@@ -0,0 +1,64 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+from pysnmp import hlapi
+from pysnmp.proto import rfc1902
+
+
+class OIDResolver(object):
+    """
+    Resolves OIDs into their MIB symbol and indexes, like `ObjectIdentity.resolveWithMib` does.
+
+    The MIB symbol of every table column or scalar resolved is kept along with its OID, so the
+    following OIDs of the same column are resolved without looking up the MIBs again: only their
+    indexes are decoded from the end of the OID. The cache lives as long as the MIB view controller.
+    """
+
+    def __init__(self, mib_view_controller):
+        self.mib_view_controller = mib_view_controller
+        mib_builder = mib_view_controller.mibBuilder
+        self._mib_scalar, self._mib_table_column = mib_builder.importSymbols(
+            'SNMPv2-SMI', 'MibScalar', 'MibTableColumn'
+        )
+        # OID of a column or scalar -> (symbol, row node of the column or None for a scalar)
+        self._nodes = {}
+        # Lengths of the OIDs in `_nodes`, longest first
+        self._prefix_lengths = []
+
+    def resolve(self, oid, mibs_to_load=()):
+        """
+        Return the symbol and the indexes of `oid`, a tuple of integers.
+        The MIBs in `mibs_to_load` are loaded if the MIBs have to be looked up.
+        """
+        for length in self._prefix_lengths:
+            node = self._nodes.get(oid[:length])
+            if node is not None:
+                symbol, row_node = node
+                suffix = oid[length:]
+                if not suffix:
+                    return symbol, ()
+                if row_node is None:
+                    return symbol, (rfc1902.ObjectName(suffix),)
+                return symbol, row_node.getIndicesFromInstId(suffix)
+
+        object_identity = hlapi.ObjectIdentity(oid).loadMibs(*mibs_to_load)
+        object_identity.resolveWithMib(self.mib_view_controller)
+        _, symbol, indexes = object_identity.getMibSymbol()
+        self._cache_node(object_identity.getMibNode(), symbol)
+        return symbol, indexes
+
+    def _cache_node(self, mib_node, symbol):
+        if isinstance(mib_node, self._mib_table_column):
+            row_mib, row_symbol, _ = self.mib_view_controller.getNodeLocation(mib_node.name[:-1])
+            (row_node,) = self.mib_view_controller.mibBuilder.importSymbols(row_mib, row_symbol)
+        elif isinstance(mib_node, self._mib_scalar):
+            row_node = None
+        else:
+            # Other nodes are not cached, their OIDs are not expected to be returned with values
+            return
+
+        prefix = tuple(mib_node.name)
+        self._nodes[prefix] = (symbol, row_node)
+        if len(prefix) not in self._prefix_lengths:
+            self._prefix_lengths.append(len(prefix))
+            self._prefix_lengths.sort(reverse=True)
@@ -6,7 +6,6 @@ from collections import defaultdict
 import pysnmp.proto.rfc1902 as snmp_type
 from pyasn1.type.univ import OctetString
 from pysnmp import hlapi
-from pysnmp.error import PySnmpError
 from pysnmp.smi import builder, view
 from pysnmp.smi.exval import noSuchInstance, noSuchObject
 from six import iteritems
@@ -14,6 +13,9 @@ from six import iteritems
 from datadog_checks.checks.network import NetworkCheck, Status
 from datadog_checks.config import _is_affirmative
 
+from .poller import DEFAULT_BULK_MAX_REPETITIONS, DEFAULT_MAX_CONCURRENT_REQUESTS, SnmpPoller
+from .resolver import OIDResolver
+
 # Additional types that are not part of the SNMP protocol. cf RFC 2856
 (CounterBasedGauge64, ZeroBasedCounter64) = builder.MibBuilder().importSymbols(
     "HCNUM-TC", "CounterBasedGauge64", "ZeroBasedCounter64"
@@ -46,6 +48,8 @@ class SnmpCheck(NetworkCheck):
     DEFAULT_RETRIES = 5
     DEFAULT_TIMEOUT = 1
     SC_STATUS = 'snmp.can_check'
+    # The instance is used to pass the errors of the run down to the service check
+    DEEP_COPY_INSTANCE = True
 
     def __init__(self, name, init_config, agentConfig, instances):
         for instance in instances:
@@ -55,6 +59,12 @@ class SnmpCheck(NetworkCheck):
         # Set OID batch size
         self.oid_batch_size = int(init_config.get("oid_batch_size", DEFAULT_OID_BATCH_SIZE))
 
+        # Maximum number of SNMP requests waiting for an answer at the same time, all devices included
+        self.max_concurrent_requests = int(init_config.get("max_concurrent_requests", DEFAULT_MAX_CONCURRENT_REQUESTS))
+
+        # Number of rows fetched by each GETBULK request when walking tables, 0 to walk them with GETNEXT requests
+        self.bulk_max_repetitions = int(init_config.get("bulk_max_repetitions", DEFAULT_BULK_MAX_REPETITIONS))
+
         # Load Custom MIB directory
         self.mibs_path = None
         self.ignore_nonincreasing_oid = False
@@ -62,18 +72,23 @@ class SnmpCheck(NetworkCheck):
             self.mibs_path = init_config.get("mibs_folder")
             self.ignore_nonincreasing_oid = _is_affirmative(init_config.get("ignore_nonincreasing_oid", False))
 
+        # SNMP engine shared by all the devices and check runs, created on first use
+        self._snmp_engine = None
+        self._mib_view_controller = None
+        self._oid_resolver = None
+
         NetworkCheck.__init__(self, name, init_config, agentConfig, instances)
 
     def _load_conf(self, instance):
         tags = instance.get("tags", [])
-        ip_address = instance["ip_address"]
+        ip_address = instance.get("ip_address")
         metrics = instance.get('metrics', [])
         if _is_affirmative(instance.get('use_global_metrics', True)):
             metrics.extend(self.init_config.get('global_metrics', []))
         timeout = int(instance.get('timeout', self.DEFAULT_TIMEOUT))
         retries = int(instance.get('retries', self.DEFAULT_RETRIES))
         enforce_constraints = _is_affirmative(instance.get('enforce_mib_constraints', True))
-        snmp_engine, mib_view_controller = self.create_snmp_engine(self.mibs_path)
+        snmp_engine, mib_view_controller = self.get_snmp_engine()
 
         return snmp_engine, mib_view_controller, ip_address, tags, metrics, timeout, retries, enforce_constraints
 
@@ -96,6 +111,42 @@ class SnmpCheck(NetworkCheck):
 
         return key
 
+    def get_snmp_engine(self):
+        '''
+        Return the SNMP engine and MIB view controller of the check, creating them on first use.
+        Loading the MIBs is expensive, and one engine can query any number of devices.
+        '''
+        if self._snmp_engine is None:
+            self._snmp_engine, self._mib_view_controller = self.create_snmp_engine(self.mibs_path)
+        return self._snmp_engine, self._mib_view_controller
+
+    def get_oid_resolver(self, mib_view_controller):
+        '''
+        Return the resolver of the OIDs of the MIB view controller, which caches
+        the MIB symbols of the columns between check runs.
+        '''
+        if self._oid_resolver is None or self._oid_resolver.mib_view_controller is not mib_view_controller:
+            self._oid_resolver = OIDResolver(mib_view_controller)
+        return self._oid_resolver
+
+    def get_devices(self, instance):
+        '''
+        Return the configurations of the devices to poll for the instance: the instance itself if
+        it has an `ip_address`, and each entry of `devices` merged with the instance configuration.
+        '''
+        devices = []
+        if "ip_address" in instance or not instance.get("devices"):
+            devices.append(instance)
+
+        for device in instance.get("devices") or []:
+            config = {key: value for key, value in iteritems(instance) if key != "devices"}
+            config.update(device)
+            config["name"] = device.get("name", device.get("ip_address"))
+            config["tags"] = instance.get("tags", []) + device.get("tags", [])
+            devices.append(config)
+
+        return devices
+
     def create_snmp_engine(self, mibs_path):
         '''
         Create a command generator to perform all the snmp query.
@@ -175,16 +226,10 @@ class SnmpCheck(NetworkCheck):
         '''
         if "ip_address" not in instance:
             raise Exception("An IP address needs to be specified")
-        ip_address = instance["ip_address"]
+        ip_address = instance.get("ip_address")
         port = int(instance.get("port", 161))  # Default SNMP port
         return hlapi.UdpTransportTarget((ip_address, port), timeout=timeout, retries=retries)
 
-    def raise_on_error_indication(self, error_indication, instance):
-        if error_indication:
-            message = "{} for instance {}".format(error_indication, instance["ip_address"])
-            instance["service_check_error"] = message
-            raise Exception(message)
-
     def check_table(
         self,
         instance,
@@ -207,110 +252,148 @@ class SnmpCheck(NetworkCheck):
         dict[oid/metric_name][row index] = value
         In case of scalar objects, the row index is just 0
         '''
+        poller = SnmpPoller(snmp_engine, self.max_concurrent_requests)
+        query = self.query_oids(poller, instance, oids, timeout, retries, enforce_constraints)
+        poller.run()
+        return self.get_query_results(
+            instance, query, mib_view_controller, lookup_names, enforce_constraints, mibs_to_load
+        )
+
+    def query_oids(self, poller, instance, oids, timeout, retries, enforce_constraints):
+        '''
+        Queue the requests fetching the oids from the device configured in instance on the poller.
+        The oids are requested by batches, all the batches are requested concurrently.
+
+        Returns the query, whose var binds are filled as the poller runs
+        '''
         # UPDATE: We used to perform only a snmpgetnext command to fetch metric values.
         # It returns the wrong value when the OID passeed is referring to a specific leaf.
         # For example:
         # snmpgetnext -v2c -c public localhost:11111 1.3.6.1.2.1.25.4.2.1.7.222
         # iso.3.6.1.2.1.25.4.2.1.7.224 = INTEGER: 2
         # SOLUTION: perform a snmpget command and fallback with snmpgetnext if not found
-
-        # Set aliases for snmpget and snmpgetnext with logging
         transport_target = self.get_transport_target(instance, timeout, retries)
         auth_data = self.get_auth_data(instance)
         context_engine_id, context_name = self.get_context_data(instance)
+        target = (auth_data, transport_target, hlapi.ContextData(context_engine_id, context_name))
 
-        first_oid = 0
-        all_binds = []
-        results = defaultdict(dict)
+        # SNMP v1 devices do not support GETBULK requests
+        max_repetitions = int(instance.get("bulk_max_repetitions", self.bulk_max_repetitions))
+        use_bulk = max_repetitions > 0 and int(instance.get("snmp_version", 2)) != 1
 
-        while first_oid < len(oids):
-            try:
-                # Start with snmpget command
-                oids_batch = oids[first_oid : first_oid + self.oid_batch_size]
-                self.log.debug("Running SNMP command get on OIDS {}".format(oids_batch))
-                error_indication, error_status, error_index, var_binds = next(
-                    hlapi.getCmd(
-                        snmp_engine,
-                        auth_data,
-                        transport_target,
-                        hlapi.ContextData(context_engine_id, context_name),
-                        *(oids_batch),
-                        lookupMib=enforce_constraints
-                    )
-                )
-                self.log.debug("Returned vars: {}".format(var_binds))
+        # The var binds of each batch, kept in the order of the batches whatever the order of the answers
+        query = {'batches': [], 'error': None}
 
-                # Raise on error_indication
-                self.raise_on_error_indication(error_indication, instance)
+        def on_error(e):
+            if "service_check_error" not in instance:
+                instance["service_check_error"] = "Fail to collect some metrics: {}".format(e)
+            if "service_check_severity" not in instance:
+                instance["service_check_severity"] = Status.CRITICAL
+            self.warning("Fail to collect some metrics: {}".format(e))
 
-                missing_results = []
-                complete_results = []
+        def on_error_indication(error_indication):
+            message = "{} for instance {}".format(error_indication, instance["ip_address"])
+            instance["service_check_error"] = message
+            query['error'] = message
+
+        def fetch_batch(oids_batch, batch_binds):
+            def on_get(error, error_indication, error_status, var_binds):
+                self.log.debug("Returned vars: {}".format(var_binds))
+                if error is not None:
+                    return on_error(error)
+                if error_indication:
+                    return on_error_indication(error_indication)
 
+                missing_results = []
                 for var in var_binds:
                     result_oid, value = var
                     if reply_invalid(value):
                         oid_tuple = result_oid.asTuple()
                         missing_results.append(hlapi.ObjectType(hlapi.ObjectIdentity(oid_tuple)))
                     else:
-                        complete_results.append(var)
+                        batch_binds.append(var)
 
                 if missing_results:
                     # If we didn't catch the metric using snmpget, try snmpnext
-                    self.log.debug("Running SNMP command getNext on OIDS {}".format(missing_results))
-                    for error_indication, error_status, _, var_binds_table in hlapi.nextCmd(
-                        snmp_engine,
-                        auth_data,
-                        transport_target,
-                        hlapi.ContextData(context_engine_id, context_name),
-                        *missing_results,
-                        lookupMib=enforce_constraints,
-                        ignoreNonIncreasingOid=self.ignore_nonincreasing_oid,
-                        lexicographicMode=False  # Don't walk through the entire MIB, stop at end of table
-                    ):
-
-                        self.log.debug("Returned vars: {}".format(var_binds_table))
-                        # Raise on error_indication
-                        self.raise_on_error_indication(error_indication, instance)
-
-                        if error_status:
-                            message = "{} for instance {}".format(error_status.prettyPrint(), instance["ip_address"])
-                            instance["service_check_error"] = message
-
-                            # submit CRITICAL service check if we can't connect to device
-                            if 'unknownUserName' in message:
-                                instance["service_check_severity"] = Status.CRITICAL
-                                self.log.error(message)
-                            else:
-                                self.warning(message)
-
-                        for table_row in var_binds_table:
-                            complete_results.append(table_row)
-
-                all_binds.extend(complete_results)
-
-            except PySnmpError as e:
-                if "service_check_error" not in instance:
-                    instance["service_check_error"] = "Fail to collect some metrics: {}".format(e)
-                if "service_check_severity" not in instance:
-                    instance["service_check_severity"] = Status.CRITICAL
-                self.warning("Fail to collect some metrics: {}".format(e))
-
-            # if we fail move onto next batch
-            first_oid = first_oid + self.oid_batch_size
+                    if use_bulk:
+                        self.log.debug("Running SNMP command getBulk on OIDS {}".format(missing_results))
+                        poller.bulk_walk(
+                            target,
+                            missing_results,
+                            on_walk,
+                            lookup_mib=enforce_constraints,
+                            max_repetitions=max_repetitions,
+                            ignore_nonincreasing_oid=self.ignore_nonincreasing_oid,
+                        )
+                    else:
+                        self.log.debug("Running SNMP command getNext on OIDS {}".format(missing_results))
+                        poller.walk(
+                            target,
+                            missing_results,
+                            on_walk,
+                            lookup_mib=enforce_constraints,
+                            ignore_nonincreasing_oid=self.ignore_nonincreasing_oid,
+                        )
+
+            def on_walk(error, error_indication, error_status, var_binds_table):
+                self.log.debug("Returned vars: {}".format(var_binds_table))
+                if error is not None:
+                    return on_error(error)
+                if error_indication:
+                    return on_error_indication(error_indication)
+
+                if error_status:
+                    message = "{} for instance {}".format(error_status.prettyPrint(), instance["ip_address"])
+                    instance["service_check_error"] = message
+
+                    # submit CRITICAL service check if we can't connect to device
+                    if 'unknownUserName' in message:
+                        instance["service_check_severity"] = Status.CRITICAL
+                        self.log.error(message)
+                    else:
+                        self.warning(message)
+
+                for table_row in var_binds_table:
+                    batch_binds.extend(table_row)
+
+            # Start with snmpget command
+            self.log.debug("Running SNMP command get on OIDS {}".format(oids_batch))
+            poller.get(target, oids_batch, on_get, lookup_mib=enforce_constraints)
+
+        for first_oid in range(0, len(oids), self.oid_batch_size):
+            batch_binds = []
+            query['batches'].append(batch_binds)
+            fetch_batch(oids[first_oid : first_oid + self.oid_batch_size], batch_binds)
+
+        return query
+
+    def get_query_results(
+        self, instance, query, mib_view_controller, lookup_names, enforce_constraints=False, mibs_to_load=None
+    ):
+        '''
+        Build the results of a query once the poller ran, see `check_table`.
+        Raise if the device could not be reached.
+        '''
+        if query['error']:
+            raise Exception(query['error'])
+
+        all_binds = [var for batch_binds in query['batches'] for var in batch_binds]
+        results = defaultdict(dict)
 
         # if we've collected some variables, it's not that bad.
         if "service_check_severity" in instance and len(all_binds):
             instance["service_check_severity"] = Status.WARNING
 
+        oid_resolver = self.get_oid_resolver(mib_view_controller)
         for result_oid, value in all_binds:
             if lookup_names:
                 if not enforce_constraints:
                     # if enforce_constraints is false, then MIB resolution has not been done yet
                     # so we need to do it manually. We have to specify the mibs that we will need
-                    # to resolve the name.
-                    oid_to_resolve = hlapi.ObjectIdentity(result_oid.asTuple()).loadMibs(*mibs_to_load)
-                    result_oid = oid_to_resolve.resolveWithMib(mib_view_controller)
-                _, metric, indexes = result_oid.getMibSymbol()
+                    # to resolve the name. The resolver only looks up the MIBs once per column.
+                    metric, indexes = oid_resolver.resolve(result_oid.asTuple(), mibs_to_load)
+                else:
+                    _, metric, indexes = result_oid.getMibSymbol()
                 results[metric][indexes] = value
             else:
                 oid = result_oid.asTuple()
@@ -374,65 +457,70 @@ class SnmpCheck(NetworkCheck):
     def _check(self, instance):
         '''
         Perform two series of SNMP requests, one for all that have MIB asociated
-        and should be looked up and one for those specified by oids
+        and should be looked up and one for those specified by oids.
+        All the devices of the instance are queried at once.
         '''
 
-        (
-            snmp_engine,
-            mib_view_controller,
-            ip_address,
-            tags,
-            metrics,
-            timeout,
-            retries,
-            enforce_constraints,
-        ) = self._load_conf(instance)
-
-        tags += ['snmp_device:{}'.format(ip_address)]
+        (snmp_engine, mib_view_controller, _, _, metrics, _, _, enforce_constraints) = self._load_conf(instance)
 
         table_oids, raw_oids, mibs_to_load = self.parse_metrics(metrics, enforce_constraints)
+
+        poller = SnmpPoller(snmp_engine, self.max_concurrent_requests)
+        queries = []
+        for device in self.get_devices(instance):
+            timeout = int(device.get('timeout', self.DEFAULT_TIMEOUT))
+            retries = int(device.get('retries', self.DEFAULT_RETRIES))
+            table_query = raw_query = None
+            try:
+                if table_oids:
+                    self.log.debug("Querying device %s for %s oids", device["ip_address"], len(table_oids))
+                    table_query = self.query_oids(poller, device, table_oids, timeout, retries, enforce_constraints)
+                if raw_oids:
+                    self.log.debug("Querying device %s for %s oids", device["ip_address"], len(raw_oids))
+                    raw_query = self.query_oids(poller, device, raw_oids, timeout, retries, False)
+            except Exception as e:
+                self._set_device_error(device, e)
+            queries.append((device, table_query, raw_query))
+
         try:
-            if table_oids:
-                self.log.debug("Querying device %s for %s oids", ip_address, len(table_oids))
-                table_results = self.check_table(
-                    instance,
-                    snmp_engine,
-                    mib_view_controller,
-                    table_oids,
-                    True,
-                    timeout,
-                    retries,
-                    enforce_constraints=enforce_constraints,
-                    mibs_to_load=mibs_to_load,
-                )
-                self.report_table_metrics(metrics, table_results, tags)
-
-            if raw_oids:
-                self.log.debug("Querying device %s for %s oids", ip_address, len(raw_oids))
-                raw_results = self.check_table(
-                    instance,
-                    snmp_engine,
-                    mib_view_controller,
-                    raw_oids,
-                    False,
-                    timeout,
-                    retries,
-                    enforce_constraints=False,
-                )
-                self.report_raw_metrics(metrics, raw_results, tags)
+            poller.run()
         except Exception as e:
-            if "service_check_error" not in instance:
-                instance["service_check_error"] = "Fail to collect metrics for {} - {}".format(instance['name'], e)
-            self.warning(instance["service_check_error"])
-        finally:
+            for device, _, _ in queries:
+                self._set_device_error(device, e)
+
+        for device, table_query, raw_query in queries:
+            tags = device.get("tags", []) + ['snmp_device:{}'.format(device["ip_address"])]
+            # The metrics collected are reported even if some batches failed,
+            # `get_query_results` only raises if the device could not be reached
+            try:
+                if table_query is not None:
+                    table_results = self.get_query_results(
+                        device,
+                        table_query,
+                        mib_view_controller,
+                        True,
+                        enforce_constraints=enforce_constraints,
+                        mibs_to_load=mibs_to_load,
+                    )
+                    self.report_table_metrics(metrics, table_results, tags)
+
+                if raw_query is not None:
+                    raw_results = self.get_query_results(device, raw_query, mib_view_controller, False)
+                    self.report_raw_metrics(metrics, raw_results, tags)
+            except Exception as e:
+                self._set_device_error(device, e)
+
             # Report service checks
-            if "service_check_error" in instance:
-                status = Status.DOWN
-                if "service_check_severity" in instance:
-                    status = instance["service_check_severity"]
-                return [(self.SC_STATUS, status, instance["service_check_error"])]
+            if "service_check_error" in device:
+                status = device.get("service_check_severity", Status.DOWN)
+                self.report_as_service_check(self.SC_STATUS, status, device, device["service_check_error"])
+            else:
+                self.report_as_service_check(self.SC_STATUS, Status.UP, device)
 
-            return [(self.SC_STATUS, Status.UP, None)]
+    def _set_device_error(self, device, e):
+        if "service_check_error" not in device:
+            device["service_check_error"] = "Fail to collect metrics for {} - {}".format(device['name'], e)
+        self.warning(device["service_check_error"])
 
     def report_as_service_check(self, sc_name, status, instance, msg=None):
         sc_tags = ['snmp_device:{}'.format(instance["ip_address"])]
@@ -80,19 +80,51 @@ def test_snmpget(aggregator, check):
 def test_snmp_getnext_call(check):
     instance = common.generate_instance_config(common.PLAY_WITH_GET_NEXT_METRICS)
 
-    # Test that we invoke next with the correct keyword arguments that are hard to test otherwise
-    with mock.patch("datadog_checks.snmp.snmp.hlapi.nextCmd") as nextCmd:
+    # Test that we walk with the correct keyword arguments that are hard to test otherwise
+    with mock.patch("datadog_checks.snmp.snmp.SnmpPoller.bulk_walk") as bulk_walk:
 
         check.check(instance)
-        _, kwargs = nextCmd.call_args
-        assert ("ignoreNonIncreasingOid", False) in kwargs.items()
-        assert ("lexicographicMode", False) in kwargs.items()
+        _, kwargs = bulk_walk.call_args
+        assert ("ignore_nonincreasing_oid", False) in kwargs.items()
+        assert ("max_repetitions", 10) in kwargs.items()
 
         check = SnmpCheck('snmp', common.IGNORE_NONINCREASING_OID, {}, {})
         check.check(instance)
-        _, kwargs = nextCmd.call_args
-        assert ("ignoreNonIncreasingOid", True) in kwargs.items()
-        assert ("lexicographicMode", False) in kwargs.items()
+        _, kwargs = bulk_walk.call_args
+        assert ("ignore_nonincreasing_oid", True) in kwargs.items()
+
+    # SNMP v1 devices are walked with GETNEXT requests
+    instance['snmp_version'] = 1
+    with mock.patch("datadog_checks.snmp.snmp.SnmpPoller.walk") as walk:
+        check.check(instance)
+        _, kwargs = walk.call_args
+        assert ("ignore_nonincreasing_oid", True) in kwargs.items()
+
+
+def test_getnext_walk(aggregator):
+    """
+    Tables walked with GETNEXT requests give the same metrics as with GETBULK requests
+    """
+    instance = common.generate_instance_config(common.TABULAR_OBJECTS)
+    symbols = common.TABULAR_OBJECTS[0]['symbols']
+
+    check = SnmpCheck('snmp', {'bulk_max_repetitions': 3}, {}, {})
+    check.check(instance)
+    bulk_metrics = {
+        symbol: sorted((m.value, sorted(m.tags)) for m in aggregator.metrics("snmp." + symbol)) for symbol in symbols
+    }
+    aggregator.reset()
+
+    check = SnmpCheck('snmp', {'bulk_max_repetitions': 0}, {}, {})
+    with mock.patch("datadog_checks.snmp.snmp.SnmpPoller.get_bulk") as get_bulk:
+        check.check(instance)
+        assert get_bulk.call_count == 0
+
+    for symbol in symbols:
+        assert bulk_metrics[symbol]
+        assert sorted((m.value, sorted(m.tags)) for m in aggregator.metrics("snmp." + symbol)) == bulk_metrics[symbol]
+
+    aggregator.assert_service_check("snmp.can_check", status=SnmpCheck.OK, tags=common.CHECK_TAGS, at_least=1)
 
 
 def test_custom_mib(aggregator):
@@ -412,3 +444,29 @@ def test_network_failure(aggregator, check):
     aggregator.assert_service_check("snmp.can_check", status=SnmpCheck.CRITICAL, tags=common.CHECK_TAGS, at_least=1)
 
     aggregator.all_metrics_asserted()
+
+
+def test_devices(aggregator, check):
+    """
+    All the devices of an instance are polled, and reported with their own tags and service check
+    """
+    instance = common.generate_instance_config(common.SCALAR_OBJECTS)
+    instance['tags'] = ['instance:snmp']
+    del instance['ip_address']
+    instance['devices'] = [
+        {'ip_address': common.HOST, 'tags': ['device:good']},
+        {'ip_address': common.HOST, 'port': 162, 'name': 'bad', 'tags': ['device:bad'], 'timeout': 1, 'retries': 0},
+    ]
+
+    check.check(instance)
+
+    good_tags = common.CHECK_TAGS + ['instance:snmp', 'device:good']
+    bad_tags = common.CHECK_TAGS + ['instance:snmp', 'device:bad']
+    for metric in common.SCALAR_OBJECTS:
+        metric_name = "snmp." + (metric.get('name') or metric.get('symbol'))
+        aggregator.assert_metric(metric_name, tags=good_tags, count=1)
+
+    aggregator.assert_service_check("snmp.can_check", status=SnmpCheck.OK, tags=good_tags, count=1)
+    aggregator.assert_service_check("snmp.can_check", status=SnmpCheck.CRITICAL, tags=bad_tags, count=1)
+
+    aggregator.all_metrics_asserted()
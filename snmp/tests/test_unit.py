@@ -5,6 +5,13 @@
 import mock
 import pytest
 
+from pyasn1.type.univ import Integer, Null
+from pysnmp import hlapi
+from pysnmp.proto.rfc1905 import endOfMibView
+
+from datadog_checks.snmp import SnmpCheck, resolver
+from datadog_checks.snmp.poller import SnmpPoller
+
 pytestmark = pytest.mark.unit
 
 
@@ -92,3 +99,191 @@ def test_parse_metrics(hlapi_mock, check):
     hlapi_mock.ObjectIdentity.assert_any_call("foo_mib", "bar")
     hlapi_mock.ObjectIdentity.assert_any_call("foo_mib", "baz")
     hlapi_mock.reset_mock()
+
+
+def test_get_devices(check):
+    instance = {'ip_address': '1.2.3.4', 'name': 'snmp', 'tags': ['foo:bar'], 'community_string': 'public'}
+    assert check.get_devices(instance) == [instance]
+
+    instance['devices'] = [{'ip_address': '5.6.7.8', 'tags': ['baz:qux']}, {'ip_address': '9.9.9.9', 'name': 'nine'}]
+    devices = check.get_devices(instance)
+    assert devices[0] is instance
+    assert devices[1] == {
+        'ip_address': '5.6.7.8',
+        'name': '5.6.7.8',
+        'tags': ['foo:bar', 'baz:qux'],
+        'community_string': 'public',
+    }
+    assert devices[2] == {'ip_address': '9.9.9.9', 'name': 'nine', 'tags': ['foo:bar'], 'community_string': 'public'}
+
+    # Only the devices are polled when the instance has no address
+    del instance['ip_address']
+    assert [device['ip_address'] for device in check.get_devices(instance)] == ['5.6.7.8', '9.9.9.9']
+
+
+@mock.patch("datadog_checks.snmp.poller.vb_processor")
+@mock.patch("datadog_checks.snmp.poller.lcd")
+@mock.patch("datadog_checks.snmp.poller.cmdgen")
+def test_poller_max_concurrent_requests(cmdgen_mock, lcd_mock, vb_processor_mock):
+    lcd_mock.configure.return_value = ('addr', 'params')
+    vb_processor_mock.unmakeVarBinds.side_effect = lambda engine, var_binds, lookup_mib: var_binds
+    generator = cmdgen_mock.GetCommandGenerator.return_value
+    target = (mock.Mock(), mock.Mock(), mock.Mock())
+    callback = mock.Mock()
+
+    poller = SnmpPoller(mock.Mock(), max_concurrent_requests=2)
+    for _ in range(5):
+        poller.get(target, [], callback)
+
+    # Only two requests are sent, the others wait for an answer
+    assert generator.sendVarBinds.call_count == 2
+    assert poller._in_flight == 2
+
+    _, _, _, _, _, on_response, cb_ctx = generator.sendVarBinds.call_args[0]
+    on_response(None, None, None, None, None, ['var_bind'], cb_ctx)
+    callback.assert_called_once_with(None, None, None, ['var_bind'])
+    assert generator.sendVarBinds.call_count == 3
+    assert poller._in_flight == 2
+
+    # Errors raised while sending are reported to the callback
+    generator.sendVarBinds.side_effect = Exception('send error')
+    on_response(None, None, None, None, None, [], cb_ctx)
+    assert generator.sendVarBinds.call_count == 5
+    assert poller._in_flight == 1
+    assert [args[0][0] is not None for args in callback.call_args_list] == [False, False, True, True]
+
+
+def test_poller_bulk_walk():
+    poller = SnmpPoller(hlapi.SnmpEngine())
+    in_octets = hlapi.ObjectIdentifier('1.3.6.1.2.1.2.2.1.10')
+    out_octets = hlapi.ObjectIdentifier('1.3.6.1.2.1.2.2.1.16')
+    callback = mock.Mock()
+
+    with mock.patch.object(poller, 'get_bulk') as get_bulk:
+        poller.bulk_walk(
+            (None, None, None), [(in_octets, Null('')), (out_octets, Null(''))], callback, max_repetitions=2
+        )
+        _, max_repetitions, var_binds, on_response = get_bulk.call_args[0][:4]
+        assert max_repetitions == 2
+        assert [name for name, _ in var_binds] == [in_octets, out_octets]
+
+        on_response(
+            None,
+            None,
+            None,
+            [
+                [(in_octets + (1,), 10), (out_octets + (1,), 20)],
+                # The first column is over, only the second one is walked further
+                [(out_octets, 11), (out_octets + (2,), 21)],
+            ],
+        )
+        _, _, var_binds, on_response = get_bulk.call_args[0][:4]
+        assert [name for name, _ in var_binds] == [out_octets + (2,)]
+        assert callback.call_count == 0
+
+        on_response(None, None, None, [[(out_octets + (3,), 22)], [(out_octets + (3,), endOfMibView)]])
+        assert get_bulk.call_count == 2
+
+    callback.assert_called_once_with(
+        None,
+        None,
+        None,
+        [[(in_octets + (1,), 10), (out_octets + (1,), 20)], [(out_octets + (2,), 21)], [(out_octets + (3,), 22)]],
+    )
+
+
+@pytest.mark.parametrize('ignore_nonincreasing_oid', [False, True])
+def test_poller_bulk_walk_nonincreasing(ignore_nonincreasing_oid):
+    poller = SnmpPoller(hlapi.SnmpEngine())
+    in_octets = hlapi.ObjectIdentifier('1.3.6.1.2.1.2.2.1.10')
+    callback = mock.Mock()
+
+    with mock.patch.object(poller, 'get_bulk') as get_bulk:
+        poller.bulk_walk(
+            (None, None, None),
+            [(in_octets, Null(''))],
+            callback,
+            max_repetitions=3,
+            ignore_nonincreasing_oid=ignore_nonincreasing_oid,
+        )
+        on_response = get_bulk.call_args[0][3]
+        # A device returning the rows of a table out of order
+        on_response(None, None, None, [[(in_octets + (3,), 30)], [(in_octets + (1,), 10)], [(in_octets + (2,), 20)]])
+
+        if ignore_nonincreasing_oid:
+            # The walk goes on from the last OID, until the device loops
+            _, _, var_binds, on_response = get_bulk.call_args[0][:4]
+            assert [name for name, _ in var_binds] == [in_octets + (2,)]
+            on_response(None, None, None, [[(in_octets + (4,), 40)], [(in_octets + (3,), 30)]])
+
+    if ignore_nonincreasing_oid:
+        assert get_bulk.call_count == 2
+        expected_rows = [
+            [(in_octets + (3,), 30)],
+            [(in_octets + (1,), 10)],
+            [(in_octets + (2,), 20)],
+            [(in_octets + (4,), 40)],
+        ]
+    else:
+        assert get_bulk.call_count == 1
+        expected_rows = [[(in_octets + (3,), 30)]]
+    callback.assert_called_once_with(None, None, None, expected_rows)
+
+
+def test_oid_resolver(check):
+    _, mib_view_controller = check.get_snmp_engine()
+    oid_resolver = check.get_oid_resolver(mib_view_controller)
+    assert check.get_oid_resolver(mib_view_controller) is oid_resolver
+
+    in_octets = (1, 3, 6, 1, 2, 1, 2, 2, 1, 10)
+    tcp_active_opens = (1, 3, 6, 1, 2, 1, 6, 5)
+    with mock.patch.object(resolver.hlapi, 'ObjectIdentity', wraps=hlapi.ObjectIdentity) as object_identity:
+        symbol, indexes = oid_resolver.resolve(in_octets + (1,), ['IF-MIB'])
+        assert symbol == 'ifInOctets'
+        assert indexes == (1,)
+        assert object_identity.call_count == 1
+
+        # The MIBs are not looked up again for the other cells of the column
+        symbol, indexes = oid_resolver.resolve(in_octets + (42,), ['IF-MIB'])
+        assert symbol == 'ifInOctets'
+        assert indexes == (42,)
+        assert object_identity.call_count == 1
+
+        # Scalars
+        assert oid_resolver.resolve(tcp_active_opens + (0,), ['TCP-MIB']) == ('tcpActiveOpens', ((0,),))
+        assert oid_resolver.resolve(tcp_active_opens + (0,), ['TCP-MIB']) == ('tcpActiveOpens', ((0,),))
+        assert object_identity.call_count == 2
+
+    # Same results as without the cache
+    _, symbol, indexes = (
+        hlapi.ObjectIdentity(in_octets + (42,)).loadMibs('IF-MIB').resolveWithMib(mib_view_controller).getMibSymbol()
+    )
+    assert (symbol, indexes) == oid_resolver.resolve(in_octets + (42,))
+
+
+def test_check_partial_batch_failure(aggregator):
+    check = SnmpCheck('snmp', {'oid_batch_size': 1}, {}, {})
+    instance = {
+        'name': 'device',
+        'ip_address': 'localhost',
+        'community_string': 'public',
+        'metrics': [{'OID': '1.3.6.1.2.1.1.3', 'name': 'a'}, {'OID': '1.3.6.1.2.1.1.4', 'name': 'b'}],
+    }
+    # One batch per OID: the first one succeeds, the second one fails
+    responses = [
+        (None, None, None, [(hlapi.ObjectIdentifier('1.3.6.1.2.1.1.3'), Integer(5))]),
+        (Exception('boom'), None, None, None),
+    ]
+
+    def get(poller, target, var_binds, callback, lookup_mib=True):
+        callback(*responses.pop(0))
+
+    with mock.patch.object(SnmpPoller, 'get', autospec=True, side_effect=get), mock.patch.object(SnmpPoller, 'run'):
+        check.check(instance)
+
+    # The metrics of the batches that succeeded are still submitted
+    tags = ['snmp_device:localhost']
+    aggregator.assert_metric('snmp.a', 5, tags=tags, count=1)
+    aggregator.assert_metric('snmp.b', count=0)
+    aggregator.assert_service_check('snmp.can_check', status=SnmpCheck.WARNING, tags=tags, count=1)
+    assert aggregator.service_checks('snmp.can_check')[0].message == 'Fail to collect some metrics: boom'
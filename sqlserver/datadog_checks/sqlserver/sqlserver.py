@@ -12,6 +12,7 @@ import traceback
 from collections import defaultdict
 from contextlib import contextmanager
 
+from datadog_checks.base.utils.db import QueryManager, iter_cursor
 from datadog_checks.checks import AgentCheck
 from datadog_checks.config import is_affirmative
 
@@ -126,6 +127,7 @@ class SQLServer(AgentCheck):
         self.existing_databases = None
         self.do_check = {}
         self.proc_type_mapping = {'gauge': self.gauge, 'rate': self.rate, 'histogram': self.histogram}
+        self.query_managers = {}
         self.adoprovider = self.default_adoprovider
 
         self.connector = init_config.get('connector', 'adodbapi')
@@ -517,6 +519,8 @@ class SQLServer(AgentCheck):
                     except Exception as e:
                         self.log.warning("Could not fetch metric {} : {}".format(metric.datadog_name, e))
 
+            self.do_custom_queries(instance, custom_tags)
+
     def do_stored_procedure_check(self, instance, proc):
         """
         Fetch the metrics from the stored proc
@@ -558,11 +562,37 @@ class SQLServer(AgentCheck):
             except Exception as e:
                 self.log.warning("Could not call procedure {}: {}".format(proc, e))
 
+            self.do_custom_queries(instance, custom_tags)
+
             self.close_cursor(cursor)
             self.close_db_connections(instance, self.DEFAULT_DB_KEY)
         else:
             self.log.info("Skipping call to {} due to only_if".format(proc))
 
+    def do_custom_queries(self, instance, tags):
+        """
+        Run the custom queries of the instance, its default db connection must be open
+        """
+        instance_key = self._conn_key(instance, self.DEFAULT_DB_KEY)
+        if instance_key not in self.query_managers:
+            stats_namespace = None
+            if is_affirmative(instance.get('collect_custom_query_stats', False)):
+                stats_namespace = 'sqlserver'
+            self.query_managers[instance_key] = QueryManager(
+                self, instance.get('custom_queries', []), stats_namespace=stats_namespace
+            )
+
+        def execute(query):
+            cursor = self.get_cursor(instance, self.DEFAULT_DB_KEY)
+            try:
+                cursor.execute(query)
+                for row in iter_cursor(cursor):
+                    yield row
+            finally:
+                self.close_cursor(cursor)
+
+        self.query_managers[instance_key].execute(execute, tags=tags)
+
     def proc_check_guard(self, instance, sql):
         """
         check to see if the guard SQL returns a single column containing 0 or 1
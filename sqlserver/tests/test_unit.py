@@ -1,6 +1,7 @@
 # (C) Datadog, Inc. 2018
 # All rights reserved
 # Licensed under a 3-clause BSD style license (see LICENSE)
+import mock
 import pytest
 
 from datadog_checks.sqlserver import SQLServer
@@ -20,3 +21,25 @@ def test_get_cursor(instance_sql2017):
     check = SQLServer(CHECK_NAME, {}, {}, [])
     with pytest.raises(SQLConnectionError):
         check.get_cursor(instance_sql2017, 'foo')
+
+
+def test_do_custom_queries(aggregator, instance_sql2017):
+    instance_sql2017['custom_queries'] = [
+        {
+            'metric_prefix': 'sqlserver.custom',
+            'query': 'SELECT name, size FROM sys.database_files',
+            'columns': [{'name': 'file', 'type': 'tag'}, {'name': 'size', 'type': 'gauge'}],
+            'tags': ['query:files'],
+        }
+    ]
+    check = SQLServer(CHECK_NAME, {}, {}, [])
+    cursor = mock.MagicMock()
+    cursor.fetchmany.side_effect = [[('master', 10), ('mastlog', 2)], []]
+    check.get_cursor = mock.MagicMock(return_value=cursor)
+
+    check.do_custom_queries(instance_sql2017, ['optional:tag1'])
+
+    cursor.execute.assert_called_once_with('SELECT name, size FROM sys.database_files')
+    cursor.close.assert_called_once_with()
+    aggregator.assert_metric('sqlserver.custom.size', 10, tags=['optional:tag1', 'query:files', 'file:master'])
+    aggregator.assert_metric('sqlserver.custom.size', 2, tags=['optional:tag1', 'query:files', 'file:mastlog'])
@@ -0,0 +1,102 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import threading
+
+# Weight of the latest check run in the estimated cost of one object
+COST_SMOOTHING = 0.5
+
+
+class BatchSizer:
+    """
+    Implements a thread safe sizing of the QueryPerf calls.
+    Worker threads record the duration and the size of each call, then at the beginning of the
+    next check run the batch size and the number of concurrent calls are adjusted so that one
+    call lasts about `target_latency` seconds:
+      * the cost of one object is estimated from the recorded calls, and the batch size set to
+        the number of objects that can be queried within the target latency, at most doubling
+        from one run to the other
+      * if a call failed or lasted more than the target latency, vCenter is slowing down: the
+        batch size is halved and one less concurrent call is made
+      * if all calls lasted less than half the target latency, one more concurrent call is made
+    """
+
+    def __init__(self, batch_size, concurrency, target_latency, min_batch_size, max_batch_size, max_concurrency):
+        self.min_batch_size = max(min_batch_size, 1)
+        self.max_batch_size = max(max_batch_size, self.min_batch_size)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.target_latency = target_latency
+
+        self.batch_size = min(max(batch_size, self.min_batch_size), self.max_batch_size)
+        self.concurrency = min(max(concurrency, 1), self.max_concurrency)
+        # Estimated number of seconds taken by vCenter to answer for one object
+        self.object_cost = None
+
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._failures = 0
+        self._objects = 0
+        self._values = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+        # Stats of the calls of the last adjusted run
+        self.last_objects = 0
+        self.last_values = 0
+        self.last_max_latency = 0.0
+
+    def record(self, objects, values, latency):
+        """
+        Record a QueryPerf call for `objects` objects that returned `values` values in `latency` seconds.
+        """
+        with self._lock:
+            self._calls += 1
+            self._objects += objects
+            self._values += values
+            self._total_latency += latency
+            self._max_latency = max(self._max_latency, latency)
+
+    def record_failure(self):
+        """
+        Record a QueryPerf call that failed, usually because it timed out.
+        """
+        with self._lock:
+            self._failures += 1
+
+    def adjust(self):
+        """
+        Compute the batch size and concurrency from the calls recorded since the last adjustment,
+        and reset the recorded calls. Nothing changes if no call was recorded.
+        """
+        with self._lock:
+            calls, failures = self._calls, self._failures
+            objects, values = self._objects, self._values
+            total_latency, max_latency = self._total_latency, self._max_latency
+            self._calls = self._failures = self._objects = self._values = 0
+            self._total_latency = self._max_latency = 0.0
+
+        if not calls and not failures:
+            return
+
+        self.last_objects = objects
+        self.last_values = values
+        self.last_max_latency = max_latency
+
+        if objects:
+            cost = total_latency / objects
+            if self.object_cost is None:
+                self.object_cost = cost
+            else:
+                self.object_cost = COST_SMOOTHING * cost + (1 - COST_SMOOTHING) * self.object_cost
+
+        if failures or max_latency > self.target_latency:
+            batch_size = self.batch_size // 2
+            self.concurrency = max(self.concurrency - 1, 1)
+        else:
+            batch_size = self.batch_size * 2
+            if self.object_cost:
+                batch_size = min(batch_size, int(self.target_latency / self.object_cost))
+            if max_latency < self.target_latency / 2:
+                self.concurrency = min(self.concurrency + 1, self.max_concurrency)
+
+        self.batch_size = min(max(batch_size, self.min_batch_size), self.max_batch_size)
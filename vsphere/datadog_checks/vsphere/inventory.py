@@ -0,0 +1,138 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+from pyVmomi import vim  # pylint: disable=E0611
+from pyVmomi import vmodl  # pylint: disable=E0611
+
+# Objects whose name or position in the inventory appear in the tags of other objects
+CONTAINER_TYPES = (vim.Folder, vim.Datacenter, vim.ComputeResource, vim.HostSystem)
+# Properties of a container that the tags of other objects depend on
+CONTAINER_PROPERTIES = {"name", "parent"}
+
+
+class Inventory:
+    """
+    Keeps a copy of the vCenter inventory up to date by applying the changes reported by a dedicated
+    property collector, instead of retrieving the whole inventory again.
+
+    The first update after `connect` reports every object of the inventory. The following ones only report
+    the objects that entered the inventory, left it or had some properties modified since the previous one.
+
+    It also keeps, for the instance, the Mor cache entries computed from the inventory and the tags
+    inherited through each parent, which are only computed again when a container changes.
+    Not thread safe, the inventory is synchronized from the main thread only.
+    """
+
+    def __init__(self):
+        self.server_instance = None
+        self.collector = None
+        self.version = None
+        # Properties of the objects of the inventory: mor -> {property name: value}
+        self.objects = {}
+        # Mor cache entries of the objects metrics are collected for: mor -> mor dict
+        self.mors = {}
+        # Tags inherited through each parent: mor -> tags
+        self.parent_tags = {}
+
+    def connected_to(self, server_instance):
+        return self.collector is not None and self.server_instance is server_instance
+
+    def connect(self, server_instance, filter_spec):
+        """
+        Create the property collector watching the objects selected by `filter_spec`.
+        The known Mor cache entries are kept, so that they can be compared to the objects
+        reported by the first update.
+        """
+        self.disconnect()
+
+        content = server_instance.content
+        self.collector = content.propertyCollector.CreatePropertyCollector()
+        self.collector.CreateFilter(filter_spec, partialUpdates=False)
+        self.server_instance = server_instance
+        self.version = ''
+
+        # Add rootFolder since it is not explored by the propertyCollector
+        root_folder = content.rootFolder
+        self.objects = {root_folder: {"name": root_folder.name, "parent": None}}
+        self.parent_tags = {}
+
+    def disconnect(self):
+        """
+        Destroy the property collector. The next update will report the whole inventory again.
+        """
+        collector = self.collector
+        self.collector = None
+        self.server_instance = None
+        self.version = None
+        if collector is not None:
+            try:
+                collector.DestroyPropertyCollector()
+            except Exception:
+                # The session is probably gone along with the collector
+                pass
+
+    def update(self, max_objects=None):
+        """
+        Apply the changes that happened since the last update.
+
+        Return a tuple (number of object updates, objects that changed, whether all the objects must be reviewed),
+        all the objects must be reviewed after the first update or when a container changed.
+        """
+        full = self.version == ''
+
+        options = vmodl.query.PropertyCollector.WaitOptions()
+        # Only get the pending updates, never wait for new ones
+        options.maxWaitSeconds = 0
+        # To limit the number of objects retrieved per call.
+        options.maxObjectUpdates = max_objects
+
+        n_updates = 0
+        changed = set()
+        while True:
+            update_set = self.collector.WaitForUpdatesEx(self.version, options)
+            if update_set is None:
+                break
+
+            self.version = update_set.version
+            for filter_update in update_set.filterSet or []:
+                for object_update in filter_update.objectSet or []:
+                    n_updates += 1
+                    changed.add(object_update.obj)
+                    if self._apply(object_update):
+                        full = True
+
+            # Results can be split across several updates
+            if not update_set.truncated:
+                break
+
+        if full:
+            self.parent_tags = {}
+
+        return n_updates, changed, full
+
+    def _apply(self, object_update):
+        """
+        Apply the update of one object, return whether it changed a container.
+        """
+        obj = object_update.obj
+        kind = str(object_update.kind)
+        if kind == 'leave':
+            self.objects.pop(obj, None)
+            return isinstance(obj, CONTAINER_TYPES)
+
+        if kind == 'enter':
+            properties = self.objects[obj] = {}
+        else:
+            properties = self.objects.setdefault(obj, {})
+
+        container_changed = False
+        for change in object_update.changeSet or []:
+            if str(change.op) in ('remove', 'indirectRemove'):
+                properties.pop(change.name, None)
+            else:
+                properties[change.name] = change.val
+
+            if kind != 'enter' and change.name in CONTAINER_PROPERTIES:
+                container_changed = True
+
+        return container_changed and isinstance(obj, CONTAINER_TYPES)
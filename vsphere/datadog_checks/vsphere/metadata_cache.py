@@ -12,11 +12,13 @@ class MetadataCache:
     """
     Implements a thread safe storage for metrics metadata.
     For each instance key the cache maps: counter ID --> metric name, unit
+    It also keeps the table used to decode the QueryPerf results: counter ID --> submitted metric name, transform
     """
 
     def __init__(self):
         self._metadata = {}
         self._metric_ids = {}
+        self._counters = {}
         self._lock = threading.RLock()
 
     def init_instance(self, key):
@@ -28,6 +30,7 @@ class MetadataCache:
             if key not in self._metadata:
                 self._metadata[key] = {}
                 self._metric_ids[key] = []
+                self._counters[key] = {}
 
     def contains(self, key, counter_id):
         """
@@ -51,6 +54,23 @@ class MetadataCache:
         with self._lock:
             self._metric_ids[key] = metric_ids
 
+    def set_counters(self, key, counters):
+        """
+        Store the table decoding the values of the collected counters for the given instance key.
+        """
+        with self._lock:
+            self._counters[key] = counters
+
+    def get_counters(self, key):
+        """
+        Return the table mapping a counter ID to the metric name to submit its values with and whether
+        they are percentages to transform, or None if its values are not submitted.
+        The table is replaced as a whole on updates, so it can be read without holding the lock.
+        If the key is not in the cache, raises a KeyError.
+        """
+        with self._lock:
+            return self._counters[key]
+
     def get_metric_ids(self, key):
         """
         Return the list of metric IDs to collect for the given instance key
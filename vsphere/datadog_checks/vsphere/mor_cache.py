@@ -67,6 +67,14 @@ class MorCache:
             except KeyError:
                 raise MorNotFoundError("Mor object '{}' is not in the cache.".format(name))
 
+    def remove_mor(self, key, name):
+        """
+        Remove the Mor object identified by `name` for the given instance key, if present.
+        If the key is not in the cache, raises a KeyError.
+        """
+        with self._mor_lock:
+            self._mor[key].pop(name, None)
+
     def set_metrics(self, key, name, metrics):
         """
         Store a list of metric identifiers for the given instance key and Mor
@@ -25,11 +25,13 @@ from datadog_checks.checks.libs.vmware.all_metrics import ALL_METRICS
 from datadog_checks.checks.libs.vmware.basic_metrics import BASIC_METRICS
 from datadog_checks.config import is_affirmative
 
+from .batch_sizer import BatchSizer
 from .cache_config import CacheConfig
 from .common import SOURCE_TYPE
 from .errors import BadConfigError, ConnectionError
 from .event import VSphereEvent
-from .metadata_cache import MetadataCache, MetadataNotFoundError
+from .inventory import Inventory
+from .metadata_cache import MetadataCache
 from .mor_cache import MorCache, MorNotFoundError
 from .objects_queue import ObjectsQueue
 
@@ -48,6 +50,11 @@ BATCH_MORLIST_SIZE = 50
 # Maximum number of objects to collect at once by the propertyCollector. The size of the response returned by the query
 # is significantly lower than the size of the queryPerf response, so allow specifying a different value.
 BATCH_COLLECTOR_SIZE = 500
+# Number of seconds a QueryPerf call should last when the batch size is adaptive
+ADAPTIVE_BATCH_TARGET_LATENCY = 10
+# Bounds of the adaptive batch size
+ADAPTIVE_BATCH_MIN_SIZE = 10
+ADAPTIVE_BATCH_MAX_SIZE = 1000
 
 REALTIME_RESOURCES = {'vm', 'host'}
 
@@ -98,6 +105,7 @@ class VSphereCheck(AgentCheck):
 
         self.batch_morlist_size = max(init_config.get("batch_morlist_size", BATCH_MORLIST_SIZE), 0)
         self.batch_collector_size = max(init_config.get("batch_property_collector_size", BATCH_COLLECTOR_SIZE), 0)
+        self.adaptive_batching = is_affirmative(init_config.get('adaptive_batching', False))
 
         self.refresh_morlist_interval = init_config.get('refresh_morlist_interval', REFRESH_MORLIST_INTERVAL)
         self.clean_morlist_interval = max(
@@ -117,6 +125,9 @@ class VSphereCheck(AgentCheck):
         # Caching configuration
         self.cache_config = CacheConfig()
 
+        # Adaptive sizing of the QueryPerf batches, for each instance
+        self.batch_sizers = {}
+
         # build up configurations
         for instance in instances:
             i_key = self._instance_key(instance)
@@ -125,6 +136,9 @@ class VSphereCheck(AgentCheck):
             self.cache_config.set_interval(CacheConfig.Metadata, i_key, self.refresh_metrics_metadata_interval)
             # events
             self.event_config[i_key] = instance.get('event_config')
+            # QueryPerf batches
+            if self.adaptive_batching:
+                self.batch_sizers[i_key] = self._new_batch_sizer()
 
         # Queue of raw Mor objects to process
         self.mor_objects_queue = ObjectsQueue()
@@ -135,6 +149,9 @@ class VSphereCheck(AgentCheck):
         # managed entity raw view
         self.registry = {}
 
+        # Inventories kept up to date incrementally, for each instance
+        self.inventories = {}
+
         # Metrics metadata, for each instance keeps the mapping: perfCounterKey -> {name, group, description}
         self.metadata_cache = MetadataCache()
         self.latest_event_query = {}
@@ -148,11 +165,21 @@ class VSphereCheck(AgentCheck):
             self.log.error(msg)
             self.exception_printed += 1
 
-    def start_pool(self):
+    def start_pool(self, size=None):
         self.log.info("Starting Thread Pool")
-        self.pool_size = int(self.init_config.get('threads_count', DEFAULT_SIZE_POOL))
+        self.pool_size = size or int(self.init_config.get('threads_count', DEFAULT_SIZE_POOL))
         self.pool = Pool(self.pool_size)
 
+    def _new_batch_sizer(self):
+        return BatchSizer(
+            batch_size=self.batch_morlist_size or BATCH_MORLIST_SIZE,
+            concurrency=int(self.init_config.get('threads_count', DEFAULT_SIZE_POOL)),
+            target_latency=float(self.init_config.get('adaptive_batch_target_latency', ADAPTIVE_BATCH_TARGET_LATENCY)),
+            min_batch_size=int(self.init_config.get('adaptive_batch_min_size', ADAPTIVE_BATCH_MIN_SIZE)),
+            max_batch_size=int(self.init_config.get('adaptive_batch_max_size', ADAPTIVE_BATCH_MAX_SIZE)),
+            max_concurrency=int(self.init_config.get('threads_count', DEFAULT_SIZE_POOL)),
+        )
+
     def terminate_pool(self):
         self.log.info("Terminating Thread Pool")
         self.pool.terminate()
@@ -339,11 +366,18 @@ class VSphereCheck(AgentCheck):
 
         return external_host_tags
 
-    def _get_parent_tags(self, mor, all_objects):
+    def _get_parent_tags(self, mor, all_objects, parent_tags_cache=None):
+        """
+        Return the tags inherited by `mor` from its parents. When `parent_tags_cache` is given,
+        the tags inherited through each parent are stored there and reused for its other children.
+        """
         tags = []
         properties = all_objects.get(mor, {})
         parent = properties.get("parent")
         if parent:
+            if parent_tags_cache is not None and parent in parent_tags_cache:
+                return list(parent_tags_cache[parent])
+
             parent_name = ensure_unicode(all_objects.get(parent, {}).get("name", "unknown"))
             tag = []
             if isinstance(parent, vim.HostSystem):
@@ -357,22 +391,23 @@ class VSphereCheck(AgentCheck):
             elif isinstance(parent, vim.Datacenter):
                 tag.append('vsphere_datacenter:{}'.format(parent_name))
 
-            tags = self._get_parent_tags(parent, all_objects)
+            tags = self._get_parent_tags(parent, all_objects, parent_tags_cache)
             if tag:
                 tags.extend(tag)
 
+            if parent_tags_cache is not None:
+                parent_tags_cache[parent] = list(tags)
+
         return tags
 
-    def _collect_mors_and_attributes(self, server_instance):
+    def _get_filter_spec(self, content):
+        """
+        Return the property collector filter selecting the objects of the inventory and the attributes we require.
+        """
         resources = RESOURCE_TYPE_METRICS + RESOURCE_TYPE_NO_METRIC
 
-        content = server_instance.content
         view_ref = content.viewManager.CreateContainerView(content.rootFolder, resources, True)
 
-        # Object used to query MORs as well as the attributes we require in one API call
-        # See https://code.vmware.com/apis/358/vsphere#/doc/vmodl.query.PropertyCollector.html
-        collector = content.propertyCollector
-
         # Specify the root object from where we collect the rest of the objects
         obj_spec = vmodl.query.PropertyCollector.ObjectSpec()
         obj_spec.obj = view_ref
@@ -402,6 +437,15 @@ class VSphereCheck(AgentCheck):
         filter_spec.objectSet = [obj_spec]
         filter_spec.propSet = property_specs
 
+        return filter_spec
+
+    def _collect_mors_and_attributes(self, server_instance):
+        content = server_instance.content
+        # Object used to query MORs as well as the attributes we require in one API call
+        # See https://code.vmware.com/apis/358/vsphere#/doc/vmodl.query.PropertyCollector.html
+        collector = content.propertyCollector
+        filter_spec = self._get_filter_spec(content)
+
         retr_opts = vmodl.query.PropertyCollector.RetrieveOptions()
         # To limit the number of objects retrieved per call.
         # If batch_collector_size is 0, collect maximum number of objects.
@@ -470,70 +514,82 @@ class VSphereCheck(AgentCheck):
         rootFolder = server_instance.content.rootFolder
         all_objects[rootFolder] = {"name": rootFolder.name, "parent": None}
 
+        # Tags inherited through each folder, datacenter, cluster... computed once for all their children
+        parent_tags_cache = {}
         for obj, properties in all_objects.items():
-            instance_tags = []
-            if not self._is_excluded(obj, properties, regexes, include_only_marked) and any(
-                isinstance(obj, vimtype) for vimtype in RESOURCE_TYPE_METRICS
-            ):
-                if use_guest_hostname:
-                    hostname = properties.get("guest.hostName", properties.get("name", "unknown"))
-                else:
-                    hostname = properties.get("name", "unknown")
-                if properties.get("parent"):
-                    instance_tags += self._get_parent_tags(obj, all_objects)
-
-                if isinstance(obj, vim.VirtualMachine):
-                    vsphere_type = 'vsphere_type:vm'
-                    vimtype = vim.VirtualMachine
-                    mor_type = "vm"
-                    power_state = properties.get("runtime.powerState")
-                    if power_state != vim.VirtualMachinePowerState.poweredOn:
-                        self.log.debug("Skipping VM in state {}".format(ensure_unicode(power_state)))
-                        continue
-                    host_mor = properties.get("runtime.host")
-                    host = "unknown"
-                    if host_mor:
-                        host = ensure_unicode(all_objects.get(host_mor, {}).get("name", "unknown"))
-                    instance_tags.append('vsphere_host:{}'.format(ensure_unicode(host)))
-                elif isinstance(obj, vim.HostSystem):
-                    vsphere_type = 'vsphere_type:host'
-                    vimtype = vim.HostSystem
-                    mor_type = "host"
-                elif isinstance(obj, vim.Datastore):
-                    vsphere_type = 'vsphere_type:datastore'
-                    instance_tags.append(
-                        'vsphere_datastore:{}'.format(ensure_unicode(properties.get("name", "unknown")))
-                    )
-                    hostname = None
-                    vimtype = vim.Datastore
-                    mor_type = "datastore"
-                elif isinstance(obj, vim.Datacenter):
-                    vsphere_type = 'vsphere_type:datacenter'
-                    instance_tags.append(
-                        "vsphere_datacenter:{}".format(ensure_unicode(properties.get("name", "unknown")))
-                    )
-                    hostname = None
-                    vimtype = vim.Datacenter
-                    mor_type = "datacenter"
-                elif isinstance(obj, vim.ClusterComputeResource):
-                    vsphere_type = 'vsphere_type:cluster'
-                    instance_tags.append("vsphere_cluster:{}".format(ensure_unicode(properties.get("name", "unknown"))))
-                    hostname = None
-                    vimtype = vim.ClusterComputeResource
-                    mor_type = "cluster"
-                else:
-                    vsphere_type = None
-
-                if vsphere_type:
-                    instance_tags.append(vsphere_type)
-
-                obj_list[vimtype].append(
-                    {"mor_type": mor_type, "mor": obj, "hostname": hostname, "tags": tags + instance_tags}
-                )
+            entry = self._get_mor_entry(
+                obj, properties, all_objects, regexes, include_only_marked, tags, use_guest_hostname, parent_tags_cache
+            )
+            if entry is not None:
+                vimtype, mor = entry
+                obj_list[vimtype].append(mor)
 
         self.log.debug("All objects with attributes cached in {} seconds.".format(time.time() - start))
         return obj_list
 
+    def _get_mor_entry(
+        self, obj, properties, all_objects, regexes, include_only_marked, tags, use_guest_hostname, parent_tags_cache
+    ):
+        """
+        Return the resource type and the dictionary describing `obj` in the Mor cache,
+        or None if no metric is collected for `obj`.
+        """
+        if self._is_excluded(obj, properties, regexes, include_only_marked) or not any(
+            isinstance(obj, vimtype) for vimtype in RESOURCE_TYPE_METRICS
+        ):
+            return None
+
+        instance_tags = []
+        if use_guest_hostname:
+            hostname = properties.get("guest.hostName", properties.get("name", "unknown"))
+        else:
+            hostname = properties.get("name", "unknown")
+        if properties.get("parent"):
+            instance_tags += self._get_parent_tags(obj, all_objects, parent_tags_cache)
+
+        if isinstance(obj, vim.VirtualMachine):
+            vsphere_type = 'vsphere_type:vm'
+            vimtype = vim.VirtualMachine
+            mor_type = "vm"
+            power_state = properties.get("runtime.powerState")
+            if power_state != vim.VirtualMachinePowerState.poweredOn:
+                self.log.debug("Skipping VM in state {}".format(ensure_unicode(power_state)))
+                return None
+            host_mor = properties.get("runtime.host")
+            host = "unknown"
+            if host_mor:
+                host = ensure_unicode(all_objects.get(host_mor, {}).get("name", "unknown"))
+            instance_tags.append('vsphere_host:{}'.format(ensure_unicode(host)))
+        elif isinstance(obj, vim.HostSystem):
+            vsphere_type = 'vsphere_type:host'
+            vimtype = vim.HostSystem
+            mor_type = "host"
+        elif isinstance(obj, vim.Datastore):
+            vsphere_type = 'vsphere_type:datastore'
+            instance_tags.append('vsphere_datastore:{}'.format(ensure_unicode(properties.get("name", "unknown"))))
+            hostname = None
+            vimtype = vim.Datastore
+            mor_type = "datastore"
+        elif isinstance(obj, vim.Datacenter):
+            vsphere_type = 'vsphere_type:datacenter'
+            instance_tags.append("vsphere_datacenter:{}".format(ensure_unicode(properties.get("name", "unknown"))))
+            hostname = None
+            vimtype = vim.Datacenter
+            mor_type = "datacenter"
+        elif isinstance(obj, vim.ClusterComputeResource):
+            vsphere_type = 'vsphere_type:cluster'
+            instance_tags.append("vsphere_cluster:{}".format(ensure_unicode(properties.get("name", "unknown"))))
+            hostname = None
+            vimtype = vim.ClusterComputeResource
+            mor_type = "cluster"
+        else:
+            vsphere_type = None
+
+        if vsphere_type:
+            instance_tags.append(vsphere_type)
+
+        return vimtype, {"mor_type": mor_type, "mor": obj, "hostname": hostname, "tags": tags + instance_tags}
+
     @staticmethod
     def _is_excluded(obj, properties, regexes, include_only_marked):
         """
@@ -607,6 +663,92 @@ class VSphereCheck(AgentCheck):
         self.mor_objects_queue.fill(i_key, dict(all_objs))
         self.cache_config.set_last(CacheConfig.Morlist, i_key, time.time())
 
+    def _sync_inventory(self, instance):
+        """
+        Apply the changes of the vCenter inventory since the last check run to the Mor cache:
+        the new and modified objects are put in the Mor objects queue, while the removed ones
+        are deleted from the cache right away.
+        """
+        # ## <TEST-INSTRUMENTATION>
+        t = Timer()
+        # ## </TEST-INSTRUMENTATION>
+        i_key = self._instance_key(instance)
+        custom_tags = instance.get('tags', [])
+        self.mor_cache.init_instance(i_key)
+
+        server_instance = self._get_server_instance(instance)
+        inventory = self.inventories.get(i_key)
+        if inventory is None:
+            inventory = self.inventories[i_key] = Inventory()
+        if not inventory.connected_to(server_instance):
+            self.log.debug("Synchronizing the whole inventory for vcenter instance {}".format(i_key))
+            inventory.connect(server_instance, self._get_filter_spec(server_instance.content))
+
+        try:
+            n_updates, changed, full = inventory.update(self.batch_collector_size or None)
+        except Exception as e:
+            # The collector is gone with the session, or its version is not valid anymore
+            self.log.warning("Unable to get the inventory changes, it will be synchronized again: %s", e)
+            inventory.disconnect()
+            return
+
+        tags = ["vcenter_server:{}".format(ensure_unicode(instance.get('name')))]
+        regexes = {
+            'host_include': instance.get('host_include_only_regex'),
+            'vm_include': instance.get('vm_include_only_regex'),
+        }
+        include_only_marked = is_affirmative(instance.get('include_only_marked', False))
+        use_guest_hostname = is_affirmative(instance.get("use_guest_hostname", False))
+
+        if full:
+            # Review the removed objects too
+            changed = set(inventory.objects).union(inventory.mors)
+
+        obj_list = defaultdict(list)
+        n_removed = 0
+        for obj in changed:
+            properties = inventory.objects.get(obj)
+            entry = None
+            if properties is not None:
+                entry = self._get_mor_entry(
+                    obj,
+                    properties,
+                    inventory.objects,
+                    regexes,
+                    include_only_marked,
+                    tags,
+                    use_guest_hostname,
+                    inventory.parent_tags,
+                )
+
+            if entry is None:
+                if inventory.mors.pop(obj, None) is not None:
+                    self.mor_cache.remove_mor(i_key, str(obj))
+                    n_removed += 1
+                continue
+
+            vimtype, mor = entry
+            if inventory.mors.get(obj) != mor:
+                inventory.mors[obj] = mor
+                # The queued dictionary is completed by the queue processing
+                obj_list[vimtype].append(dict(mor))
+
+        self.mor_objects_queue.fill(i_key, dict(obj_list))
+        self.cache_config.set_last(CacheConfig.Morlist, i_key, time.time())
+
+        n_queued = sum(len(mors) for mors in obj_list.values())
+        self.log.debug(
+            "Inventory synchronized from {} object updates: {} objects to update, {} removed".format(
+                n_updates, n_queued, n_removed
+            )
+        )
+        # ## <TEST-INSTRUMENTATION>
+        self.histogram('datadog.agent.vsphere.inventory_sync.time', t.total(), tags=custom_tags)
+        self.gauge('datadog.agent.vsphere.inventory_sync.object_updates', n_updates, tags=custom_tags)
+        self.gauge('datadog.agent.vsphere.inventory_sync.mors_updated', n_queued, tags=custom_tags)
+        self.gauge('datadog.agent.vsphere.inventory_sync.mors_removed', n_removed, tags=custom_tags)
+        # ## </TEST-INSTRUMENTATION>
+
     @trace_method
     def _process_mor_objects_queue_async(self, instance, mors):
         """
@@ -694,19 +836,28 @@ class VSphereCheck(AgentCheck):
         custom_tags = instance.get('tags', [])
 
         new_metadata = {}
+        # Table used to decode the QueryPerf results: counter ID -> (metric name, whether the value is a percentage)
+        counters = {}
         metric_ids = []
         # Use old behaviour with metrics to collect defined by our constants
         if self.in_compatibility_mode(instance, log_warning=True):
             for counter in perfManager.perfCounter:
                 metric_name = self.format_metric_name(counter, compatibility=True)
                 new_metadata[counter.key] = {'name': metric_name, 'unit': counter.unitInfo.key}
+                if metric_name in ALL_METRICS:
+                    counters[counter.key] = self._counter_entry(metric_name, counter)
+                else:
+                    # Unknown metrics are not submitted
+                    counters[counter.key] = None
                 # Build the list of metrics we will want to collect
                 if instance.get("all_metrics") or metric_name in BASIC_METRICS:
                     metric_ids.append(vim.PerformanceManager.MetricId(counterId=counter.key, instance="*"))
         else:
             collection_level = instance.get("collection_level", 1)
             for counter in perfManager.QueryPerfCounterByLevel(collection_level):
-                new_metadata[counter.key] = {"name": self.format_metric_name(counter), "unit": counter.unitInfo.key}
+                metric_name = self.format_metric_name(counter)
+                new_metadata[counter.key] = {"name": metric_name, "unit": counter.unitInfo.key}
+                counters[counter.key] = self._counter_entry(metric_name, counter)
                 # Build the list of metrics we will want to collect
                 metric_ids.append(vim.PerformanceManager.MetricId(counterId=counter.key, instance="*"))
 
@@ -714,6 +865,7 @@ class VSphereCheck(AgentCheck):
         # Reset metadata
         self.metadata_cache.set_metadata(i_key, new_metadata)
         self.metadata_cache.set_metric_ids(i_key, metric_ids)
+        self.metadata_cache.set_counters(i_key, counters)
 
         self.cache_config.set_last(CacheConfig.Metadata, i_key, time.time())
 
@@ -721,6 +873,10 @@ class VSphereCheck(AgentCheck):
         self.histogram('datadog.agent.vsphere.metric_metadata_collection.time', t.total(), tags=custom_tags)
         # ## </TEST-INSTRUMENTATION>
 
+    @staticmethod
+    def _counter_entry(metric_name, counter):
+        return "vsphere.{}".format(ensure_unicode(metric_name)), counter.unitInfo.key == "percent"
+
     def format_metric_name(self, counter, compatibility=False):
         if compatibility:
             return "{}.{}".format(ensure_unicode(counter.groupInfo.key), ensure_unicode(counter.nameInfo.key))
@@ -750,21 +906,6 @@ class VSphereCheck(AgentCheck):
 
         return False
 
-    def _transform_value(self, instance, counter_id, value):
-        """ Given the counter_id, look up for the metrics metadata to check the vsphere
-        type of the counter and apply pre-reporting transformation if needed.
-        """
-        i_key = self._instance_key(instance)
-        try:
-            metadata = self.metadata_cache.get_metadata(i_key, counter_id)
-            if metadata["unit"] == "percent":
-                return float(value) / 100
-        except MetadataNotFoundError:
-            pass
-
-        # Defaults to return the value without transformation
-        return value
-
     @trace_method
     def _collect_metrics_async(self, instance, query_specs):
         """ Task that collects the metrics listed in the morlist for one MOR
@@ -776,8 +917,22 @@ class VSphereCheck(AgentCheck):
         server_instance = self._get_server_instance(instance)
         perfManager = server_instance.content.perfManager
         custom_tags = instance.get('tags', [])
-        results = perfManager.QueryPerf(query_specs)
+        batch_sizer = self.batch_sizers.get(i_key)
+
+        query_start = time.time()
+        try:
+            results = perfManager.QueryPerf(query_specs)
+        except Exception:
+            if batch_sizer is not None:
+                batch_sizer.record_failure()
+            raise
+        query_latency = time.time() - query_start
+
+        n_values = 0
         if results:
+            counters = self.metadata_cache.get_counters(i_key)
+            # The instance tags of the values, by vSphere instance name
+            instance_tags = {}
             for mor_perfs in results:
                 mor_name = str(mor_perfs.entity)
                 try:
@@ -790,9 +945,16 @@ class VSphereCheck(AgentCheck):
                     )
                     continue
 
+                hostname = mor['hostname']
+                # No host tags available without hostname
+                mor_tags = custom_tags if hostname else mor['tags'] + custom_tags
+                n_values += len(mor_perfs.value)
+
                 for result in mor_perfs.value:
                     counter_id = result.id.counterId
-                    if not self.metadata_cache.contains(i_key, counter_id):
+                    try:
+                        counter = counters[counter_id]
+                    except KeyError:
                         self.log.debug(
                             "Skipping value for counter {}, because there is no metadata about it".format(
                                 ensure_unicode(counter_id)
@@ -800,35 +962,32 @@ class VSphereCheck(AgentCheck):
                         )
                         continue
 
-                    # Metric types are absolute, delta, and rate
-                    metric_name = self.metadata_cache.get_metadata(i_key, result.id.counterId).get('name')
-
-                    if self.in_compatibility_mode(instance):
-                        if metric_name not in ALL_METRICS:
-                            self.log.debug("Skipping unknown `{}` metric.".format(ensure_unicode(metric_name)))
-                            continue
+                    # Unknown metric in compatibility mode
+                    if counter is None:
+                        continue
 
+                    metric_name, is_percent = counter
                     if not result.value:
-                        self.log.debug(
-                            "Skipping `{}` metric because the value is empty".format(ensure_unicode(metric_name))
-                        )
+                        self.log.debug("Skipping `{}` metric because the value is empty".format(metric_name))
                         continue
 
-                    instance_name = result.id.instance or "none"
-                    value = self._transform_value(instance, result.id.counterId, result.value[0])
+                    value = result.value[0]
+                    if is_percent:
+                        value = float(value) / 100
 
-                    tags = ['instance:{}'.format(ensure_unicode(instance_name))]
-                    if not mor['hostname']:  # no host tags available
-                        tags.extend(mor['tags'])
+                    instance_name = result.id.instance
+                    instance_tag = instance_tags.get(instance_name)
+                    if instance_tag is None:
+                        instance_tag = instance_tags[instance_name] = 'instance:{}'.format(
+                            ensure_unicode(instance_name or "none")
+                        )
 
-                    # vsphere "rates" should be submitted as gauges (rate is
-                    # precomputed).
-                    self.gauge(
-                        "vsphere.{}".format(ensure_unicode(metric_name)),
-                        value,
-                        hostname=mor['hostname'],
-                        tags=tags + custom_tags,
-                    )
+                    # Metric types are absolute, delta, and rate
+                    # vsphere "rates" should be submitted as gauges (rate is precomputed).
+                    self.gauge(metric_name, value, hostname=hostname, tags=[instance_tag] + mor_tags)
+
+        if batch_sizer is not None:
+            batch_sizer.record(len(query_specs), n_values, query_latency)
 
         # ## <TEST-INSTRUMENTATION>
         self.histogram('datadog.agent.vsphere.metric_colection.time', t.total(), tags=custom_tags)
@@ -858,7 +1017,17 @@ class VSphereCheck(AgentCheck):
 
         # Request metrics for several objects at once. We can limit the number of objects with batch_size
         # If batch_size is 0, process everything at once
-        batch_size = self.batch_morlist_size or n_mors
+        batch_sizer = self.batch_sizers.get(i_key)
+        if batch_sizer is not None:
+            batch_size = batch_sizer.batch_size
+            # ## <TEST-INSTRUMENTATION>
+            self.gauge('datadog.agent.vsphere.query_perf.batch_size', batch_size, tags=custom_tags)
+            self.gauge('datadog.agent.vsphere.query_perf.concurrency', batch_sizer.concurrency, tags=custom_tags)
+            self.gauge('datadog.agent.vsphere.query_perf.values', batch_sizer.last_values, tags=custom_tags)
+            self.gauge('datadog.agent.vsphere.query_perf.max_latency', batch_sizer.last_max_latency, tags=custom_tags)
+            # ## </TEST-INSTRUMENTATION>
+        else:
+            batch_size = self.batch_morlist_size or n_mors
         for batch in self.mor_cache.mors_batch(i_key, batch_size):
             query_specs = []
             for _, mor in iteritems(batch):
@@ -884,20 +1053,31 @@ class VSphereCheck(AgentCheck):
 
     def check(self, instance):
         try:
-            self.start_pool()
+            # Size the QueryPerf calls of this run from the ones of the previous run
+            batch_sizer = self.batch_sizers.get(self._instance_key(instance))
+            if batch_sizer is not None:
+                batch_sizer.adjust()
+                self.start_pool(batch_sizer.concurrency)
+            else:
+                self.start_pool()
             self.exception_printed = 0
 
             # First part: make sure our object repository is neat & clean
             if self._should_cache(instance, CacheConfig.Metadata):
                 self._cache_metrics_metadata(instance)
 
-            if self._should_cache(instance, CacheConfig.Morlist):
+            incremental_inventory = is_affirmative(instance.get('incremental_inventory', False))
+            if incremental_inventory:
+                self._sync_inventory(instance)
+            elif self._should_cache(instance, CacheConfig.Morlist):
                 self._cache_morlist_raw(instance)
 
             self._process_mor_objects_queue(instance)
 
             # Remove old objects that might be gone from the Mor cache
-            self.mor_cache.purge(self._instance_key(instance), self.clean_morlist_interval)
+            # The incremental inventory removes them as soon as they are gone
+            if not incremental_inventory:
+                self.mor_cache.purge(self._instance_key(instance), self.clean_morlist_interval)
 
             # Second part: do the job
             self.collect_metrics(instance)
@@ -0,0 +1,76 @@
+# (C) Datadog, Inc. 2019
+# All rights reserved
+# Licensed under Simplified BSD License (see LICENSE)
+import pytest
+
+from datadog_checks.vsphere.batch_sizer import BatchSizer
+
+
+@pytest.fixture
+def sizer():
+    return BatchSizer(
+        batch_size=50, concurrency=2, target_latency=10, min_batch_size=10, max_batch_size=1000, max_concurrency=4
+    )
+
+
+def test_bounds():
+    sizer = BatchSizer(
+        batch_size=5000, concurrency=10, target_latency=10, min_batch_size=0, max_batch_size=1000, max_concurrency=4
+    )
+    assert sizer.batch_size == 1000
+    assert sizer.concurrency == 4
+    assert sizer.min_batch_size == 1
+
+
+def test_no_calls(sizer):
+    sizer.adjust()
+    assert sizer.batch_size == 50
+    assert sizer.concurrency == 2
+
+
+def test_fast_calls(sizer):
+    sizer.record(50, 500, 1)
+    sizer.record(50, 500, 2)
+    sizer.adjust()
+    # Grows at most twice as large, one more concurrent call
+    assert sizer.batch_size == 100
+    assert sizer.concurrency == 3
+    assert sizer.last_objects == 100
+    assert sizer.last_values == 1000
+    assert sizer.last_max_latency == 2
+
+    # Recorded calls are consumed
+    sizer.adjust()
+    assert sizer.batch_size == 100
+
+
+def test_limited_by_cost(sizer):
+    # 0.16s per object, 62 objects fit in the target latency
+    sizer.record(50, 500, 8)
+    sizer.adjust()
+    assert sizer.batch_size == 62
+    assert sizer.concurrency == 2
+
+
+def test_slow_calls(sizer):
+    sizer.record(50, 500, 12)
+    sizer.adjust()
+    assert sizer.batch_size == 25
+    assert sizer.concurrency == 1
+
+    sizer.record(25, 250, 30)
+    sizer.adjust()
+    assert sizer.batch_size == 12
+    assert sizer.concurrency == 1
+
+    sizer.record(12, 120, 30)
+    sizer.adjust()
+    assert sizer.batch_size == 10
+
+
+def test_failures(sizer):
+    sizer.record(50, 500, 1)
+    sizer.record_failure()
+    sizer.adjust()
+    assert sizer.batch_size == 25
+    assert sizer.concurrency == 1
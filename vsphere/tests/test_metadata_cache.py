@@ -51,3 +51,13 @@ def test_get_metrics(cache):
     cache._metric_ids["foo_instance"] = ["foo"]
 
     assert cache.get_metric_ids("foo_instance") == ["foo"]
+
+
+def test_counters(cache):
+    with pytest.raises(KeyError):
+        cache.get_counters("foo_instance")
+
+    cache.init_instance("foo_instance")
+    assert cache.get_counters("foo_instance") == {}
+    cache.set_counters("foo_instance", {"foo_id": ("vsphere.foo", False)})
+    assert cache.get_counters("foo_instance") == {"foo_id": ("vsphere.foo", False)}
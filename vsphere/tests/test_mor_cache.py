@@ -56,6 +56,17 @@ def test_get_mor(cache):
         cache.get_mor('foo_instance', 'foo')
 
 
+def test_remove_mor(cache):
+    with pytest.raises(KeyError):
+        cache.remove_mor('foo_instance', 'mor_name')
+
+    cache._mor['foo_instance'] = {'mor_name': {}}
+    cache.remove_mor('foo_instance', 'mor_name')
+    assert cache.instance_size('foo_instance') == 0
+    # Removing a missing Mor is a noop
+    cache.remove_mor('foo_instance', 'mor_name')
+
+
 def test_set_metrics(cache):
     with pytest.raises(KeyError):
         cache.set_metrics('instance', 'mor_name', [])
@@ -21,7 +21,7 @@ from datadog_checks.vsphere.vsphere import (
     SHORT_ROLLUP,
 )
 
-from .utils import MockedMOR, assertMOR, disable_thread_pool, get_mocked_server
+from .utils import MockedMOR, assertMOR, disable_thread_pool, get_mocked_server, get_recorded_server
 
 SERVICE_CHECK_TAGS = ["vcenter_server:vsphere_mock", "vcenter_host:None", "foo:bar"]
 
@@ -161,6 +161,34 @@ def test__get_all_objs(vsphere, instance):
         } in obj_list[vim.ClusterComputeResource]
 
 
+def test__get_parent_tags_cache(vsphere):
+    folder = MockedMOR(spec="Folder", name="folder")
+    datacenter = MockedMOR(spec="Datacenter", name="datacenter")
+    host = MockedMOR(spec="HostSystem", name="host")
+    vm1 = MockedMOR(spec="VirtualMachine", name="vm1")
+    vm2 = MockedMOR(spec="VirtualMachine", name="vm2")
+    all_objects = {
+        folder: {"name": "folder", "parent": None},
+        datacenter: {"name": "datacenter", "parent": folder},
+        host: {"name": "host", "parent": datacenter},
+        vm1: {"name": "vm1", "parent": host},
+        vm2: {"name": "vm2", "parent": host},
+    }
+    expected_tags = ['vsphere_folder:folder', 'vsphere_datacenter:datacenter', 'vsphere_host:host']
+
+    cache = {}
+    assert vsphere._get_parent_tags(vm1, all_objects, cache) == expected_tags
+    assert cache == {folder: expected_tags[:1], datacenter: expected_tags[:2], host: expected_tags}
+
+    # The tags of the parents are not computed again
+    all_objects[datacenter]["name"] = "renamed"
+    tags = vsphere._get_parent_tags(vm2, all_objects, cache)
+    assert tags == expected_tags
+    tags.append("foo")
+    assert cache[host] == expected_tags
+    assert vsphere._get_parent_tags(vm2, all_objects)[1] == 'vsphere_datacenter:renamed'
+
+
 def test__collect_mors_and_attributes(vsphere, instance):
     """
     Test that we check for errors when collecting properties with property collector
@@ -277,6 +305,93 @@ def test_use_guest_hostname(vsphere, instance):
         assertMOR(vsphere, instance, name="vm4_guest", spec="vm", subset=True)
 
 
+def test__sync_inventory(aggregator, vsphere, instance):
+    server_instance = get_recorded_server()
+    vsphere._get_server_instance = MagicMock(return_value=server_instance)
+    i_key = vsphere._instance_key(instance)
+
+    def sync():
+        aggregator.reset()
+        with mock.patch('datadog_checks.vsphere.vsphere.vmodl'):
+            vsphere._sync_inventory(instance)
+        vsphere._process_mor_objects_queue(instance)
+        return {mor['hostname'] or mor['tags'][-2]: mor for _, mor in vsphere.mor_cache.mors(i_key)}
+
+    # The whole inventory is reported first
+    mors = sync()
+    assert len(mors) == 11
+    assert set(mors['vm4']['tags']) == {
+        'vcenter_server:vsphere_mock',
+        'vsphere_folder:rootFolder',
+        'vsphere_folder:folder1',
+        'vsphere_datacenter:datacenter2',
+        'vsphere_cluster:compute_resource2',
+        'vsphere_compute:compute_resource2',
+        'vsphere_host:host3',
+        'vsphere_type:vm',
+    }
+    aggregator.assert_metric('datadog.agent.vsphere.inventory_sync.object_updates', value=13, tags=['foo:bar'])
+    aggregator.assert_metric('datadog.agent.vsphere.inventory_sync.mors_updated', value=11, tags=['foo:bar'])
+    aggregator.assert_metric('datadog.agent.vsphere.inventory_sync.mors_removed', value=0, tags=['foo:bar'])
+    aggregator.assert_metric('datadog.agent.vsphere.inventory_sync.time', tags=['foo:bar'])
+
+    # A VM is created, one is renamed and one is deleted
+    mors = sync()
+    assert len(mors) == 11
+    assert 'vm5' in mors and 'vm1_renamed' in mors
+    assert 'vm1' not in mors and 'vm2' not in mors
+    aggregator.assert_metric('datadog.agent.vsphere.inventory_sync.mors_updated', value=2, tags=['foo:bar'])
+    aggregator.assert_metric('datadog.agent.vsphere.inventory_sync.mors_removed', value=1, tags=['foo:bar'])
+
+    # A VM is migrated, one is powered off
+    mors = sync()
+    assert len(mors) == 10
+    assert 'vm5' not in mors
+    assert 'vsphere_host:host1' in mors['vm4']['tags']
+    assert 'vsphere_datacenter:datacenter1' in mors['vm4']['tags']
+    aggregator.assert_metric('datadog.agent.vsphere.inventory_sync.mors_updated', value=1, tags=['foo:bar'])
+    aggregator.assert_metric('datadog.agent.vsphere.inventory_sync.mors_removed', value=1, tags=['foo:bar'])
+
+    # A folder is renamed, the objects it contains are updated
+    mors = sync()
+    assert len(mors) == 10
+    assert 'vsphere_folder:folder1_renamed' in mors['vm1_renamed']['tags']
+    assert 'vsphere_folder:folder1_renamed' in mors['host3']['tags']
+    aggregator.assert_metric('datadog.agent.vsphere.inventory_sync.object_updates', value=1, tags=['foo:bar'])
+    # datacenter2, compute_resource2, host3 and vm1
+    aggregator.assert_metric('datadog.agent.vsphere.inventory_sync.mors_updated', value=4, tags=['foo:bar'])
+
+    # Nothing changed
+    mors = sync()
+    assert len(mors) == 10
+    aggregator.assert_metric('datadog.agent.vsphere.inventory_sync.object_updates', value=0, tags=['foo:bar'])
+    aggregator.assert_metric('datadog.agent.vsphere.inventory_sync.mors_updated', value=0, tags=['foo:bar'])
+
+    # The collector is lost, the inventory is synchronized again from scratch on the next run
+    server_instance.content.propertyCollector.destroyed = True
+    sync()
+    aggregator.assert_metric('datadog.agent.vsphere.inventory_sync.object_updates', count=0)
+    vsphere._get_server_instance.return_value = get_recorded_server()
+    mors = sync()
+    assert len(mors) == 11
+    assert 'vm1' in mors and 'vm2' in mors and 'vm1_renamed' not in mors
+    # The VMs of the original topology are different objects
+    aggregator.assert_metric('datadog.agent.vsphere.inventory_sync.mors_removed', value=10, tags=['foo:bar'])
+
+
+def test_check_incremental_inventory(vsphere, instance):
+    instance['incremental_inventory'] = True
+    vsphere._get_server_instance = MagicMock(return_value=get_recorded_server())
+    vsphere._cache_morlist_raw = MagicMock()
+    vsphere.mor_cache.purge = MagicMock()
+    with mock.patch('datadog_checks.vsphere.vsphere.vmodl'):
+        vsphere.check(instance)
+
+    vsphere._cache_morlist_raw.assert_not_called()
+    vsphere.mor_cache.purge.assert_not_called()
+    assert vsphere.mor_cache.instance_size(vsphere._instance_key(instance)) == 11
+
+
 def test__process_mor_objects_queue(vsphere, instance):
     vsphere.log = MagicMock()
     vsphere._process_mor_objects_queue_async = MagicMock()
@@ -422,20 +537,101 @@ def test__collect_metrics_async_compatibility(vsphere, instance):
     server_instance.content.perfManager.QueryPerf.return_value = [MagicMock(value=[MagicMock()])]
     vsphere.mor_cache = MagicMock()
     vsphere.metadata_cache = MagicMock()
-    vsphere.metadata_cache.get_metadata.return_value = {"name": "unknown"}
-    vsphere.in_compatibility_mode = MagicMock()
+    vsphere.gauge = MagicMock()
     vsphere.log = MagicMock()
 
-    vsphere.in_compatibility_mode.return_value = True
+    # Unknown metrics in compatibility mode are not submitted
+    vsphere.metadata_cache.get_counters.return_value = MagicMock(__getitem__=lambda _, key: None)
     vsphere._collect_metrics_async(instance, [])
-    vsphere.log.debug.assert_called_with("Skipping unknown `unknown` metric.")
+    vsphere.gauge.assert_not_called()
+    vsphere.log.debug.assert_not_called()
 
-    vsphere.log.reset_mock()
-    vsphere.in_compatibility_mode.return_value = False
+    vsphere.metadata_cache.get_counters.return_value = MagicMock(__getitem__=lambda _, key: ("vsphere.foo", False))
     vsphere._collect_metrics_async(instance, [])
+    vsphere.gauge.assert_called_once()
     vsphere.log.debug.assert_not_called()
 
 
+def test__collect_metrics_async(aggregator, vsphere, instance):
+    server_instance = vsphere._get_server_instance(instance)
+    i_key = vsphere._instance_key(instance)
+    percent_counter = MagicMock(key=1, groupInfo=MagicMock(key="cpu"), nameInfo=MagicMock(key="usage"))
+    percent_counter.rollupType = "average"
+    percent_counter.unitInfo.key = "percent"
+    counter = MagicMock(key=2, groupInfo=MagicMock(key="mem"), nameInfo=MagicMock(key="active"))
+    counter.rollupType = "maximum"
+    counter.unitInfo.key = "kiloBytes"
+    server_instance.content.perfManager.QueryPerfCounterByLevel.return_value = [percent_counter, counter]
+    vsphere._cache_metrics_metadata(instance)
+    assert vsphere.metadata_cache.get_counters(i_key) == {
+        1: ("vsphere.cpu.usage.avg", True),
+        2: ("vsphere.mem.active.max", False),
+    }
+
+    vsphere.mor_cache.init_instance(i_key)
+    vsphere.mor_cache.set_mor(i_key, "vm1", {"hostname": "vm1", "tags": ["vsphere_type:vm"]})
+    vsphere.mor_cache.set_mor(i_key, "datastore1", {"hostname": None, "tags": ["vsphere_type:datastore"]})
+    server_instance.content.perfManager.QueryPerf.return_value = [
+        MagicMock(
+            entity="vm1",
+            value=[
+                MagicMock(id=MagicMock(counterId=1, instance=""), value=[4200]),
+                MagicMock(id=MagicMock(counterId=1, instance="0"), value=[1200]),
+                MagicMock(id=MagicMock(counterId=3, instance=""), value=[1]),
+            ],
+        ),
+        MagicMock(entity="datastore1", value=[MagicMock(id=MagicMock(counterId=2, instance=""), value=[])]),
+        MagicMock(entity="datastore1", value=[MagicMock(id=MagicMock(counterId=2, instance=""), value=[12])]),
+    ]
+    vsphere._collect_metrics_async(instance, [])
+
+    aggregator.assert_metric('vsphere.cpu.usage.avg', value=42, hostname="vm1", tags=["instance:none", "foo:bar"])
+    aggregator.assert_metric('vsphere.cpu.usage.avg', value=12, hostname="vm1", tags=["instance:0", "foo:bar"])
+    aggregator.assert_metric(
+        'vsphere.mem.active.max',
+        value=12,
+        count=1,
+        hostname=None,
+        tags=["instance:none", "vsphere_type:datastore", "foo:bar"],
+    )
+
+
+def test_adaptive_batching(aggregator, instance):
+    init_config = {'adaptive_batching': True, 'batch_morlist_size': 2, 'adaptive_batch_min_size': 1}
+    check = disable_thread_pool(VSphereCheck('vsphere', init_config, {}, [instance]))
+    check._get_server_instance = MagicMock(return_value=get_mocked_server())
+    i_key = check._instance_key(instance)
+    batch_sizer = check.batch_sizers[i_key]
+    assert batch_sizer.batch_size == 2
+    assert batch_sizer.concurrency == 4
+
+    with mock.patch('datadog_checks.vsphere.vsphere.vmodl'):
+        check.check(instance)
+    aggregator.assert_metric('datadog.agent.vsphere.query_perf.batch_size', value=2, tags=['foo:bar'])
+    # The 6 VMs and hosts have been queried
+    assert batch_sizer._objects == 6
+
+    aggregator.reset()
+    with mock.patch('datadog_checks.vsphere.vsphere.vmodl'):
+        check.check(instance)
+    # The calls were fast, batches are doubled
+    aggregator.assert_metric('datadog.agent.vsphere.query_perf.batch_size', value=4, tags=['foo:bar'])
+
+    # vCenter times out, batches are halved on the next run
+    check._get_server_instance.return_value.content.perfManager.QueryPerf.side_effect = Exception("timeout")
+    aggregator.reset()
+    with mock.patch('datadog_checks.vsphere.vsphere.vmodl'):
+        check.check(instance)
+    aggregator.assert_metric('datadog.agent.vsphere.query_perf.batch_size', value=8, tags=['foo:bar'])
+    assert batch_sizer._failures > 0
+
+    aggregator.reset()
+    with mock.patch('datadog_checks.vsphere.vsphere.vmodl'):
+        check.check(instance)
+    aggregator.assert_metric('datadog.agent.vsphere.query_perf.batch_size', value=4, tags=['foo:bar'])
+    aggregator.assert_metric('datadog.agent.vsphere.query_perf.concurrency', value=3, tags=['foo:bar'])
+
+
 def test_check(vsphere, instance):
     """
     Test the check() method
@@ -142,3 +142,92 @@ def get_mocked_server():
     server_mock = MagicMock()
     server_mock.configure_mock(**{'RetrieveContent.return_value': content_mock, 'content': content_mock})
     return server_mock
+
+
+class FakePropertyCollector(object):
+    """
+    Property collector replaying recorded inventory updates: the first update reports every object
+    of the topology, then each call to `WaitForUpdatesEx` returns the next recorded update, if any,
+    like when one update happens between two check runs.
+    """
+
+    def __init__(self, all_mors, recorded_updates):
+        self.all_mors = all_mors
+        self.updates = [[self._enter(mor) for mor in all_mors if mor.name != "rootFolder"]]
+        for recorded_update in recorded_updates:
+            self.updates.append([self._object_update(update) for update in recorded_update])
+        self.filters = []
+        self.destroyed = False
+
+    def CreatePropertyCollector(self):
+        return self
+
+    def CreateFilter(self, spec, partialUpdates):
+        self.filters.append(spec)
+
+    def DestroyPropertyCollector(self):
+        self.destroyed = True
+
+    def WaitForUpdatesEx(self, version, options):
+        if self.destroyed:
+            raise Exception("The collector has been destroyed")
+
+        next_version = int(version or 0)
+        if next_version >= len(self.updates):
+            return None
+        return MagicMock(
+            version=str(next_version + 1), truncated=False, filterSet=[MagicMock(objectSet=self.updates[next_version])]
+        )
+
+    def _get_mor(self, name):
+        return next(mor for mor in self.all_mors if mor.name == name)
+
+    @staticmethod
+    def _change(name, val, op='assign'):
+        change = Mock(op=op, val=val)
+        change.name = name
+        return change
+
+    def _enter(self, mor):
+        changes = [self._change("name", mor.name), self._change("parent", mor.parent)]
+        changes.append(self._change("customValue", mor.customValue))
+        for prop_name in ["runtime_powerState", "runtime_host", "guest_hostName"]:
+            if hasattr(mor, prop_name):
+                changes.append(self._change(prop_name.replace("_", "."), getattr(mor, prop_name)))
+        return Mock(obj=mor, kind='enter', changeSet=changes)
+
+    def _object_update(self, update):
+        """
+        Build an object update from its recorded description, new objects are added to the topology.
+        """
+        if update['kind'] == 'enter':
+            self.all_mors.append(MockedMOR(spec=update['spec'], name=update['obj']))
+        obj = self._get_mor(update['obj'])
+
+        changes = []
+        for name, val in iteritems(update.get('changes', {})):
+            if name in ('parent', 'runtime.host'):
+                val = self._get_mor(val)
+            elif name == 'runtime.powerState':
+                val = getattr(vim.VirtualMachinePowerState, val)
+            elif name == 'customValue':
+                val = [Mock(value=v) for v in val]
+            changes.append(self._change(name, val))
+        for name in update.get('removed', []):
+            changes.append(self._change(name, None, op='remove'))
+
+        return Mock(obj=obj, kind=update['kind'], changeSet=changes)
+
+
+def get_recorded_server():
+    """
+    Return a mocked Server object whose property collector replays the recorded inventory updates
+    """
+    server_mock = get_mocked_server()
+    all_mors = create_topology(os.path.join(HERE, 'fixtures', 'vsphere_topology.json'))
+    with open(os.path.join(HERE, 'fixtures', 'vsphere_inventory_updates.json')) as f:
+        recorded_updates = json.loads(f.read())
+    root_folder_mock = next(mor for mor in all_mors if mor.name == "rootFolder")
+    server_mock.content.rootFolder = root_folder_mock
+    server_mock.content.propertyCollector = FakePropertyCollector(all_mors, recorded_updates)
+    return server_mock